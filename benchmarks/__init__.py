@@ -0,0 +1 @@
+''' Benchmark suite for tec_util; run with "python -m benchmarks --help" '''
@@ -0,0 +1,188 @@
+import argparse
+import logging
+import sys
+from . import compare
+from . import run
+from .generate import generate_dataset
+logging.basicConfig(
+    stream=sys.stdout,
+    format="%(asctime)s | %(name)s | %(levelname)s | %(message)s",
+)
+
+
+#-------------------------------------------------------------------------------
+# Subcommands
+#-------------------------------------------------------------------------------
+def generate(args):
+    ''' Write a synthetic dataset '''
+    zones = generate_dataset(
+        args.datafile_out,
+        num_zones = args.zones,
+        num_points = args.points,
+        num_vars = args.variables,
+        num_times = args.times,
+        fe = args.fe,
+        rank = args.rank,
+        precision = args.precision,
+    )
+    print(f"Wrote {len(zones)} zones to {args.datafile_out}")
+
+def run_benchmarks(args):
+    ''' Run benchmarks and append the results to a history file '''
+    record = run.run_benchmarks(
+        args.benchmarks,
+        size = args.size,
+        num_times = args.times,
+        fe = args.fe,
+        repeat = args.repeat,
+        workdir = args.workdir,
+    )
+    run.append_history(args.history, record)
+    print(run.format_results(record))
+
+def compare_runs(args):
+    ''' Flag regressions between two runs in a history file '''
+    history = run.load_history(args.history)
+    if len(history) < 2:
+        print(f"Need at least two runs in {args.history} to compare")
+        return 1
+    regressions = compare.compare_runs(history[args.baseline], history[args.current], args.threshold)
+    print(compare.format_regressions(regressions))
+    return 1 if regressions else 0
+
+
+#-------------------------------------------------------------------------------
+# Subcommand Parser Configurators
+#-------------------------------------------------------------------------------
+def configure_dataset_options(parser):
+    parser.add_argument(
+        '--times',
+        help = "number of solution times; each zone becomes a strand (def: 1)",
+        type = int,
+        default = 1,
+    )
+    parser.add_argument(
+        '--fe',
+        help = "write FE zones (FEBrick/FEQuad) instead of ordered zones",
+        action = 'store_true',
+    )
+
+def configure_generate_parser(parser):
+    parser.add_argument(
+        'datafile_out',
+        help = "file to be written (.plt or .dat)",
+    )
+    parser.add_argument('--zones', help="number of zones (def: 4)", type=int, default=4)
+    parser.add_argument('--points', help="approx. points per zone (def: 10000)", type=int, default=10000)
+    parser.add_argument('--variables', help="number of field variables (def: 5)", type=int, default=5)
+    parser.add_argument('--rank', help="zone dimension, 2 or 3 (def: 3)", type=int, choices=[2,3], default=3)
+    parser.add_argument(
+        '--precision',
+        help = "precision of the field data (def: single)",
+        choices = ['single', 'double'],
+        default = 'single',
+    )
+    configure_dataset_options(parser)
+
+def configure_run_parser(parser):
+    parser.add_argument(
+        'benchmarks',
+        help = "benchmarks to run (def: all of %s)" % ', '.join(run.BENCHMARKS),
+        nargs = '*',
+    )
+    parser.add_argument(
+        '--size',
+        help = "size of the generated datasets (def: small)",
+        choices = list(run.SIZES),
+        default = 'small',
+    )
+    parser.add_argument(
+        '--repeat',
+        help = "number of times each benchmark is run; the fastest is kept (def: 1)",
+        type = int,
+        default = 1,
+    )
+    parser.add_argument(
+        '--workdir',
+        help = "use datasets previously generated in this directory",
+        default = None,
+    )
+    parser.add_argument(
+        '--history',
+        help = "JSON file to which results are appended (def: benchmark_history.json)",
+        default = 'benchmark_history.json',
+    )
+    configure_dataset_options(parser)
+
+def configure_compare_parser(parser):
+    parser.add_argument(
+        'history',
+        help = "JSON history file written by the run command",
+    )
+    parser.add_argument(
+        '--baseline',
+        help = "index of the baseline run in the history (def: -2)",
+        type = int,
+        default = -2,
+    )
+    parser.add_argument(
+        '--current',
+        help = "index of the run to check (def: -1)",
+        type = int,
+        default = -1,
+    )
+    parser.add_argument(
+        '--threshold',
+        help = "relative change that is flagged as a regression (def: 0.1)",
+        type = float,
+        default = 0.1,
+    )
+
+
+#-------------------------------------------------------------------------------
+# Main Program
+#-------------------------------------------------------------------------------
+def build_parser():
+    ''' Construct the command line argument parser '''
+    parser = argparse.ArgumentParser(
+        prog = "python -m benchmarks",
+        description = "Benchmarks for tec_util.",
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        help = 'show detailed output log',
+        action = 'store_const',
+        dest = 'loglevel',
+        const = logging.INFO,
+        default = logging.WARNING,
+    )
+    subparsers = parser.add_subparsers(
+        metavar = 'cmd',
+        help = 'Subcommand to execute',
+    )
+    cmds = {
+        # name        function         parser
+        'generate': ( generate,        configure_generate_parser ),
+        'run':      ( run_benchmarks,  configure_run_parser      ),
+        'compare':  ( compare_runs,    configure_compare_parser  ),
+    }
+    for name, (action, configure_func) in cmds.items():
+        sp = subparsers.add_parser(
+            name,
+            help = action.__doc__,
+            description = action.__doc__,
+        )
+        configure_func(sp)
+        sp.set_defaults(func = action)
+    return parser
+
+def main(args):
+    parser = build_parser()
+    args = parser.parse_args(args)
+    logging.getLogger('benchmarks').setLevel(args.loglevel)
+    if "func" in args:
+        return args.func(args)
+    parser.print_help()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,44 @@
+''' Regression checks between two benchmark runs '''
+
+METRICS = {
+    # metric       larger is worse
+    'wall':        True,
+    'peak_rss':    True,
+    'throughput':  False,
+}
+
+def compare_runs(baseline, current, threshold=0.10):
+    ''' Compare the results of two history records.
+
+    Returns a list of (benchmark, metric, baseline, current, change) for
+    every metric that got worse by more than the fractional threshold.
+    Benchmarks missing from either run, or failed in either run, are
+    skipped, except that a benchmark that ran in the baseline but failed
+    in the current run is reported with metric "error".
+    '''
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None or 'error' in old:
+            continue
+        if 'error' in new:
+            regressions.append((name, 'error', None, None, None))
+            continue
+        for metric, larger_is_worse in METRICS.items():
+            if not old.get(metric):
+                continue
+            change = new[metric] / old[metric] - 1.0
+            if (change if larger_is_worse else -change) > threshold:
+                regressions.append((name, metric, old[metric], new[metric], change))
+    return regressions
+
+def format_regressions(regressions):
+    if not regressions:
+        return 'No regressions found.'
+    lines = ['{:20s} {:12s} {:>14s} {:>14s} {:>8s}'.format('Benchmark', 'Metric', 'Baseline', 'Current', 'Change')]
+    for name, metric, old, new, change in regressions:
+        if metric == 'error':
+            lines.append('{:20s} {:12s} {:>14s} {:>14s}'.format(name, metric, 'ok', 'FAILED'))
+        else:
+            lines.append('{:20s} {:12s} {:14.4g} {:14.4g} {:+7.1%}'.format(name, metric, old, new, change))
+    return '\n'.join(lines)
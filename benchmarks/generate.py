@@ -0,0 +1,82 @@
+''' Synthetic dataset generator for benchmarks.
+
+Datasets are written with the native writers, so generating them does not
+require the Tecplot engine. Every zone is a unit block (or square, for
+rank-2 zones) offset along x by its index, with smooth analytic field
+variables, so that slices, interpolation and revolution all produce
+meaningful results.
+'''
+import numpy as np
+from tec_util import native
+
+FE_TYPES = {2: 'FEQuad', 3: 'FEBrick'}
+
+
+def block_shape(num_points, rank):
+    ''' Ordered zone dimensions with about num_points nodes '''
+    n = max(int(round(num_points ** (1.0/rank))), 2)
+    return tuple([n] * rank + [1] * (3 - rank))
+
+def block_coordinates(shape, offset):
+    ''' Nodal coordinates of a unit block with the given shape, in I-fastest order '''
+    axes = [np.linspace(0.0, 1.0, n) if n > 1 else np.zeros(1) for n in shape]
+    k, j, i = np.meshgrid(axes[2], axes[1], axes[0], indexing='ij')
+    return [(i + offset).ravel(), j.ravel(), k.ravel()]
+
+def block_connectivity(shape, rank):
+    ''' Zero-based FEQuad/FEBrick connectivity of the cells of an ordered block '''
+    I, J, K = shape
+    nodes = np.arange(I*J*K).reshape(K, J, I)
+    if rank == 2:
+        n = nodes[0]
+        corners = [n[:-1,:-1], n[:-1,1:], n[1:,1:], n[1:,:-1]]
+    else:
+        corners = [
+            nodes[:-1,:-1,:-1], nodes[:-1,:-1,1:], nodes[:-1,1:,1:], nodes[:-1,1:,:-1],
+            nodes[1:,:-1,:-1],  nodes[1:,:-1,1:],  nodes[1:,1:,1:],  nodes[1:,1:,:-1],
+        ]
+    return np.stack([c.ravel() for c in corners], axis=1)
+
+def field(n, x, y, z, t):
+    ''' The n-th synthetic field variable '''
+    return np.sin(n*x + t) * np.cos(y) + n * z
+
+def generate_dataset(filename, num_zones=4, num_points=10000, num_vars=5, num_times=1,
+                     fe=False, rank=3, coordinates=('x','y','z'), precision='single'):
+    ''' Write a synthetic dataset and return its list of native.Zone
+
+    Arguments:
+        num_zones     Number of zones per solution time
+        num_points    Approximate number of nodes per zone
+        num_vars      Number of field variables (besides coordinates)
+        num_times     Number of solution times; if more than one, each zone
+                      becomes a strand with one zone per solution time
+        fe            Write FEQuad/FEBrick zones instead of ordered zones
+        rank          Dimension of the zones (2 or 3)
+        coordinates   Names of the coordinate variables; use ('x','y') for
+                      datasets that are to be revolved
+        precision     single|double
+    '''
+    dtype = native.PRECISIONS[precision]
+    shape = block_shape(num_points, rank)
+    variables = list(coordinates) + ['q%d' % n for n in range(1, num_vars+1)]
+    zones = []
+    for it in range(num_times):
+        for iz in range(num_zones):
+            name = 'block:%d' % (iz+1)
+            strand = iz + 1 if num_times > 1 else 0
+            if fe:
+                num_cells = int(np.prod([n-1 for n in shape[:rank]]))
+                zone = native.Zone(name, FE_TYPES[rank], (int(np.prod(shape)), num_cells), strand, float(it))
+            else:
+                zone = native.Zone(name, 'Ordered', shape, strand, float(it))
+            zones.append(zone)
+
+    connectivity = block_connectivity(shape, rank) if fe else None
+    with native.open_writer(filename, variables, zones) as writer:
+        for zone_index, zone in enumerate(zones):
+            x, y, z = block_coordinates(shape, zone_index % num_zones)
+            xyz = [x, y, z][:len(coordinates)]
+            values = xyz + [field(n, x, y, z, zone.solution_time) for n in range(1, num_vars+1)]
+            writer.write_zone([v.astype(dtype) for v in values], connectivity)
+    return zones
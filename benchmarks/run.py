@@ -0,0 +1,222 @@
+''' Benchmarks of the tec_util API and command line functions.
+
+Each benchmark runs in a freshly spawned process, so that its peak RSS
+(which includes memory used by the Tecplot engine) is not polluted by the
+benchmarks that ran before it. Results are appended to a JSON history
+file, which can be checked for regressions with benchmarks.compare.
+'''
+import concurrent.futures
+import contextlib
+import datetime
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from tec_util import instrument
+from tec_util import native
+from .generate import generate_dataset
+
+LOG = logging.getLogger(__name__)
+
+SIZES = {
+    # name       zones  points/zone  variables
+    'small':  dict(num_zones=4,  num_points=20000,  num_vars=5),
+    'medium': dict(num_zones=16, num_points=100000, num_vars=10),
+    'large':  dict(num_zones=64, num_points=250000, num_vars=20),
+}
+
+SLICES = '''slices = [
+    ('x-mid', (0.5, 0.5, 0.5), (1.0, 0.0, 0.0), 'all'),
+    ('y-mid', (0.5, 0.5, 0.5), (0.0, 1.0, 0.0), 'all'),
+]
+'''
+
+
+#-----------------------------------------------------------------------
+# Datasets
+#-----------------------------------------------------------------------
+def prepare(workdir, size='small', num_times=1, fe=False):
+    ''' Generate the datasets used by the benchmarks in workdir '''
+    config = dict(SIZES[size], num_times=num_times, fe=fe)
+    LOG.info("Generate %s datasets in %s", size, workdir)
+    generate_dataset(os.path.join(workdir, 'volume.plt'), **config)
+    generate_dataset(os.path.join(workdir, 'volume_old.plt'), **dict(config, precision='double'))
+    generate_dataset(os.path.join(workdir, 'volume.dat'), **config)
+    generate_dataset(os.path.join(workdir, 'surface.plt'), **dict(config, rank=2))
+    generate_dataset(os.path.join(workdir, 'plane.plt'), **dict(config, rank=2, coordinates=('x','y'), fe=False))
+    target = dict(config, num_zones=1, num_points=config['num_points'] // 10)
+    generate_dataset(os.path.join(workdir, 'target.plt'), **target)
+    with open(os.path.join(workdir, 'slices.py'), 'w') as f:
+        f.write(SLICES)
+
+def total_points(filename):
+    ''' Number of nodes in all zones of a datafile '''
+    return sum(native.num_points(z) for z in native.read_header(filename).zones)
+
+
+#-----------------------------------------------------------------------
+# Benchmarks
+#-----------------------------------------------------------------------
+# Each benchmark runs in the directory created by prepare() and returns the
+# number of points it processed, which is used to compute the throughput.
+def bench_stats():
+    import tec_util
+    tec_util.compute_statistics('volume.plt')
+    return total_points('volume.plt')
+
+def bench_diff():
+    import tec_util
+    tec_util.difference_datasets('volume.plt', 'volume_old.plt', 'diff.plt')
+    return total_points('volume.plt')
+
+def bench_diff_jobs():
+    import tec_util
+    tec_util.difference_datasets('volume.plt', 'volume_old.plt', 'diff.plt', jobs=4)
+    return total_points('volume.plt')
+
+def bench_diff_out_of_core():
+    import tec_util
+    tec_util.difference_datasets('volume.plt', 'volume_old.plt', 'diff.plt', out_of_core=True)
+    return total_points('volume.plt')
+
+def bench_extract():
+    import tec_util
+    tec_util.extract('volume.plt', 'extract.plt', zone_patterns=['block:1*'], var_patterns=['x','y','z','q1'])
+    return total_points('extract.plt')
+
+def bench_interp():
+    import tec_util
+    tec_util.interpolate_dataset('volume.plt', 'target.plt', 'interp.plt')
+    return total_points('target.plt')
+
+def bench_revolve():
+    import tec_util
+    tec_util.revolve_dataset('plane.plt', 'revolve.plt', planes=33)
+    return total_points('revolve.plt')
+
+def bench_slice():
+    import tec_util
+    tec_util.slice_surfaces('slices.py', 'surface.plt', 'slice.plt')
+    return total_points('surface.plt')
+
+def bench_info():
+    from tec_util.__main__ import main
+    with contextlib.redirect_stdout(io.StringIO()):
+        main(['info', 'volume.plt'])
+    return total_points('volume.plt')
+
+def bench_to_ascii():
+    from tec_util.__main__ import main
+    main(['to_ascii', 'volume.plt', '-o', 'volume_out.dat'])
+    return total_points('volume.plt')
+
+def bench_to_plt():
+    from tec_util.__main__ import main
+    main(['to_plt', 'volume.dat', '-o', 'volume_out.plt'])
+    return total_points('volume.dat')
+
+BENCHMARKS = {
+    name[len('bench_'):]: func
+    for name, func in list(globals().items()) if name.startswith('bench_')
+}
+
+
+#-----------------------------------------------------------------------
+# Runner
+#-----------------------------------------------------------------------
+def measure(name, workdir):
+    ''' Run a benchmark in workdir; return dict of wall time, points and peak RSS '''
+    os.chdir(workdir)
+    start = time.perf_counter()
+    points = BENCHMARKS[name]()
+    wall = time.perf_counter() - start
+    return {
+        'wall': wall,
+        'points': points,
+        'throughput': points / wall if wall > 0 else 0.0,
+        'peak_rss': instrument.peak_rss(),
+    }
+
+def run_isolated(name, workdir):
+    ''' Run a benchmark in a new process '''
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(measure, name, workdir).result()
+
+def git_commit():
+    ''' Commit hash of the source tree, if it is a git checkout '''
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd = os.path.dirname(os.path.abspath(__file__)),
+            capture_output = True, text = True, check = True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(names=None, size='small', num_times=1, fe=False, repeat=1, workdir=None):
+    ''' Run benchmarks and return a history record of the results
+
+    Each benchmark is run repeat times; the fastest wall time and the
+    largest peak RSS are kept. Benchmarks that fail are recorded with
+    their error message instead of measurements.
+    '''
+    names = names or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {' '.join(sorted(unknown))}")
+    results = {}
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+            prepare(workdir, size, num_times, fe)
+        for name in names:
+            LOG.info("Run benchmark %s", name)
+            try:
+                runs = [run_isolated(name, workdir) for _ in range(repeat)]
+            except (Exception, SystemExit) as e: # SystemExit: e.g. bad command line arguments
+                error = f"exit status {e.code}" if isinstance(e, SystemExit) else str(e)
+                LOG.error("Benchmark %s failed: %s", name, error)
+                results[name] = {'error': error}
+                continue
+            best = min(runs, key=lambda r: r['wall'])
+            results[name] = dict(best, peak_rss=max(r['peak_rss'] for r in runs))
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'config': {'size': size, 'num_times': num_times, 'fe': fe, 'repeat': repeat},
+        'results': results,
+    }
+
+def load_history(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return json.load(f)
+
+def append_history(filename, record):
+    ''' Append a run record to a JSON history file '''
+    history = load_history(filename)
+    history.append(record)
+    with open(filename, 'w') as f:
+        json.dump(history, f, indent=1)
+    return history
+
+def format_results(record):
+    ''' Results of a run as a text table '''
+    lines = ['{:20s} {:>10s} {:>12s} {:>12s} {:>10s}'.format('Benchmark', 'Wall [s]', 'Points', 'Mpts/s', 'RSS MB')]
+    for name, r in record['results'].items():
+        if 'error' in r:
+            lines.append('{:20s} FAILED: {}'.format(name, r['error']))
+        else:
+            lines.append('{:20s} {:10.3f} {:12d} {:12.2f} {:10.1f}'.format(
+                name, r['wall'], r['points'], r['throughput'] / 1e6, r['peak_rss'] / 2**20,
+            ))
+    return '\n'.join(lines)
@@ -9,7 +9,7 @@ setup(
     author = 'Jeffrey Hill',
     author_email = 'jeff.p.hill@gmail.com',
     packages = ['tec_util'],
-    python_requires = '>=3.4',
+    python_requires = '>=3.8',
     install_requires = ['pytecplot>=0.8'],
     entry_points= {
         'console_scripts': [
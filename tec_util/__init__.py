@@ -1 +1,10 @@
 from .core import *
+from .batch import run_manifest
+from .fingerprint import compare_datafiles, datafile_fingerprints
+from .integrate import integrate_surfaces
+from .runner import run_jobs
+from .series import compute_series_statistics
+from .session import Session
+from .shard import merge_datafiles, split_dataset
+from .sketch import compute_distributions
+from .watch import watch_directory
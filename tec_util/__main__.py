@@ -1,12 +1,24 @@
 import argparse
 import logging
 import os
+import re
+import shlex
 import sys
 import tec_util
+from tec_util import instrument
+from tec_util import native
 logging.basicConfig(
     stream=sys.stdout,
     format="%(asctime)s | %(name)s | %(levelname)s | %(message)s",
 )
+LOG = logging.getLogger('tec_util.main')
+
+# Arguments of the subcommands naming their input and output files
+COMMAND_INPUT_ARGS = {
+    'datafile_a', 'datafile_b', 'datafile_in', 'datafile_new', 'datafile_old',
+    'datafile_src', 'datafile_tgt', 'slice_file',
+}
+COMMAND_OUTPUT_ARGS = {'datafile_out', 'norms', 'output'}
 
 
 #-------------------------------------------------------------------------------
@@ -40,6 +52,16 @@ def vector_spec(arg):
                'a comma separated pair of strings'
         return { name_in : names_out }
 
+def strides_spec(arg):
+    ''' Parse comma-separated I,J,K strides; missing strides default to 1 '''
+    try:
+        strides = [int(s) for s in arg.split(',')]
+    except ValueError:
+        strides = []
+    if not 1 <= len(strides) <= 3 or min(strides) < 1:
+        raise argparse.ArgumentTypeError(f'invalid strides "{arg}"; expected e.g. 2,2,2')
+    return tuple(strides + [1] * (3 - len(strides)))
+
 def glob_spec(arg):
     ''' Parse list of glob patterns used to select variables and zones '''
     if arg:
@@ -47,12 +69,215 @@ def glob_spec(arg):
     else:
         return arg
 
+def size_spec(arg):
+    ''' Parse memory size such as 512M, 4G, 1.5GiB or a plain number of bytes '''
+    units = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([KMGT]?)(I?B)?\s*', arg.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f'invalid size "{arg}"; expected e.g. 512M or 4G')
+    return int(float(match.group(1)) * units[match.group(2)])
+
+def estimate_command_memory(args):
+    ''' Estimate bytes of field data held in memory by a subcommand (None if unknown) '''
+    estimate = tec_util.estimate_memory
+    cmd = args.func.__name__
+    if cmd == 'diff':
+        extra = range(args.nskip)
+        required = (
+            estimate(args.datafile_new, args.zones, args.variables, extra) +
+            estimate(args.datafile_old, args.zones, args.variables, extra) +
+            estimate(args.datafile_new, args.zones, args.variables)  # Deltas
+        )
+        if args.out_of_core or args.transient or args.norms or args.skip_identical:
+            streaming = tec_util.estimate_streaming_memory
+            num_old = 2 if args.interp_time else 1 # Interpolation reads two old timesteps
+            return 2 * streaming(args.datafile_new) + num_old * streaming(args.datafile_old) # New, delta, old
+        return required
+    if cmd == 'stats' and (args.series or args.percentiles or args.histogram):
+        datafiles = tec_util.series.expand_datafiles(args.datafile_in)
+        return max(tec_util.estimate_streaming_memory(f) for f in datafiles) # Streamed one chunk or zone at a time
+    if cmd == 'stats':
+        return estimate(args.datafile_in[0], args.zones, args.variables)
+    if cmd in ('decimate', 'extract'):
+        return estimate(args.datafile_in, args.zones, args.variables)
+    if cmd == 'derive':
+        header = native.read_header(args.datafile_in)
+        size_in = estimate(args.datafile_in, args.zones)
+        return size_in + size_in * 2 * len(args.expression) // len(header.variables) # Doubles
+    if cmd in ('compare', 'hash'):
+        datafiles = [args.datafile_a, args.datafile_b] if cmd == 'compare' else [args.datafile_in]
+        return max(tec_util.estimate_streaming_memory(f) for f in datafiles) # Hashed one zone-variable at a time
+    if cmd == 'split':
+        return args.jobs * tec_util.estimate_streaming_memory(args.datafile_in) # One chunk or zone per worker
+    if cmd == 'integrate':
+        datafiles = tec_util.series.expand_datafiles(args.datafile_in)
+        return args.jobs * max(estimate(f, args.zones) for f in datafiles) # Zones of one file per worker
+    if cmd == 'merge':
+        datafiles = tec_util.series.expand_datafiles(args.datafile_in)
+        return max(tec_util.estimate_streaming_memory(f) for f in datafiles)
+    if cmd == 'interp':
+        return estimate(args.datafile_src) + estimate(args.datafile_tgt)
+    if cmd == 'revolve':
+        header = native.read_header(args.datafile_in)
+        size_in = estimate(args.datafile_in)
+        num_vars = len(header.variables)
+        num_new = 1 + 2 * len(args.vector or [])  # At most
+        return size_in + size_in * args.num_planes * (num_vars + num_new) // num_vars
+    if 'datafile_in' in args:
+        return estimate(args.datafile_in)
+    return None
+
+def check_memory_budget(args):
+    ''' Switch to a streaming mode or fail if a subcommand would exceed --mem-budget '''
+    try:
+        required = estimate_command_memory(args)
+    except native.UnsupportedFormat as e:
+        LOG.warning("Cannot estimate memory use (%s); ignoring --mem-budget", e)
+        return
+    if required is None:
+        return
+    LOG.info(
+        "Estimated memory use: %s (budget: %s)",
+        tec_util.format_bytes(required), tec_util.format_bytes(args.mem_budget),
+    )
+    if required <= args.mem_budget:
+        return
+    if args.func.__name__ == 'diff' and not args.out_of_core:
+        LOG.warning(
+            "Estimated memory use %s exceeds budget of %s; switching to --out-of-core",
+            tec_util.format_bytes(required), tec_util.format_bytes(args.mem_budget),
+        )
+        args.out_of_core = True
+        return check_memory_budget(args)
+    message = "Estimated memory use of {} ({}) exceeds the budget of {}.".format(
+        args.func.__name__, tec_util.format_bytes(required), tec_util.format_bytes(args.mem_budget),
+    )
+    LOG.error(message)
+    raise RuntimeError(message)
+
+def command_loads(args):
+    ''' 1 if a subcommand loads datasets into Tecplot, 0 if it streams them '''
+    cmd = args.func.__name__
+    if cmd in ('compare', 'hash', 'integrate', 'merge', 'split'):
+        return 0
+    if cmd == 'diff' and (args.out_of_core or args.transient or args.norms or args.skip_identical):
+        return 0
+    if cmd == 'stats' and (args.series or args.percentiles or args.histogram):
+        return 0
+    if cmd == 'watch' and 'export' not in args.do and 'slice' not in args.do:
+        return 0
+    return 1
+
+def command_task(index, line):
+    ''' runner.Task running a tec_util command line such as "to_plt a.dat -o a.plt" '''
+    from tec_util import batch as batch_jobs
+    from tec_util import runner
+    argv = shlex.split(line)
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit:
+        args = None
+    if args is None or "func" not in args or args.func.__name__ in ('batch', 'run'):
+        message = f"Invalid command {index + 1}: {line}"
+        LOG.error(message)
+        raise ValueError(message)
+    params = vars(args)
+    try:
+        memory = estimate_command_memory(args) or 0
+    except (OSError, ValueError, native.UnsupportedFormat):
+        memory = 0 # Inputs written by earlier commands
+    return runner.Task(
+        f"{index + 1}-{args.func.__name__}",
+        None,
+        argv,
+        batch_jobs.job_files(params, COMMAND_INPUT_ARGS),
+        batch_jobs.job_files(params, COMMAND_OUTPUT_ARGS),
+        memory,
+        command_loads(args),
+    )
+
+def runner_options(args):
+    ''' Keyword arguments of runner.run_tasks given with configure_runner_options '''
+    options = {
+        'max_loads': args.max_loads,
+        'max_memory': args.max_memory,
+        'retries': args.retries,
+        'timeout': args.timeout,
+        'mode': args.mode,
+        'progress': args.progress,
+        'prefetch': args.prefetch,
+        'prefetch_bytes': args.prefetch_mem,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
 
 #-------------------------------------------------------------------------------
 # Subcommmands
 #-------------------------------------------------------------------------------
+def batch(args):
+    ''' Run the jobs of a manifest, resuming where a previous run stopped '''
+    report = tec_util.run_manifest(
+        args.manifest,
+        journal_file = args.journal,
+        force = args.force,
+        keep_going = not args.stop_on_error,
+        jobs = args.jobs,
+        **runner_options(args),
+    )
+    print("{} run, {} skipped, {} failed".format(len(report.done), len(report.skipped), len(report.failed)))
+    if report.failed:
+        message = "Failed jobs: " + ' '.join(report.failed)
+        LOG.error(message)
+        raise RuntimeError(message)
+
+def decimate(args):
+    ''' Write a subsampled preview of a datafile '''
+    tec_util.decimate(
+        args.datafile_in,
+        args.datafile_out,
+        strides = args.strides,
+        num_points = args.points,
+        zone_patterns = args.zones,
+        var_patterns = args.variables,
+        precision = args.precision,
+    )
+
+def derive(args):
+    ''' Append variables computed from expressions to a datafile '''
+    tec_util.derive_variables(
+        args.datafile_in,
+        args.datafile_out,
+        args.expression,
+        zone_patterns = args.zones,
+        coordinates = args.coordinates,
+        precision = args.precision,
+        jobs = args.jobs,
+    )
+
+def compare(args):
+    ''' Compare two datafiles zone by zone using content fingerprints '''
+    result = tec_util.compare_datafiles(
+        args.datafile_a,
+        args.datafile_b,
+        zone_patterns = args.zones,
+        var_patterns = args.variables,
+    )
+    for name in result.identical:
+        print(f"identical  {name}")
+    for name, variables in result.changed:
+        print(f"changed    {name}: {' '.join(variables)}")
+    for name in result.missing:
+        print(f"missing    {name}")
+    for name in result.added:
+        print(f"added      {name}")
+    print("{} identical, {} changed, {} missing, {} added".format(
+        len(result.identical), len(result.changed), len(result.missing), len(result.added),
+    ))
+
 def diff(args):
     ''' Compute delta between two solution files '''
+    if args.datafile_out is None and not args.norms:
+        args.datafile_out = 'diff.plt'
     tec_util.difference_datasets(
         args.datafile_new,
         args.datafile_old,
@@ -60,6 +285,14 @@ def diff(args):
         zone_patterns = args.zones,
         var_patterns = args.variables,
         nskip = args.nskip,
+        precision = args.precision,
+        jobs = args.jobs,
+        out_of_core = args.out_of_core,
+        transient = args.transient,
+        interpolate_time = args.interp_time,
+        norms_out = args.norms,
+        skip_identical = args.skip_identical,
+        share = args.share,
     )
 
 def export(args):
@@ -84,13 +317,22 @@ def extract(args):
         args.datafile_out,
         zone_patterns = args.zones,
         var_patterns = args.variables,
+        precision = args.precision,
+        box = args.box,
+        where = args.where,
     )
 
+def hash(args):
+    ''' Print content fingerprints of each zone and zone-variable of a datafile '''
+    for zone in tec_util.datafile_fingerprints(args.datafile_in, args.zones, args.variables):
+        print(f"{zone.structure}  {zone.name}")
+        for name, digest in zone.variables.items():
+            print(f"{digest}  {zone.name}/{name}")
+
 def info(args):
     ''' Print summary information about a dataset '''
-    import tecplot as tp
     from tecplot.constant import ZoneType as zt
-    dataset = tp.data.load_tecplot(args.datafile_in)
+    dataset = tec_util.load_tecplot(args.datafile_in)
     has_times = hasattr(dataset, 'num_solution_times') # Missing in early versions of pytecplot
 
     # Determine width for pretty printed data
@@ -121,9 +363,13 @@ def info(args):
         print(line.format(col_width, leader, z=zone))
 
     print("\nVariable Info:")
+    stats = tec_util.compute_statistics(args.datafile_in, sidecar=True) if args.sidecar else None
     for var in dataset.variables():
         vmin,vmax = float('inf'), -float('inf')
-        for i in range(var.num_zones):
+        if stats is not None:
+            vmin = min(zone.min for zone in stats[var.name])
+            vmax = max(zone.max for zone in stats[var.name])
+        for i in range(var.num_zones if stats is None else 0):
             vmin = min(vmin, var.values(i).min())
             vmax = max(vmax, var.values(i).max())
         leader = "[{v.index:^3d}] {v.name}".format(v=var)
@@ -143,6 +389,44 @@ def interp(args):
         args.datafile_src,
         args.datafile_tgt,
         args.datafile_out,
+        precision = args.precision,
+    )
+
+def integrate(args):
+    ''' Integrate forces and fluxes over surface zones and slices '''
+    rows = tec_util.integrate_surfaces(
+        args.datafile_in,
+        scalars = args.scalar or [],
+        forces = args.force or [],
+        fluxes = args.flux or [],
+        zone_patterns = args.zones,
+        coordinates = args.coordinates,
+        center = args.center,
+        output = args.output,
+        cache_dir = args.geometry_cache,
+        jobs = args.jobs,
+        sample_geometry = args.sample_geometry,
+    )
+    rows = rows + tec_util.integrate.total_integrals(rows)
+    columns = list(rows[0].values) if rows else []
+    zone_width = max([len('Zone,')] + [len(r.zone)+1 for r in rows])
+    print('{:{zone_width}s}'.format('Zone,', zone_width=zone_width) + ''.join(', {:>15s}'.format(c) for c in columns))
+    for row in rows:
+        print(
+            '{:{zone_width}s}'.format(row.zone+',', zone_width=zone_width) +
+            ''.join(', {:15.6e}'.format(row.values[c]) for c in columns)
+        )
+    print()
+
+def merge(args):
+    ''' Concatenate the zones of several datafiles into one '''
+    tec_util.merge_datafiles(
+        tec_util.series.expand_datafiles(args.datafile_in),
+        args.datafile_out,
+        zone_patterns = args.zones,
+        var_patterns = args.variables,
+        precision = args.precision,
+        common = args.common,
     )
 
 def slice(args):
@@ -150,15 +434,36 @@ def slice(args):
     tec_util.slice_surfaces(
         args.slice_file,
         args.datafile_in,
-        args.datafile_out
+        args.datafile_out,
+        precision = args.precision,
+    )
+
+def split(args):
+    ''' Write each zone (or group of zones) of a datafile to its own file '''
+    tec_util.split_dataset(
+        args.datafile_in,
+        args.output,
+        groups = args.group,
+        zone_patterns = args.zones,
+        var_patterns = args.variables,
+        precision = args.precision,
+        jobs = args.jobs,
     )
 
 def stats(args):
     ''' Extract zone max/min/averages for each variable. '''
+    if args.series:
+        return stats_series(args)
+    if args.percentiles or args.histogram:
+        return stats_distributions(args)
+    if len(args.datafile_in) > 1:
+        LOG.error("Several datafiles given without --series, --percentiles or --histogram")
+        raise RuntimeError("Several datafiles given without --series, --percentiles or --histogram")
     stats = tec_util.compute_statistics(
-        args.datafile_in,
-        zone_patterns = arg.zones,
-        var_patterns = args.variables,
+        args.datafile_in[0],
+        zone_patterns = args.zones,
+        variable_patterns = args.variables,
+        sidecar = args.sidecar,
     )
 
     columns = ['Variable,', 'ZoneID', 'Zone,', 'Min', 'Max', 'Mean']
@@ -183,13 +488,75 @@ def stats(args):
             )
     print()
 
+def stats_distributions(args):
+    ''' Approximate percentiles and histograms of each variable over all zones and files. '''
+    datafiles = tec_util.series.expand_datafiles(args.datafile_in)
+    sketches = tec_util.compute_distributions(
+        datafiles,
+        zone_patterns = args.zones,
+        variable_patterns = args.variables,
+        bins = args.histogram,
+        jobs = args.jobs,
+    )
+    percentiles = args.percentiles or []
+    columns = ['Variable,', 'Count', 'Min'] + ['p{:g}'.format(p) for p in percentiles] + ['Max']
+    var_width = max([len(columns[0])] + [len(v)+1 for v in sketches])
+    print('{:{var_width}s}'.format(columns[0], var_width=var_width) + ''.join(', {:>15s}'.format(c) for c in columns[1:]))
+    for var_name, sketch in sketches.items():
+        values = [sketch.quantiles.min] + list(sketch.quantiles.quantiles([p / 100 for p in percentiles])) + [sketch.quantiles.max]
+        print(
+            '{:{var_width}s}, {:15d}'.format(var_name+',', sketch.count, var_width=var_width) +
+            ''.join(', {:15.6e}'.format(v) for v in values)
+        )
+    print()
+    for var_name, sketch in sketches.items():
+        if sketch.histogram is None:
+            continue
+        hist = sketch.histogram
+        print("Histogram of {} ({} below, {} above range):".format(var_name, hist.underflow, hist.overflow))
+        for lo, hi, count in zip(hist.edges[:-1], hist.edges[1:], hist.counts):
+            print('  [{:+13.6e}, {:+13.6e}] {:12d}'.format(lo, hi, count))
+        print()
+
+def stats_series(args):
+    ''' Min/max/mean/std of each zone-variable over a series of solution times. '''
+    zones, variables, total = tec_util.compute_series_statistics(
+        args.datafile_in,
+        output = args.output,
+        zone_patterns = args.zones,
+        variable_patterns = args.variables,
+        prefetch = args.prefetch,
+        prefetch_bytes = args.prefetch_mem,
+    )
+    columns = ['Variable,', 'Zone,', 'Min', 'Time', 'Max', 'Time', 'Mean', 'Std']
+    var_width  = max([len(columns[0])] + [len(v)+1 for v in variables])
+    zone_width = max([len(columns[1])] + [len(z)+1 for z in zones])
+    print(
+        '{:{var_width}s} {:{zone_width}s}' .format(*columns[:2], var_width=var_width, zone_width=zone_width) +
+        ''.join(', {:>15s}'.format(c) for c in columns[2:])
+    )
+    std = total.variance ** 0.5
+    for iv, var_name in enumerate(variables):
+        for iz, zone_name in enumerate(zones):
+            print(
+                '{:{var_width}s} {:{zone_width}s}'.format(
+                    var_name+',', zone_name+',', var_width=var_width, zone_width=zone_width,
+                ) +
+                ''.join(', {:15.6e}'.format(v) for v in [
+                    total.min[iz,iv], total.tmin[iz,iv], total.max[iz,iv], total.tmax[iz,iv],
+                    total.mean[iz,iv], std[iz,iv],
+                ])
+            )
+    print()
+
 def rename_vars(args):
     ''' Rename variables within the dataset. '''
     name_map = dict([np.split('=') for np in args.name_pairs])
     tec_util.rename_variables(
         args.datafile_in,
         args.datafile_out,
-        name_map
+        name_map,
+        precision = args.precision,
     )
 
 def rename_zones(args):
@@ -198,7 +565,8 @@ def rename_zones(args):
     tec_util.rename_zones(
         args.datafile_in,
         args.datafile_out,
-        name_map
+        name_map,
+        precision = args.precision,
     )
 
 def revolve(args):
@@ -218,24 +586,181 @@ def revolve(args):
         planes       = args.num_planes,
         angle        = args.angle,
         vector_vars  = vectors,
+        precision    = args.precision,
+        share        = args.share,
     )
 
+def run(args):
+    ''' Run tec_util command lines concurrently, within memory and load limits '''
+    from tec_util import runner
+    lines = list(args.commands)
+    for filename in args.file or []:
+        with open(filename) as f:
+            lines.extend(l.strip() for l in f if l.strip() and not l.lstrip().startswith('#'))
+    if not lines:
+        message = "No commands to run"
+        LOG.error(message)
+        raise ValueError(message)
+    tasks = [command_task(i, line) for i, line in enumerate(lines)]
+    report = runner.run_jobs(
+        tasks,
+        max_jobs = args.jobs,
+        keep_going = not args.stop_on_error,
+        **runner_options(args),
+    )
+    print("{} run, {} failed".format(len(report.done), len(report.failed)))
+    if len(report.done) < len(tasks):
+        message = "Failed commands: " + ' '.join(t.id for t in tasks if t.id not in report.done)
+        LOG.error(message)
+        raise RuntimeError(message)
+
 def to_ascii(args):
     ''' Convert a Tecplot datafile to ascii format '''
-    import tecplot as tp
-    dataset = tp.data.load_tecplot(args.datafile_in)
-    tp.data.save_tecplot_ascii(args.datafile_out, dataset=dataset)
+    dataset = tec_util.load_tecplot(args.datafile_in)
+    tec_util.write_dataset(args.datafile_out, dataset, args.precision, ascii=True)
 
 def to_plt(args):
     ''' Convert a Tecplot datafile to binary (plt) format '''
-    import tecplot as tp
-    dataset = tp.data.load_tecplot(args.datafile_in)
-    tp.data.save_tecplot_plt(args.datafile_out, dataset=dataset)
+    dataset = tec_util.load_tecplot(args.datafile_in)
+    tec_util.write_dataset(args.datafile_out, dataset, args.precision, ascii=False)
+
+def watch(args):
+    ''' Process each new datafile written to a directory, appending to the outputs '''
+    from tec_util import watch as watcher
+    report = watcher.watch_directory(
+        args.directory,
+        actions = args.do,
+        output_dir = args.output_dir,
+        pattern = args.pattern,
+        slice_file = args.slice_file,
+        layout_file = args.layout,
+        variable_patterns = args.variables,
+        zone_patterns = args.zones,
+        settle = args.settle,
+        interval = args.interval,
+        inotify = False if args.poll else None,
+        idle_timeout = args.idle_timeout,
+        max_files = args.max_files,
+        prefetch = args.prefetch,
+        prefetch_bytes = args.prefetch_mem,
+    )
+    print("{} processed, {} failed".format(len(report.processed), len(report.failed)))
 
 
 #-------------------------------------------------------------------------------
 # Subcommand Parser Configurators
 #-------------------------------------------------------------------------------
+def configure_precision_option(parser):
+    parser.add_argument(
+        '--precision',
+        help = (
+            "precision of the field data written to the output file; auto "
+            "keeps the precision of each variable (def: auto)"
+        ),
+        choices = ['auto', 'single', 'double'],
+        default = 'auto',
+    )
+
+def configure_share_option(parser):
+    parser.add_argument(
+        '--share',
+        help = (
+            "store variables and connectivity identical between zones once, "
+            "shared, with the built-in writer"
+        ),
+        action = 'store_true',
+    )
+
+def configure_batch_parser(parser):
+    parser.add_argument(
+        'manifest',
+        help = "JSON file listing the jobs to run",
+    )
+    parser.add_argument(
+        '--journal',
+        help = "JSON-lines file recording completed jobs (def: <manifest>.journal)",
+        default = None,
+    )
+    parser.add_argument(
+        '--force',
+        help = "Run all jobs, even those that are up to date",
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '--stop-on-error',
+        help = "Stop at the first job that fails",
+        action = 'store_true',
+    )
+    configure_runner_options(parser)
+
+def configure_runner_options(parser):
+    parser.add_argument(
+        '-j', '--jobs',
+        help = "Number of jobs run at once (def: 1)",
+        type = int,
+        default = 1,
+    )
+    parser.add_argument(
+        '--max-loads',
+        help = "Number of jobs loading datasets into Tecplot at once (def: no limit)",
+        type = int,
+        default = None,
+    )
+    parser.add_argument(
+        '--max-memory',
+        help = "Estimated field data held by the running jobs, e.g. 16G (def: no limit)",
+        metavar = 'SIZE',
+        type = size_spec,
+        default = None,
+    )
+    parser.add_argument(
+        '--retries',
+        help = "Number of times a failed job is run again (def: 0)",
+        type = int,
+        default = None,
+    )
+    parser.add_argument(
+        '--timeout',
+        help = "Seconds after which a running job is cancelled and failed (def: none)",
+        type = float,
+        default = None,
+    )
+    parser.add_argument(
+        '--mode',
+        help = (
+            "run each job in a subprocess of its own, or in a pool of worker "
+            "processes (def: subprocess)"
+        ),
+        choices = ['subprocess', 'process'],
+        default = None,
+    )
+    parser.add_argument(
+        '--progress',
+        help = "Show a live progress line on stderr (def: if it is a terminal)",
+        action = 'store_true',
+        default = None,
+    )
+    parser.add_argument(
+        '--no-progress',
+        help = "Do not show the progress line",
+        dest = 'progress',
+        action = 'store_false',
+        default = None,
+    )
+    parser.add_argument(
+        '--prefetch',
+        help = "Number of upcoming jobs whose input files are read ahead in the background (def: 0)",
+        type = int,
+        default = None,
+    )
+    parser.add_argument(
+        '--prefetch-mem',
+        help = "Cap on the bytes read ahead by --prefetch, e.g. 512M (def: 1G)",
+        metavar = 'SIZE',
+        type = size_spec,
+        default = None,
+    )
+
 def configure_diff_parser(parser):
     parser.add_argument(
         'datafile_new',
@@ -247,8 +772,8 @@ def configure_diff_parser(parser):
     )
     parser.add_argument(
         '-o', '--datafile_out',
-        help = "file where differences are saved (def: diff.plt)",
-        default = "diff.plt",
+        help = "file where differences are saved (def: diff.plt, or none with --norms)",
+        default = None,
     )
     parser.add_argument(
         '-z', '--zones',
@@ -271,6 +796,42 @@ def configure_diff_parser(parser):
         type = int,
         default = 3,
     )
+    parser.add_argument(
+        '-j', '--jobs',
+        help = "Number of worker processes used to compute deltas (def: 1)",
+        type = int,
+        default = 1,
+    )
+    parser.add_argument(
+        '--out-of-core',
+        help = "Stream deltas to the output file instead of loading both datasets",
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '--transient',
+        help = (
+            "Pair zones by strand and solution time instead of by position "
+            "and stream through the timesteps (implies --out-of-core)"
+        ),
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '--interp-time',
+        help = "With --transient, interpolate the old dataset linearly in time where solution times differ",
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '--norms',
+        help = "CSV file where L2/Linf norms of each delta are saved, per zone and solution time",
+        default = None,
+    )
+    parser.add_argument(
+        '--skip-identical',
+        help = "write zero deltas without subtracting zone-variables whose fingerprints match",
+        action = 'store_true',
+    )
+    configure_precision_option(parser)
+    configure_share_option(parser)
 
 def configure_export_parser(parser):
     parser.add_argument(
@@ -325,6 +886,108 @@ def configure_export_parser(parser):
         type = int,
     )
 
+def configure_compare_parser(parser):
+    parser.add_argument(
+        'datafile_a',
+        help = "first dataset to be compared",
+    )
+    parser.add_argument(
+        'datafile_b',
+        help = "second dataset to be compared",
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to compare (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-v', '--variables',
+        help = "Comma-separated list of variables to compare (supports globs)",
+        type = glob_spec,
+        default = None,  # all vars
+    )
+
+def configure_decimate_parser(parser):
+    parser.add_argument(
+        'datafile_in',
+        help = "input dataset to be decimated",
+    )
+    parser.add_argument(
+        '-o', '--datafile_out',
+        help = "file where the preview is saved (def: preview.plt)",
+        default = "preview.plt",
+    )
+    parser.add_argument(
+        '--strides',
+        help = "comma-separated I,J,K strides of ordered zones (def: 2,2,2)",
+        type = strides_spec,
+        default = (2,2,2),
+    )
+    parser.add_argument(
+        '--points',
+        help = (
+            "target number of points of each FE zone, which is decimated by "
+            "vertex clustering (def: number of points / product of strides)"
+        ),
+        metavar = 'N',
+        type = int,
+        default = None,
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to decimate (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-v', '--variables',
+        help = "Comma-separated list of variables to write (supports globs)",
+        type = glob_spec,
+        default = None,  # all vars
+    )
+    configure_precision_option(parser)
+
+def configure_derive_parser(parser):
+    parser.add_argument(
+        'datafile_in',
+        help = "input dataset to be processed",
+    )
+    parser.add_argument(
+        '-o', '--datafile_out',
+        help = "file where outputs are saved (def: derived.plt)",
+        default = "derived.plt",
+    )
+    parser.add_argument(
+        '-e', '--expression',
+        help = (
+            'expression "<name> = <expression>" over variable names, e.g. '
+            '"M = sqrt(u**2+v**2+w**2)/c"; names with spaces go in braces and '
+            'ddx/ddy/ddz take gradients in ordered zones; may be repeated'
+        ),
+        action = 'append',
+        required = True,
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to process (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-c', '--coordinates',
+        help = "Comma-separated x,y[,z] variables used by gradients (def: first three)",
+        type = lambda arg: [dequote(name) for name in arg.split(',')],
+        default = None,
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help = "Number of worker processes evaluating zones (def: 1)",
+        type = int,
+        default = 1,
+    )
+    configure_precision_option(parser)
+
 def configure_extract_parser(parser):
     parser.add_argument(
         'datafile_in',
@@ -347,12 +1010,55 @@ def configure_extract_parser(parser):
         type = glob_spec,
         default = None,  # all vars
     )
+    parser.add_argument(
+        '--box',
+        help = (
+            "clip zones to a box in the coordinate variables, given as "
+            "xmin,xmax,ymin,ymax[,zmin,zmax]"
+        ),
+        type = lambda arg: [float(b) for b in arg.split(',')],
+        default = None,
+    )
+    parser.add_argument(
+        '--where',
+        help = (
+            'keep only data satisfying a condition such as "p>1e5" '
+            '(operators: < <= > >= == !=); may be repeated'
+        ),
+        metavar = 'CONDITION',
+        action = 'append',
+        default = None,
+    )
+    configure_precision_option(parser)
+
+def configure_hash_parser(parser):
+    parser.add_argument(
+        'datafile_in',
+        help = "dataset to be fingerprinted",
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to fingerprint (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-v', '--variables',
+        help = "Comma-separated list of variables to fingerprint (supports globs)",
+        type = glob_spec,
+        default = None,  # all vars
+    )
 
 def configure_info_parser(parser):
     parser.add_argument(
         "datafile_in",
         help = "file to print metadata for",
     )
+    parser.add_argument(
+        "--sidecar",
+        help = "Take variable ranges from the statistics sidecar file, updating it if needed",
+        action = "store_true",
+    )
 
 def configure_interp_parser(parser):
     parser.add_argument(
@@ -368,6 +1074,109 @@ def configure_interp_parser(parser):
         help = "file where outputs are saved (def: interp.plt)",
         default = "interp.plt",
     )
+    configure_precision_option(parser)
+
+def configure_integrate_parser(parser):
+    parser.add_argument(
+        'datafile_in',
+        help = "datafiles (or glob patterns), e.g. the timesteps of a run",
+        nargs = '+',
+    )
+    parser.add_argument(
+        '-s', '--scalar',
+        help = "variable f integrated as f dA, e.g. heat flux; may be repeated",
+        action = 'append',
+        default = None,
+    )
+    parser.add_argument(
+        '-f', '--force',
+        help = "variable p integrated as p n dA, with moments; may be repeated",
+        action = 'append',
+        default = None,
+    )
+    parser.add_argument(
+        '-F', '--flux',
+        help = "comma-separated vector u,v[,w] integrated as u.n dA; may be repeated",
+        type = lambda arg: [dequote(name) for name in arg.split(',')],
+        action = 'append',
+        default = None,
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to integrate (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-c', '--coordinates',
+        help = "Comma-separated x,y[,z] variables (def: first three)",
+        type = lambda arg: [dequote(name) for name in arg.split(',')],
+        default = None,
+    )
+    parser.add_argument(
+        '--center',
+        help = "comma-separated reference point of the moments (def: 0,0,0)",
+        type = lambda arg: [float(c) for c in arg.split(',')],
+        default = (0.0, 0.0, 0.0),
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help = "CSV file where the integrals of each zone and their totals are saved",
+        default = None,
+    )
+    parser.add_argument(
+        '--geometry-cache',
+        help = "directory where zone geometries are cached for later runs on the same mesh",
+        metavar = 'DIR',
+        default = None,
+    )
+    parser.add_argument(
+        '--sample-geometry',
+        help = (
+            "key cached geometries on a sample of the coordinates rather than all of them; "
+            "faster, but misses a mesh that moves only between the sampled points"
+        ),
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help = "Number of worker processes integrating zones (def: 1)",
+        type = int,
+        default = 1,
+    )
+
+def configure_merge_parser(parser):
+    parser.add_argument(
+        'datafile_in',
+        help = "datafiles (or glob patterns) whose zones are merged, in order",
+        nargs = '+',
+    )
+    parser.add_argument(
+        '-o', '--datafile_out',
+        help = "file where the merged dataset is saved (def: merged.plt)",
+        default = "merged.plt",
+    )
+    parser.add_argument(
+        '--common',
+        help = (
+            "keep only the variables found in every datafile; by default, "
+            "variables missing in a datafile are passive in its zones"
+        ),
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to merge (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-v', '--variables',
+        help = "Comma-separated list of variables to write (supports globs)",
+        type = glob_spec,
+        default = None,  # all vars
+    )
+    configure_precision_option(parser)
 
 def configure_rename_vars_parser(parser):
     parser.add_argument(
@@ -385,6 +1194,7 @@ def configure_rename_vars_parser(parser):
         help = "file where renamed dataset is saved (def: renamed.plt)",
         default = "renamed.plt",
     )
+    configure_precision_option(parser)
 
 def configure_rename_zones_parser(parser):
     parser.add_argument(
@@ -402,6 +1212,7 @@ def configure_rename_zones_parser(parser):
         help = "file where renamed dataset is saved (def: renamed.plt)",
         default = "renamed.plt",
     )
+    configure_precision_option(parser)
 
 def configure_revolve_parser(parser):
     parser.add_argument(
@@ -438,6 +1249,27 @@ def configure_revolve_parser(parser):
         action = 'append',
         default = None
     )
+    configure_precision_option(parser)
+    configure_share_option(parser)
+
+def configure_run_parser(parser):
+    parser.add_argument(
+        'commands',
+        help = 'tec_util command lines to run, each quoted, e.g. "to_plt a.dat -o a.plt"',
+        nargs = '*',
+    )
+    parser.add_argument(
+        '-f', '--file',
+        help = "file listing command lines to run, one per line ('#' starts a comment)",
+        action = 'append',
+        default = None,
+    )
+    parser.add_argument(
+        '--stop-on-error',
+        help = "Cancel the other commands when one fails",
+        action = 'store_true',
+    )
+    configure_runner_options(parser)
 
 def configure_slice_parser(parser):
     parser.add_argument(
@@ -453,11 +1285,56 @@ def configure_slice_parser(parser):
         help = "file where extracted slices will be saved (def: slices.plt)",
         default = "slices.plt",
     )
+    configure_precision_option(parser)
+
+def configure_split_parser(parser):
+    parser.add_argument(
+        'datafile_in',
+        help = "input dataset to be split",
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help = (
+            "template of the output filenames, with fields {index} and {name} "
+            "(zone name or group patterns) (def: {index:04d}_{name}.plt)"
+        ),
+        default = tec_util.shard.DEFAULT_TEMPLATE,
+    )
+    parser.add_argument(
+        '-g', '--group',
+        help = (
+            "Comma-separated list of zones (supports globs) written to one file; "
+            "may be repeated (def: one file per zone)"
+        ),
+        type = glob_spec,
+        action = 'append',
+        default = None,
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones to split (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '-v', '--variables',
+        help = "Comma-separated list of variables to write (supports globs)",
+        type = glob_spec,
+        default = None,  # all vars
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help = "Number of worker processes writing files (def: 1)",
+        type = int,
+        default = 1,
+    )
+    configure_precision_option(parser)
 
 def configure_stats_parser(parser):
     parser.add_argument(
         "datafile_in",
-        help = "file to be analyzed",
+        help = "file to be analyzed; with --series, several files or glob patterns",
+        nargs = "+",
     )
     parser.add_argument(
         "-v", "--variables",
@@ -471,6 +1348,61 @@ def configure_stats_parser(parser):
         type = glob_spec,
         default = None,  # all zones
     )
+    parser.add_argument(
+        "--sidecar",
+        help = (
+            "Answer from the statistics sidecar file (<datafile>.stats.json) "
+            "and recompute only zones that changed"
+        ),
+        action = "store_true",
+    )
+    parser.add_argument(
+        "--percentiles",
+        help = (
+            "Comma-separated list of percentiles (e.g. 1,50,99) of each variable over "
+            "all zones and files, estimated with bounded-memory sketches"
+        ),
+        type = lambda arg: [float(p) for p in arg.split(',')],
+        default = None,
+    )
+    parser.add_argument(
+        "--histogram",
+        help = "Number of bins of a histogram of each variable over all zones and files",
+        metavar = "BINS",
+        type = int,
+        default = 0,
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        help = "With --percentiles/--histogram, number of worker processes, one file each (def: 1)",
+        type = int,
+        default = 1,
+    )
+    parser.add_argument(
+        "--series",
+        help = "Statistics over a series of solution times: one per file, "
+               "or all solution times of a single file. Files are read one "
+               "timestep at a time.",
+        action = "store_true",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help = "With --series, file (.csv or .npz) where the statistics "
+               "of every timestep are saved.",
+        default = None,
+    )
+    parser.add_argument(
+        "--prefetch",
+        help = "With --series, number of datafiles read ahead in the background (def: 0)",
+        type = int,
+        default = 0,
+    )
+    parser.add_argument(
+        "--prefetch-mem",
+        help = "Cap on the bytes read ahead by --prefetch, e.g. 512M (def: 1G)",
+        type = size_spec,
+        default = tec_util.prefetch.MAX_BYTES,
+    )
 
 def configure_to_ascii_parser(parser):
     parser.add_argument(
@@ -482,6 +1414,7 @@ def configure_to_ascii_parser(parser):
         help = "file where ascii data is saved (def: dataset.dat)",
         default = "dataset.dat",
     )
+    configure_precision_option(parser)
 
 def configure_to_plt_parser(parser):
     parser.add_argument(
@@ -493,6 +1426,93 @@ def configure_to_plt_parser(parser):
         help = "file where binary data is saved (def: dataset.plt)",
         default = "dataset.plt",
     )
+    configure_precision_option(parser)
+
+def configure_watch_parser(parser):
+    parser.add_argument(
+        'directory',
+        help = "directory where the solver writes datafiles",
+    )
+    parser.add_argument(
+        '--do',
+        help = "Comma-separated actions applied to each new file: stats, slice, export (def: stats)",
+        type = glob_spec,
+        default = ['stats'],
+    )
+    parser.add_argument(
+        '-o', '--output_dir',
+        help = "directory of the aggregated outputs and journal (def: <directory>/watch)",
+        default = None,
+    )
+    parser.add_argument(
+        '-p', '--pattern',
+        help = "glob pattern of the datafiles in directory (def: *.plt)",
+        default = "*.plt",
+    )
+    parser.add_argument(
+        '--slice-file',
+        help = "file defining the slices extracted by the slice action",
+        default = None,
+    )
+    parser.add_argument(
+        '--layout',
+        help = "layout whose pages are exported by the export action",
+        default = None,
+    )
+    parser.add_argument(
+        '-v', '--variables',
+        help = "Comma-separated list of variables whose statistics are computed (supports globs)",
+        type = glob_spec,
+        default = None,  # all vars
+    )
+    parser.add_argument(
+        '-z', '--zones',
+        help = "Comma-separated list of zones whose statistics are computed (supports globs)",
+        type = glob_spec,
+        default = None, # all zones
+    )
+    parser.add_argument(
+        '--settle',
+        help = "seconds a file must stay the same size to be complete (def: 2)",
+        type = float,
+        default = 2.0,
+    )
+    parser.add_argument(
+        '--interval',
+        help = "seconds between two scans of the directory (def: 1)",
+        type = float,
+        default = 1.0,
+    )
+    parser.add_argument(
+        '--poll',
+        help = "poll the directory even if inotify is available",
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '--idle-timeout',
+        help = "stop after this many seconds without new files (def: run until interrupted)",
+        type = float,
+        default = None,
+    )
+    parser.add_argument(
+        '--max-files',
+        help = "stop after processing this many files",
+        type = int,
+        default = None,
+    )
+    parser.add_argument(
+        '--prefetch',
+        help = "number of new files read ahead in the background while one is processed (def: 0)",
+        type = int,
+        default = 0,
+    )
+    parser.add_argument(
+        '--prefetch-mem',
+        help = "cap on the bytes read ahead by --prefetch, e.g. 512M (def: 1G)",
+        metavar = 'SIZE',
+        type = size_spec,
+        default = tec_util.prefetch.MAX_BYTES,
+    )
 
 
 #-------------------------------------------------------------------------------
@@ -521,6 +1541,27 @@ def build_parser():
         dest = 'loglevel',
         const = logging.DEBUG,
     )
+    parser.add_argument(
+        '--profile',
+        help = 'write timing spans to a Chrome trace file and print a summary',
+        metavar = 'out.json',
+        default = None,
+    )
+    parser.add_argument(
+        '--mem-report',
+        help = 'record RSS and Python (tracemalloc) memory peaks of each phase and print a summary',
+        action = 'store_true',
+    )
+    parser.add_argument(
+        '--mem-budget',
+        help = (
+            'estimate memory use from the datafile headers before doing any work; '
+            'switch to a streaming mode (diff) or fail if it exceeds SIZE (e.g. 8G)'
+        ),
+        metavar = 'SIZE',
+        type = size_spec,
+        default = None,
+    )
     subparsers = parser.add_subparsers(
         metavar = 'cmd',
         help = 'Subcommand to execute',
@@ -529,18 +1570,28 @@ def build_parser():
     # Subcommand parsers
     cmds = {
         # name            function       parser
+        'batch':        ( batch,         configure_batch_parser        ),
+        'compare':      ( compare,       configure_compare_parser      ),
+        'decimate':     ( decimate,      configure_decimate_parser     ),
+        'derive':       ( derive,        configure_derive_parser       ),
         'diff':         ( diff,          configure_diff_parser         ),
         'export':       ( export,        configure_export_parser       ),
         'extract':      ( extract,       configure_extract_parser      ),
+        'hash':         ( hash,          configure_hash_parser         ),
         'info':         ( info,          configure_info_parser         ),
+        'integrate':    ( integrate,     configure_integrate_parser    ),
         'interp':       ( interp,        configure_interp_parser       ),
+        'merge':        ( merge,         configure_merge_parser        ),
         'slice':        ( slice,         configure_slice_parser        ),
+        'split':        ( split,         configure_split_parser        ),
         'stats':        ( stats,         configure_stats_parser        ),
         'rename_vars':  ( rename_vars,   configure_rename_vars_parser  ),
         'rename_zones': ( rename_zones,  configure_rename_zones_parser ),
         'revolve':      ( revolve,       configure_revolve_parser      ),
+        'run':          ( run,           configure_run_parser          ),
         'to_ascii':     ( to_ascii,      configure_to_ascii_parser     ),
         'to_plt':       ( to_plt,        configure_to_plt_parser       ),
+        'watch':        ( watch,         configure_watch_parser        ),
     }
     for name, (action, configure_func) in cmds.items():
         sp = subparsers.add_parser(
@@ -557,7 +1608,18 @@ def main(args):
     parser = build_parser()
     args = parser.parse_args(args)
     logging.getLogger('tec_util').setLevel(args.loglevel)
-    if "func" in args:
+    if "func" in args and args.mem_budget is not None:
+        check_memory_budget(args)
+    if "func" in args and (args.profile or args.mem_report):
+        with instrument.recording(memory=args.mem_report) as recorder:
+            try:
+                with instrument.span(args.func.__name__):
+                    args.func(args)
+            finally:
+                if args.profile:
+                    recorder.write_chrome_trace(args.profile)
+                print(recorder.format_summary(), file=sys.stderr)
+    elif "func" in args:
         args.func(args)
     else:
         parser.print_help()
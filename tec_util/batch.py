@@ -0,0 +1,266 @@
+''' Resumable batch processing of a job manifest.
+
+A manifest is a JSON file listing calls of tec_util API functions:
+
+    {
+        "defaults": {"precision": "single"},
+        "jobs": [
+            {"id": "case1", "function": "difference_datasets",
+             "args": {"datafile_new": "new/case1.plt", "datafile_old": "old/case1.plt",
+                      "datafile_out": "diff/case1.plt", "nskip": 3}},
+            {"id": "case1-slices", "function": "slice_surfaces",
+             "args": {"slice_file": "slices.py", "datafile_in": "new/case1.plt",
+                      "datafile_out": "slices/case1.plt"}}
+        ]
+    }
+
+"defaults" are merged into the args of every job whose function accepts
+them. The input and output files of a job are taken from its args (see
+job_files) unless listed explicitly as "inputs" and "outputs". Glob
+patterns among them are expanded when the job is checked or recorded, so
+they also match files written by earlier jobs.
+
+Each completed job is appended to a JSON-lines journal with the content
+hashes of its inputs and outputs. When the manifest is run again, jobs whose
+args, inputs and outputs are unchanged since they completed are skipped, so
+a run that was killed resumes where it stopped. Since outputs are written
+atomically (see core.atomic_output), a killed job never leaves a truncated
+datafile that could be mistaken for a complete one. Jobs may also run
+concurrently, within limits on memory and Tecplot loads (see runner.py).
+With prefetch, the input files of the next jobs are read into the page cache
+in the background while a job runs (see prefetch.py).
+'''
+import collections
+import glob
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from . import core
+from . import integrate
+from . import series
+from . import shard
+from .prefetch import MAX_BYTES, Prefetcher
+
+LOG = logging.getLogger(__name__)
+
+FUNCTIONS = {
+    f.__name__: f for f in [
+        core.compute_statistics,
+        core.decimate,
+        core.derive_variables,
+        core.difference_datafiles,
+        core.difference_datasets,
+        core.extract,
+        core.interpolate_dataset,
+        core.rename_variables,
+        core.rename_zones,
+        core.revolve_dataset,
+        core.slice_surfaces,
+        integrate.integrate_surfaces,
+        series.compute_series_statistics,
+        shard.merge_datafiles,
+    ]
+}
+INPUT_ARGS = {'datafile_in', 'datafile_new', 'datafile_old', 'datafile_src', 'datafile_tgt', 'slice_file', 'datafiles'}
+OUTPUT_ARGS = {'datafile_out', 'norms_out', 'output'}
+HASH_BLOCK_SIZE = 1 << 20
+
+Job = collections.namedtuple('Job', ['id', 'function', 'args', 'inputs', 'outputs'])
+BatchReport = collections.namedtuple('BatchReport', ['done', 'skipped', 'failed'])
+
+
+#-----------------------------------------------------------------------
+# Manifest
+#-----------------------------------------------------------------------
+def job_files(args, names):
+    ''' Paths passed in the given arguments (which may be single paths or lists) '''
+    files = []
+    for name in sorted(names & args.keys()):
+        value = args[name]
+        if value is None:
+            continue
+        files.extend(value if isinstance(value, (list, tuple)) else [value])
+    return files
+
+def expand_patterns(filenames):
+    ''' Expand glob patterns among filenames; patterns without matches are kept '''
+    return [f for pattern in filenames for f in sorted(glob.glob(pattern)) or [pattern]]
+
+def load_manifest(filename):
+    ''' Return the list of Jobs of a manifest file '''
+    with open(filename) as f:
+        manifest = json.load(f)
+    defaults = manifest.get('defaults', {})
+    jobs = []
+    for i, spec in enumerate(manifest['jobs']):
+        job_id = str(spec.get('id', i))
+        if spec.get('function') not in FUNCTIONS:
+            message = f"Unknown function '{spec.get('function')}' in job {job_id} of {filename}"
+            LOG.error(message)
+            raise ValueError(message)
+        function = FUNCTIONS[spec['function']]
+        parameters = inspect.signature(function).parameters
+        args = {k: v for k, v in defaults.items() if k in parameters}
+        args.update(spec.get('args', {}))
+        jobs.append(Job(
+            job_id,
+            spec['function'],
+            args,
+            spec.get('inputs', job_files(args, INPUT_ARGS)),
+            spec.get('outputs', job_files(args, OUTPUT_ARGS)),
+        ))
+    ids = [job.id for job in jobs]
+    if len(set(ids)) != len(ids):
+        message = f"Duplicate job ids in {filename}"
+        LOG.error(message)
+        raise ValueError(message)
+    return jobs
+
+
+#-----------------------------------------------------------------------
+# Journal
+#-----------------------------------------------------------------------
+def file_hash(filename):
+    ''' BLAKE2b digest of the contents of a file '''
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Journal:
+    ''' Append-only JSON-lines record of completed jobs
+
+    File hashes are cached by (size, mtime) so that unchanged files are not
+    read again when checking whether a job is up to date.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self._hashes = {}
+        self._partial = False # Last line was cut short, e.g. by a killed run
+        if os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    self._partial = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        LOG.warning("Ignoring truncated line in journal %s", filename)
+                        continue
+                    self.entries[entry['id']] = entry
+                    for path, info in list(entry['inputs'].items()) + list(entry['outputs'].items()):
+                        self._hashes[path, info['size'], info['mtime_ns']] = info['hash']
+
+    def file_info(self, filename):
+        ''' {size, mtime_ns, hash} of a file, or None if it does not exist '''
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        key = (filename, stat.st_size, stat.st_mtime_ns)
+        if key not in self._hashes:
+            self._hashes[key] = file_hash(filename)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': self._hashes[key]}
+
+    def files_info(self, filenames):
+        ''' {filename: file_info} with glob patterns expanded to the current matches '''
+        return {f: self.file_info(f) for f in expand_patterns(filenames)}
+
+    def up_to_date(self, job):
+        ''' True if the job completed with the same args, inputs and outputs '''
+        entry = self.entries.get(job.id)
+        if entry is None or entry['status'] != 'done' or entry['args'] != job_key(job):
+            return False
+        for old, new in [(entry['inputs'], self.files_info(job.inputs)),
+                         (entry['outputs'], self.files_info(job.outputs))]:
+            if set(old) != set(new) or any(new[f] is None or new[f]['hash'] != old[f]['hash'] for f in old):
+                return False
+        return True
+
+    def record(self, job, status, elapsed, error=None):
+        ''' Append the outcome of a job, flushed to disk before returning '''
+        entry = {
+            'id': job.id,
+            'status': status,
+            'args': job_key(job),
+            'inputs': {f: i for f, i in self.files_info(job.inputs).items() if i},
+            'outputs': {f: i for f, i in self.files_info(job.outputs).items() if i} if status == 'done' else {},
+            'elapsed': elapsed,
+            'time': time.time(),
+        }
+        if error:
+            entry['error'] = error
+        with open(self.filename, 'a') as f:
+            f.write(('\n' if self._partial else '') + json.dumps(entry) + '\n')
+            self._partial = False
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[job.id] = entry
+
+def job_key(job):
+    ''' JSON-compatible description of what a job computes '''
+    return json.loads(json.dumps({'function': job.function, 'args': job.args}, sort_keys=True))
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+def run_manifest(manifest_file, journal_file=None, force=False, keep_going=True, jobs=1,
+                 prefetch=0, prefetch_bytes=MAX_BYTES, **kwargs):
+    ''' Run the jobs of a manifest, skipping those already completed
+
+    Arguments:
+        manifest_file  Path of the JSON manifest
+        journal_file   Path of the JSON-lines journal (def: manifest_file + '.journal')
+        force          Run every job, even if it is up to date
+        keep_going     Continue with the next job after a failure
+        jobs           Number of jobs run at once
+        prefetch       Number of upcoming jobs whose input files are warmed
+                       in the background (def: 0)
+        prefetch_bytes Cap on the bytes warmed ahead
+
+    With jobs > 1, or any of the other arguments of runner.run_tasks (e.g.
+    max_memory or retries), jobs run concurrently in subprocesses, each one
+    after the jobs writing its inputs. Otherwise they run one at a time in
+    this process.
+
+    Returns a BatchReport with the ids of the done, skipped and failed jobs.
+    '''
+    journal = Journal(journal_file or manifest_file + '.journal')
+    if jobs > 1 or kwargs:
+        from . import runner
+        tasks = [runner.job_task(job) for job in load_manifest(manifest_file)]
+        return runner.run_jobs(
+            tasks, max_jobs=jobs, journal=journal, force=force, keep_going=keep_going,
+            prefetch=prefetch, prefetch_bytes=prefetch_bytes, **kwargs,
+        )
+    jobs = load_manifest(manifest_file)
+    report = BatchReport([], [], [])
+    inputs = Prefetcher([expand_patterns(job.inputs) for job in jobs], prefetch, prefetch_bytes)
+    for i, (job, _) in enumerate(zip(jobs, inputs)):
+        if not force and journal.up_to_date(job):
+            LOG.info("Skip job %s (%d/%d); up to date", job.id, i+1, len(jobs))
+            report.skipped.append(job.id)
+            continue
+        LOG.info("Run job %s (%d/%d): %s", job.id, i+1, len(jobs), job.function)
+        start = time.perf_counter()
+        try:
+            FUNCTIONS[job.function](**job.args)
+        except Exception as e:
+            LOG.exception("Job %s failed", job.id)
+            journal.record(job, 'failed', time.perf_counter() - start, f'{type(e).__name__}: {e}')
+            report.failed.append(job.id)
+            if not keep_going:
+                raise
+            continue
+        journal.record(job, 'done', time.perf_counter() - start)
+        report.done.append(job.id)
+    LOG.info(
+        "Batch done: %d run, %d skipped, %d failed",
+        len(report.done), len(report.skipped), len(report.failed),
+    )
+    return report
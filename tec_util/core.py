@@ -1,50 +1,260 @@
+import bisect
 import collections
+import csv
+import fnmatch
+import glob
 import itertools
 import logging
 import math
 import numpy as np
 import os
+import re
 import sys
-import tempfile
+import contextlib
 from contextlib import contextmanager
 from importlib.machinery import SourceFileLoader
 from statistics import mean
+from . import expr
+from . import instrument
+from . import mesh
+from . import native
 # import tecplot  (deferred to function scope to minimize load time)
 
 LOG = logging.getLogger(__name__)
+WriteReport = collections.namedtuple('WriteReport', ['filename', 'num_bytes', 'precision', 'max_error'])
+ZoneStats = collections.namedtuple('ZoneStats', ['name', 'max', 'min', 'mean', 'std', 'count'])
+
+# NumPy dtypes of the tecplot.constant.FieldDataType members, by name
+FIELD_DTYPES = {'Float': '<f4', 'Double': '<f8', 'Int32': '<i4', 'Int16': '<i2', 'Byte': '<u1', 'Bit': '<u1'}
 
 
 #-----------------------------------------------------------------------
 # Helper Functions
 #-----------------------------------------------------------------------
+class NameIndex:
+    ''' Index of zone/variable names for fast glob-pattern lookup
+
+    The index is built once per dataset. Patterns without wildcards are
+    answered by hash lookup, glob patterns are compiled into a single regex
+    alternation that is applied once per unique name, and patterns with a
+    literal prefix (e.g. "wing*") only scan the bucket of names sharing that
+    prefix. Matching uses the same rules as fnmatch.fnmatch.
+    '''
+    MAGIC = re.compile(r'[*?[]')
+
+    def __init__(self, names):
+        self.indices = collections.defaultdict(list)
+        for i, name in enumerate(names):
+            self.indices[os.path.normcase(name)].append(i)
+        self.sorted_names = sorted(self.indices)
+
+    def bucket(self, prefix):
+        ''' Range of sorted_names starting with prefix '''
+        lo = bisect.bisect_left(self.sorted_names, prefix)
+        hi = bisect.bisect_left(self.sorted_names, prefix[:-1] + chr(ord(prefix[-1])+1))
+        return lo, hi
+
+    def first_matches(self, patterns):
+        ''' Map each matching name to the position of the first pattern it matches '''
+        first = {}
+        globs = []
+        for k, pattern in enumerate(map(os.path.normcase, patterns)):
+            if not self.MAGIC.search(pattern):
+                if pattern in self.indices:
+                    first.setdefault(pattern, k)
+            else:
+                globs.append((k, pattern))
+        if not globs:
+            return first
+
+        # Candidate names are the union of prefix buckets (all names if any
+        # glob pattern starts with a wildcard)
+        prefixes = [self.MAGIC.split(p, 1)[0] for k, p in globs]
+        if all(prefixes):
+            ranges = sorted(self.bucket(p) for p in prefixes)
+            candidates, stop = [], 0
+            for lo, hi in ranges:
+                candidates.extend(self.sorted_names[max(lo, stop):hi])
+                stop = max(stop, hi)
+        else:
+            candidates = self.sorted_names
+
+        regex = re.compile('|'.join(
+            '(?P<p%d>%s)' % (k, fnmatch.translate(p)) for k, p in globs
+        ))
+        for name in candidates:
+            m = regex.match(name)
+            if m:
+                k = int(m.lastgroup[1:])
+                if first.get(name, k) >= k:
+                    first[name] = k
+        return first
+
+    def matching(self, patterns=None):
+        ''' Sorted indices of all items matching any of the patterns '''
+        if patterns is None:
+            return sorted(i for indices in self.indices.values() for i in indices)
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        matches = self.first_matches(patterns)
+        return sorted(i for name in matches for i in self.indices[name])
+
+    def select(self, patterns=None):
+        ''' Indices of items matching patterns, ordered like get_zones/get_variables
+
+        A bare pattern (or None) selects all matching items in dataset order.
+        For a list of patterns, items are ordered by the first pattern they
+        match and deduplicated by name, keeping the last item of each name.
+        '''
+        if not patterns or isinstance(patterns, str):
+            return self.matching(patterns or None)
+        first = self.first_matches(patterns)
+        names = sorted(first, key=lambda name: (first[name], self.indices[name][0]))
+        return [self.indices[name][-1] for name in names]
+
+_NAME_INDEX_CACHE = None
+
+@contextmanager
+def name_index_cache():
+    ''' Reuse the name indexes built by get_zones/get_variables in this context '''
+    global _NAME_INDEX_CACHE
+    outer = _NAME_INDEX_CACHE
+    if outer is None:
+        _NAME_INDEX_CACHE = {}
+    try:
+        yield
+    finally:
+        _NAME_INDEX_CACHE = outer
+
+def name_index(ds, kind):
+    ''' Return the NameIndex of the zones|variables of a dataset '''
+    if kind == 'zones':
+        count, items = ds.num_zones, ds.zones
+    else:
+        count, items = ds.num_variables, ds.variables
+    key = (kind, ds.uid, count)
+    if _NAME_INDEX_CACHE is not None and key in _NAME_INDEX_CACHE:
+        return _NAME_INDEX_CACHE[key]
+    index = NameIndex(item.name for item in items())
+    if _NAME_INDEX_CACHE is not None:
+        _NAME_INDEX_CACHE[key] = index
+    return index
+
+def forget_name_index(ds, kind):
+    ''' Drop the cached NameIndex of the zones|variables of a dataset, e.g. after a rename '''
+    if _NAME_INDEX_CACHE is not None:
+        for key in [k for k in _NAME_INDEX_CACHE if k[:2] == (kind, ds.uid)]:
+            del _NAME_INDEX_CACHE[key]
+
 def get_variables(ds, patterns=None):
     ''' Return list of variable objects matching specified patterns '''
-    if not patterns or isinstance(patterns,str):
-        # Allows bare string input when only one pattern needed
-        result = list(ds.variables(patterns))
-    else:
-        matches = {}
-        for p in patterns:
-            for v in ds.variables(p):
-                matches[v.name] = v
-        result = list(matches.values())
+    with instrument.span('select', kind='variables'):
+        result = [ds.variable(i) for i in name_index(ds, 'variables').select(patterns)]
     assert result, f"No variables in dataset matching {' '.join(patterns)}"
     return result
 
 def get_zones(ds, patterns=None):
     ''' Return list of zone objects matching specified patterns '''
-    if not patterns or isinstance(patterns,str):
-        # Allows bare string input when only one pattern needed
-        result = list(ds.zones(patterns))
-    else:
-        matches = {}
-        for p in patterns:
-            for z in ds.zones(p):
-                matches[z.name] = z
-        result = list(matches.values())
+    with instrument.span('select', kind='zones'):
+        result = [ds.zone(i) for i in name_index(ds, 'zones').select(patterns)]
     assert result, f"No zones in dataset matching {' '.join(patterns)}"
     return result
 
+def load_dataset(datafile, frame, zone_patterns=None, var_patterns=None, extra_variables=(), zone_indices=None,
+                 **kwargs):
+    ''' Load only the zones/variables of a datafile matching the given patterns
+
+    The patterns are resolved against the file header, which is read without
+    loading any field data, and only the matching subset is passed on to
+    tecplot.data.load_tecplot. Variables whose indices appear in extra_variables
+    (e.g. grid coordinates) are always loaded. If the header can't be read
+    natively or no names match, the full datafile is loaded instead.
+    zone_indices, if given, replaces the zones selected by zone_patterns.
+    '''
+    zones, variables = None, None
+    if zone_patterns or var_patterns or zone_indices is not None:
+        with instrument.span('select', file=datafile):
+            try:
+                header = native.read_header(datafile)
+            except native.UnsupportedFormat as e:
+                LOG.debug("Cannot pre-select data from %s: %s", datafile, e)
+            else:
+                if zone_patterns:
+                    zones = NameIndex(z.name for z in header.zones).matching(zone_patterns) or None
+                if var_patterns:
+                    variables = NameIndex(header.variables).matching(var_patterns) or None
+                    if variables is not None:
+                        extra = [i for i in extra_variables if i < len(header.variables)]
+                        variables = sorted(set(variables).union(extra))
+                if zone_indices is not None:
+                    zones = sorted(zone_indices)
+                LOG.debug("Selected zones %s, variables %s from %s", zones, variables, datafile)
+    return load_tecplot(
+        datafile,
+        frame = frame,
+        zones = zones,
+        variables = variables,
+        **kwargs
+    )
+
+def load_tecplot(datafile, **kwargs):
+    ''' Call tecplot.data.load_tecplot, recording a "load" span '''
+    import tecplot as tp
+    with instrument.span('load', file=datafile) as s:
+        dataset = tp.data.load_tecplot(datafile, **kwargs)
+        if s:
+            s.add(bytes=os.path.getsize(datafile), points=dataset_points(dataset))
+    return dataset
+
+def dataset_points(dataset, zones=None):
+    ''' Total number of nodes in the given zones of a dataset (def: all) '''
+    return sum(z.num_points for z in (dataset.zones() if zones is None else zones))
+
+def estimate_memory(datafile, zone_patterns=None, var_patterns=None, extra_variables=()):
+    ''' Estimate the bytes of field data needed to load part of a datafile
+
+    Sums the number of values of every matching zone-variable times the size
+    of its data type, plus the connectivity of FE zones. Only the header (and
+    for PLT files, the zone data layout) is read, so this is cheap compared
+    with loading the data. Shared and passive variables are counted as if
+    they were stored. Raises native.UnsupportedFormat if the file can't be
+    read natively.
+    '''
+    with native.open_dataset(datafile) as reader:
+        zones = NameIndex(z.name for z in reader.zones).matching(zone_patterns)
+        variables = NameIndex(reader.variables).matching(var_patterns)
+        extra = [i for i in extra_variables if i < len(reader.variables)]
+        variables = sorted(set(variables).union(extra))
+        total = 0
+        for iz in zones:
+            zone = reader.zones[iz]
+            for iv in variables:
+                total += native.value_count(zone, iv) * reader.dtype(iz, iv).itemsize
+            if zone.zone_type != 'Ordered':
+                total += 4 * int(np.prod(native.connectivity_shape(zone)))
+    return total
+
+def estimate_streaming_memory(datafile):
+    ''' Estimate the bytes held in memory while streaming a datafile zone by zone
+
+    PLT files are memory-mapped and processed in chunks of at most
+    native.CHUNK_SIZE values, while ASCII files are parsed one zone at a time.
+    '''
+    with native.open_dataset(datafile) as reader:
+        nvars = len(reader.variables)
+        sizes = [native.num_points(z) for z in reader.zones] or [0]
+        if isinstance(reader, native.AsciiReader):
+            return 8 * nvars * max(sizes)
+        return 8 * min(native.CHUNK_SIZE, max(sizes))
+
+def format_bytes(num_bytes):
+    ''' Human-readable byte count, e.g. 1.5 GiB '''
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TiB"
+
 def rescale_frame(frame, num_contour):
     ''' Rescale 1st colormap for 2D and 3D plots, 1st xy-axes for XY plots '''
     import tecplot.constant as tpc
@@ -86,29 +296,648 @@ def set_contour_variable(frame, cvar):
 @contextmanager
 def temp_frame():
     ''' Create/deletes a temporary frame on the current layout page.
+
+    Name indexes used by get_zones/get_variables are cached while the frame
+    exists, so repeated pattern lookups within an API function are cheap.
     '''
     import tecplot
     page  = tecplot.active_page()
     frame = page.add_frame()
-    yield frame
-    page.delete_frame(frame)
+    try:
+        with name_index_cache():
+            yield frame
+    finally:
+        page.delete_frame(frame)
+
+def field_array(zone, variable):
+    ''' Return the values of a variable in a zone as a numpy array '''
+    values = zone.values(variable.index)
+    try:
+        return values.as_numpy_array()
+    except AttributeError: # Missing in early versions of pytecplot
+        return np.asarray(values[:])
+
+def field_dtype(zone, variable):
+    ''' NumPy dtype of the values of a variable in a zone, without reading them '''
+    return np.dtype(FIELD_DTYPES[zone.values(variable.index).data_type.name])
+
+def nodemap_array(zone):
+    ''' Return the zero-based connectivity of an FE zone as a 2D numpy array '''
+    nodemap = zone.nodemap
+    try:
+        data = np.asarray(nodemap.array[:])
+    except AttributeError: # Missing in early versions of pytecplot
+        data = np.asarray(nodemap[:])
+    return data.reshape(zone.num_elements, -1)
+
+def aux_data_dict(item):
+    ''' Return auxiliary data of a dataset/zone as a dict (empty if unavailable) '''
+    try:
+        aux = item.aux_data
+        return {name: str(aux[name]) for name in aux}
+    except (AttributeError, TypeError):
+        return {}
 
-def write_dataset(filename, dataset, **kwargs):
-    ''' Writes dataset as ASCII or PLT depending on extension '''
+def native_zone(zone, variables):
+    ''' Describe a pytecplot zone as a native.Zone for the native writers '''
+    import tecplot.constant as tpc
+    if zone.zone_type == tpc.ZoneType.Ordered:
+        shape = tuple(zone.dimensions)
+    else:
+        shape = (zone.num_points, zone.num_elements)
+    return native.Zone(
+        name = zone.name,
+        zone_type = zone.zone_type.name,
+        shape = shape,
+        strand = zone.strand,
+        solution_time = zone.solution_time,
+        locations = [
+            int(zone.values(v.index).location == tpc.ValueLocation.CellCentered)
+            for v in variables
+        ],
+        aux_data = aux_data_dict(zone),
+    )
+
+def native_values(zone, spec, ivar, variable):
+    ''' Values of a variable sized as the native writers expect them '''
+    data = field_array(zone, variable)
+    count = native.value_count(spec, ivar)
+    if data.size != count and spec.zone_type == 'Ordered':
+        # Ordered cell-centered data is padded to the nodal dimensions
+        I, J, K = spec.shape
+        data = data.reshape(K, J, I)[:max(K-1,1), :max(J-1,1), :max(I-1,1)]
+    return data.ravel()
+
+def write_native(filename, dataset, precision, ascii=None, zones=None, variables=None):
+    ''' Write dataset with the native writers, converting to given precision
+
+    With precision "auto", each zone-variable keeps its data type. Values and
+    connectivity identical to those of an earlier zone are stored once,
+    shared between the zones, and passive variables stay passive.
+    '''
+    dtype = native.PRECISIONS.get(precision)
+    zones = [dataset.zone(z) if isinstance(z, (int,str)) else z for z in (zones or dataset.zones())]
+    variables = [
+        dataset.variable(v) if isinstance(v, (int,str)) else v
+        for v in (dataset.variables() if variables is None else variables)
+    ]
+    specs = [native_zone(z, variables) for z in zones]
+    max_error = 0.0
+    with native.open_writer(
+        filename,
+        variables = [v.name for v in variables],
+        zones = specs,
+        title = dataset.title,
+        aux_data = aux_data_dict(dataset),
+        ascii = ascii,
+        share = True,
+    ) as writer:
+        for zone, spec in zip(zones, specs):
+            values = []
+            for i, var in enumerate(variables):
+                if getattr(zone.values(var.index), 'passive', False): # Missing in early versions of pytecplot
+                    values.append(native.PASSIVE)
+                    continue
+                data = native_values(zone, spec, i, var)
+                converted = data if dtype is None else data.astype(dtype, copy=False)
+                if converted is not data:
+                    max_error = max(max_error, native.rounding_error(data, converted))
+                values.append(converted)
+            connectivity = None if spec.zone_type == 'Ordered' else nodemap_array(zone)
+            writer.write_zone(values, connectivity)
+    return max_error
+
+def native_writable(dataset, zones=None):
+    ''' True if the native writers support all zones (def: of the dataset) '''
+    zones = [dataset.zone(z) if isinstance(z, (int,str)) else z for z in (zones or dataset.zones())]
+    return all(z.zone_type.name == 'Ordered' or z.zone_type.name in native.NODES_PER_ELEMENT for z in zones)
+
+@contextmanager
+def atomic_output(filename):
+    ''' Yield a temporary path next to filename, renamed to filename on success
+
+    The temporary file keeps the extension of filename. If the write fails
+    (or the process is killed) filename is left untouched, so readers never
+    see a truncated datafile.
+    '''
+    directory, base = os.path.split(filename)
+    stem, ext = os.path.splitext(base)
+    temp = os.path.join(directory, f'.{stem}.{os.getpid()}.partial{ext}')
+    try:
+        yield temp
+        os.replace(temp, filename)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+def write_dataset(filename, dataset, precision='auto', ascii=None, share=False, **kwargs):
+    ''' Writes dataset as ASCII or PLT depending on extension (or ascii flag)
+
+    The file is written to a temporary path and renamed when complete.
+
+    The precision argument controls the type of the field data written to
+    the file. If set to "single" or "double", every zone-variable is converted
+    to that precision as it is written; "auto" writes each variable with its
+    native precision. Returns a WriteReport with the number of bytes written
+    and the largest absolute rounding error introduced by the conversion.
+
+    In auto precision, datasets are saved by Tecplot, unless share is set:
+    the native writers then store values and connectivity identical between
+    zones once, shared (if they support all zone types; polygonal and
+    polyhedral zones are still saved by Tecplot). Single and double precision
+    are written with the native writers.
+    '''
     import tecplot as tp
     LOG.info("Write dataset %s", filename)
-    ext = os.path.splitext(filename)[1]
-    if ext == ".dat":
-        tp.data.save_tecplot_ascii(filename, dataset=dataset, **kwargs)
+    if ascii is None:
+        ascii = os.path.splitext(filename)[1] == ".dat"
+    with instrument.span('write', file=filename, precision=precision) as s:
+        if precision != 'auto' and precision not in native.PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}'; expected auto, single or double")
+        with atomic_output(filename) as temp:
+            if precision == 'auto' and not (share and native_writable(dataset, kwargs.get('zones'))):
+                max_error = 0.0
+                if ascii:
+                    tp.data.save_tecplot_ascii(temp, dataset=dataset, **kwargs)
+                else:
+                    tp.data.save_tecplot_plt(temp, dataset=dataset, **kwargs)
+            else:
+                max_error = write_native(temp, dataset, precision, ascii, **kwargs)
+        if s:
+            zones = kwargs.get('zones')
+            zones = None if zones is None else [dataset.zone(z) if isinstance(z, (int,str)) else z for z in zones]
+            s.add(bytes=os.path.getsize(filename), points=dataset_points(dataset, zones))
+    report = WriteReport(filename, os.path.getsize(filename), precision, max_error)
+    LOG.info(
+        "Wrote %d bytes to %s (precision: %s, max rounding error: %.3e)",
+        report.num_bytes, filename, precision, max_error,
+    )
+    return report
+
+
+def dataset_statistics(dataset, variables, zones):
+    ''' Return {var_name: [ZoneStats, ...]} for the given variables and zones '''
+    var_stats = {}
+    with instrument.span('compute') as s:
+        for var in variables:
+            zone_stats = []
+            for zone in zones:
+                data = dataset.variable(var.index).values(zone.index)
+                values = data[:]
+                zone_stats.append(ZoneStats(
+                    zone.name, data.max(), data.min(), mean(values), float(np.std(values)), len(values),
+                ))
+                if s:
+                    s.add(points=len(data))
+            var_stats[var.name] = zone_stats
+    return var_stats
+
+def add_differences(data_new, data_old, var_new, var_old, zone_new, zone_old, nskip=3, jobs=1, datafiles=None):
+    ''' Append "delta_" variables holding new - old to data_new
+
+    Variables and zones are paired by position (see check_pairs); pairs with
+    a variable index less than nskip (e.g. grid coordinates) are skipped. Returns the list of
+    delta variables added. With jobs > 1, datafiles (new, old) the datasets
+    were loaded from let the workers read them directly.
+    '''
+    var_pairs = []
+    for i, (vnew, vold) in enumerate(zip(var_new, var_old)):
+        if vnew.index < nskip or vold.index < nskip:
+            LOG.debug("Skipping variable pair %d; index less than nskip", i)
+            continue
+        delta = data_new.add_variable("delta_" + vnew.name)
+        var_pairs.append((vnew, vold, delta))
+    with instrument.span('compute', jobs=jobs) as s:
+        if jobs > 1:
+            difference_zones_parallel(data_new, data_old, zone_new, zone_old, var_pairs, jobs, datafiles)
+        else:
+            for vnew, vold, delta in var_pairs:
+                for znew, zold in zip(zone_new, zone_old):
+                    try:
+                        delta.values(znew.index)[:] = np.subtract(
+                            vnew.values(znew.index)[:],
+                            vold.values(zold.index)[:],
+                        )
+                    except:
+                        LOG.exception(
+                            'Error while computing delta "%s" for zones "%s" and "%s". Setting to NaN.',
+                            vnew.name, znew.name, zold.name,
+                        )
+                        delta.values(znew.index)[:] = [math.nan] * len(delta.values(znew.index))
+        if s:
+            s.add(points=len(var_pairs) * dataset_points(data_new, zone_new))
+    return [delta for vnew, vold, delta in var_pairs]
+
+
+def add_derived(dataset, plans, zones, coordinates=(), jobs=1, datafile=None):
+    ''' Append the variables computed by expr.Plans to dataset
+
+    Each plan is evaluated, in order, in the given zones; coordinates names
+    the coordinate variables used by gradients. The new variables are double
+    precision, with the value location of the inputs of their plan, and are
+    zero in any other zone. With jobs > 1, zones are evaluated in worker
+    processes (see derive_zones_parallel), which read their inputs from
+    datafile if the dataset was loaded from it. Returns the list of
+    variables added.
+    '''
+    import tecplot.constant as tpc
+    all_vars = list(dataset.variables())
+    names = [v.name for v in all_vars]
+    expr.check_names(plans, names, coordinates)
+    for plan in plans:
+        if plan.name in names:
+            message = f'Cannot derive "{plan.name}": the dataset already has a variable of that name'
+            LOG.error(message)
+            raise ValueError(message)
+    specs = {zone.index: native_zone(zone, all_vars) for zone in zones}
+    locations = {iz: expr.result_locations(plans, spec, names, coordinates) for iz, spec in specs.items()}
+    parallel = jobs > 1 and len(zones) > 1
+    # Matched before the derived variables are added to the dataset
+    indices = file_indices(datafile, dataset) if parallel and datafile else None
+    derived = [
+        dataset.add_variable(
+            plan.name,
+            dtypes = tpc.FieldDataType.Double,
+            locations = [
+                tpc.ValueLocation.CellCentered if locations.get(z.index, [0] * len(plans))[k]
+                else tpc.ValueLocation.Nodal
+                for z in dataset.zones()
+            ],
+        )
+        for k, plan in enumerate(plans)
+    ]
+
+    # Read only the variables the plans need (coordinates only for gradients)
+    inputs = [name for plan in plans for name in plan.inputs if name in names]
+    if any(plan.gradients for plan in plans):
+        inputs += list(coordinates)
+    inputs = [v for v in all_vars if v.name in inputs]
+
+    with instrument.span('compute', jobs=jobs) as s:
+        if parallel:
+            derive_zones_parallel(
+                dataset, plans, zones, [specs[z.index] for z in zones], [locations[z.index] for z in zones],
+                inputs, derived, coordinates, jobs, (datafile, indices) if indices else None,
+            )
+        else:
+            for zone in zones:
+                values = {var.name: field_array(zone, var) for var in inputs}
+                outputs = [np.empty(len(var.values(zone.index))) for var in derived]
+                expr.evaluate_zone(plans, specs[zone.index], values, outputs, coordinates)
+                for var, out in zip(derived, outputs):
+                    var.values(zone.index)[:] = out
+        if s:
+            s.add(points=len(plans) * dataset_points(dataset, zones))
+    return derived
+
+def derive_zones_parallel(dataset, plans, zones, specs, locations, inputs, derived, coordinates, jobs, source=None):
+    ''' Evaluate plans over zones in worker processes; see add_derived
+
+    Zones are sharded round-robin across jobs workers, which write the
+    results into one shared memory block; the parent then assigns them to
+    the derived variables. With source, a (datafile, file_indices) pair, the
+    workers read their inputs from the datafile natively, in parallel.
+    Otherwise the inputs are copied out of PyTecplot into a shared memory
+    block first.
+
+        INPUTS:
+            specs       native.Zone of each zone
+            locations   Location of the result of each plan, for each zone
+            inputs      Variables read by the plans
+            derived     Variables receiving the result of each plan
+    '''
+    import concurrent.futures
+    from . import shm
+    with contextlib.ExitStack() as stack:
+        # Output sizes follow from the zone structure, as PyTecplot pads
+        # ordered cell-centered values to the nodal dimensions
+        out = stack.enter_context(shm.SharedDataset(
+            [plan.name for plan in plans], specs, {
+                (i, k): (np.float64, native.num_elements(spec)
+                         if loc and spec.zone_type != 'Ordered' else native.num_points(spec))
+                for i, (spec, locs) in enumerate(zip(specs, locations)) for k, loc in enumerate(locs)
+            },
+        ))
+        if source is not None:
+            datafile, (zone_index, var_index) = source
+            source_in = datafile
+            zone_pairs = [(zone_index[zone.index], i) for i, zone in enumerate(zones)]
+            input_index = [var_index[var.index] for var in inputs]
+            LOG.debug("Workers read %s natively", datafile)
+        else:
+            shared_in = stack.enter_context(shm.SharedDataset(
+                [v.name for v in dataset.variables()], specs, {
+                    (i, var.index): (field_dtype(zone, var), len(zone.values(var.index)))
+                    for i, zone in enumerate(zones) for var in inputs
+                },
+            ))
+            for i, zone in enumerate(zones):
+                for var in inputs:
+                    shared_in.publish(i, var.index, field_array(zone, var))
+            source_in = shared_in.descriptor
+            zone_pairs = [(i, i) for i in range(len(zones))]
+            input_index = [var.index for var in inputs]
+
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            futures = [
+                pool.submit(
+                    shm.derive_zones, source_in, out.descriptor,
+                    zone_pairs[i::jobs], input_index, plans, coordinates,
+                )
+                for i in range(jobs)
+            ]
+            for future in futures:
+                future.result()
+        for i, zone in enumerate(zones):
+            for k, var in enumerate(derived):
+                var.values(zone.index)[:] = out.values(i, k)
+
+
+CONDITION = re.compile(r'^\s*([^<>=!]+?)\s*(<=|>=|==|!=|<|>)\s*([^<>=!]+?)\s*$')
+OPERATORS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    '==': np.equal, '!=': np.not_equal,
+}
+
+def parse_condition(text):
+    ''' Parse a condition such as "p>1e5" into (variable name, operator, value) '''
+    match = CONDITION.match(text)
+    try:
+        return match.group(1), match.group(2), float(match.group(3))
+    except (AttributeError, ValueError):
+        message = f'Bad condition "{text}"; expected <variable><op><value> with op one of {" ".join(OPERATORS)}'
+        LOG.error(message)
+        raise ValueError(message)
+
+def condition_possible(bounds, op, value):
+    ''' False if no value within bounds (min, max) can satisfy the condition '''
+    vmin, vmax = bounds
+    if math.isnan(vmin) or math.isnan(vmax):
+        return True
+    return {
+        '<': vmin < value, '<=': vmin <= value, '>': vmax > value, '>=': vmax >= value,
+        '==': vmin <= value <= vmax, '!=': not vmin == vmax == value,
+    }[op]
+
+def box_pairs(box):
+    ''' [(lo, hi), ...] per coordinate from a flat xmin,xmax,ymin,ymax[,zmin,zmax] list '''
+    if box is None:
+        return None
+    box = [float(b) for b in box]
+    if len(box) not in (2, 4, 6):
+        message = f"Bad box {box}; expected xmin,xmax[,ymin,ymax[,zmin,zmax]]"
+        LOG.error(message)
+        raise ValueError(message)
+    return list(zip(box[0::2], box[1::2]))
+
+def prune_zones(datafile, zone_patterns, box=None, conditions=()):
+    ''' Indices of the selected zones whose bounds may intersect box and satisfy conditions
+
+    The bounds are the variable ranges stored in PLT zone headers (computed
+    for ASCII files), so zones are pruned without loading their data. Raises
+    native.UnsupportedFormat if the datafile can't be read natively.
+    '''
+    with native.open_dataset(datafile) as reader:
+        zones = NameIndex(z.name for z in reader.zones).matching(zone_patterns)
+        var_index = {name: i for i, name in reversed(list(enumerate(reader.variables)))}
+        kept = []
+        for iz in zones:
+            if box and not mesh.box_intersects([reader.value_range(iz, iv) for iv in range(len(box))], box):
+                continue
+            if not all(condition_possible(reader.value_range(iz, var_index[name]), op, value)
+                       for name, op, value in conditions if name in var_index):
+                continue
+            kept.append(iz)
+    LOG.info("%d of %d zones intersect the clipping region", len(kept), len(zones))
+    return kept
+
+def clip_zone(zone, variables, coordinates, box=None, conditions=()):
+    ''' Clip a zone to a box and conditions on variable values
+
+    Conditions on nodal variables (and the box) select nodes and conditions on
+    cell-centered variables select cells. A cell is kept if it satisfies the
+    cell conditions and one of its nodes satisfies the nodal ones. Ordered
+    zones are reduced to the smallest IJK block holding all kept cells, FE
+    zones to the kept elements with renumbered connectivity.
+
+    Returns (spec, values, connectivity) of the clipped zone, with values of
+    the given variables as native_values, or None if nothing is kept.
+    '''
+    import tecplot.constant as tpc
+    spec = native_zone(zone, variables)
+    node_mask = np.ones(zone.num_points, bool)
+    cell_mask = np.ones(native.num_elements(spec), bool)
+    if box:
+        node_mask &= mesh.box_mask([field_array(zone, c) for c in coordinates], box)
+    for var, op, value in conditions:
+        values = field_array(zone, var)
+        if zone.values(var.index).location == tpc.ValueLocation.CellCentered:
+            if values.size != cell_mask.size: # Padded ordered cell-centered data
+                values = native_values(zone, spec._replace(locations=[1]), 0, var)
+            cell_mask &= OPERATORS[op](values, value)
+        else:
+            node_mask &= OPERATORS[op](values, value)
+
+    connectivity = None
+    if spec.zone_type == 'Ordered':
+        block = mesh.ordered_subblock(spec.shape, cell_mask & mesh.ordered_cell_mask(spec.shape, node_mask))
+        if block is None:
+            return None
+        node_index, cell_index, shape = block
     else:
-        tp.data.save_tecplot_plt(filename, dataset=dataset, **kwargs)
+        connectivity = nodemap_array(zone)
+        element_mask = cell_mask & node_mask[connectivity].any(axis=1)
+        if not element_mask.any():
+            return None
+        connectivity, node_index, cell_index = mesh.fe_subset(connectivity, element_mask)
+        shape = (len(node_index), len(cell_index))
+    locations = spec.locations or [0] * len(variables)
+    values = [
+        native_values(zone, spec, i, v)[cell_index if loc else node_index]
+        for i, (v, loc) in enumerate(zip(variables, locations))
+    ]
+    return spec._replace(shape=shape), values, connectivity
+
+def add_native_zone(dataset, spec, variables, values, connectivity=None):
+    ''' Add a zone described by a native.Zone to a dataset and fill in its values
+
+    Variables of the dataset missing from variables are left at zero.
+    '''
+    import tecplot.constant as tpc
+    locations = None
+    if spec.locations:
+        cell_centered = {v.index for v, loc in zip(variables, spec.locations) if loc}
+        locations = [
+            tpc.ValueLocation.CellCentered if v.index in cell_centered else tpc.ValueLocation.Nodal
+            for v in dataset.variables()
+        ]
+    options = dict(locations=locations, solution_time=spec.solution_time, strand_id=spec.strand)
+    if spec.zone_type == 'Ordered':
+        zone = dataset.add_ordered_zone(spec.name, spec.shape, **options)
+    else:
+        zone = dataset.add_fe_zone(getattr(tpc.ZoneType, spec.zone_type), spec.name, *spec.shape, **options)
+        zone.nodemap[:] = connectivity
+    for var, data in zip(variables, values):
+        target = zone.values(var.index)
+        if len(target) != data.size: # Ordered cell-centered data is padded to the nodal dimensions
+            data = native.pad_cell_values(spec, data)
+        target[:] = data
+    return zone
+
+def copy_zone(zone, dataset, variables):
+    ''' Copy a zone (and the given variables) from another dataset into dataset
+
+    variables are those of the source dataset; each must have a namesake in
+    dataset. The other variables of dataset are left at zero.
+    '''
+    spec = native_zone(zone, variables)
+    values = [native_values(zone, spec, i, v) for i, v in enumerate(variables)]
+    connectivity = None if spec.zone_type == 'Ordered' else nodemap_array(zone)
+    targets = [dataset.variable(v.name) for v in variables]
+    return add_native_zone(dataset, spec, targets, values, connectivity)
+
+def interpolate_zones(src_zones, tgt_zones):
+    ''' Interpolate all variables but the coordinates from src_zones onto tgt_zones (same dataset) '''
+    import tecplot as tp
+    with instrument.span('compute') as s:
+        for zone in tgt_zones:
+            tp.data.operate.interpolate_inverse_distance(
+                destination_zone = zone,
+                source_zones = src_zones,
+            )
+        if s and tgt_zones:
+            s.add(points=dataset_points(tgt_zones[0].dataset, tgt_zones))
+
+def revolve_zones(zones, variables, frame, radial_coord=None, planes=65, angle=180.0, vector_vars=None):
+    ''' Revolve 2D zones into a new 3D dataset of frame; see revolve_dataset
+
+    Returns the new dataset.
+    '''
+    import tecplot as tp
+
+    if vector_vars:
+        if isinstance(vector_vars,list):
+            vector_vars = { v:(v+'_cos',v+'_sin') for v in vector_vars }
+    else:
+        vector_vars = {}
+
+    vars_in = [v.name for v in variables]
+    assert len(vars_in) == len(set(vars_in)), \
+           'ERROR: Cannot revolve dataset. All variables must have unique names.'
+
+    # Select the radial coordinate and add to vector_vars
+    zname = 'z'
+    default_zname = False
+    if not radial_coord:
+        radial_coord = vars_in[1]
+    if isinstance(radial_coord,str):
+        radial_coord = { radial_coord: (radial_coord, zname) }
+        default_zname = True
+    vector_vars = { **radial_coord, **vector_vars }
+
+    # Check that radial coordinate and the new out-of-plane coordiante make sense
+    rname = list(radial_coord.keys())[0]
+    assert rname in vars_in, \
+           f'ERROR: User-specified radial coordinate {rname} does not exist in dataset!'
+    if default_zname:
+        assert not zname in vars_in, \
+               f'ERROR: New coordinate "{zname}" will clobber existing variable! ' \
+               'Please use a dict argument to radial_coord to specify coordinate names.'
+
+    # Check the vector_vars mapping
+    for v in vector_vars:
+        assert v in vars_in, \
+               f'ERROR: User requested vector variable {v} not present in dataset.'
+
+    # Initialize output dataset and construct variable list
+    data_out = frame.create_dataset('anchor3d')
+    for v in vars_in:
+        data_out.add_variable(v)
+        if v in vector_vars:
+            LOG.info(f'Using variable {v} as a vector-valued variable.')
+            for component in vector_vars[v]:
+                if not component in vars_in:
+                    LOG.info(f'Adding vector component variable "{component}" to the dataset')
+                    data_out.add_variable(component)
+
+    # Compute sine/cosine for each data plane
+    t = np.linspace(0.0, np.radians(angle), planes)
+    st = np.sin(t)
+    ct = np.cos(t)
+
+    # Construct all zones and revolve data
+    with instrument.span('compute') as s:
+        for zin in zones:
+            assert isinstance(zin, tp.data.OrderedZone), \
+                   f'ERROR: Cannot revolve zone "{zin.name}". Must be an OrderedZone.'
+            assert zin.rank < 3, \
+                   f'ERROR: Cannot revolve zone "{zin.name}". Must be rank 1 or 2.'
+            zout = data_out.add_ordered_zone(zin.name, [*zin.dimensions[0:zin.rank], planes])
+            npt  = np.prod(zin.dimensions)
+            for v in vars_in:
+                vals_in  = zin.values(v)
+                vals_out = zout.values(v)
+                for k in range(planes):
+                    vals_out[k*npt:(k+1)*npt] = vals_in[:]
+                if v in vector_vars:
+                    vy,vz  = vector_vars[v]
+                    vals_y = zout.values(vy)
+                    vals_z = zout.values(vz)
+                    for k in range(planes):
+                        vals_y[k*npt:(k+1)*npt] = np.multiply(vals_in[:],ct[k])
+                        vals_z[k*npt:(k+1)*npt] = np.multiply(vals_in[:],st[k])
+        if s:
+            s.add(points=dataset_points(data_out))
+    return data_out
+
+def load_slices(slice_file):
+    ''' Return the list of slice definitions of a slice file; see slice_surfaces '''
+    # Load slice definition file as "config" module
+    # This is based on https://stackoverflow.com/questions/67631
+    LOG.info("Load slice definition from %s", slice_file)
+    sys.dont_write_bytecode = True # So we don't clutter users workspace
+    config = SourceFileLoader("config", slice_file).load_module()
+    sys.dont_write_bytecode = False
+    return config.slices
+
+def extract_slices(frame, dataset, slices, all_zones=None):
+    ''' Extract the slice zones of a list of slice definitions; see slice_surfaces
+
+    all_zones are the indices of the zones sliced by definitions whose zones
+    are "all" (def: every zone of the dataset). Returns the slice zones.
+    '''
+    import tecplot as tp
+    import tecplot.constant as tpc
+    with instrument.span('compute') as s:
+        slice_zones = []
+        for slice_definition in slices:
+            name, origin, normal, zones = slice_definition
+            if isinstance(zones, str):
+                if zones == "all":
+                    zones = range(dataset.num_zones) if all_zones is None else all_zones
+                else:
+                    raise RuntimeError("String '%s' is not a valid zone specifier" % zones)
+            LOG.info("Extract slice '%s'", name)
+            frame.active_zones(zones)
+            zone = tp.data.extract.extract_slice(
+                origin  = origin,
+                normal  = normal,
+                source  = tpc.SliceSource.SurfaceZones,
+                dataset = dataset,
+            )
+            zone.name = name
+            slice_zones.append(zone)
+        if s:
+            s.add(points=dataset_points(dataset, slice_zones))
+    return slice_zones
 
 
 #-----------------------------------------------------------------------
 # API Functions
 #-----------------------------------------------------------------------
-def compute_statistics(datafile_in, variable_patterns=None, zone_patterns=None):
-    ''' Compute min/max/mean for each variable/zone combination
+@instrument.traced
+def compute_statistics(datafile_in, variable_patterns=None, zone_patterns=None, sidecar=False):
+    ''' Compute min/max/mean/std for each variable/zone combination
 
     Arguments:
         datafile_in        [str]  Path of Tecplot datafile
@@ -116,43 +945,46 @@ def compute_statistics(datafile_in, variable_patterns=None, zone_patterns=None):
                            Wildcard patterns are allowed.
         zone_patterns      [list(str)] Names of zones to be analyzed.
                            Wildcard patterns are allowed.
+        sidecar            [bool] Answer from (and update) the sidecar
+                           index next to the datafile; see tec_util.sidecar.
 
     Returns:
-        stats_info         [dict(list(stats_tuple))] Data structure with
-                           max/min/mean for every variable/zone combination
-                           e.g. stats_info[var_name][zone_id].max
+        stats_info         [dict(list(ZoneStats))] Data structure with
+                           max/min/mean/std/count for every variable/zone
+                           combination e.g. stats_info[var_name][zone_id].max
     '''
-    import tecplot as tp
+    if sidecar:
+        from . import sidecar as index
+        try:
+            return index.cached_statistics(datafile_in, variable_patterns, zone_patterns)
+        except native.UnsupportedFormat as e:
+            LOG.warning("Cannot use a sidecar for %s (%s); computing statistics", datafile_in, e)
+
     import tecplot.constant as tpc
     with temp_frame() as frame:
 
         # Load the dataset
         LOG.info("Load dataset %s", datafile_in)
-        dataset = tp.data.load_tecplot(
+        dataset = load_dataset(
             datafile_in,
             frame = frame,
+            zone_patterns = zone_patterns,
+            var_patterns = variable_patterns,
             initial_plot_type = tpc.PlotType.Cartesian3D
         )
 
         # Get all variables/zones matching requested patterns
-        variables = get_variables(ds, variable_patterns)
+        variables = get_variables(dataset, variable_patterns)
         LOG.info("Generating statisitics for: %s", ' '.join([v.name for v in variables]))
-        zones = get_zones(ds, zone_patterns)
+        zones = get_zones(dataset, zone_patterns)
         LOG.info("Gathering statisitics from: %s", ' '.join([z.name for z in zones]))
 
-        # Compute per-zone statistics
-        var_stats = {}
-        stats_tuple = collections.namedtuple('ZoneStats',['name','max','min','mean'])
-        for var in variables:
-            zone_stats = []
-            for zone in zones:
-                data = dataset.variable(var.index).values(zone.index)
-                zone_stats.append(stats_tuple(zone.name, data.max(), data.min(), mean(data[:])))
-            var_stats[var.name] = zone_stats
-
-    return var_stats
+        return dataset_statistics(dataset, variables, zones)
 
-def difference_datasets(datafile_new, datafile_old, datafile_out, zone_patterns=None, var_patterns=None, nskip=3):
+@instrument.traced
+def difference_datasets(datafile_new, datafile_old, datafile_out, zone_patterns=None, var_patterns=None, nskip=3,
+                        precision='auto', jobs=1, out_of_core=False, transient=False, interpolate_time=False,
+                        norms_out=None, skip_identical=False, share=False):
     ''' Compute variable-by-variable difference between datasets.
 
         INPUTS:
@@ -162,82 +994,425 @@ def difference_datasets(datafile_new, datafile_old, datafile_out, zone_patterns=
             zone_patterns   List of glob pattern specifying zones to difference (def: all)
             var_patterns    List of glob pattern specifying variables to difference (def: all)
             nskip           Number of variables at start of file to skip (def:3)
+            precision       Precision of output data: auto|single|double (def: auto)
+            jobs            Number of worker processes used to compute deltas (def: 1)
+            out_of_core     Stream deltas to datafile_out without loading either dataset (def: False)
+            transient       Pair zones by strand and solution time instead of by position;
+                            implies out_of_core (def: False)
+            interpolate_time  With transient, interpolate datafile_old linearly in time where
+                            the solution times of the datasets differ (def: False)
+            norms_out       CSV file where L2/Linf norms of each delta are saved; implies
+                            out_of_core. If given, datafile_out may be None (def: None)
+            skip_identical  Don't subtract zone-variables whose fingerprints match; their
+                            deltas are zero. Implies out_of_core (def: False)
+            share           Store grid variables and connectivity identical between zones
+                            once, shared, with the native writers (def: False)
 
         OUTPUTS:
             none
     '''
-    import tecplot as tp
-    import tecplot.constant as tpc
+    if out_of_core or transient or norms_out or skip_identical:
+        if jobs > 1:
+            LOG.warning("Ignoring jobs=%d; out-of-core differencing is serial", jobs)
+        difference_datafiles(
+            datafile_new, datafile_old, datafile_out, zone_patterns, var_patterns, nskip, precision,
+            transient, interpolate_time, norms_out, skip_identical,
+        )
+        return
 
     with temp_frame() as frame_new, temp_frame() as frame_old:
 
         # Load datasets
+        # Grid variables (index < nskip) are loaded even if not selected
         LOG.info("Load new dataset from %s", datafile_new)
-        data_new = tp.data.load_tecplot(datafile_new, frame = frame_new)
+        data_new = load_dataset(
+            datafile_new,
+            frame = frame_new,
+            zone_patterns = zone_patterns,
+            var_patterns = var_patterns,
+            extra_variables = range(nskip),
+        )
         LOG.info("Load old dataset from %s", datafile_old)
-        data_old = tp.data.load_tecplot(datafile_old, frame = frame_old)
+        data_old = load_dataset(
+            datafile_old,
+            frame = frame_old,
+            zone_patterns = zone_patterns,
+            var_patterns = var_patterns,
+            extra_variables = range(nskip),
+        )
 
-        # Get variable information
+        # Get variable/zone information
         var_new = get_variables(data_new, var_patterns)
         var_old = get_variables(data_old, var_patterns)
-        if len(var_new) != len(var_old):
-            message = (
-                "The number of variables matching the glob pattern "
-                "'{}' in datafile_new ({}) does not match the number "
-                "in datafile_old ({})."
-            ).format(var_pattern, len(var_new), len(var_old))
-            LOG.error(message)
-            raise RuntimeError(message)
-        for i, (vnew, vold) in enumerate(zip(var_new, var_old)):
-            if vnew.name != vold.name:
-                LOG.warning(
-                    "Variable pair %d has mismatching names: %s != %s",
-                    i, vnew.name, vold.name,
-                )
-
-        # Get zone information
+        check_pairs('variable', var_patterns, [v.name for v in var_new], [v.name for v in var_old])
         zone_new = get_zones(data_new, zone_patterns)
         zone_old = get_zones(data_old, zone_patterns)
-        if len(zone_new) != len(zone_old):
-            message = (
-                "The number of zones matching the glob pattern "
-                "'{}' in datafile_new ({}) does not match the number "
-                "in datafile_old ({})."
-            ).format(zone_pattern, len(zone_new), len(zone_old))
-            LOG.error(message)
-            raise RuntimeError(message)
-        for i, (znew, zold) in enumerate(zip(zone_new, zone_old)):
-            if znew.name != zold.name:
-                LOG.warning(
-                    "Zone pair %d has mismatching names: %s != %s",
-                    i, znew.name, zold.name,
-                )
+        check_pairs('zone', zone_patterns, [z.name for z in zone_new], [z.name for z in zone_old])
 
         # Compute delta new - old. Deltas get appended to data_new.
         LOG.info("Compute dataset differences (new - old).")
         initial_num_vars = data_new.num_variables
+        add_differences(
+            data_new, data_old, var_new, var_old, zone_new, zone_old, nskip, jobs,
+            datafiles = (datafile_new, datafile_old),
+        )
+
+        # Save results
+        vars_to_save = itertools.chain(range(nskip),range(initial_num_vars, data_new.num_variables))
+        write_dataset(datafile_out, data_new, precision, share=share, variables=vars_to_save, zones=zone_new)
+
+def check_pairs(kind, patterns, names_new, names_old):
+    ''' Check that new/old zones or variables can be paired for differencing '''
+    if len(names_new) != len(names_old):
+        message = (
+            "The number of {}s matching the glob pattern "
+            "'{}' in datafile_new ({}) does not match the number "
+            "in datafile_old ({})."
+        ).format(kind, patterns, len(names_new), len(names_old))
+        LOG.error(message)
+        raise RuntimeError(message)
+    for i, (name_new, name_old) in enumerate(zip(names_new, names_old)):
+        if name_new != name_old:
+            LOG.warning(
+                "%s pair %d has mismatching names: %s != %s",
+                kind.capitalize(), i, name_new, name_old,
+            )
+
+def zone_key(zone):
+    ''' Key identifying a native.Zone across timesteps: its strand, or its name if static '''
+    return ('strand', zone.strand) if zone.strand > 0 else ('name', zone.name)
+
+def transient_pairs(zones_new, zones_old, zone_new, zone_old, interpolate=False):
+    ''' Pair zones of two transient datasets by strand and solution time
+
+    Arguments:
+        zones_new, zones_old   Lists of native.Zone of each dataset
+        zone_new, zone_old     Indices of the selected zones of each dataset
+        interpolate            If a solution time of zones_new is missing in
+                               zones_old, interpolate linearly between the
+                               nearest earlier and later old zones
+
+    Returns a list of (izone_new, [(izone_old, weight), ...]) in order of
+    solution time. Static zones (strand 0) are paired by name. New zones
+    without a counterpart are skipped with a warning.
+    '''
+    timesteps = collections.defaultdict(list)
+    for iz in zone_old:
+        timesteps[zone_key(zones_old[iz])].append((zones_old[iz].solution_time, iz))
+    for steps in timesteps.values():
+        steps.sort()
+
+    pairs = []
+    for iz in sorted(zone_new, key=lambda iz: zones_new[iz].solution_time):
+        zone = zones_new[iz]
+        steps = timesteps.get(zone_key(zone), [])
+        times = [t for t, _ in steps]
+        i = bisect.bisect_left(times, zone.solution_time)
+        if zone.strand == 0 and steps:
+            pairs.append((iz, [(steps[0][1], 1.0)]))
+        elif i < len(times) and times[i] == zone.solution_time:
+            pairs.append((iz, [(steps[i][1], 1.0)]))
+        elif interpolate and 0 < i < len(times):
+            (t0, iz0), (t1, iz1) = steps[i-1], steps[i]
+            w = (zone.solution_time - t0) / (t1 - t0)
+            pairs.append((iz, [(iz0, 1.0 - w), (iz1, w)]))
+        else:
+            LOG.warning(
+                'No zone in datafile_old to pair with "%s" (strand %d, time %s); skipping it',
+                zone.name, zone.strand, zone.solution_time,
+            )
+    return pairs
+
+def file_indices(datafile, dataset):
+    ''' ({zone index: index in datafile}, {variable index: index in datafile}) of a dataset
+
+    The dataset must have been loaded from (a subset of) datafile, so its
+    zones and variables are found in the file header in the same order.
+    Returns None if the file can't be read natively or doesn't match.
+    '''
+    try:
+        header = native.read_header(datafile)
+    except (OSError, native.UnsupportedFormat) as e:
+        LOG.debug("Cannot read %s natively: %s", datafile, e)
+        return None
+    def match(items, candidates):
+        result, start = {}, 0
+        for index, key in items:
+            try:
+                start = candidates.index(key, start) + 1
+            except ValueError:
+                return None
+            result[index] = start - 1
+        return result
+    zones = match(
+        [(z.index, (z.name, native_zone(z, []).shape)) for z in dataset.zones()],
+        [(z.name, tuple(z.shape)) for z in header.zones],
+    )
+    variables = match([(v.index, v.name) for v in dataset.variables()], header.variables)
+    if zones is None or variables is None:
+        LOG.debug("Dataset doesn't match the header of %s", datafile)
+        return None
+    return zones, variables
+
+def difference_zones_parallel(data_new, data_old, zone_new, zone_old, var_pairs, jobs, datafiles=None):
+    ''' Compute deltas for zone pairs in worker processes.
+
+    Zone pairs are sharded round-robin across jobs workers, which write the
+    deltas into one shared memory block; the parent then assigns them to
+    the delta variables. If the datasets were loaded from datafiles
+    (new, old) that the native readers can read, the workers read their
+    inputs from the files themselves, in parallel. Otherwise the inputs
+    are copied out of PyTecplot into a shared memory block first.
+    Failed pairs are set to NaN, as in the serial loop.
+
+        INPUTS:
+            zone_new    List of zones in data_new, paired with zone_old
+            var_pairs   List of (var_new, var_old, delta) variable triplets
+            jobs        Number of worker processes
+            datafiles   Optional (datafile_new, datafile_old) the datasets
+                        were loaded from
+    '''
+    import concurrent.futures
+    from . import shm
+
+    all_new = list(data_new.variables())
+    specs_new = [native_zone(z, all_new) for z in data_new.zones()]
+    pairs = list(zip(zone_new, zone_old))
+    indices = None
+    if datafiles is not None:
+        indices = [file_indices(f, d) for f, d in zip(datafiles, (data_new, data_old))]
+        if None in indices:
+            indices = None
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(shm.SharedDataset(
+            [v.name for v in all_new], specs_new,
+            {
+                (znew.index, k): (np.float64, len(delta.values(znew.index)))
+                for znew, _ in pairs for k, (_, _, delta) in enumerate(var_pairs)
+            },
+        ))
+        if indices is not None:
+            (zones_new, vars_new), (zones_old, vars_old) = indices
+            source_new, source_old = datafiles
+            zone_index = [(zones_new[znew.index], zones_old[zold.index], znew.index) for znew, zold in pairs]
+            var_index = [(vars_new[vnew.index], vars_old[vold.index], k) for k, (vnew, vold, _) in enumerate(var_pairs)]
+            names = (
+                {v: k for k, v in zones_new.items()},
+                {v: k for k, v in zones_old.items()},
+            )
+            LOG.debug("Workers read %s and %s natively", *datafiles)
+        else:
+            # Copy the arrays exactly as the serial loop reads them
+            def publish(dataset, zone_vars):
+                zone_vars = list(zone_vars)
+                all_vars = list(dataset.variables())
+                shared = stack.enter_context(shm.SharedDataset(
+                    [v.name for v in all_vars], [native_zone(z, all_vars) for z in dataset.zones()], {
+                        (zone.index, var.index): (field_dtype(zone, var), len(zone.values(var.index)))
+                        for zone, var in zone_vars
+                    },
+                ))
+                for zone, var in zone_vars:
+                    shared.publish(zone.index, var.index, field_array(zone, var))
+                return shared.descriptor
+            source_new = publish(data_new, ((znew, v[0]) for znew, _ in pairs for v in var_pairs))
+            source_old = publish(data_old, ((zold, v[1]) for _, zold in pairs for v in var_pairs))
+            zone_index = [(znew.index, zold.index) for znew, zold in pairs]
+            var_index = [(vnew.index, vold.index, k) for k, (vnew, vold, delta) in enumerate(var_pairs)]
+            names = None
+
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            futures = [
+                pool.submit(
+                    shm.difference_zones, source_new, source_old, out.descriptor,
+                    zone_index[i::jobs], var_index,
+                )
+                for i in range(jobs)
+            ]
+            failures = [f for future in futures for f in future.result()]
+
+        for znew_idx, zold_idx, k, message in failures:
+            if names is not None:
+                znew_idx, zold_idx = names[0][znew_idx], names[1][zold_idx]
+            LOG.error(
+                'Error while computing delta "%s" for zones "%s" and "%s": %s. Setting to NaN.',
+                var_pairs[k][0].name, data_new.zone(znew_idx).name, data_old.zone(zold_idx).name, message,
+            )
+        for znew in zone_new:
+            for k, (vnew, vold, delta) in enumerate(var_pairs):
+                delta.values(znew.index)[:] = out.values(znew.index, k)
+
+def log_identical(identical):
+    ''' Log how many zone-variable pairs were skipped by difference_datafiles '''
+    if identical:
+        LOG.info(
+            "Skipped subtraction of %d of %d zone-variable pairs with identical fingerprints",
+            sum(identical.values()), len(identical),
+        )
+
+@instrument.traced
+def difference_datafiles(datafile_new, datafile_old, datafile_out, zone_patterns=None, var_patterns=None,
+                         nskip=3, precision='auto', transient=False, interpolate=False, norms_out=None,
+                         skip_identical=False):
+    ''' Out-of-core version of difference_datasets.
+
+    Both datafiles are read with the native readers and the output is
+    streamed zone by zone, with deltas computed one chunk at a time, so
+    memory use is bounded by native.CHUNK_SIZE values for PLT inputs (and
+    by one zone for ASCII inputs, which must be parsed). Deltas are stored
+    at the location of the new variable, in the common floating point type
+    of the two variables unless a precision is given.
+
+    If transient is True, zones are paired by strand and solution time (see
+    transient_pairs) instead of by position, and written in order of time;
+    with interpolate, old zones are interpolated linearly in time where the
+    time grids differ. Grid variables and connectivity identical to those
+    of an earlier zone (e.g. of the same strand) are written once and shared.
+    If norms_out is given, the L2 and Linf norms of each
+    delta are written to it as CSV rows of time,zone,variable,l2,linf.
+    datafile_out may then be None to skip writing the deltas.
+
+    With skip_identical, zone-variables of the same type whose fingerprints
+    (see fingerprint.py) match are not subtracted; their deltas are written
+    as zeros. Fingerprints are taken from the statistics sidecars of the
+    datafiles if they are up to date.
+    '''
+    dtype_out = native.PRECISIONS.get(precision)
+    if dtype_out is None and precision != 'auto':
+        raise ValueError(f"Unknown precision '{precision}'; expected auto, single or double")
+
+    with native.open_dataset(datafile_new) as new, native.open_dataset(datafile_old) as old:
+        with instrument.span('select'):
+            var_new = NameIndex(new.variables).select(var_patterns)
+            var_old = NameIndex(old.variables).select(var_patterns)
+            zone_new = NameIndex([z.name for z in new.zones]).select(zone_patterns)
+            zone_old = NameIndex([z.name for z in old.zones]).select(zone_patterns)
+        assert var_new and var_old, f"No variables in dataset matching {' '.join(var_patterns)}"
+        assert zone_new and zone_old, f"No zones in dataset matching {' '.join(zone_patterns)}"
+        check_pairs('variable', var_patterns, [new.variables[i] for i in var_new], [old.variables[i] for i in var_old])
+        if transient:
+            zone_pairs = transient_pairs(new.zones, old.zones, zone_new, zone_old, interpolate)
+            assert zone_pairs, "No zones of datafile_new match a strand and solution time of datafile_old"
+        else:
+            check_pairs('zone', zone_patterns, [new.zones[i].name for i in zone_new], [old.zones[i].name for i in zone_old])
+            zone_pairs = [(znew, [(zold, 1.0)]) for znew, zold in zip(zone_new, zone_old)]
+
+        grid = list(range(min(nskip, len(new.variables))))
+        var_pairs = []
         for i, (vnew, vold) in enumerate(zip(var_new, var_old)):
-            if vnew.index < nskip or vold.index < nskip:
+            if vnew < nskip or vold < nskip:
                 LOG.debug("Skipping variable pair %d; index less than nskip", i)
                 continue
-            delta = data_new.add_variable("delta_" + vnew.name)
-            for znew, zold in zip(zone_new, zone_old):
-                try:
-                    delta.values(znew.index)[:] = np.subtract(
-                        vnew.values(znew.index)[:],
-                        vold.values(zold.index)[:],
+            var_pairs.append((vnew, vold))
+
+        variables = [new.variables[i] for i in grid] + ["delta_" + new.variables[i] for i, _ in var_pairs]
+        zones = []
+        for iz, _ in zone_pairs:
+            zone = new.zones[iz]
+            if zone.locations:
+                locations = [zone.locations[i] for i in grid] + [zone.locations[i] for i, _ in var_pairs]
+                zone = zone._replace(locations=locations if any(locations) else None)
+            zones.append(zone)
+
+        max_error = [0.0]
+        def source(dtype, size, read):
+            ''' ChunkedArray converting chunks to the output precision '''
+            if dtype_out is None:
+                return native.ChunkedArray(dtype, size, read)
+            def convert(start, stop):
+                chunk = read(start, stop)
+                result = chunk.astype(dtype_out)
+                max_error[0] = max(max_error[0], native.rounding_error(chunk, result))
+                return result
+            return native.ChunkedArray(np.dtype(dtype_out), size, convert)
+
+        if skip_identical:
+            from . import fingerprint
+            caches = (fingerprint.cached_hashes(datafile_new), fingerprint.cached_hashes(datafile_old))
+        identical = {}
+        def is_identical(znew, zold, vnew, vold):
+            ''' True if a new and an old zone-variable have the same fingerprint '''
+            key = (znew, zold, vnew, vold)
+            if key not in identical:
+                identical[key] = (
+                    fingerprint.variable_hash(new, caches[0], znew, vnew) ==
+                    fingerprint.variable_hash(old, caches[1], zold, vold)
+                )
+            return identical[key]
+
+        def delta_sources(znew, olds):
+            ''' ChunkedArrays of the deltas of a zone pair, one per variable pair '''
+            sources = []
+            for vnew, vold in var_pairs:
+                a = new.values(znew, vnew)
+                b = [(old.values(zold, vold), weight) for zold, weight in olds]
+                dtype = np.result_type(a.dtype, *[v.dtype for v, _ in b], np.float32)
+                sizes = [v.size for v, _ in b]
+                if len(b) == 1 and a.size == sizes[0] and skip_identical and a.dtype == b[0][0].dtype and \
+                   is_identical(znew, olds[0][0], vnew, vold):
+                    read = lambda start, stop, dtype=dtype: np.zeros(stop - start, dtype)
+                elif len(b) == 1 and a.size == sizes[0]:
+                    read = lambda start, stop, a=a, b=b[0][0], dtype=dtype: np.subtract(a[start:stop], b[start:stop], dtype=dtype)
+                elif all(size == a.size for size in sizes):
+                    read = lambda start, stop, a=a, b=b, dtype=dtype: np.subtract(
+                        a[start:stop], sum(w * v[start:stop].astype(np.float64) for v, w in b), dtype=dtype,
                     )
-                except:
-                    LOG.exception(
-                        'Error while computing delta "%s" for zones "%s" and "%s". Setting to NaN.',
-                        zold.name, znew.name,
+                else:
+                    LOG.error(
+                        'Error while computing delta "%s" for zones "%s" and "%s": '
+                        'sizes %d and %s do not match. Setting to NaN.',
+                        new.variables[vnew], new.zones[znew].name, old.zones[olds[0][0]].name,
+                        a.size, ', '.join(map(str, sizes)),
                     )
-                    delta.values(znew.index)[:] = [math.nan] * len(delta.values(znew.index))
-
-        # Save results
-        vars_to_save = itertools.chain(range(nskip),range(initial_num_vars, data_new.num_variables))
-        write_dataset(datafile_out, data_new, variables=vars_to_save, zones=zone_new)
-
+                    read = lambda start, stop, dtype=dtype: np.full(stop - start, np.nan, dtype)
+                sources.append(source(dtype, a.size, read))
+            return sources
+
+        if norms_out:
+            LOG.info("Write difference norms (new - old) to %s", norms_out)
+            with instrument.span('norms', file=norms_out), open(norms_out, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['time', 'zone', 'variable', 'l2', 'linf'])
+                for znew, olds in zone_pairs:
+                    spec_new = new.zones[znew]
+                    for (vnew, _), delta in zip(var_pairs, delta_sources(znew, olds)):
+                        l2, linf = 0.0, 0.0
+                        for chunk in native.iter_chunks(delta):
+                            chunk = chunk.astype(np.float64)
+                            l2 += np.dot(chunk, chunk)
+                            linf = max(linf, np.abs(chunk).max()) if chunk.size else linf
+                        writer.writerow([spec_new.solution_time, spec_new.name, new.variables[vnew], np.sqrt(l2), linf])
+
+        if datafile_out is None:
+            log_identical(identical)
+            return None
+
+        LOG.info("Stream dataset differences (new - old) to %s", datafile_out)
+        with instrument.span('stream', file=datafile_out) as s:
+            with atomic_output(datafile_out) as temp, \
+                 native.open_writer(temp, variables, zones, new.header.title, new.header.aux_data,
+                                    share=range(len(grid))) as writer:
+                for znew, olds in zone_pairs:
+                    spec_new = new.zones[znew]
+                    sources = []
+                    for ivar in grid:
+                        values = new.values(znew, ivar)
+                        sources.append(source(values.dtype, values.size, lambda start, stop, v=values: v[start:stop]))
+                    sources += delta_sources(znew, olds)
+                    connectivity = None if spec_new.zone_type == 'Ordered' else new.connectivity(znew)
+                    writer.write_zone_chunked(sources, connectivity)
+            if s:
+                s.add(bytes=os.path.getsize(datafile_out), points=sum(native.num_points(z) for z in zones))
+        log_identical(identical)
+
+    report = WriteReport(datafile_out, os.path.getsize(datafile_out), precision, max_error[0])
+    LOG.info(
+        "Wrote %d bytes to %s (precision: %s, max rounding error: %.3e)",
+        report.num_bytes, datafile_out, precision, report.max_error,
+    )
+    return report
+
+@instrument.traced
 def export_pages(output_dir, prefix='', width=600, supersample=2,
                  yvar=None, cvar=None, rescale=False, num_contour=21):
     ''' Export all pages in the current layout to <page_name>.png '''
@@ -256,13 +1431,18 @@ def export_pages(output_dir, prefix='', width=600, supersample=2,
                 rescale_frame(frame, num_contour)
         outfile = os.path.join(output_dir, prefix + page.name + ".png")
         LOG.info("Export page %s to %s", page.name, outfile)
-        tp.export.save_png(
-            outfile, width,
-            region = tpc.ExportRegion.AllFrames,
-            supersample = supersample
-        )
+        with instrument.span('write', file=outfile) as s:
+            tp.export.save_png(
+                outfile, width,
+                region = tpc.ExportRegion.AllFrames,
+                supersample = supersample
+            )
+            if s:
+                s.add(bytes=os.path.getsize(outfile))
 
-def extract(datafile_in, datafile_out, zone_patterns=None, var_patterns=None):
+@instrument.traced
+def extract(datafile_in, datafile_out, zone_patterns=None, var_patterns=None, precision='auto', box=None,
+            where=None):
     ''' Copy specified zones/variables into a new file
 
     Arguments:
@@ -272,42 +1452,226 @@ def extract(datafile_in, datafile_out, zone_patterns=None, var_patterns=None):
                            Wildcard patterns are allowed.
         zone_patterns      [list(str)] Names of zones to be analyzed.
                            Wildcard patterns are allowed.
+        precision          [str] Precision of output data: auto|single|double
+        box                [list(float)] xmin,xmax,ymin,ymax[,zmin,zmax] of a
+                           region of interest in the first (coordinate)
+                           variables. Zones are clipped to it.
+        where              [list(str)] Conditions such as "p>1e5" (operators
+                           < <= > >= == !=), all of which must hold for
+                           the data that is kept.
+
+    Zones whose bounds lie outside the box or can't satisfy the conditions
+    are skipped without being loaded (see prune_zones). The others are
+    clipped with clip_zone: ordered zones to the IJK block holding the data
+    that is kept, FE zones to the elements that are kept.
     '''
-    import tecplot as tp
-    import tecplot.constant as tpc
+    box = box_pairs(box)
+    conditions = [parse_condition(c) for c in where or []]
+    if not box and not conditions:
+        with temp_frame() as frame:
+            LOG.info("Load input dataset from %s", datafile_in)
+            ds = load_dataset(datafile_in, frame, zone_patterns, var_patterns)
+            write_dataset(datafile_out, ds, precision,
+                zones = get_zones(ds, zone_patterns),
+                variables = get_variables(ds, var_patterns),
+            )
+        return
+
+    zone_indices = None
+    with instrument.span('select', file=datafile_in):
+        try:
+            zone_indices = prune_zones(datafile_in, zone_patterns, box, conditions)
+        except native.UnsupportedFormat as e:
+            LOG.debug("Cannot prune zones of %s: %s", datafile_in, e)
+    if zone_indices == []:
+        message = f"No zones of {datafile_in} intersect the clipping region"
+        LOG.error(message)
+        raise RuntimeError(message)
+
+    load_patterns = None
+    if var_patterns:
+        # The variables of the conditions are loaded, but not written
+        load_patterns = [var_patterns] if isinstance(var_patterns, str) else list(var_patterns)
+        load_patterns += [glob.escape(name) for name, _, _ in conditions]
     with temp_frame() as frame:
         LOG.info("Load input dataset from %s", datafile_in)
-        ds = tp.data.load_tecplot(datafile_in, frame=frame)
-        write_dataset(datafile_out, ds,
-            zones = get_zones(ds, zone_patterns),
-            variables = get_variables(ds, var_patterns),
+        ds = load_dataset(datafile_in, frame, zone_patterns, load_patterns,
+            extra_variables = range(len(box or [])),
+            zone_indices = zone_indices,
         )
+        zones = get_zones(ds, zone_patterns)
+        variables = get_variables(ds, var_patterns)
+        coordinates = [ds.variable(i) for i in range(len(box or []))]
+        for name, _, _ in conditions:
+            assert name in [v.name for v in ds.variables()], f"No variable {name} in dataset"
+        conditions = [(ds.variable(name), op, value) for name, op, value in conditions]
+
+        clipped = []
+        with instrument.span('compute') as s:
+            for zone in zones:
+                result = clip_zone(zone, variables, coordinates, box, conditions)
+                if result is None:
+                    LOG.debug("Zone %s lies outside the clipping region", zone.name)
+                    continue
+                spec, values, connectivity = result
+                LOG.debug("Clip zone %s from %s to %s", zone.name, zone.num_points, native.num_points(spec))
+                clipped.append(add_native_zone(ds, spec, variables, values, connectivity))
+                if s:
+                    s.add(points=zone.num_points)
+        if not clipped:
+            message = f"No data of {datafile_in} lies within the clipping region"
+            LOG.error(message)
+            raise RuntimeError(message)
+        write_dataset(datafile_out, ds, precision, zones=clipped, variables=variables)
+
+@instrument.traced
+def decimate(datafile_in, datafile_out, strides=(2,2,2), num_points=None, zone_patterns=None, var_patterns=None,
+             precision='auto'):
+    ''' Write a lightweight preview of a dataset by subsampling its zones
+
+    Arguments:
+        datafile_in        [str] Path to input Tecplot datafile
+        datafile_out       [str] Path to Tecplot datafile to be written
+        strides            [tuple(int)] I, J, K strides for ordered zones. The
+                           last node along each index is always kept.
+        num_points         [int] Target number of points of each FE zone,
+                           which are decimated by vertex clustering on the
+                           first three (coordinate) variables. By default,
+                           the number of points divided by the product of
+                           the strides.
+        zone_patterns      [list(str)] Names of zones to be decimated.
+        var_patterns       [list(str)] Names of variables to be written.
+        precision          [str] Precision of output data: auto|single|double
 
-def interpolate_dataset(datafile_src, datafile_tgt, datafile_out):
+    Returns:
+        WriteReport of datafile_out
+
+    Polygonal and polyhedral zones are not supported (ValueError).
+    '''
+    dtype_out = native.PRECISIONS.get(precision)
+    if dtype_out is None and precision != 'auto':
+        raise ValueError(f"Unknown precision '{precision}'; expected auto, single or double")
+    strides = (list(strides) + [1,1,1])[:3]
+
+    with temp_frame() as frame:
+        LOG.info("Load input dataset from %s", datafile_in)
+        ds = load_dataset(datafile_in, frame, zone_patterns, var_patterns, extra_variables=range(3))
+        zones = get_zones(ds, zone_patterns)
+        variables = get_variables(ds, var_patterns)
+        coordinates = [ds.variable(i) for i in range(min(3, ds.num_variables))]
+        unsupported = [z for z in zones if not native_writable(ds, [z])]
+        if unsupported:
+            message = "Cannot decimate polygonal/polyhedral zones " + ', '.join(f'"{z.name}"' for z in unsupported)
+            LOG.error(message)
+            raise ValueError(message)
+
+        specs, zone_data, max_error = [], [], 0.0
+        with instrument.span('compute') as s:
+            for zone in zones:
+                spec = native_zone(zone, variables)
+                values = [native_values(zone, spec, i, v) for i, v in enumerate(variables)]
+                locations = spec.locations or [0] * len(variables)
+                connectivity = None
+                if spec.zone_type == 'Ordered':
+                    node_index, cell_index, shape = mesh.decimate_ordered(spec.shape, strides)
+                    values = [v[cell_index if loc else node_index] for v, loc in zip(values, locations)]
+                else:
+                    target = num_points or max(zone.num_points // int(np.prod(strides)), 1)
+                    xyz = [field_array(zone, c) for c in coordinates]
+                    cluster, count = mesh.cluster_vertices(xyz, target)
+                    connectivity, element_index = mesh.cluster_elements(spec.zone_type, nodemap_array(zone), cluster)
+                    if len(connectivity) == 0:
+                        LOG.warning('Zone "%s" collapses entirely at %d points; skipping it', zone.name, target)
+                        continue
+                    values = [
+                        v[element_index] if loc else mesh.cluster_mean(v, cluster, count).astype(v.dtype)
+                        for v, loc in zip(values, locations)
+                    ]
+                    shape = (count, len(connectivity))
+                if dtype_out is not None:
+                    converted = [v.astype(dtype_out) for v in values]
+                    max_error = max([max_error] + [native.rounding_error(v, c) for v, c in zip(values, converted)])
+                    values = converted
+                LOG.debug("Decimate zone %s from %s to %s", zone.name, spec.shape, shape)
+                specs.append(spec._replace(shape=shape))
+                zone_data.append((values, connectivity))
+                if s:
+                    s.add(points=zone.num_points)
+
+        with instrument.span('write', file=datafile_out) as s:
+            with atomic_output(datafile_out) as temp, native.open_writer(
+                temp, [v.name for v in variables], specs, ds.title, aux_data_dict(ds), share=True,
+            ) as writer:
+                for values, connectivity in zone_data:
+                    writer.write_zone(values, connectivity)
+            if s:
+                s.add(bytes=os.path.getsize(datafile_out), points=sum(native.num_points(z) for z in specs))
+
+    report = WriteReport(datafile_out, os.path.getsize(datafile_out), precision, max_error)
+    LOG.info(
+        "Wrote %d bytes to %s (precision: %s, max rounding error: %.3e)",
+        report.num_bytes, datafile_out, precision, report.max_error,
+    )
+    return report
+
+@instrument.traced
+def derive_variables(datafile_in, datafile_out, expressions, zone_patterns=None, coordinates=None,
+                     precision='auto', jobs=1):
+    ''' Append variables computed from expressions to a dataset
+
+    Arguments:
+        datafile_in     [str] Path to input Tecplot datafile
+        datafile_out    [str] Path to Tecplot datafile to be written
+        expressions     [list(str)] Expressions "<name> = <expression>" over
+                        variable names, evaluated in order, so later ones may
+                        use the results of earlier ones (see tec_util.expr)
+        zone_patterns   [list(str)] Names of zones to be written
+        coordinates     [list(str)] Names of the x, y (and z) variables used
+                        by ddx/ddy/ddz (def: the first three variables)
+        precision       [str] Precision of output data: auto|single|double
+        jobs            [int] Number of worker processes
+
+    Returns:
+        WriteReport of datafile_out
+    '''
+    plans = [expr.compile_expression(e) for e in expressions]
+    assert plans, "No expressions to evaluate"
+    with temp_frame() as frame:
+        LOG.info("Load input dataset from %s", datafile_in)
+        ds = load_dataset(datafile_in, frame, zone_patterns)
+        zones = get_zones(ds, zone_patterns)
+        if coordinates is None:
+            coordinates = [ds.variable(i).name for i in range(min(3, ds.num_variables))]
+        LOG.info("Derive %s", ', '.join(plan.name for plan in plans))
+        add_derived(ds, plans, zones, coordinates, jobs, datafile_in)
+        return write_dataset(datafile_out, ds, precision, zones=zones)
+
+@instrument.traced
+def interpolate_dataset(datafile_src, datafile_tgt, datafile_out, precision='auto'):
     ''' Interpolate variables from one dataset onto another (3D only)
 
         INPUTS:
             datafile_src    Path to datafile to be interpolated
             datafile_tgt    Path to datafile with interpolation coordintes
             datafile_out    Path where datafile with interpolated data is saved
+            precision       Precision of output data: auto|single|double (def: auto)
 
         OUTPUTS:
             none
     '''
-    import tecplot as tp
     import tecplot.constant as tpc
     with temp_frame() as frame:
 
         # Load datasets
         LOG.info("Load source dataset from %s", datafile_src)
-        data = tp.data.load_tecplot(
+        data = load_tecplot(
             datafile_src,
             frame = frame,
             initial_plot_type = tpc.PlotType.Cartesian3D,
         )
         nzone_src = data.num_zones
         LOG.info("Load target dataset from %s", datafile_tgt)
-        tp.data.load_tecplot(
+        load_tecplot(
             datafile_tgt,
             frame = frame,
             read_data_option = tpc.ReadDataOption.Append,
@@ -316,16 +1680,13 @@ def interpolate_dataset(datafile_src, datafile_tgt, datafile_out):
         # Perform interpolation
         src_zones = [data.zone(i) for i in range(nzone_src)]
         tgt_zones = [data.zone(i) for i in range(nzone_src, data.num_zones)]
-        for zone in tgt_zones:
-            tp.data.operate.interpolate_inverse_distance(
-                destination_zone = zone,
-                source_zones = src_zones,
-            )
+        interpolate_zones(src_zones, tgt_zones)
 
         # Save results
-        write_dataset(datafile_out, data, zones=tgt_zones)
+        write_dataset(datafile_out, data, precision, zones=tgt_zones)
 
-def rename_variables(datafile_in, datafile_out, name_map):
+@instrument.traced
+def rename_variables(datafile_in, datafile_out, name_map, precision='auto'):
     ''' Rename variables in a dataset '''
     import tecplot as tp
     import tecplot.constant as tpc
@@ -337,45 +1698,49 @@ def rename_variables(datafile_in, datafile_out, name_map):
 
         # Load the dataset
         LOG.info("Load dataset %s", datafile_in)
-        dataset = tp.data.load_tecplot(
+        dataset = load_tecplot(
             datafile_in,
             frame = frame,
             initial_plot_type = tpc.PlotType.Cartesian3D
         )
 
         # Rename the variables
-        for old_name, new_name in name_map.items():
-            var = dataset.variable(old_name)
-            var.name = new_name
-            LOG.info("Rename %d-th variable '%s' to '%s'", var.index, old_name, new_name)
+        with instrument.span('compute'):
+            for old_name, new_name in name_map.items():
+                var = dataset.variable(old_name)
+                var.name = new_name
+                LOG.info("Rename %d-th variable '%s' to '%s'", var.index, old_name, new_name)
 
         # Save results
-        write_dataset(datafile_out, dataset)
+        write_dataset(datafile_out, dataset, precision)
 
-def rename_zones(datafile_in, datafile_out, name_map):
+@instrument.traced
+def rename_zones(datafile_in, datafile_out, name_map, precision='auto'):
     ''' Rename zones in a dataset '''
-    import tecplot as tp
     import tecplot.constant as tpc
     with temp_frame() as frame:
 
         # Load the dataset
         LOG.info("Load dataset %s", datafile_in)
-        dataset = tp.data.load_tecplot(
+        dataset = load_tecplot(
             datafile_in,
             frame = frame,
             initial_plot_type = tpc.PlotType.Cartesian3D
         )
 
         # Rename the variables
-        for old_name, new_name in name_map.items():
-            zone = dataset.zone(old_name)
-            zone.name = new_name
-            LOG.info("Rename %d-th zone '%s' to '%s'", zone.index, old_name, new_name)
+        with instrument.span('compute'):
+            for old_name, new_name in name_map.items():
+                zone = dataset.zone(old_name)
+                zone.name = new_name
+                LOG.info("Rename %d-th zone '%s' to '%s'", zone.index, old_name, new_name)
 
         # Save results
-        write_dataset(datafile_out, dataset)
+        write_dataset(datafile_out, dataset, precision)
 
-def revolve_dataset(datafile_in, datafile_out, radial_coord=None, planes=65, angle=180.0, vector_vars=None):
+@instrument.traced
+def revolve_dataset(datafile_in, datafile_out, radial_coord=None, planes=65, angle=180.0, vector_vars=None,
+                    precision='auto', share=False):
     ''' Create a 3D dataset by revolving a 2D dataset. Supports vector quantities.
 
     Arguments:
@@ -400,96 +1765,33 @@ def revolve_dataset(datafile_in, datafile_out, radial_coord=None, planes=65, ang
                        tuple, e.g. { 'r': ('x','y'), 'vr': ('vx','vy') }. Note that
                        if a key appears in the name tuple, e.g {'y':('y','z')}, only
                        one new variable is added and the 'y' variable is overwritten.
+        precision      Precision of output data: auto|single|double (def: auto)
+        share          Store values identical between zones once, shared, with the
+                       native writers (def: False)
 
     Limitations:
         Only works for block-structured grids.
         All variable names in the dataset must be unique.
 
     '''
-    import tecplot as tp
-    import tecplot.constant as tpc
-
-    if vector_vars:
-        if isinstance(vector_vars,list):
-            vector_vars = { v:(v+'_cos',v+'_sin') for v in vector_vars }
-    else:
-        vector_vars = {}
-
     with temp_frame() as frame_in, temp_frame() as frame_out:
 
         # Load input dataset
         LOG.info("Load input dataset from %s", datafile_in)
         frame_in.activate()
-        data_in = tp.data.load_tecplot(datafile_in, frame=frame_in)
-        vars_in = [v.name for v in data_in.variables()]
-        assert len(vars_in) == len(set(vars_in)), \
-               f'ERROR: Cannot revolve {datafile_in}. All variables must have unique names.'
-
-        # Select the radial coordinate and add to vector_vars
-        zname = 'z'
-        default_zname = False
-        if not radial_coord:
-            radial_coord = vars_in[1]
-        if isinstance(radial_coord,str):
-            radial_coord = { radial_coord: (radial_coord, zname) }
-            default_zname = True
-        vector_vars = { **radial_coord, **vector_vars }
-
-        # Check that radial coordinate and the new out-of-plane coordiante make sense
-        rname = list(radial_coord.keys())[0]
-        assert rname in vars_in, \
-               f'ERROR: User-specified radial coordinate {rname} does not exist in dataset!'
-        if default_zname:
-            assert not zname in vars_in, \
-                   f'ERROR: New coordinate "{zname}" will clobber existing variable! ' \
-                   'Please use a dict argument to radial_coord to specify coordinate names.'
-
-        # Check the vector_vars mapping
-        for v in vector_vars:
-            assert v in vars_in, \
-                   f'ERROR: User requested vector variable {v} not present in dataset.'
-
-        # Initialize output dataset and construct variable list
-        data_out = frame_out.create_dataset('anchor3d')
-        for v in vars_in:
-            data_out.add_variable(v)
-            if v in vector_vars:
-                LOG.info(f'Using variable {v} as a vector-valued variable.')
-                for component in vector_vars[v]:
-                    if not component in vars_in:
-                        LOG.info(f'Adding vector component variable "{component}" to the dataset')
-                        data_out.add_variable(component)
-
-        # Compute sine/cosine for each data plane
-        t = np.linspace(0.0, np.radians(angle), planes)
-        st = np.sin(t)
-        ct = np.cos(t)
-
-        # Construct all zones and revolve data
-        for zin in data_in.zones():
-            assert isinstance(zin, tp.data.OrderedZone), \
-                   f'ERROR: Cannot revolve zone "{zin.name}". Must be an OrderedZone.'
-            assert zin.rank < 3, \
-                   f'ERROR: Cannot revolve zone "{zin.name}". Must be rank 1 or 2.'
-            zout = data_out.add_ordered_zone(zin.name, [*zin.dimensions[0:zin.rank], planes])
-            npt  = np.prod(zin.dimensions)
-            for v in vars_in:
-                vals_in  = zin.values(v)
-                vals_out = zout.values(v)
-                for k in range(planes):
-                    vals_out[k*npt:(k+1)*npt] = vals_in[:]
-                if v in vector_vars:
-                    vy,vz  = vector_vars[v]
-                    vals_y = zout.values(vy)
-                    vals_z = zout.values(vz)
-                    for k in range(planes):
-                        vals_y[k*npt:(k+1)*npt] = np.multiply(vals_in[:],ct[k])
-                        vals_z[k*npt:(k+1)*npt] = np.multiply(vals_in[:],st[k])
+        data_in = load_tecplot(datafile_in, frame=frame_in)
+
+        # Revolve it into the output frame
+        data_out = revolve_zones(
+            list(data_in.zones()), list(data_in.variables()), frame_out,
+            radial_coord, planes, angle, vector_vars,
+        )
 
         # Write output
-        write_dataset(datafile_out, data_out)
+        write_dataset(datafile_out, data_out, precision, share=share)
 
-def slice_surfaces(slice_file, datafile_in, datafile_out):
+@instrument.traced
+def slice_surfaces(slice_file, datafile_in, datafile_out, precision='auto'):
     ''' Extract slice zones from a datafile of surface zones.
 
         INPUTS:
@@ -509,18 +1811,16 @@ def slice_surfaces(slice_file, datafile_in, datafile_out):
                 extension ".dat", the data will be written in ASCII format.
                 Otherwise, binary format will be used.
 
+            precision
+                Precision of output data: auto|single|double (def: auto)
+
         OUPUTS:
             none
     '''
     import tecplot as tp
     import tecplot.constant as tpc
 
-    # Load slice definition file as "config" module
-    # This is based on https://stackoverflow.com/questions/67631
-    LOG.info("Load slice definition from %s", slice_file)
-    sys.dont_write_bytecode = True # So we don't clutter users workspace
-    config = SourceFileLoader("config", slice_file).load_module()
-    sys.dont_write_bytecode = False
+    slices = load_slices(slice_file)
 
     try:
 
@@ -530,32 +1830,15 @@ def slice_surfaces(slice_file, datafile_in, datafile_out):
 
         # Load and slice the dataset
         LOG.info("Load dataset %s", datafile_in)
-        dataset = tp.data.load_tecplot(
+        dataset = load_tecplot(
             datafile_in,
             frame = frame,
             initial_plot_type = tpc.PlotType.Cartesian3D
         )
-        slice_zones = []
-        for slice_definition in config.slices:
-            name, origin, normal, zones = slice_definition
-            if isinstance(zones, str):
-                if zones == "all":
-                    zones = range(dataset.num_zones)
-                else:
-                    raise RuntimeError("String '%s' is not a valid zone specifier" % zones)
-            LOG.info("Extract slice '%s'", name)
-            frame.active_zones(zones)
-            zone = tp.data.extract.extract_slice(
-                origin  = origin,
-                normal  = normal,
-                source  = tpc.SliceSource.SurfaceZones,
-                dataset = dataset,
-            )
-            zone.name = name
-            slice_zones.append(zone)
+        slice_zones = extract_slices(frame, dataset, slices)
 
         # Save results
-        write_dataset(datafile_out, dataset, zones=slice_zones)
+        write_dataset(datafile_out, dataset, precision, zones=slice_zones)
 
     finally:
         # Restore global state
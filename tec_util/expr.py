@@ -0,0 +1,302 @@
+''' Derived-variable expressions compiled into vectorized NumPy plans.
+
+An expression such as "M = sqrt(u**2 + v**2 + w**2) / c" is parsed once,
+with the ast module, into a Plan: a flat list of ufunc calls whose operands
+are input variables, constants or scratch registers. Evaluating a Plan
+streams a zone through it in chunks. Each call writes into a preallocated
+register (the last one straight into the output array) with out=, so no
+temporary arrays are created however long the expression is, and scratch
+memory is a few chunks whatever the size of the zone. Constant
+subexpressions are folded when the plan is compiled.
+
+Names that are not Python identifiers are written in braces, e.g.
+"p_kPa = {Pressure (Pa)} / 1000". ddx(), ddy() and ddz() differentiate
+their argument with respect to the coordinates of an ordered zone by finite
+differences (see mesh.ordered_gradient). They need the whole zone, so their
+arguments are evaluated first into full arrays, which the chunked plan then
+reads like input variables; the gradient of each argument is computed once
+however many of its components are used.
+'''
+import ast
+import logging
+import numpy as np
+import re
+from . import mesh
+
+LOG = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+BINARY_OPERATORS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide,
+    ast.Pow: np.power, ast.Mod: np.mod,
+}
+UNARY_OPERATORS = {ast.USub: np.negative, ast.UAdd: np.positive}
+FUNCTIONS = {
+    'abs': np.absolute, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log10': np.log10,
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'asin': np.arcsin, 'acos': np.arccos,
+    'atan': np.arctan, 'atan2': np.arctan2, 'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
+    'hypot': np.hypot, 'min': np.minimum, 'max': np.maximum, 'sign': np.sign,
+}
+GRADIENTS = {'ddx': 0, 'ddy': 1, 'ddz': 2}
+CONSTANTS = {'pi': np.pi}
+BRACED = re.compile(r'\{([^{}]+)\}')
+
+
+class Plan:
+    ''' Compiled expression assigning a new variable; see compile_expression
+
+    Attributes:
+        name        Name of the variable computed by the plan
+        text        Source expression
+        variables   Names of the variables read by the chunked steps
+        gradients   Plans of the arguments of ddx/ddy/ddz
+        steps       List of (ufunc, operands, register); operands are
+                    ('const', value), ('var', name), ('grad', index, axis)
+                    or ('reg', register)
+        result      Operand holding the result
+    '''
+    def __init__(self, name, text, variables, gradients, steps, result, num_registers):
+        self.name = name
+        self.text = text
+        self.variables = variables
+        self.gradients = gradients
+        self.steps = steps
+        self.result = result
+        self.num_registers = num_registers
+
+    def __repr__(self):
+        return f'Plan({self.text!r})'
+
+    @property
+    def axes(self):
+        ''' Coordinate axes (0: x, 1: y, 2: z) along which the plan differentiates '''
+        operands = [op for _, ops, _ in self.steps for op in ops] + [self.result]
+        axes = {op[2] for op in operands if op[0] == 'grad'}
+        for plan in self.gradients:
+            axes.update(plan.axes)
+        return axes
+
+    @property
+    def inputs(self):
+        ''' Names of all variables read by the plan, including gradient arguments '''
+        names = list(self.variables)
+        for plan in self.gradients:
+            names.extend(n for n in plan.inputs if n not in names)
+        return names
+
+    def evaluate(self, values, size, out=None, shape=None, xyz=None, chunk_size=CHUNK_SIZE):
+        ''' Evaluate the plan over the points (or cells) of a zone
+
+        Arguments:
+            values      Mapping of variable names to arrays of length size
+            size        Number of values of the zone
+            out         float64 array receiving the result (def: new array)
+            shape       IJK dimensions of an ordered zone  } required by
+            xyz         Coordinate arrays of the zone      } gradients
+            chunk_size  Number of values per chunk
+
+        Returns:
+            out
+        '''
+        if out is None:
+            out = np.empty(size)
+        fields = [
+            gradient_field(plan.evaluate(values, size, None, shape, xyz, chunk_size), shape, xyz, plan)
+            for plan in self.gradients
+        ]
+        registers = np.empty((self.num_registers, min(chunk_size, size)))
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            chunk = registers[:, :stop-start]
+            def operand(op):
+                if op[0] == 'const':
+                    return op[1]
+                if op[0] == 'var':
+                    return values[op[1]][start:stop]
+                if op[0] == 'grad':
+                    return fields[op[1]][op[2], start:stop]
+                return chunk[op[1]]
+            for i, (func, operands, register) in enumerate(self.steps):
+                target = out[start:stop] if i == len(self.steps) - 1 else chunk[register]
+                func(*map(operand, operands), out=target, dtype=np.float64)
+            if not self.steps:
+                out[start:stop] = operand(self.result)
+        return out
+
+
+class _Compiler:
+    ''' Translate an expression tree into the steps of a Plan '''
+    def __init__(self, names):
+        self.names = names # Placeholder -> braced variable name
+        self.variables = []
+        self.gradients = {}
+        self.steps = []
+        self.free = []
+        self.num_registers = 0
+
+    def fail(self, node, message):
+        raise SyntaxError(f"{message} at column {getattr(node, 'col_offset', 0) + 1}")
+
+    def emit(self, func, operands):
+        ''' Append a step, or fold it if all operands are constant '''
+        if all(op[0] == 'const' for op in operands):
+            return ('const', float(func(*(op[1] for op in operands))))
+        for op in operands:
+            if op[0] == 'reg':
+                self.free.append(op[1])
+        if self.free:
+            register = self.free.pop()
+        else:
+            register = self.num_registers
+            self.num_registers += 1
+        self.steps.append((func, tuple(operands), register))
+        return ('reg', register)
+
+    def compile(self, node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return ('const', float(node.value))
+        if isinstance(node, ast.Name):
+            if node.id in self.names:
+                name = self.names[node.id]
+            elif node.id in CONSTANTS:
+                return ('const', CONSTANTS[node.id])
+            else:
+                name = node.id
+            if name not in self.variables:
+                self.variables.append(name)
+            return ('var', name)
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            left = self.compile(node.left)
+            right = self.compile(node.right)
+            if isinstance(node.op, ast.Pow) and right == ('const', 2.0):
+                return self.emit(np.square, [left])
+            if isinstance(node.op, ast.Pow) and right == ('const', 0.5):
+                return self.emit(np.sqrt, [left])
+            return self.emit(BINARY_OPERATORS[type(node.op)], [left, right])
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            return self.emit(UNARY_OPERATORS[type(node.op)], [self.compile(node.operand)])
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            if name in GRADIENTS:
+                if len(node.args) != 1:
+                    self.fail(node, f"{name}() takes 1 argument")
+                key = ast.dump(node.args[0])
+                if key not in self.gradients:
+                    self.gradients[key] = compile_tree(name, node.args[0], self.names)
+                return ('grad', list(self.gradients).index(key), GRADIENTS[name])
+            if name in FUNCTIONS:
+                func = FUNCTIONS[name]
+                if len(node.args) != func.nin:
+                    self.fail(node, f"{name}() takes {func.nin} argument{'s' if func.nin > 1 else ''}")
+                return self.emit(func, [self.compile(arg) for arg in node.args])
+            self.fail(node, f'Unknown function "{name}"')
+        self.fail(node, f"Unsupported syntax ({type(node).__name__})")
+
+def compile_tree(text, tree, names):
+    ''' Compile the tree of an expression into an (unnamed) Plan '''
+    compiler = _Compiler(names)
+    result = compiler.compile(tree)
+    return Plan(
+        None, text, compiler.variables, list(compiler.gradients.values()),
+        compiler.steps, result, compiler.num_registers,
+    )
+
+def compile_expression(text):
+    ''' Compile an expression "<name> = <expression>" into a Plan
+
+    Expressions may use + - * / ** %, the functions in FUNCTIONS, ddx/ddy/ddz
+    and the constant pi. Variable names that are not Python identifiers are
+    written in braces, on either side of the "=".
+    '''
+    names = {}
+    def placeholder(match):
+        key = f'_var{len(names)}_'
+        names[key] = match.group(1).strip()
+        return key
+    try:
+        module = ast.parse(BRACED.sub(placeholder, text).strip())
+        if len(module.body) != 1 or not isinstance(module.body[0], ast.Assign) \
+           or len(module.body[0].targets) != 1 or not isinstance(module.body[0].targets[0], ast.Name):
+            raise SyntaxError('expected "<name> = <expression>"')
+        target = module.body[0].targets[0].id
+        plan = compile_tree(text, module.body[0].value, names)
+    except SyntaxError as e:
+        message = f'Bad expression "{text}": {e.msg}'
+        LOG.error(message)
+        raise ValueError(message)
+    plan.name = names.get(target, target)
+    LOG.debug("Compiled %s into %d steps, %d registers", plan, len(plan.steps), plan.num_registers)
+    return plan
+
+def gradient_field(values, shape, xyz, plan):
+    ''' Gradient of the values of a plan's argument, checking that it can be taken '''
+    if shape is None or xyz is None:
+        raise ValueError(f"Cannot differentiate {plan.text}: gradients require an ordered zone")
+    return mesh.ordered_gradient(values, shape, xyz)
+
+def check_names(plans, variables, coordinates=()):
+    ''' Check that each plan only reads variables or the results of earlier plans '''
+    known = set(variables)
+    missing = [name for name in coordinates if name not in known]
+    if missing and any(plan.gradients for plan in plans):
+        message = f'Unknown coordinate variables: {", ".join(missing)}'
+        LOG.error(message)
+        raise ValueError(message)
+    for plan in plans:
+        missing = [name for name in plan.inputs if name not in known]
+        if missing:
+            message = f'Unknown variables in "{plan.text}": {", ".join(missing)}'
+            LOG.error(message)
+            raise ValueError(message)
+        known.add(plan.name)
+
+def result_locations(plans, zone, variables, coordinates=()):
+    ''' Value location (0: nodal, 1: cell-centered) of the result of each plan in a zone
+
+    Arguments:
+        plans        List of Plans, evaluated in order
+        zone         native.Zone
+        variables    Names of the variables of the zone, in order
+        coordinates  Names of the coordinate variables used by gradients
+
+    Raises ValueError if a plan mixes nodal and cell-centered values, or if
+    it takes a gradient in an FE zone or of cell-centered values.
+    '''
+    locations = dict(zip(variables, zone.locations or [0] * len(variables)))
+    result = []
+    for plan in plans:
+        found = {locations[name] for name in plan.inputs}
+        if plan.gradients and zone.zone_type != 'Ordered':
+            message = f'Cannot evaluate "{plan.text}" in {zone.zone_type} zone "{zone.name}": gradients require an ordered zone'
+        elif plan.gradients and max(plan.axes) >= len(coordinates):
+            message = f'Cannot evaluate "{plan.text}": it needs {max(plan.axes) + 1} coordinate variables'
+        elif plan.gradients and (found | {locations[c] for c in coordinates}) != {0}:
+            message = f'Cannot evaluate "{plan.text}" in zone "{zone.name}": gradients require nodal values'
+        elif len(found) > 1:
+            message = f'Cannot evaluate "{plan.text}" in zone "{zone.name}": it mixes nodal and cell-centered values'
+        else:
+            locations[plan.name] = found.pop() if found else 0
+            result.append(locations[plan.name])
+            continue
+        LOG.error(message)
+        raise ValueError(message)
+    return result
+
+def evaluate_zone(plans, zone, values, outputs, coordinates=(), chunk_size=CHUNK_SIZE):
+    ''' Evaluate plans in order over one zone
+
+    Arguments:
+        plans        List of Plans
+        zone         native.Zone
+        values       Mapping of variable names to the arrays of the zone
+        outputs      float64 arrays receiving the result of each plan
+        coordinates  Names of the coordinate variables used by gradients
+
+    Later plans read the results of earlier ones by name.
+    '''
+    values = dict(values)
+    shape = zone.shape if zone.zone_type == 'Ordered' else None
+    for plan, out in zip(plans, outputs):
+        xyz = [values[name] for name in coordinates] if shape is not None else None
+        plan.evaluate(values, len(out), out, shape, xyz, chunk_size)
+        values[plan.name] = out
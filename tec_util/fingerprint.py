@@ -0,0 +1,125 @@
+''' Content fingerprints of zones and zone-variables.
+
+The fingerprint of a zone-variable is the BLAKE2b digest of its data type
+and raw buffer (sidecar.buffer_hash); that of the zone structure covers its
+type, dimensions, value locations and, for FE zones, connectivity. Buffers
+are hashed as memory views of the memory-mapped (PLT) or parsed (ASCII)
+arrays, so no value is ever converted or copied element by element.
+
+If a datafile has an up-to-date statistics sidecar (see sidecar.py), the
+digests of its zone-variables are taken from it instead of being computed.
+Two datafiles can then be compared without reading any field data.
+'''
+import collections
+import hashlib
+import logging
+import numpy as np
+import os
+from . import instrument
+from . import native
+from .core import NameIndex
+from .sidecar import buffer_hash, load_sidecar
+
+LOG = logging.getLogger(__name__)
+
+ZoneFingerprint = collections.namedtuple('ZoneFingerprint', [
+    'name', 'strand', 'solution_time', 'structure', 'variables',
+])
+Comparison = collections.namedtuple('Comparison', ['identical', 'changed', 'missing', 'added'])
+
+
+def structure_hash(reader, izone):
+    ''' BLAKE2b digest of the type, dimensions, locations and connectivity of a zone '''
+    zone = reader.zones[izone]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((zone.zone_type, tuple(zone.shape), zone.locations)).encode())
+    if zone.zone_type != 'Ordered':
+        digest.update(np.ascontiguousarray(reader.connectivity(izone), '<i4').data)
+    return digest.hexdigest()
+
+def cached_hashes(datafile):
+    ''' {(zone index, variable name): digest} from an up-to-date sidecar, or {} '''
+    index = load_sidecar(datafile)
+    stat = os.stat(datafile)
+    if index is None or (index['size'], index['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        return {}
+    return {
+        (int(iz), name): entry['hash']
+        for iz, zone in index['zones'].items()
+        for name, entry in zone['variables'].items()
+    }
+
+def variable_hash(reader, cache, izone, ivar):
+    ''' Digest of a zone-variable, from cache (see cached_hashes) if possible '''
+    digest = cache.get((izone, reader.variables[ivar]))
+    return digest if digest is not None else buffer_hash(reader.values(izone, ivar))
+
+def zone_key(fingerprint):
+    ''' Key pairing the zones of two datafiles: name, strand and solution time '''
+    return (fingerprint.name, fingerprint.strand, fingerprint.solution_time)
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+@instrument.traced
+def datafile_fingerprints(datafile, zone_patterns=None, var_patterns=None):
+    ''' Return a ZoneFingerprint for each selected zone of a datafile
+
+    ZoneFingerprint.variables maps each selected variable name to the digest
+    of its values in the zone.
+    '''
+    cache = cached_hashes(datafile)
+    with native.open_dataset(datafile) as reader, instrument.span('compute', file=datafile) as s:
+        variables = NameIndex(reader.variables).select(var_patterns)
+        zones = NameIndex(z.name for z in reader.zones).select(zone_patterns)
+        result = []
+        for iz in zones:
+            zone = reader.zones[iz]
+            hashes = {reader.variables[iv]: variable_hash(reader, cache, iz, iv) for iv in variables}
+            result.append(ZoneFingerprint(
+                zone.name, zone.strand, zone.solution_time, structure_hash(reader, iz), hashes,
+            ))
+            if s:
+                s.add(points=native.num_points(zone))
+    if cache:
+        LOG.info("Fingerprints of %s taken from its sidecar where possible", datafile)
+    return result
+
+@instrument.traced
+def compare_datafiles(datafile_a, datafile_b, zone_patterns=None, var_patterns=None):
+    ''' Compare the contents of two datafiles zone by zone
+
+    Zones are paired by name, strand and solution time (and by order among
+    zones sharing all three). Returns a Comparison of lists of zone names:
+        identical  zones with the same structure and variable values
+        changed    (name, [differing variables]) of the other paired zones;
+                   "<structure>" stands for the dimensions/connectivity
+        missing    zones of datafile_a not found in datafile_b
+        added      zones of datafile_b not found in datafile_a
+    '''
+    zones_a = datafile_fingerprints(datafile_a, zone_patterns, var_patterns)
+    zones_b = datafile_fingerprints(datafile_b, zone_patterns, var_patterns)
+    unpaired = collections.defaultdict(collections.deque)
+    for fingerprint in zones_b:
+        unpaired[zone_key(fingerprint)].append(fingerprint)
+
+    result = Comparison([], [], [], [])
+    for a in zones_a:
+        if not unpaired[zone_key(a)]:
+            result.missing.append(a.name)
+            continue
+        b = unpaired[zone_key(a)].popleft()
+        differences = ['<structure>'] if a.structure != b.structure else []
+        names = list(a.variables) + [name for name in b.variables if name not in a.variables]
+        differences += [name for name in names if a.variables.get(name) != b.variables.get(name)]
+        if differences:
+            result.changed.append((a.name, differences))
+        else:
+            result.identical.append(a.name)
+    result.added.extend(b.name for remaining in unpaired.values() for b in remaining)
+    LOG.info(
+        "%d zones identical, %d changed, %d missing, %d added",
+        len(result.identical), len(result.changed), len(result.missing), len(result.added),
+    )
+    return result
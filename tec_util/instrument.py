@@ -0,0 +1,247 @@
+''' Lightweight timing spans for profiling tec_util functions.
+
+Spans are recorded only while a Recorder is active (see recording()); at
+all other times span() returns a shared no-op object, so instrumented code
+costs one global lookup per span. Counters such as bytes or points are
+attached to a span with add(); since computing them may not be free,
+guard that with "if s:" (the no-op span is falsy).
+
+    with instrument.span('load', file=filename) as s:
+        dataset = load(filename)
+        if s:
+            s.add(bytes=os.path.getsize(filename))
+
+Recorded spans can be saved in the Chrome trace event format (viewable in
+chrome://tracing or https://ui.perfetto.dev) and summarized as a table.
+
+If a Recorder is created with memory=True, each span also records the
+resident set size (RSS) of the process when it exits, the high-water mark
+of the RSS, and the peak memory allocated through Python while the span
+was open, as traced by tracemalloc (this includes NumPy arrays, but not
+memory allocated internally by the Tecplot engine). Note that the RSS
+high-water mark is process-wide, so it never decreases.
+'''
+import collections
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+_RECORDER = None # Active Recorder, if any
+
+Event = collections.namedtuple('Event', ['name', 'start', 'duration', 'thread', 'args'])
+
+
+class _NullSpan:
+    ''' Span used when nothing is being recorded '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def __bool__(self):
+        return False
+
+    def add(self, **counts):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    ''' Timed region of code; records an Event when it exits '''
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        if self.recorder.memory:
+            self.recorder.enter_memory(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if self.recorder.memory:
+            self.recorder.exit_memory(self)
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.recorder.record(Event(self.name, self.start, duration, threading.get_ident(), self.args))
+
+    def add(self, **counts):
+        ''' Add to numeric counters (e.g. bytes, points) of the span '''
+        for key, value in counts.items():
+            self.args[key] = self.args.get(key, 0) + value
+
+
+def rss():
+    ''' Current resident set size of this process in bytes (0 if unknown) '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def peak_rss():
+    ''' High-water mark of the resident set size of this process in bytes '''
+    if resource is None:
+        return 0
+    scale = 1 if os.uname().sysname == 'Darwin' else 1024 # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class Recorder:
+    ''' Collects the Events of all spans that exit while it is active '''
+    def __init__(self, memory=False):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._stack = [] # Open spans, for nested tracemalloc peaks
+
+    def record(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def enter_memory(self, span):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.py_peak = max(parent.py_peak, peak)
+        span.py_peak = current
+        self._stack.append(span)
+        if hasattr(tracemalloc, 'reset_peak'): # Python 3.9+
+            tracemalloc.reset_peak()
+
+    def exit_memory(self, span):
+        current, peak = tracemalloc.get_traced_memory()
+        span.py_peak = max(span.py_peak, peak)
+        if span in self._stack:
+            self._stack.remove(span)
+        if self._stack:
+            parent = self._stack[-1]
+            parent.py_peak = max(parent.py_peak, span.py_peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        span.args.update(rss=rss(), rss_peak=peak_rss(), py_peak=span.py_peak)
+
+    def chrome_trace(self):
+        ''' Events in the Chrome trace event format '''
+        pid = os.getpid()
+        threads = {}
+        trace = []
+        for e in sorted(self.events, key=lambda e: e.start):
+            trace.append({
+                'name': e.name,
+                'cat': 'tec_util',
+                'ph': 'X',
+                'ts': (e.start - self.origin) * 1e6,
+                'dur': e.duration * 1e6,
+                'pid': pid,
+                'tid': threads.setdefault(e.thread, len(threads)),
+                'args': {k: v if isinstance(v, (int, float, bool)) else str(v) for k, v in e.args.items()},
+            })
+            if 'rss' in e.args:
+                trace.append({
+                    'name': 'memory',
+                    'ph': 'C',
+                    'ts': (e.start + e.duration - self.origin) * 1e6,
+                    'pid': pid,
+                    'args': {'rss_mb': e.args['rss'] / 2**20, 'py_peak_mb': e.args['py_peak'] / 2**20},
+                })
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms', 'otherData': {'summary': self.summary()}}
+
+    def write_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f, indent=1)
+
+    def summary(self):
+        ''' Per-span-name totals: {name: {count, total, mean, max, bytes, points}}
+
+        With memory=True, also includes the largest rss_peak and py_peak of
+        each span name.
+        '''
+        result = {}
+        for e in self.events:
+            s = result.setdefault(e.name, {'count': 0, 'total': 0.0, 'max': 0.0, 'bytes': 0, 'points': 0})
+            s['count'] += 1
+            s['total'] += e.duration
+            s['max'] = max(s['max'], e.duration)
+            s['bytes'] += e.args.get('bytes', 0)
+            s['points'] += e.args.get('points', 0)
+            for key in ['rss_peak', 'py_peak']:
+                if key in e.args:
+                    s[key] = max(s.get(key, 0), e.args[key])
+        for s in result.values():
+            s['mean'] = s['total'] / s['count']
+        return result
+
+    def format_summary(self):
+        ''' Summary as a text table, slowest span first '''
+        columns = ['Span', 'Count', 'Total [s]', 'Mean [s]', 'Max [s]', 'MB', 'Mpts/s']
+        if self.memory:
+            columns += ['RSS pk MB', 'Py pk MB']
+        summary = sorted(self.summary().items(), key=lambda item: -item[1]['total'])
+        width = max([len(columns[0])] + [len(name) for name, s in summary])
+        lines = [('{:{w}s}' + ' {:>6s}' + ' {:>10s}' * (len(columns)-2)).format(*columns, w=width)]
+        for name, s in summary:
+            rate = s['points'] / s['total'] / 1e6 if s['points'] and s['total'] else 0.0
+            line = '{:{w}s} {:6d} {:10.4f} {:10.4f} {:10.4f} {:10.2f} {:10.2f}'.format(
+                name, s['count'], s['total'], s['mean'], s['max'], s['bytes'] / 2**20, rate, w=width,
+            )
+            if self.memory:
+                line += ' {:10.1f} {:10.1f}'.format(s.get('rss_peak', 0) / 2**20, s.get('py_peak', 0) / 2**20)
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+#-----------------------------------------------------------------------
+# Public Interface
+#-----------------------------------------------------------------------
+def span(name, **args):
+    ''' Context manager timing a region of code as a span called name '''
+    if _RECORDER is None:
+        return NULL_SPAN
+    return Span(_RECORDER, name, args)
+
+def enabled():
+    ''' True if spans are being recorded '''
+    return _RECORDER is not None
+
+def traced(func):
+    ''' Decorator wrapping each call of a function in a span '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _RECORDER is None:
+            return func(*args, **kwargs)
+        with Span(_RECORDER, func.__name__, {}):
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def recording(memory=False):
+    ''' Record all spans within the context; yields the Recorder
+
+    If memory is True, tracemalloc is started (if not already tracing) for
+    the duration of the context and spans also record memory use.
+    '''
+    global _RECORDER
+    previous = _RECORDER
+    _RECORDER = Recorder(memory)
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    try:
+        yield _RECORDER
+    finally:
+        if start_tracing:
+            tracemalloc.stop()
+        _RECORDER = previous
@@ -0,0 +1,336 @@
+''' Integration of forces and fluxes over surface zones and slice lines.
+
+The geometry of each zone (element area vectors, areas and centroids) is
+computed from the FE connectivity, or from the IJ (or IK, JK) cells of an
+ordered surface, in vectorized NumPy; line zones, e.g. the slices written by
+slice_surfaces, are integrated per unit length with normals in their plane.
+Nodal values are averaged over the nodes of each element and cell-centered
+values are used as they are, so that
+
+    scalar   S = sum(f * area)              e.g. heat flux
+    force    F = sum(p * area vector)       e.g. pressure (sign as the normals)
+             M = sum((centroid - center) x p * area vector)
+    flux     Q = sum((u,v,w) . area vector) e.g. mass flux rho*u, rho*v, rho*w
+
+Zones are read with the native readers and integrated by worker processes;
+each worker integrates the same zones of every datafile. The geometry of a
+zone is cached, in the memory of its worker and optionally in a directory of
+.npz files, so the timesteps of a series on the same mesh only compute it
+once. The cache key is the structure of the zone and the digests of its
+coordinates from an up-to-date sidecar (tec_util stats --sidecar) or, without
+one, a hash of the full coordinates and connectivity, a single pass over the
+zone. With sample_geometry, the coordinates are instead fingerprinted by
+their min/max (stored in PLT headers) and a strided sample of the values and
+connectivity: cheaper, but a mesh that only moves between sampled points
+gets a stale geometry, so this is only an opt-in.
+'''
+import collections
+import concurrent.futures
+import csv
+import hashlib
+import logging
+import numpy as np
+import os
+from . import instrument
+from . import mesh
+from . import native
+from .core import NameIndex, atomic_output
+from .fingerprint import cached_hashes
+from .series import expand_datafiles
+
+LOG = logging.getLogger(__name__)
+
+CACHE_BYTES = 1 << 29
+SAMPLE_SIZE = 1024 # Values sampled per coordinate (and connectivity) by a sampled geometry_key
+SURFACE_TYPES = {'Ordered', 'FELineSeg', 'FETriangle', 'FEQuad'}
+FORCE_COMPONENTS = ['Fx', 'Fy', 'Fz', 'Mx', 'My', 'Mz']
+
+Geometry = collections.namedtuple('Geometry', ['elements', 'vectors', 'measure', 'centroid'])
+Integrands = collections.namedtuple('Integrands', ['scalars', 'forces', 'fluxes', 'center'])
+ZoneIntegrals = collections.namedtuple('ZoneIntegrals', ['datafile', 'zone', 'solution_time', 'values'])
+
+_geometry_cache = collections.OrderedDict()
+
+
+#-----------------------------------------------------------------------
+# Geometry
+#-----------------------------------------------------------------------
+def is_surface(zone):
+    ''' True if a native.Zone is a surface or a line '''
+    if zone.zone_type == 'Ordered':
+        return sum(n > 1 for n in zone.shape) in (1, 2)
+    return zone.zone_type in SURFACE_TYPES
+
+def sample(values, size=SAMPLE_SIZE):
+    ''' About size evenly strided values of an array, including the last one '''
+    values = values.ravel()
+    if values.size <= size:
+        return values
+    return np.append(values[::values.size // size], values[-1])
+
+def geometry_key(reader, hashes, izone, coordinates, sampled=False):
+    ''' Digest of the type, dimensions, connectivity and coordinates of a zone
+
+    Coordinates without a digest in hashes (see cached_hashes) are hashed
+    whole, as is the connectivity. If sampled, they are fingerprinted by
+    their range and a sample instead, so the key costs a few pages of the
+    file rather than a pass over the zone, but misses changes between the
+    sampled values.
+    '''
+    zone = reader.zones[izone]
+    digest = hashlib.blake2b(repr((zone.zone_type, tuple(zone.shape), len(coordinates), sampled)).encode(), digest_size=16)
+    if zone.zone_type != 'Ordered':
+        connectivity = reader.connectivity(izone)
+        digest.update(np.ascontiguousarray(sample(connectivity) if sampled else connectivity, '<i4').data)
+    for iv in coordinates:
+        cached = hashes.get((izone, reader.variables[iv]))
+        if cached is not None:
+            digest.update(cached.encode())
+        elif sampled:
+            digest.update(np.array(reader.value_range(izone, iv), '<f8').data)
+            digest.update(np.ascontiguousarray(sample(reader.values(izone, iv)), '<f8').data)
+        else:
+            values = np.ascontiguousarray(reader.values(izone, iv))
+            digest.update(values.dtype.str.encode())
+            digest.update(values.data)
+    return digest.hexdigest()
+
+def compute_geometry(reader, izone, coordinates):
+    ''' Geometry of a surface zone of a native reader '''
+    zone = reader.zones[izone]
+    if zone.zone_type == 'Ordered':
+        elements = mesh.ordered_elements(zone.shape)
+    else:
+        elements = np.asarray(reader.connectivity(izone))
+    xyz = [reader.values(izone, iv) for iv in coordinates]
+    return Geometry(elements, *mesh.element_geometry(elements, xyz))
+
+def cache_geometry(key, geometry):
+    ''' Keep geometry in the in-memory cache, evicting the least recently used '''
+    _geometry_cache[key] = geometry
+    _geometry_cache.move_to_end(key)
+    size = lambda g: sum(a.nbytes for a in g)
+    while sum(size(g) for g in _geometry_cache.values()) > CACHE_BYTES and len(_geometry_cache) > 1:
+        _geometry_cache.popitem(last=False)
+
+def zone_geometry(reader, hashes, izone, coordinates, cache_dir=None, sampled=False):
+    ''' (Geometry, cached) of a zone, from the in-memory or on-disk cache if possible '''
+    key = geometry_key(reader, hashes, izone, coordinates, sampled)
+    if key in _geometry_cache:
+        _geometry_cache.move_to_end(key)
+        return _geometry_cache[key], True
+    path = cache_dir and os.path.join(cache_dir, key + '.npz')
+    if path and os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                geometry = Geometry(**{field: data[field] for field in Geometry._fields})
+            cache_geometry(key, geometry)
+            return geometry, True
+        except (OSError, ValueError, KeyError) as e:
+            LOG.warning("Ignoring unreadable geometry cache %s: %s", path, e)
+    geometry = compute_geometry(reader, izone, coordinates)
+    cache_geometry(key, geometry)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        with atomic_output(path) as temp:
+            np.savez(temp, **geometry._asdict())
+    return geometry, False
+
+
+#-----------------------------------------------------------------------
+# Integration
+#-----------------------------------------------------------------------
+def integral_columns(integrands):
+    ''' Names of the integrals computed for integrands, in order '''
+    return (
+        ['area'] + list(integrands.scalars) +
+        [f'{name}_{c}' for name in integrands.forces for c in FORCE_COMPONENTS] +
+        [f"flux({','.join(names)})" for names in integrands.fluxes]
+    )
+
+def element_values(geometry, values, cell_centered):
+    ''' Values of a variable per element: averaged over the nodes if nodal '''
+    if cell_centered:
+        return np.asarray(values, dtype=np.float64)
+    elements = geometry.elements
+    result = np.zeros(len(elements))
+    for c in range(elements.shape[1]):
+        result += values[elements[:,c]]
+    return result / elements.shape[1]
+
+def zone_integrals(geometry, values, integrands):
+    ''' {column: integral} of a zone; values maps names to (values, cell_centered) '''
+    result = {'area': float(geometry.measure.sum())}
+    element = {name: element_values(geometry, *v) for name, v in values.items()}
+    for name in integrands.scalars:
+        result[name] = float(element[name] @ geometry.measure)
+    for name in integrands.forces:
+        force = element[name][:,None] * geometry.vectors
+        moment = np.cross(geometry.centroid - np.asarray(integrands.center, dtype=np.float64), force)
+        totals = np.concatenate([force.sum(axis=0), moment.sum(axis=0)])
+        result.update((f'{name}_{c}', float(t)) for c, t in zip(FORCE_COMPONENTS, totals))
+    for names in integrands.fluxes:
+        flux = sum(element[n] * geometry.vectors[:,i] for i, n in enumerate(names))
+        result[f"flux({','.join(names)})"] = float(flux.sum())
+    return result
+
+def integrate_zones(datafile, zones, integrands, coordinates, cache_dir=None, sample_geometry=False):
+    ''' Integrate the given zones of a datafile
+
+    Returns:
+        (rows, num_cached) where rows is a list of (zone index, ZoneIntegrals)
+        and num_cached the number of zones whose geometry came from a cache.
+    '''
+    names = list(integrands.scalars) + list(integrands.forces) + [n for f in integrands.fluxes for n in f]
+    hashes = cached_hashes(datafile)
+    rows, num_cached = [], 0
+    with native.open_dataset(datafile) as reader, instrument.span('integrate', file=datafile) as s:
+        index = {}
+        for i, name in enumerate(reader.variables):
+            index.setdefault(name, i)
+        missing = [name for name in list(coordinates) + names if name not in index]
+        if missing:
+            message = f"Variables {', '.join(missing)} missing in {datafile}"
+            LOG.error(message)
+            raise ValueError(message)
+        for iz in zones:
+            zone = reader.zones[iz]
+            geometry, cached = zone_geometry(
+                reader, hashes, iz, [index[c] for c in coordinates], cache_dir, sample_geometry,
+            )
+            num_cached += cached
+            values = {
+                name: (reader.values(iz, index[name]), bool(zone.locations and zone.locations[index[name]]))
+                for name in names
+            }
+            integrals = zone_integrals(geometry, values, integrands)
+            rows.append((iz, ZoneIntegrals(datafile, zone.name, zone.solution_time, integrals)))
+            if s:
+                s.add(points=native.num_points(zone))
+    return rows, num_cached
+
+def integrate_shard(tasks, integrands, coordinates, cache_dir=None, sample_geometry=False):
+    ''' integrate_zones for a list of (datafile, zones), in order, in one process
+
+    A worker given the same zones of every datafile computes the geometry
+    of each zone once, and then finds it in its in-memory cache.
+    '''
+    return [
+        integrate_zones(datafile, zones, integrands, coordinates, cache_dir, sample_geometry)
+        for datafile, zones in tasks
+    ]
+
+def total_integrals(rows):
+    ''' ZoneIntegrals summed over the zones of each datafile, with zone "<total>" '''
+    totals = {}
+    for row in rows:
+        if row.datafile not in totals:
+            totals[row.datafile] = ZoneIntegrals(row.datafile, '<total>', row.solution_time, dict.fromkeys(row.values, 0.0))
+        for column, value in row.values.items():
+            totals[row.datafile].values[column] += value
+    return list(totals.values())
+
+def write_integrals(filename, rows):
+    ''' Write ZoneIntegrals, followed by the totals of each datafile, as CSV '''
+    columns = list(rows[0].values) if rows else []
+    with atomic_output(filename) as temp, open(temp, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['datafile', 'zone', 'time'] + columns)
+        for row in rows + total_integrals(rows):
+            writer.writerow(
+                [row.datafile, row.zone, repr(float(row.solution_time))] +
+                [repr(row.values[c]) for c in columns]
+            )
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+@instrument.traced
+def integrate_surfaces(datafiles, scalars=(), forces=(), fluxes=(), zone_patterns=None, coordinates=None,
+                       center=(0.0, 0.0, 0.0), output=None, cache_dir=None, jobs=1, sample_geometry=False):
+    ''' Integrate variables over the surface (and line) zones of datafiles
+
+    Arguments:
+        datafiles       [list(str)] Datafiles (or glob patterns), e.g. the
+                        timesteps of a run
+        scalars         [list(str)] Variables f integrated as f dA
+        forces          [list(str)] Variables p integrated as p n dA, with
+                        their moments about center
+        fluxes          [list(list(str))] Vectors (u,v,w) integrated as u.n dA
+        zone_patterns   [list(str)] Names of zones to be integrated; volume
+                        zones are skipped
+        coordinates     [list(str)] Names of the x, y (and z) variables (def:
+                        the first three variables)
+        center          [tuple(float)] Reference point of the moments
+        output          [str] Optional CSV file where the integrals of each
+                        zone, and their totals per datafile, are written
+        cache_dir       [str] Optional directory where zone geometries are
+                        cached between calls
+        jobs            [int] Number of worker processes
+        sample_geometry [bool] Key the cached geometries on a sample of the
+                        coordinates rather than all of them (see
+                        geometry_key): faster, but only safe if the mesh
+                        cannot move between the sampled points
+
+    Returns:
+        List of ZoneIntegrals, one per zone and datafile, whose values map
+        "area" and the name of each integral to its value (see
+        integral_columns). The orientation of the normals follows the
+        connectivity (I x J for ordered surfaces).
+    '''
+    datafiles = expand_datafiles(datafiles)
+    integrands = Integrands(list(scalars), list(forces), [list(f) for f in fluxes], tuple((list(center) + [0.0]*3)[:3]))
+    for names in integrands.fluxes:
+        if not 2 <= len(names) <= 3:
+            message = f"Flux vector {','.join(names)} must have 2 or 3 components"
+            LOG.error(message)
+            raise ValueError(message)
+    assert scalars or forces or fluxes, "No variables to integrate"
+
+    with instrument.span('select'):
+        shards = [[] for _ in range(jobs)] # (datafile, zones) integrated by each worker
+        for datafile in datafiles:
+            header = native.read_header(datafile)
+            if coordinates is None:
+                coordinates = header.variables[:3]
+            zones = []
+            for iz in NameIndex(z.name for z in header.zones).select(zone_patterns):
+                if is_surface(header.zones[iz]):
+                    zones.append(iz)
+                else:
+                    LOG.warning('Skipping %s zone "%s" of %s', header.zones[iz].zone_type, header.zones[iz].name, datafile)
+            if not zones:
+                LOG.warning("No surface zones matching %s in %s", ' '.join(zone_patterns or []), datafile)
+            for i, shard in enumerate(shards):
+                if zones[i::jobs]:
+                    shard.append((datafile, zones[i::jobs]))
+        shards = [shard for shard in shards if shard]
+    LOG.info("Integrate %s over %d datafiles", ', '.join(integral_columns(integrands)[1:]), len(datafiles))
+
+    with instrument.span('compute', jobs=jobs):
+        if jobs > 1 and len(shards) > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+                futures = [
+                    pool.submit(integrate_shard, shard, integrands, coordinates, cache_dir, sample_geometry)
+                    for shard in shards
+                ]
+                partial = [result for future in futures for result in future.result()]
+        else:
+            partial = [
+                result for shard in shards
+                for result in integrate_shard(shard, integrands, coordinates, cache_dir, sample_geometry)
+            ]
+        tasks = [task for shard in shards for task in shard]
+
+    # Restore the order of zones dealt out round-robin
+    order = {datafile: i for i, datafile in enumerate(datafiles)}
+    rows = sorted(
+        ((order[datafile], iz, row) for (datafile, _), (task_rows, _) in zip(tasks, partial) for iz, row in task_rows),
+        key = lambda item: item[:2],
+    )
+    rows = [row for _, _, row in rows]
+    LOG.info("Integrated %d zones; reused the geometry of %d", len(rows), sum(cached for _, cached in partial))
+    if output:
+        write_integrals(output, rows)
+    return rows
@@ -0,0 +1,237 @@
+''' Vectorized NumPy kernels operating on the arrays of a single zone.
+
+The functions in this module know nothing about PyTecplot or about where
+the arrays came from (a native reader, a shared-memory block, or a loaded
+dataset), which makes them usable from worker processes.
+'''
+import numpy as np
+
+ELEMENT_DIMENSION = {'FELineSeg': 1, 'FETriangle': 2, 'FEQuad': 2, 'FETetra': 3, 'FEBrick': 3}
+
+def stride_indices(n, stride):
+    ''' Indices 0, stride, 2*stride... of n nodes along an axis, always including the last '''
+    index = np.arange(0, n, max(stride, 1))
+    if index[-1] != n - 1:
+        index = np.append(index, n - 1)
+    return index
+
+def block_indices(shape, axes):
+    ''' Flat node and (unpadded) cell indices of an IJK block of an ordered zone
+
+    axes holds the sorted node indices kept along I, J and K. The cells of
+    the block start at each kept node but the last one along each axis.
+    '''
+    dims = (list(shape) + [1,1,1])[:3]
+    k, j, i = np.ix_(axes[2], axes[1], axes[0])
+    node_index = ((k * dims[1] + j) * dims[0] + i).ravel()
+    cells = [max(n-1, 1) for n in dims]
+    cell_axes = [np.minimum(a[:-1] if len(a) > 1 else a, c-1) for a, c in zip(axes, cells)]
+    k, j, i = np.ix_(cell_axes[2], cell_axes[1], cell_axes[0])
+    cell_index = ((k * cells[1] + j) * cells[0] + i).ravel()
+    return node_index, cell_index
+
+def decimate_ordered(shape, strides):
+    ''' Subsample an ordered zone with IJK strides.
+
+    Returns:
+        (node_index, cell_index, new_shape) where node_index and cell_index
+        are flat indices of the kept nodes and cells into nodal and (unpadded)
+        cell-centered arrays. Each new cell takes the value of the first
+        original cell it covers; the last node along each axis is kept so
+        that the extents of the zone are preserved.
+    '''
+    dims = (list(shape) + [1,1,1])[:3]
+    axes = [stride_indices(n, s) for n, s in zip(dims, strides)]
+    node_index, cell_index = block_indices(dims, axes)
+    return node_index, cell_index, tuple(len(a) for a in axes)
+
+def cluster_vertices(xyz, num_points, tolerance=0.1, max_iterations=8):
+    ''' Vertex clustering on a uniform grid with about num_points occupied cells
+
+    The grid spacing is first estimated from the bounding box and then
+    refined until the number of clusters is within tolerance of num_points.
+
+    Returns:
+        (cluster, num_clusters) where cluster is the cluster index of each node
+    '''
+    xyz = np.stack([np.asarray(x, dtype=np.float64) for x in xyz], axis=1)
+    lo, extent = xyz.min(axis=0), np.ptp(xyz, axis=0)
+    active = extent > 0
+    if num_points >= len(xyz) or not active.any():
+        return np.arange(len(xyz)), len(xyz)
+    xyz, lo, dim = xyz[:,active], lo[active], np.count_nonzero(active)
+    h = (np.prod(extent[active]) / max(num_points, 1)) ** (1.0 / dim)
+    for _ in range(max_iterations):
+        cells = np.floor((xyz - lo) / h).astype(np.int64)
+        keys = np.ravel_multi_index(cells.T, tuple(cells.max(axis=0) + 1))
+        unique, cluster = np.unique(keys, return_inverse=True)
+        ratio = len(unique) / num_points
+        if abs(ratio - 1.0) <= tolerance:
+            break
+        h *= ratio ** (1.0 / dim)
+    return cluster.ravel(), len(unique)
+
+def cluster_mean(values, cluster, num_clusters):
+    ''' Average of nodal values over each cluster '''
+    counts = np.bincount(cluster, minlength=num_clusters)
+    return np.bincount(cluster, weights=values, minlength=num_clusters) / counts
+
+def cluster_elements(zone_type, connectivity, cluster):
+    ''' Connectivity of the elements of an FE zone after merging clustered nodes
+
+    Elements that collapse to a lower dimension and duplicate elements are
+    removed. Returns (connectivity, element_index), where element_index
+    lists the original index of each remaining element.
+    '''
+    conn = cluster[connectivity]
+    nodes = np.sort(conn, axis=1)
+    distinct = 1 + np.count_nonzero(np.diff(nodes, axis=1), axis=1)
+    keep = np.flatnonzero(distinct > ELEMENT_DIMENSION[zone_type])
+    _, first = np.unique(nodes[keep], axis=0, return_index=True)
+    element_index = keep[np.sort(first)]
+    return conn[element_index], element_index
+
+def box_mask(xyz, box):
+    ''' Mask of the points whose coordinates lie within box [(lo, hi), ...] '''
+    mask = np.ones(len(xyz[0]), bool)
+    for x, (lo, hi) in zip(xyz, box):
+        mask &= (x >= lo) & (x <= hi)
+    return mask
+
+def box_intersects(bounds, box):
+    ''' True if the bounding box [(min, max), ...] of a zone intersects box '''
+    return all(vmax >= lo and vmin <= hi for (vmin, vmax), (lo, hi) in zip(bounds, box))
+
+def ordered_cell_mask(shape, node_mask):
+    ''' Mask of the cells of an ordered zone with at least one node in node_mask '''
+    I, J, K = (list(shape) + [1,1,1])[:3]
+    mask = node_mask.reshape(K, J, I)
+    for axis, n in enumerate((K, J, I)):
+        if n > 1:
+            lower = [slice(None)] * 3
+            upper = [slice(None)] * 3
+            lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+            mask = mask[tuple(lower)] | mask[tuple(upper)]
+    return mask.ravel()
+
+def ordered_subblock(shape, cell_mask):
+    ''' Smallest IJK block of an ordered zone holding all cells in cell_mask
+
+    Returns:
+        (node_index, cell_index, new_shape) as for decimate_ordered, or None
+        if no cell is selected.
+    '''
+    dims = (list(shape) + [1,1,1])[:3]
+    cells = cell_mask.reshape([max(n-1, 1) for n in reversed(dims)])
+    if not cells.any():
+        return None
+    axes = []
+    for axis, n in zip((2, 1, 0), dims):
+        selected = np.flatnonzero(cells.any(axis=tuple(a for a in range(3) if a != axis)))
+        hi = selected[-1] + 1 if n > 1 else selected[-1]
+        axes.append(np.arange(selected[0], hi + 1))
+    node_index, cell_index = block_indices(dims, axes)
+    return node_index, cell_index, tuple(len(a) for a in axes)
+
+def fe_subset(connectivity, element_mask):
+    ''' Elements of an FE zone in element_mask, with renumbered connectivity
+
+    Returns:
+        (connectivity, node_index, element_index) where node_index and
+        element_index list the original indices of the kept nodes and
+        elements.
+    '''
+    element_index = np.flatnonzero(element_mask)
+    conn = connectivity[element_index]
+    node_index, conn = np.unique(conn, return_inverse=True)
+    return conn.reshape(len(element_index), -1), node_index, element_index
+
+def ordered_gradient(values, shape, xyz):
+    ''' Gradient of nodal values of an ordered zone by finite differences
+
+    Derivatives along each I, J, K index with more than one node are taken
+    with np.gradient (second-order central differences inside the zone) and
+    mapped to physical space through the least-squares inverse of the
+    coordinate Jacobian, so surface zones and lines embedded in 3D get the
+    gradient projected on their tangent space.
+
+    Returns:
+        (len(xyz), N) array of the derivatives along each coordinate
+    '''
+    I, J, K = (list(shape) + [1,1,1])[:3]
+    axes = [axis for axis, n in enumerate((K, J, I)) if n > 1]
+    result = np.zeros((len(xyz), I*J*K))
+    if not axes:
+        return result
+    def index_derivatives(f):
+        f = np.asarray(f, dtype=np.float64).reshape(K, J, I)
+        return np.stack([np.gradient(f, axis=a).ravel() for a in axes], axis=-1)
+    dfdi = index_derivatives(values)                                      # (N, m)
+    jacobian = np.stack([index_derivatives(x) for x in xyz], axis=1)      # (N, d, m)
+    metric = np.einsum('ndm,ndk->nmk', jacobian, jacobian)
+    try:
+        weights = np.linalg.solve(metric, dfdi[..., None])[..., 0]
+    except np.linalg.LinAlgError: # Degenerate cells, e.g. at a singular line
+        weights = np.einsum('nmk,nk->nm', np.linalg.pinv(metric), dfdi)
+    result[:] = np.einsum('ndm,nm->dn', jacobian, weights)
+    return result
+
+def ordered_elements(shape):
+    ''' Nodes of the cells of an ordered surface (E,4) or line (E,2), in cell order
+
+    Quad nodes go around the cell, first along the faster varying index, so
+    that the normals of IJ surfaces point along I x J.
+    '''
+    I, J, K = (list(shape) + [1,1,1])[:3]
+    axes = [axis for axis, n in enumerate((K, J, I)) if n > 1]
+    if len(axes) not in (1, 2):
+        raise ValueError(f"Ordered zone of dimensions {tuple(shape)} is not a surface or a line")
+    nodes = np.arange(I*J*K).reshape(K, J, I)
+    def corner(*offsets):
+        index = [slice(None)] * 3
+        for axis, offset in zip(axes, offsets):
+            index[axis] = slice(offset, nodes.shape[axis] - 1 + offset)
+        return nodes[tuple(index)].ravel()
+    if len(axes) == 1:
+        return np.stack([corner(0), corner(1)], axis=1)
+    return np.stack([corner(0,0), corner(0,1), corner(1,1), corner(1,0)], axis=1)
+
+def plane_normal(points):
+    ''' Unit normal of the plane best fitting (N,3) points
+
+    The sign is chosen so that the largest component is positive, e.g. +z
+    for points in the xy plane.
+    '''
+    centered = points - points.mean(axis=0)
+    _, vectors = np.linalg.eigh(centered.T @ centered)
+    normal = vectors[:,0]
+    return normal if normal[np.argmax(np.abs(normal))] > 0 else -normal
+
+def element_geometry(elements, xyz):
+    ''' Area vectors, areas and centroids of surface (or line) elements
+
+    Arguments:
+        elements  (E,k) nodes of triangles (k=3), quads (k=4) or segments (k=2)
+        xyz       Two or three coordinate arrays; z is zero if missing
+
+    Returns:
+        (vectors, measure, centroid) where vectors (E,3) are the element
+        normals scaled by the element areas, measure (E,) the areas and
+        centroid (E,3) the mean of the element nodes. Segments have their
+        lengths as measure and lie in the plane fitting all nodes; their
+        normals are tangent x plane normal, i.e. (dy, -dx, 0) in the xy plane.
+    '''
+    points = np.zeros((len(xyz[0]), 3))
+    for axis, x in enumerate(xyz):
+        points[:, axis] = x
+    corners = [points[elements[:,c]] for c in range(elements.shape[1])]
+    if len(corners) == 2:
+        tangent = corners[1] - corners[0]
+        vectors = np.cross(tangent, plane_normal(points))
+    elif len(corners) == 3:
+        vectors = 0.5 * np.cross(corners[1] - corners[0], corners[2] - corners[0])
+    else:
+        vectors = 0.5 * np.cross(corners[2] - corners[0], corners[3] - corners[1])
+    measure = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    centroid = sum(corners) / len(corners)
+    return vectors, measure, centroid
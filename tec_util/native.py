@@ -0,0 +1,1053 @@
+''' Pure NumPy reader/writer for Tecplot ASCII and binary (PLT) datafiles.
+
+PyTecplot always materializes a complete dataset in a frame before any of
+it can be accessed or saved. The classes in this module read and write
+datafiles directly as NumPy arrays, one zone at a time, so that callers can
+control the precision of the output and never need to hold more than one
+zone in memory. PLT files are memory-mapped, so reading a zone-variable
+does not copy it.
+
+Only "classic" zone types are supported (Ordered, FELineSeg, FETriangle,
+FEQuad, FETetra, FEBrick); polygonal and polyhedral zones are not.
+'''
+import collections
+import hashlib
+import mmap
+import numpy as np
+import os
+import re
+import struct
+
+ZONE_TYPES = [
+    'Ordered', 'FELineSeg', 'FETriangle', 'FEQuad', 'FETetra', 'FEBrick',
+    'FEPolygon', 'FEPolyhedron',
+]
+NODES_PER_ELEMENT = {
+    'FELineSeg': 2, 'FETriangle': 3, 'FEQuad': 4, 'FETetra': 4, 'FEBrick': 8,
+}
+
+# Field data formats as numbered in the PLT format and named in ASCII files
+PLT_FORMATS = {1: '<f4', 2: '<f8', 3: '<i4', 4: '<i2', 5: '<u1'}
+ASCII_FORMATS = {'SINGLE': '<f4', 'DOUBLE': '<f8', 'LONGINT': '<i4', 'SHORTINT': '<i2', 'BYTE': '<u1'}
+PRECISIONS = {'single': np.float32, 'double': np.float64}
+CHUNK_SIZE = 1 << 20 # Values per chunk when streaming zone data
+
+ZONE_MARKER = 299.0
+GEOMETRY_MARKER = 399.0
+TEXT_MARKER = 499.0
+CUSTOM_LABEL_MARKER = 599.0
+USER_REC_MARKER = 699.0
+DATASET_AUX_MARKER = 799.0
+VAR_AUX_MARKER = 899.0
+EOH_MARKER = 357.0
+PLT_VERSIONS = [102, 103, 104, 105, 106, 107, 112]
+
+Zone = collections.namedtuple('Zone', [
+    'name',           # Zone title
+    'zone_type',      # One of ZONE_TYPES
+    'shape',          # (I,J,K) for ordered zones, (num_points,num_elements) for FE
+    'strand',         # Strand ID; 0 for static zones
+    'solution_time',  # Solution time
+    'locations',      # List of 0 (nodal) / 1 (cell-centered) per variable, or None
+    'aux_data',       # Dict of zone auxiliary data, or None
+])
+Zone.__new__.__defaults__ = (0, 0.0, None, None)
+
+Header = collections.namedtuple('Header', ['title', 'variables', 'zones', 'aux_data'])
+
+# Array that is produced on demand, chunk by chunk, via read(start, stop)
+ChunkedArray = collections.namedtuple('ChunkedArray', ['dtype', 'size', 'read'])
+
+# Values (or connectivity) of a zone that are stored once, in an earlier zone
+Shared = collections.namedtuple('Shared', ['zone'])
+
+class _Passive:
+    ''' Marker of a variable that is not stored in a zone; it reads as zeros '''
+    def __repr__(self):
+        return 'PASSIVE'
+
+PASSIVE = _Passive()
+
+class UnsupportedFormat(ValueError):
+    ''' Raised when a datafile uses features the native reader does not support '''
+
+
+#-----------------------------------------------------------------------
+# Helper Functions
+#-----------------------------------------------------------------------
+def num_points(zone):
+    ''' Number of nodes in a zone '''
+    if zone.zone_type == 'Ordered':
+        return int(np.prod(zone.shape))
+    return int(zone.shape[0])
+
+def num_elements(zone):
+    ''' Number of cells/elements in a zone '''
+    if zone.zone_type == 'Ordered':
+        return int(np.prod([max(d-1,1) for d in zone.shape]))
+    return int(zone.shape[1])
+
+def value_count(zone, ivar):
+    ''' Number of values stored for the ivar-th variable of a zone '''
+    if zone.locations and zone.locations[ivar]:
+        return num_elements(zone)
+    return num_points(zone)
+
+def connectivity_shape(zone):
+    ''' Shape of the (zero-based) connectivity array of an FE zone '''
+    return (num_elements(zone), NODES_PER_ELEMENT[zone.zone_type])
+
+def pad_cell_values(zone, values):
+    ''' Pad ordered cell-centered values to nodal dimensions, as stored in PLT files '''
+    I, J, K = (list(zone.shape) + [1,1,1])[:3]
+    padded = np.zeros(I*J*K, values.dtype)
+    padded.reshape(K,J,I)[:max(K-1,1), :max(J-1,1), :max(I-1,1)] = \
+        values.reshape(max(K-1,1), max(J-1,1), max(I-1,1))
+    return padded
+
+def minmax(values):
+    ''' Min/max of an array ignoring NaN; (0,0) if empty, (nan,nan) if all-NaN '''
+    if values.size == 0:
+        return (0.0, 0.0)
+    return (float(np.fmin.reduce(values, axis=None)), float(np.fmax.reduce(values, axis=None)))
+
+def chunked(values):
+    ''' Wrap an array as a ChunkedArray '''
+    values = np.ravel(values)
+    return ChunkedArray(values.dtype, values.size, lambda start, stop: values[start:stop])
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    ''' Yield the values of a ChunkedArray in chunks of (at most) chunk_size '''
+    for start in range(0, source.size, chunk_size):
+        yield np.asarray(source.read(start, min(start + chunk_size, source.size)), source.dtype)
+
+def chunked_minmax(source, chunk_size=CHUNK_SIZE):
+    ''' Same as minmax(), but for a ChunkedArray '''
+    if source.size == 0:
+        return (0.0, 0.0)
+    bounds = np.array([minmax(chunk) for chunk in iter_chunks(source, chunk_size)])
+    return (float(np.fmin.reduce(bounds[:,0])), float(np.fmax.reduce(bounds[:,1])))
+
+def rounding_error(original, converted):
+    ''' Largest absolute difference between an array and its converted copy '''
+    if original.size == 0:
+        return 0.0
+    error = np.abs(converted.astype(np.float64) - original)
+    error = float(np.fmax.reduce(error, axis=None))
+    return 0.0 if np.isnan(error) else error
+
+def chunked_hash(source, chunk_size=CHUNK_SIZE):
+    ''' BLAKE2b digest of the data type and values of a ChunkedArray '''
+    digest = hashlib.blake2b(np.dtype(source.dtype).str.encode(), digest_size=16)
+    for chunk in iter_chunks(source, chunk_size):
+        digest.update(np.ascontiguousarray(chunk).data)
+    return digest.hexdigest()
+
+def format_code(dtype):
+    ''' PLT field data format number for a NumPy dtype '''
+    dtype = np.dtype(dtype).newbyteorder('<')
+    for code, fmt in PLT_FORMATS.items():
+        if np.dtype(fmt) == dtype:
+            return code
+    raise ValueError(f"Data type {dtype} cannot be stored in a Tecplot datafile")
+
+def check_zone(zone, num_vars):
+    ''' Validate a zone specification before it is written '''
+    if zone.zone_type not in NODES_PER_ELEMENT and zone.zone_type != 'Ordered':
+        raise NotImplementedError(f'Zone "{zone.name}" has unsupported type {zone.zone_type}')
+    if zone.locations is not None and len(zone.locations) != num_vars:
+        raise ValueError(f'Zone "{zone.name}" must specify a location for all {num_vars} variables')
+
+def read_header(filename):
+    ''' Read the title, variable names and zone list of a datafile.
+
+    Only the header of the file is parsed (for ASCII files, data lines are
+    skipped without being converted), so this is much cheaper than loading
+    the dataset. Raises UnsupportedFormat for SZPLT files and for PLT/ASCII
+    features the native reader does not understand.
+    '''
+    with open(filename, 'rb') as f:
+        magic = f.read(8)
+    if magic.startswith(b'#!TDV'):
+        return read_plt_header(filename)[0]
+    if magic.startswith(b'#!'):
+        raise UnsupportedFormat(f"{filename} is not a PLT or ASCII Tecplot datafile")
+    return read_ascii_header(filename)[0]
+
+def open_dataset(filename):
+    ''' Open a PLT or ASCII datafile for reading, depending on its contents '''
+    with open(filename, 'rb') as f:
+        magic = f.read(8)
+    if magic.startswith(b'#!TDV'):
+        return PltReader(filename)
+    if magic.startswith(b'#!'):
+        raise UnsupportedFormat(f"{filename} is not a PLT or ASCII Tecplot datafile")
+    return AsciiReader(filename)
+
+def open_writer(filename, variables, zones, title='', aux_data=None, ascii=None, share=False, append=False):
+    ''' Open an ASCII or PLT writer depending on extension (or ascii flag)
+
+    With share (True, or a list of variable indices), values and
+    connectivity identical to those of an earlier zone are stored once,
+    by reference (see _Writer.write_zone).
+
+    With append, zones are added to the end of an existing ASCII datafile
+    with the same variables, whose header is left as is. PLT files cannot
+    be appended to, since their header lists every zone.
+    '''
+    if ascii is None:
+        ascii = os.path.splitext(filename)[1] == '.dat'
+    if append and not ascii:
+        raise ValueError(f"Cannot append zones to {filename}; only ASCII datafiles can be appended to")
+    if append and share:
+        raise ValueError("Zones appended to a datafile cannot share data")
+    cls = AsciiWriter if ascii else PltWriter
+    return cls(filename, variables, zones, title=title, aux_data=aux_data, share=share, append=append)
+
+
+#-----------------------------------------------------------------------
+# Binary (PLT) Header
+#-----------------------------------------------------------------------
+class _Cursor:
+    ''' Sequential reader of little-endian values from a buffer '''
+    def __init__(self, buffer, offset=0):
+        self.buffer = buffer
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def int32(self, count=None):
+        values = self.unpack('<%di' % (count or 1))
+        return values[0] if count is None else list(values)
+
+    def float32(self):
+        return self.unpack('<f')[0]
+
+    def float64(self, count=None):
+        values = self.unpack('<%dd' % (count or 1))
+        return values[0] if count is None else list(values)
+
+    def string(self):
+        chars = []
+        while True:
+            block = np.frombuffer(
+                self.buffer, '<i4',
+                min(64, (len(self.buffer) - self.offset)//4), self.offset,
+            )
+            end = np.flatnonzero(block == 0)
+            if end.size:
+                chars.extend(block[:end[0]])
+                self.offset += 4*(end[0]+1)
+                return ''.join(map(chr, chars))
+            if block.size == 0:
+                raise UnsupportedFormat("Unterminated string in PLT header")
+            chars.extend(block)
+            self.offset += block.nbytes
+
+def read_plt_header(filename):
+    ''' Parse the header section of a PLT file
+
+    Returns the Header and the byte offset at which the data section starts.
+    '''
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        try:
+            return _parse_plt_header(buffer)
+        except struct.error:
+            raise UnsupportedFormat(f"{filename} has a truncated or corrupt PLT header")
+
+def _parse_plt_header(buffer):
+    version = int(buffer[5:8])
+    if version not in PLT_VERSIONS:
+        raise UnsupportedFormat(f"PLT version {version} is not supported")
+    c = _Cursor(buffer, 8)
+    if c.int32() != 1:
+        raise UnsupportedFormat("Big-endian PLT files are not supported")
+    if version >= 111:
+        c.int32() # File type (full, grid, solution)
+    title = c.string()
+    variables = [c.string() for i in range(c.int32())]
+    zones = []
+    aux_data = {}
+    while True:
+        marker = c.float32()
+        if marker == ZONE_MARKER:
+            zones.append(_parse_plt_zone(c, version, len(variables)))
+        elif marker == DATASET_AUX_MARKER:
+            name = c.string()
+            c.int32() # Value format (always string)
+            aux_data[name] = c.string()
+        elif marker == VAR_AUX_MARKER:
+            c.int32() # Variable number
+            c.string()
+            c.int32()
+            c.string()
+        elif marker == CUSTOM_LABEL_MARKER:
+            for i in range(c.int32()):
+                c.string()
+        elif marker == USER_REC_MARKER:
+            c.string()
+        elif marker == EOH_MARKER:
+            break
+        else:
+            raise UnsupportedFormat(f"Unsupported PLT header record (marker {marker})")
+    return Header(title, variables, zones, aux_data), c.offset
+
+def _parse_plt_zone(c, version, num_vars):
+    name = c.string()
+    c.int32() # Parent zone
+    strand = c.int32()
+    solution_time = c.float64()
+    c.int32() # Zone color (unused)
+    ztype = c.int32()
+    if not 0 <= ztype < len(ZONE_TYPES):
+        raise UnsupportedFormat(f'Zone "{name}" has invalid zone type {ztype}')
+    zone_type = ZONE_TYPES[ztype]
+    if zone_type not in NODES_PER_ELEMENT and zone_type != 'Ordered':
+        raise UnsupportedFormat(f'Zone "{name}" has unsupported type {zone_type}')
+    if version < 112 and c.int32() != 0:
+        raise UnsupportedFormat(f'Zone "{name}" uses POINT data packing')
+    locations = c.int32(num_vars) if c.int32() else None
+    if version >= 112 and c.int32():
+        raise UnsupportedFormat(f'Zone "{name}" has raw face neighbors')
+    if c.int32():
+        raise UnsupportedFormat(f'Zone "{name}" has user-defined face neighbors')
+    if zone_type == 'Ordered':
+        shape = tuple(c.int32(3))
+    else:
+        shape = tuple(c.int32(2))
+        c.int32(3) # Cell dimensions (unused)
+    aux_data = {}
+    while c.int32():
+        key = c.string()
+        c.int32() # Value format (always string)
+        aux_data[key] = c.string()
+    return Zone(name, zone_type, shape, max(strand, 0), solution_time, locations, aux_data or None)
+
+
+#-----------------------------------------------------------------------
+# ASCII Header
+#-----------------------------------------------------------------------
+ASCII_KEYWORDS = {
+    'TITLE', 'VARIABLES', 'ZONE', 'DATASETAUXDATA', 'VARAUXDATA', 'AUXDATA',
+    'TEXT', 'GEOMETRY', 'CUSTOMLABELS', 'FILETYPE',
+}
+ASCII_ZONE_TYPES = {
+    'ORDERED': 'Ordered', 'FELINESEG': 'FELineSeg', 'FETRIANGLE': 'FETriangle',
+    'FEQUADRILATERAL': 'FEQuad', 'FETETRAHEDRON': 'FETetra', 'FEBRICK': 'FEBrick',
+    'FEPOLYGON': 'FEPolygon', 'FEPOLYHEDRON': 'FEPolyhedron',
+    # Element types used with the obsolete F=FEPOINT|FEBLOCK syntax
+    'LINESEG': 'FELineSeg', 'TRIANGLE': 'FETriangle', 'QUADRILATERAL': 'FEQuad',
+    'TETRAHEDRON': 'FETetra', 'BRICK': 'FEBrick',
+}
+_KEY_VALUE = re.compile(r'(\w+)\s*=\s*("[^"]*"|\([^)]*\)|\[[^\]]*\]|[^,\s]+)')
+_QUOTED = re.compile(r'"([^"]*)"')
+_DATA_START = b'0123456789+-.'
+
+AsciiLayout = collections.namedtuple('AsciiLayout', [
+    'offset',     # Byte offset of first data line
+    'packing',    # BLOCK or POINT
+    'dtypes',     # List of numpy dtypes per variable
+    'shared',     # List of zone index (or None) each variable is shared with
+    'passive',    # List of passive flags per variable
+    'conn_share', # Index of zone connectivity is shared with, or None
+])
+
+def _index_list(spec):
+    ''' Parse an ASCII index list like "[1-3,5]" into zero-based indices '''
+    indices = []
+    for item in spec.strip('[] ').split(','):
+        if item.strip():
+            first, _, last = item.partition('-')
+            indices.extend(range(int(first)-1, int(last or first)))
+    return indices
+
+def _assignments(spec):
+    ''' Parse "([1-3]=X, [4]=Y)" into a list of (indices, value) pairs '''
+    return [
+        (_index_list(indices), value.strip())
+        for indices, value in re.findall(r'(\[[^\]]*\])\s*=\s*([^,)]+)', spec)
+    ]
+
+def read_ascii_header(filename):
+    ''' Parse the header records of an ASCII datafile
+
+    Returns the Header and a list with an AsciiLayout for each zone, which
+    describes where and how the zone data is stored in the file.
+    '''
+    records = []
+    current = None # Record that continuation lines are appended to
+    with open(filename, 'rb') as f:
+        offset = 0
+        for line in f:
+            offset += len(line)
+            text = line.strip()
+            if not text or text.startswith(b'#'):
+                continue
+            if text[0] in _DATA_START:
+                continue
+            keyword = re.split(rb'[\s=]', text, 1)[0].upper().decode()
+            if keyword in ASCII_KEYWORDS:
+                records.append([keyword, text[len(keyword):].decode(), offset])
+                if keyword == 'AUXDATA' and current and current[0] == 'ZONE':
+                    current[2] = offset # Zone AUXDATA lines are part of the zone record
+                else:
+                    current = records[-1]
+            elif current:
+                current[1] += ' ' + text.decode()
+                current[2] = offset
+            else:
+                raise UnsupportedFormat(f"{filename} does not look like a Tecplot datafile")
+
+    title, variables, zones, layouts, aux_data = '', [], [], [], {}
+    for keyword, text, offset in records:
+        if keyword == 'TITLE':
+            title = _QUOTED.findall(text)[0] if '"' in text else text.strip(' =')
+        elif keyword == 'VARIABLES':
+            text = text.strip(' =')
+            variables = _QUOTED.findall(text) if '"' in text else re.split(r'[\s,]+', text)
+        elif keyword == 'DATASETAUXDATA':
+            name, value = text.split('=', 1)
+            aux_data[name.strip()] = value.strip().strip('"')
+        elif keyword == 'AUXDATA' and zones:
+            name, value = text.split('=', 1)
+            zone = zones[-1]
+            zones[-1] = zone._replace(aux_data={**(zone.aux_data or {}), name.strip(): value.strip().strip('"')})
+        elif keyword == 'ZONE':
+            zone, layout = _parse_ascii_zone(text, offset, len(variables))
+            zones.append(zone)
+            layouts.append(layout)
+        elif keyword in ('TEXT', 'GEOMETRY'):
+            raise UnsupportedFormat(f"{filename} contains {keyword} records")
+    return Header(title, variables, zones, aux_data), layouts
+
+def _parse_ascii_zone(text, offset, num_vars):
+    fields = {key.upper(): value for key, value in _KEY_VALUE.findall(text)}
+    name = fields.get('T', '').strip('"')
+
+    # Zone type and data packing, allowing for the obsolete F=... syntax
+    packing = fields.get('DATAPACKING', 'POINT').upper()
+    zone_type = fields.get('ZONETYPE', 'ORDERED').upper()
+    if 'F' in fields:
+        packing = fields['F'].upper()
+        if packing.startswith('FE'):
+            packing = packing[2:]
+            zone_type = fields.get('ET', 'TRIANGLE').upper()
+    if zone_type not in ASCII_ZONE_TYPES:
+        raise UnsupportedFormat(f'Zone "{name}" has unknown zone type {zone_type}')
+    zone_type = ASCII_ZONE_TYPES[zone_type]
+    if zone_type not in NODES_PER_ELEMENT and zone_type != 'Ordered':
+        raise UnsupportedFormat(f'Zone "{name}" has unsupported type {zone_type}')
+    if zone_type == 'Ordered':
+        shape = tuple(int(fields.get(k, 1)) for k in 'IJK')
+    else:
+        shape = (
+            int(fields.get('NODES', fields.get('N', 0))),
+            int(fields.get('ELEMENTS', fields.get('E', 0))),
+        )
+
+    locations = None
+    if 'VARLOCATION' in fields:
+        locations = [0] * num_vars
+        for indices, value in _assignments(fields['VARLOCATION']):
+            for i in indices:
+                locations[i] = int(value.upper() == 'CELLCENTERED')
+    dtypes = [np.dtype('<f4')] * num_vars
+    if 'DT' in fields:
+        for i, name_dt in enumerate(fields['DT'].strip('() ').split()):
+            dtypes[i] = np.dtype(ASCII_FORMATS[name_dt.upper()])
+    shared = [None] * num_vars
+    for indices, value in _assignments(fields.get('VARSHARELIST', '')):
+        for i in indices:
+            shared[i] = int(value) - 1
+    passive = [False] * num_vars
+    for i in _index_list(fields.get('PASSIVEVARLIST', '')):
+        passive[i] = True
+    conn_share = fields.get('CONNECTIVITYSHAREZONE')
+
+    zone = Zone(
+        name = name,
+        zone_type = zone_type,
+        shape = shape,
+        strand = max(int(fields.get('STRANDID', 0)), 0),
+        solution_time = float(fields.get('SOLUTIONTIME', 0.0)),
+        locations = locations,
+    )
+    layout = AsciiLayout(
+        offset, packing, dtypes, shared, passive,
+        None if conn_share is None else int(conn_share) - 1,
+    )
+    return zone, layout
+
+
+#-----------------------------------------------------------------------
+# Readers
+#-----------------------------------------------------------------------
+class _Reader:
+    ''' Common interface of the native readers.
+
+    Readers expose the file Header as self.header and return zone data via
+    values(izone, ivar) and connectivity(izone). Shared variables and
+    connectivity are resolved transparently; passive variables read as zeros.
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def variables(self):
+        return self.header.variables
+
+    @property
+    def zones(self):
+        return self.header.zones
+
+    def variable_index(self, name):
+        return self.header.variables.index(name)
+
+    def dtype(self, izone, ivar):
+        ''' Data type of a zone-variable as stored in the file '''
+        return self.layouts[izone].dtypes[ivar]
+
+    def read_zone(self, izone, variables=None):
+        ''' Return list of arrays for the given variable indices (def: all) '''
+        if variables is None:
+            variables = range(len(self.header.variables))
+        return [self.values(izone, ivar) for ivar in variables]
+
+    def value_range(self, izone, ivar):
+        ''' (min, max) of the values of a zone-variable '''
+        return chunked_minmax(chunked(self.values(izone, ivar)))
+
+
+class PltReader(_Reader):
+    ''' Memory-mapped reader for Tecplot binary datafiles
+
+    The data section is scanned once when the file is opened to locate
+    each zone-variable; values() then returns read-only arrays that view
+    the memory map directly, so pages are only read from disk on access.
+    '''
+    ZoneLayout = collections.namedtuple('ZoneLayout', [
+        'dtypes', 'passive', 'shared', 'conn_share', 'offsets', 'conn_offset', 'ranges_offset',
+    ])
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.header, offset = _parse_plt_header(self.buffer)
+            self.layouts = self._scan_data(offset)
+        except struct.error:
+            self.close()
+            raise UnsupportedFormat(f"{filename} is truncated or corrupt")
+        except:
+            self.close()
+            raise
+
+    def _scan_data(self, offset):
+        nvars = len(self.header.variables)
+        c = _Cursor(self.buffer, offset)
+        layouts = []
+        for zone in self.header.zones:
+            if c.float32() != ZONE_MARKER:
+                raise UnsupportedFormat(f'Missing data section for zone "{zone.name}"')
+            formats = c.int32(nvars)
+            if any(f not in PLT_FORMATS for f in formats):
+                raise UnsupportedFormat(f'Zone "{zone.name}" uses an unsupported data format')
+            dtypes = [np.dtype(PLT_FORMATS[f]) for f in formats]
+            passive = c.int32(nvars) if c.int32() else [0] * nvars
+            shared = c.int32(nvars) if c.int32() else [-1] * nvars
+            conn_share = c.int32()
+            stored = [not p and s < 0 for p, s in zip(passive, shared)]
+            ranges_offset = c.offset
+            c.offset += 16 * sum(stored) # Min/max pairs
+            offsets = []
+            for ivar, dtype in enumerate(dtypes):
+                if stored[ivar]:
+                    offsets.append(c.offset)
+                    c.offset += dtype.itemsize * self._stored_count(zone, ivar)
+                else:
+                    offsets.append(None)
+            conn_offset = None
+            if zone.zone_type != 'Ordered' and conn_share < 0:
+                conn_offset = c.offset
+                c.offset += 4 * num_elements(zone) * NODES_PER_ELEMENT[zone.zone_type]
+            if c.offset > len(self.buffer):
+                raise UnsupportedFormat(f'Data for zone "{zone.name}" is truncated')
+            layouts.append(self.ZoneLayout(dtypes, passive, shared, conn_share, offsets, conn_offset, ranges_offset))
+        return layouts
+
+    @staticmethod
+    def _stored_count(zone, ivar):
+        if zone.zone_type == 'Ordered':
+            return num_points(zone) # Cell-centered data is padded
+        return value_count(zone, ivar)
+
+    def close(self):
+        if hasattr(self, 'buffer'):
+            try:
+                self.buffer.close()
+            except BufferError:
+                pass # Arrays still reference the map; it closes when they are freed
+        self.file.close()
+
+    def values(self, izone, ivar):
+        ''' Read-only array of the values of a variable in a zone '''
+        layout = self.layouts[izone]
+        zone = self.header.zones[izone]
+        if layout.shared[ivar] >= 0:
+            return self.values(layout.shared[ivar], ivar)
+        if layout.passive[ivar]:
+            return np.zeros(value_count(zone, ivar), layout.dtypes[ivar])
+        data = np.frombuffer(
+            self.buffer,
+            layout.dtypes[ivar],
+            self._stored_count(zone, ivar),
+            layout.offsets[ivar],
+        )
+        if zone.zone_type == 'Ordered' and zone.locations and zone.locations[ivar]:
+            I, J, K = zone.shape
+            data = data.reshape(K,J,I)[:max(K-1,1), :max(J-1,1), :max(I-1,1)].ravel()
+        return data
+
+    def value_range(self, izone, ivar):
+        ''' (min, max) of the values of a zone-variable, as stored in the file '''
+        layout = self.layouts[izone]
+        if layout.shared[ivar] >= 0:
+            return self.value_range(layout.shared[ivar], ivar)
+        if layout.passive[ivar]:
+            return (0.0, 0.0)
+        index = sum(1 for offset in layout.offsets[:ivar] if offset is not None)
+        vmin, vmax = np.frombuffer(self.buffer, '<f8', 2, layout.ranges_offset + 16 * index)
+        return (float(vmin), float(vmax))
+
+    def connectivity(self, izone):
+        ''' Zero-based (num_elements, nodes_per_element) connectivity of an FE zone '''
+        layout = self.layouts[izone]
+        zone = self.header.zones[izone]
+        if layout.conn_offset is None:
+            if layout.conn_share < 0:
+                raise ValueError(f'Zone "{zone.name}" is not an FE zone')
+            return self.connectivity(layout.conn_share)
+        shape = connectivity_shape(zone)
+        return np.frombuffer(self.buffer, '<i4', shape[0]*shape[1], layout.conn_offset).reshape(shape)
+
+
+class AsciiReader(_Reader):
+    ''' Zone-at-a-time reader for Tecplot ASCII datafiles
+
+    ASCII data must be parsed, so each zone is converted in full when one of
+    its variables is first requested. Only the most recently used zone is
+    kept in memory.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.header, self.layouts = read_ascii_header(filename)
+        self._zone = (None, None, None)
+
+    def close(self):
+        self._zone = (None, None, None)
+
+    def _parse_zone(self, izone):
+        if self._zone[0] == izone:
+            return self._zone[1:]
+        zone = self.header.zones[izone]
+        layout = self.layouts[izone]
+        nvars = len(self.header.variables)
+        stored = [
+            i for i in range(nvars)
+            if layout.shared[i] is None and not layout.passive[i]
+        ]
+        counts = [value_count(zone, i) for i in stored]
+        num_values = sum(counts)
+        num_conn = 0
+        if zone.zone_type != 'Ordered' and layout.conn_share is None:
+            num_conn = num_elements(zone) * NODES_PER_ELEMENT[zone.zone_type]
+
+        # Read just enough lines to get all the numbers of this zone
+        lines, ntokens = [], 0
+        with open(self.filename, 'rb') as f:
+            f.seek(layout.offset)
+            while ntokens < num_values + num_conn:
+                line = f.readline()
+                if not line:
+                    raise UnsupportedFormat(f'Data for zone "{zone.name}" is truncated')
+                line = line.replace(b',', b' ')
+                lines.append(line)
+                ntokens += len(line.split())
+        tokens = np.array(b' '.join(lines).split()[:num_values + num_conn])
+        data = tokens[:num_values].astype(np.float64)
+
+        values = {}
+        if layout.packing == 'POINT':
+            data = data.reshape(-1, len(stored))
+            for j, i in enumerate(stored):
+                values[i] = data[:,j].astype(layout.dtypes[i])
+        else:
+            start = 0
+            for i, count in zip(stored, counts):
+                values[i] = data[start:start+count].astype(layout.dtypes[i])
+                start += count
+        connectivity = None
+        if num_conn:
+            connectivity = tokens[num_values:].astype(np.int32).reshape(connectivity_shape(zone)) - 1
+        self._zone = (izone, values, connectivity)
+        return values, connectivity
+
+    def values(self, izone, ivar):
+        ''' Array of the values of a variable in a zone '''
+        layout = self.layouts[izone]
+        if layout.shared[ivar] is not None:
+            return self.values(layout.shared[ivar], ivar)
+        if layout.passive[ivar]:
+            return np.zeros(value_count(self.header.zones[izone], ivar), layout.dtypes[ivar])
+        return self._parse_zone(izone)[0][ivar]
+
+    def connectivity(self, izone):
+        ''' Zero-based (num_elements, nodes_per_element) connectivity of an FE zone '''
+        layout = self.layouts[izone]
+        if layout.conn_share is not None:
+            return self.connectivity(layout.conn_share)
+        connectivity = self._parse_zone(izone)[1]
+        if connectivity is None:
+            raise ValueError(f'Zone "{self.header.zones[izone].name}" is not an FE zone')
+        return connectivity
+
+
+#-----------------------------------------------------------------------
+# Writers
+#-----------------------------------------------------------------------
+def value_structure(zone, ivar):
+    ''' Key of the zone-variables whose values may be shared with each other '''
+    location = zone.locations[ivar] if zone.locations else 0
+    return (ivar, location, value_count(zone, ivar), zone.zone_type, tuple(zone.shape))
+
+def connectivity_structure(zone):
+    ''' Key of the FE zones whose connectivity may be shared with each other '''
+    return (zone.zone_type, tuple(zone.shape))
+
+class ShareIndex:
+    ''' Index of the values and connectivity written so far, by content hash
+
+    Values may only be shared between zones of the same type and shape, with
+    the same location, and connectivity between FE zones of the same type and
+    shape, so these structures are part of the keys. Data is only hashed if
+    another zone of the file has the same structure.
+    '''
+    def __init__(self, zones, num_vars, variables=None):
+        self.variables = variables # Indices of the variables to share, or None for all
+        self.values = {}
+        self.connectivity = {}
+        self.value_candidates = collections.Counter(
+            value_structure(zone, ivar) for zone in zones for ivar in range(num_vars)
+        )
+        self.connectivity_candidates = collections.Counter(
+            connectivity_structure(zone) for zone in zones if zone.zone_type != 'Ordered'
+        )
+
+    def share_values(self, izone, zone, ivar, source):
+        ''' Shared(zone) if source matches values written earlier, else source '''
+        if not isinstance(source, ChunkedArray) or (self.variables is not None and ivar not in self.variables):
+            return source
+        structure = value_structure(zone, ivar)
+        if self.value_candidates[structure] < 2:
+            return source
+        first = self.values.setdefault(structure + (chunked_hash(source),), izone)
+        return source if first == izone else Shared(first)
+
+    def share_connectivity(self, izone, zone, connectivity):
+        ''' Shared(zone) if connectivity matches one written earlier, else connectivity '''
+        if connectivity is None or isinstance(connectivity, Shared):
+            return connectivity
+        structure = connectivity_structure(zone)
+        if self.connectivity_candidates[structure] < 2:
+            return connectivity
+        data = np.ascontiguousarray(connectivity, '<i4')
+        digest = hashlib.blake2b(data.data, digest_size=16).hexdigest()
+        first = self.connectivity.setdefault(structure + (digest,), izone)
+        return connectivity if first == izone else Shared(first)
+
+
+class _Writer:
+    ''' Common bookkeeping for the streaming writers.
+
+    The full list of zones must be given up front. Zone data is then
+    supplied in order via write_zone(). The writer is a context manager;
+    closing it before all zones have been written is an error.
+    '''
+    def __init__(self, filename, variables, zones, title='', aux_data=None, share=False, append=False):
+        self.filename = filename
+        self.variables = list(variables)
+        self.zones = list(zones)
+        for zone in self.zones:
+            check_zone(zone, len(self.variables))
+        self.title = title
+        self.aux_data = aux_data or {}
+        self.num_written = 0
+        self.dtypes = [] # Data types of the variables of each zone written
+        self.share_index = None
+        if share:
+            self.share_index = ShareIndex(self.zones, len(self.variables), None if share is True else set(share))
+        self.chunk_size = CHUNK_SIZE
+        append = append and os.path.exists(filename)
+        self.file = open(filename, 'a' if append else self.mode)
+        try:
+            if not append:
+                self.write_header()
+        except:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(check=exc_type is None)
+
+    @property
+    def bytes_written(self):
+        return self.file.tell()
+
+    def close(self, check=True):
+        if self.file.closed:
+            return
+        self.file.close()
+        if check and self.num_written != len(self.zones):
+            raise RuntimeError(
+                f"Only {self.num_written} of {len(self.zones)} zones written to {self.filename}"
+            )
+
+    def write_zone(self, values, connectivity=None):
+        ''' Write data for the next zone.
+
+        Arguments:
+            values        List of 1D arrays, one per variable, each sized
+                          according to the zone shape and variable location.
+                          An item may also be Shared(izone), to refer to the
+                          values of the same variable in an earlier zone, or
+                          PASSIVE for a variable the zone does not store.
+            connectivity  Zero-based (num_elements, nodes_per_element) array,
+                          or Shared(izone) to refer to that of an earlier zone.
+                          Required for FE zones, ignored for ordered zones.
+        '''
+        self.write_zone_chunked(
+            [v if isinstance(v, Shared) or v is PASSIVE else chunked(v) for v in values],
+            connectivity,
+        )
+
+    def write_zone_chunked(self, values, connectivity=None):
+        ''' Write data for the next zone from ChunkedArrays.
+
+        Same as write_zone(), except that values are ChunkedArrays that are
+        read (possibly more than once) in chunks of self.chunk_size, so the
+        zone never needs to be held in memory at once.
+        '''
+        if self.num_written >= len(self.zones):
+            raise RuntimeError(f"All zones have already been written to {self.filename}")
+        izone = self.num_written
+        zone = self.zones[izone]
+        if len(values) != len(self.variables):
+            raise ValueError(f'Zone "{zone.name}" requires {len(self.variables)} arrays')
+        if self.share_index is not None:
+            values = [self.share_index.share_values(izone, zone, i, v) for i, v in enumerate(values)]
+        dtypes = []
+        for i, v in enumerate(values):
+            if isinstance(v, Shared):
+                self.check_shared(zone, v.zone, lambda other: value_structure(other, i) == value_structure(zone, i))
+                dtypes.append(self.dtypes[v.zone][i])
+            elif v is PASSIVE:
+                dtypes.append(np.dtype('<f4'))
+            elif v.size != value_count(zone, i):
+                raise ValueError(
+                    f'Variable "{self.variables[i]}" in zone "{zone.name}" has '
+                    f'{v.size} values, expected {value_count(zone, i)}'
+                )
+            else:
+                dtypes.append(np.dtype(v.dtype).newbyteorder('<'))
+        if zone.zone_type != 'Ordered':
+            if connectivity is None:
+                raise ValueError(f'FE zone "{zone.name}" requires connectivity')
+            if self.share_index is not None:
+                connectivity = self.share_index.share_connectivity(izone, zone, connectivity)
+            if isinstance(connectivity, Shared):
+                self.check_shared(zone, connectivity.zone, lambda other:
+                    connectivity_structure(other) == connectivity_structure(zone))
+            else:
+                connectivity = np.asarray(connectivity).reshape(connectivity_shape(zone))
+        self.write_zone_data(zone, values, connectivity, dtypes)
+        self.dtypes.append(dtypes)
+        self.num_written += 1
+
+    def check_shared(self, zone, izone, compatible):
+        ''' Raise ValueError unless izone is an earlier zone that is compatible with zone '''
+        if not 0 <= izone < self.num_written:
+            raise ValueError(f'Zone "{zone.name}" can only share data with zones written before it')
+        if not compatible(self.zones[izone]):
+            raise ValueError(f'Zone "{zone.name}" cannot share data with zone "{self.zones[izone].name}"')
+
+    def connectivity_chunks(self, connectivity):
+        rows = max(self.chunk_size // connectivity.shape[1], 1)
+        for start in range(0, len(connectivity), rows):
+            yield connectivity[start:start+rows]
+
+
+class PltWriter(_Writer):
+    ''' Streaming writer for Tecplot binary datafiles (#!TDV112) '''
+    mode = 'wb'
+
+    def _int32(self, *values):
+        self.file.write(np.array(values, '<i4').tobytes())
+
+    def _float32(self, value):
+        self.file.write(np.array([value], '<f4').tobytes())
+
+    def _float64(self, *values):
+        self.file.write(np.array(values, '<f8').tobytes())
+
+    def _string(self, s):
+        self._int32(*[ord(c) for c in s], 0)
+
+    def write_header(self):
+        self.file.write(b'#!TDV112')
+        self._int32(1)              # Byte order
+        self._int32(0)              # Filetype (full)
+        self._string(self.title)
+        self._int32(len(self.variables))
+        for name in self.variables:
+            self._string(name)
+        for zone in self.zones:
+            self._float32(ZONE_MARKER)
+            self._string(zone.name)
+            self._int32(-1)                             # Parent zone
+            self._int32(zone.strand if zone.strand > 0 else -1)
+            self._float64(zone.solution_time)
+            self._int32(-1)                             # Zone color (unused)
+            self._int32(ZONE_TYPES.index(zone.zone_type))
+            if zone.locations and any(zone.locations):
+                self._int32(1, *[int(bool(loc)) for loc in zone.locations])
+            else:
+                self._int32(0)
+            self._int32(0)                              # Raw face neighbors
+            self._int32(0)                              # Misc. face connections
+            if zone.zone_type == 'Ordered':
+                self._int32(*(list(zone.shape) + [1,1,1])[:3])
+            else:
+                self._int32(num_points(zone), num_elements(zone), 0, 0, 0)
+            for name, value in (zone.aux_data or {}).items():
+                self._int32(1)
+                self._string(name)
+                self._int32(0)
+                self._string(str(value))
+            self._int32(0)
+        for name, value in self.aux_data.items():
+            self._float32(DATASET_AUX_MARKER)
+            self._string(name)
+            self._int32(0)
+            self._string(str(value))
+        self._float32(EOH_MARKER)
+
+    def write_zone_data(self, zone, values, connectivity, dtypes):
+        self._float32(ZONE_MARKER)
+        self._int32(*[format_code(dtype) for dtype in dtypes])
+        passive = [int(v is PASSIVE) for v in values]
+        shared = [v.zone if isinstance(v, Shared) else -1 for v in values]
+        stored = [(i, v) for i, v in enumerate(values) if not passive[i] and shared[i] < 0]
+        self._int32(*([1] + passive if any(passive) else [0]))
+        self._int32(*([1] + shared if any(z >= 0 for z in shared) else [0]))
+        self._int32(connectivity.zone if isinstance(connectivity, Shared) else -1)
+        self._float64(*[x for _, v in stored for x in chunked_minmax(v, self.chunk_size)])
+        for i, v in stored:
+            if zone.zone_type == 'Ordered' and zone.locations and zone.locations[i]:
+                chunks = self.padded_chunks(zone, v)
+            else:
+                chunks = iter_chunks(v, self.chunk_size)
+            for chunk in chunks:
+                self.file.write(chunk.astype(dtypes[i], copy=False).tobytes())
+        if connectivity is not None and zone.zone_type != 'Ordered' and not isinstance(connectivity, Shared):
+            for chunk in self.connectivity_chunks(connectivity):
+                self.file.write(chunk.astype('<i4', copy=False).tobytes())
+
+    @staticmethod
+    def padded_chunks(zone, values):
+        ''' Yield cell-centered values padded to nodal dimensions one K-plane at a time '''
+        I, J, K = (list(zone.shape) + [1,1,1])[:3]
+        plane = zone._replace(shape=(I,J,1))
+        count = num_elements(plane)
+        for k in range(K):
+            if k < max(K-1,1):
+                yield pad_cell_values(plane, np.asarray(values.read(k*count, (k+1)*count), values.dtype))
+            else:
+                yield np.zeros(I*J, values.dtype)
+
+
+class AsciiWriter(_Writer):
+    ''' Streaming writer for Tecplot ASCII datafiles (BLOCK packing) '''
+    mode = 'w'
+    dt_names = {np.dtype(fmt): name for name, fmt in ASCII_FORMATS.items()}
+    zone_type_names = {
+        zone_type: name for name, zone_type in ASCII_ZONE_TYPES.items()
+        if name.startswith(('ORDERED', 'FE'))
+    }
+    values_per_line = 5
+
+    def write_header(self):
+        f = self.file
+        f.write('TITLE     = "{}"\n'.format(self.title))
+        f.write('VARIABLES = {}\n'.format('\n'.join('"{}"'.format(v) for v in self.variables)))
+        for name, value in self.aux_data.items():
+            f.write('DATASETAUXDATA {}="{}"\n'.format(name, value))
+
+    def write_zone_data(self, zone, values, connectivity, dtypes):
+        f = self.file
+        f.write('ZONE T="{}"\n'.format(zone.name))
+        f.write(' STRANDID={}, SOLUTIONTIME={!r}\n'.format(zone.strand, float(zone.solution_time)))
+        if zone.zone_type == 'Ordered':
+            dims = (list(zone.shape) + [1,1,1])[:3]
+            f.write(' I={}, J={}, K={}, ZONETYPE=Ordered\n'.format(*dims))
+        else:
+            f.write(' Nodes={}, Elements={}, ZONETYPE={}\n'.format(
+                num_points(zone), num_elements(zone), self.zone_type_names[zone.zone_type]))
+        f.write(' DATAPACKING=BLOCK\n')
+        if zone.locations and any(zone.locations):
+            cc = [str(i+1) for i, loc in enumerate(zone.locations) if loc]
+            f.write(' VARLOCATION=([{}]=CELLCENTERED)\n'.format(','.join(cc)))
+        shared = collections.defaultdict(list)
+        for i, v in enumerate(values):
+            if isinstance(v, Shared):
+                shared[v.zone].append(str(i+1))
+        if shared:
+            f.write(' VARSHARELIST=({})\n'.format(
+                ', '.join('[{}]={}'.format(','.join(indices), izone+1) for izone, indices in shared.items())))
+        passive = [str(i+1) for i, v in enumerate(values) if v is PASSIVE]
+        if passive:
+            f.write(' PASSIVEVARLIST=[{}]\n'.format(','.join(passive)))
+        if isinstance(connectivity, Shared):
+            f.write(' CONNECTIVITYSHAREZONE={}\n'.format(connectivity.zone + 1))
+        for name, value in (zone.aux_data or {}).items():
+            f.write(' AUXDATA {}="{}"\n'.format(name, value))
+        f.write(' DT=({} )\n'.format(' '.join(self.dt_names[dtype] for dtype in dtypes)))
+        n = self.values_per_line
+        chunk_size = max(self.chunk_size // n, 1) * n # Only the last chunk may end mid-line
+        for v in values:
+            if isinstance(v, Shared) or v is PASSIVE:
+                continue
+            dtype = np.dtype(v.dtype)
+            fmt = '%.9e' if dtype == np.float32 else '%.17e' if dtype.kind == 'f' else '%d'
+            for chunk in iter_chunks(v, chunk_size):
+                self.write_block(chunk, fmt)
+        if connectivity is not None and zone.zone_type != 'Ordered' and not isinstance(connectivity, Shared):
+            for chunk in self.connectivity_chunks(connectivity):
+                np.savetxt(f, chunk + 1, fmt='%d')
+
+    def write_block(self, values, fmt):
+        n = self.values_per_line
+        nfull = (values.size // n) * n
+        if nfull:
+            np.savetxt(self.file, values[:nfull].reshape(-1,n), fmt=fmt)
+        if nfull < values.size:
+            np.savetxt(self.file, values[nfull:].reshape(1,-1), fmt=fmt)
@@ -0,0 +1,179 @@
+''' Background prefetching of input files for multi-file workloads.
+
+While one file is being processed, a background thread warms the page
+cache with the next few files, so that on high-latency (e.g. parallel)
+filesystems the next load is served from memory instead of waiting on
+disk. Files are warmed with posix_fadvise(WILLNEED), where available,
+followed by large sequential reads into a reusable buffer, so prefetching
+uses the page cache rather than process memory.
+
+    for filename in Prefetcher(datafiles, depth=2):
+        process(filename)
+
+Each item may also be a list of files, e.g. the inputs of a job. Consumers
+that do not process the items one at a time in order (e.g. runner.run_tasks)
+start the prefetcher, call advance as they reach each item and stop it.
+
+The amount of I/O hidden by prefetching is logged when iteration ends and,
+while spans are being recorded (see instrument), each warm-up is a
+'prefetch' span and each wait for an unfinished warm-up a 'prefetch_wait'
+span.
+'''
+import logging
+import os
+import threading
+import time
+from . import instrument
+
+LOG = logging.getLogger(__name__)
+
+BLOCK_SIZE = 8 << 20    # Bytes per sequential read
+MAX_BYTES = 1 << 30     # Default cap on bytes warmed ahead of the consumer
+
+
+def warm_file(filename, max_bytes=None, block_size=BLOCK_SIZE, buffer=None):
+    ''' Read (up to max_bytes of) a file sequentially to load it into the page cache
+
+    Returns the number of bytes read.
+    '''
+    buffer = buffer or bytearray(block_size)
+    view = memoryview(buffer)
+    total = 0
+    with open(filename, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, max_bytes or 0, os.POSIX_FADV_WILLNEED)
+        while max_bytes is None or total < max_bytes:
+            count = f.readinto(view if max_bytes is None else view[:max_bytes - total])
+            if not count:
+                break
+            total += count
+    return total
+
+
+class Prefetcher:
+    ''' Iterate over filenames while warming the next ones in a background thread
+
+    Arguments:
+        filenames   Files (or lists of files) in order of processing
+        depth       Number of items warmed ahead of the current one
+        max_bytes   Cap on the bytes warmed ahead of the current item; an
+                    item larger than the cap is only warmed up to it
+
+    A file is only waited for if its warm-up has already started when the
+    consumer reaches it; otherwise the consumer just reads it. Statistics of
+    the last iteration are kept in warm_time (seconds spent warming),
+    wait_time (seconds the consumer waited) and bytes (bytes warmed).
+    '''
+    def __init__(self, filenames, depth=2, max_bytes=MAX_BYTES):
+        self.filenames = list(filenames)
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.warm_time = 0.0
+        self.wait_time = 0.0
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def hidden_time(self):
+        ''' Seconds of warm-up I/O that overlapped with processing '''
+        return max(self.warm_time - self.wait_time, 0.0)
+
+    def start(self):
+        ''' Start warming the items after the first one '''
+        self.warm_time = self.wait_time = 0.0
+        self.bytes = 0
+        self._cond = threading.Condition()
+        self._current = 0       # Index of the item being processed
+        self._warming = None    # Index of the item being warmed
+        self._ahead = {}        # Bytes warmed of each item not yet processed
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='tec_util-prefetch', daemon=True)
+        self._thread.start()
+
+    def advance(self, index, wait=False):
+        ''' Mark item index as being processed, and the ones before it as done
+
+        With wait, block until the item is warmed if its warm-up has started.
+        '''
+        with self._cond:
+            self._current = max(self._current, index)
+            for j in [j for j in self._ahead if j < index]:
+                del self._ahead[j]
+            self._cond.notify_all()
+            if wait and self._warming == index:
+                with instrument.span('prefetch_wait', file=str(self.filenames[index])):
+                    start = time.perf_counter()
+                    while self._warming == index:
+                        self._cond.wait()
+                    self.wait_time += time.perf_counter() - start
+
+    def stop(self):
+        ''' Stop warming and log the statistics '''
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+        LOG.info(
+            "Prefetched %d bytes in %.3f s; waited %.3f s, hid %.3f s of I/O",
+            self.bytes, self.warm_time, self.wait_time, self.hidden_time,
+        )
+
+    def __iter__(self):
+        if self.depth <= 0:
+            self.warm_time = self.wait_time = 0.0
+            self.bytes = 0
+            yield from self.filenames
+            return
+        self.start()
+        try:
+            for i, filename in enumerate(self.filenames):
+                self.advance(i, wait=True)
+                yield filename
+        finally:
+            self.stop()
+
+    def _run(self):
+        buffer = bytearray(BLOCK_SIZE)
+        for i, item in enumerate(self.filenames):
+            sizes = {}
+            for filename in [item] if isinstance(item, str) else item:
+                try:
+                    sizes[filename] = os.path.getsize(filename)
+                except OSError:
+                    pass # The consumer reports missing files
+            if not sizes:
+                continue
+            size = sum(sizes.values())
+            with self._cond:
+                while not self._stop and (
+                    i > self._current + self.depth or
+                    (self._ahead and sum(self._ahead.values()) + size > self.max_bytes)
+                ):
+                    self._cond.wait()
+                if self._stop:
+                    return
+                if i <= self._current:
+                    continue # Too late; being read by the consumer already
+                budget = self.max_bytes - sum(self._ahead.values())
+                self._warming = i
+            start = time.perf_counter()
+            count = 0
+            for filename, file_size in sizes.items():
+                if count >= budget:
+                    break
+                try:
+                    with instrument.span('prefetch', file=filename) as s:
+                        warmed = warm_file(filename, min(file_size, budget - count), buffer=buffer)
+                        if s:
+                            s.add(bytes=warmed)
+                    count += warmed
+                except OSError as e:
+                    LOG.debug("Cannot prefetch %s: %s", filename, e)
+            with self._cond:
+                self.warm_time += time.perf_counter() - start
+                self.bytes += count
+                self._ahead[i] = count
+                self._warming = None
+                self._cond.notify_all()
@@ -0,0 +1,416 @@
+''' Concurrent execution of tec_util jobs with asyncio.
+
+run_tasks schedules Tasks, which are either batch.Jobs (calls of API
+functions, see batch.py) or tec_util command lines. Each job runs in a
+subprocess of its own (mode "subprocess", the default) or in a pool of
+worker processes (mode "process"), while the event loop of the parent only
+admits, waits for, retries and records them.
+
+A job is admitted when the resources it needs are available:
+
+    jobs     number of running jobs (max_jobs)
+    loads    running jobs that load datasets into Tecplot (max_loads)
+    memory   estimated field data held by the running jobs (max_memory)
+
+A job that needs more than a limit on its own runs once nothing else holds
+that resource. A job whose inputs match the outputs of an earlier job waits
+for it, and fails if it failed.
+
+Failed jobs are retried with exponential backoff. On cancellation (e.g.
+Ctrl-C) the running subprocesses are terminated and the jobs that did not
+complete are not recorded in the journal, so they run when the batch is
+resumed. With prefetch, the inputs of the next jobs to start are read into
+the page cache in a background thread while the running jobs work (see
+prefetch.py). A live progress line on stderr shows the completed jobs, the input
+files and bytes processed per second and the estimated time remaining.
+'''
+import asyncio
+import collections
+import concurrent.futures
+import fnmatch
+import json
+import logging
+import os
+import sys
+import time
+from . import batch
+from . import native
+from .prefetch import MAX_BYTES, Prefetcher
+
+LOG = logging.getLogger(__name__)
+
+# API functions that load datasets into Tecplot rather than streaming them
+LOADING_FUNCTIONS = {
+    'compute_statistics', 'decimate', 'derive_variables', 'difference_datasets', 'extract',
+    'interpolate_dataset', 'rename_variables', 'rename_zones', 'revolve_dataset', 'slice_surfaces',
+}
+OUTPUT_LINES = 20 # Lines of stderr kept to report a failed subprocess
+
+Task = collections.namedtuple('Task', [
+    'id',       # Unique name of the task
+    'job',      # batch.Job to run, or None
+    'argv',     # tec_util command line arguments to run, if job is None
+    'inputs',   # Input files (or glob patterns)
+    'outputs',  # Output files (or glob patterns)
+    'memory',   # Estimated bytes of field data held in memory
+    'loads',    # 1 if the task loads datasets into Tecplot, else 0
+])
+
+
+#-----------------------------------------------------------------------
+# Tasks
+#-----------------------------------------------------------------------
+def estimate_inputs_memory(filenames):
+    ''' Estimated bytes of field data of the datafiles among filenames '''
+    from .core import estimate_memory
+    total = 0
+    for filename in batch.expand_patterns(filenames):
+        try:
+            total += estimate_memory(filename)
+        except (OSError, native.UnsupportedFormat):
+            pass # Not a datafile (yet)
+    return total
+
+def job_task(job):
+    ''' Task running a batch.Job '''
+    return Task(
+        job.id, job, None, job.inputs, job.outputs,
+        estimate_inputs_memory(job.inputs), int(job.function in LOADING_FUNCTIONS),
+    )
+
+def dependencies(tasks):
+    ''' {task id: [ids of earlier tasks writing its inputs]} '''
+    def matches(a, b):
+        return a == b or fnmatch.fnmatch(a, b) or fnmatch.fnmatch(b, a)
+    return {
+        task.id: [
+            earlier.id for earlier in tasks[:i]
+            if any(matches(f, out) for f in task.inputs for out in earlier.outputs)
+        ]
+        for i, task in enumerate(tasks)
+    }
+
+def call_function(function, args):
+    ''' Call a batch API function; runs in a worker or subprocess '''
+    batch.FUNCTIONS[function](**args)
+
+def call_command(argv):
+    ''' Run a tec_util command line; runs in a worker process '''
+    from .__main__ import main
+    main(list(argv))
+
+def call_job(text):
+    ''' Entry point of job subprocesses: call the function of a JSON job spec '''
+    spec = json.loads(text)
+    logging.basicConfig(stream=sys.stderr, format="%(name)s | %(levelname)s | %(message)s")
+    logging.getLogger('tec_util').setLevel(spec['loglevel'])
+    call_function(spec['function'], spec['args'])
+
+def subprocess_command(task):
+    ''' Command line running a task in a Python subprocess '''
+    if task.job is None:
+        return [sys.executable, '-m', 'tec_util'] + list(task.argv)
+    spec = json.dumps({
+        'function': task.job.function,
+        'args': task.job.args,
+        'loglevel': logging.getLogger('tec_util').getEffectiveLevel(),
+    })
+    return [sys.executable, '-c', 'import sys, tec_util.runner as r; r.call_job(sys.argv[1])', spec]
+
+def subprocess_env():
+    ''' Environment of job subprocesses, which import this copy of tec_util '''
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+    return env
+
+
+#-----------------------------------------------------------------------
+# Scheduling
+#-----------------------------------------------------------------------
+class Resources:
+    ''' Named counters (jobs, loads, memory) with optional limits '''
+    def __init__(self, limits):
+        self.limits = {name: limit for name, limit in limits.items() if limit is not None}
+        self.used = dict.fromkeys(self.limits, 0)
+        self._condition = asyncio.Condition()
+
+    def fits(self, request):
+        return all(
+            self.used[name] + amount <= self.limits[name] or self.used[name] == 0
+            for name, amount in request.items() if name in self.limits and amount
+        )
+
+    async def acquire(self, request):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.fits(request))
+            for name in self.limits:
+                self.used[name] += request.get(name, 0)
+
+    async def release(self, request):
+        async with self._condition:
+            for name in self.limits:
+                self.used[name] -= request.get(name, 0)
+            self._condition.notify_all()
+
+class Progress:
+    ''' Live one-line summary of a run, redrawn on a stream (def: stderr) '''
+    def __init__(self, tasks, enabled=None, stream=None):
+        self.stream = stream or sys.stderr
+        self.enabled = self.stream.isatty() if enabled is None else enabled
+        self.sizes = {task.id: input_size(task) for task in tasks}
+        self.total = len(tasks)
+        self.total_bytes = sum(size for size, _ in self.sizes.values())
+        self.done, self.failed, self.running = 0, 0, 0
+        self.bytes, self.files = 0, 0
+        self.start = time.perf_counter()
+        self._width = 0
+
+    def finish(self, task, ok):
+        size, count = self.sizes.get(task.id, (0, 0))
+        self.done += ok
+        self.failed += not ok
+        self.bytes += size
+        self.files += count
+
+    def skip(self, task):
+        self.total -= 1
+        self.total_bytes -= self.sizes.pop(task.id, (0, 0))[0]
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        finished = self.done + self.failed
+        if self.bytes:
+            eta = (self.total_bytes - self.bytes) * elapsed / self.bytes
+        elif finished:
+            eta = (self.total - finished) * elapsed / finished
+        else:
+            eta = None
+        return "[{}/{}] {} running, {} failed | {:.2f} files/s, {:.3f} GB/s | ETA {}".format(
+            finished, self.total, self.running, self.failed,
+            self.files / elapsed, self.bytes / elapsed / 1e9,
+            '?' if eta is None else time.strftime('%H:%M:%S', time.gmtime(eta)),
+        )
+
+    def draw(self):
+        if self.enabled:
+            text = self.line()
+            self.stream.write('\r' + text.ljust(self._width))
+            self.stream.flush()
+            self._width = len(text)
+
+    def clear(self):
+        if self.enabled and self._width:
+            self.stream.write('\r' + ' ' * self._width + '\r')
+            self.stream.flush()
+            self._width = 0
+
+def input_size(task):
+    ''' (bytes, number) of the existing input files of a task '''
+    sizes = [os.path.getsize(f) for f in batch.expand_patterns(task.inputs) if os.path.isfile(f)]
+    return sum(sizes), len(sizes)
+
+async def run_subprocess(task, timeout=None):
+    ''' Run a task in a subprocess; returns its stdout, raises RuntimeError on failure '''
+    process = await asyncio.create_subprocess_exec(
+        *subprocess_command(task),
+        stdout = asyncio.subprocess.PIPE,
+        stderr = asyncio.subprocess.PIPE,
+        env = subprocess_env(),
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException: # Cancelled or timed out
+        if process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                process.kill()
+        raise
+    if process.returncode != 0:
+        lines = stderr.decode(errors='replace').strip().splitlines()[-OUTPUT_LINES:]
+        raise RuntimeError(f"exit status {process.returncode}" + ''.join('\n    ' + line for line in lines))
+    return stdout.decode(errors='replace')
+
+async def run_worker(pool, task, timeout=None, submitted=None):
+    ''' Run a task in a process pool; a running worker cannot be interrupted
+
+    The future of the task is added to submitted, so that it can be
+    cancelled if it has not started when the run stops.
+    '''
+    if task.job is None:
+        future = pool.submit(call_command, task.argv)
+    else:
+        future = pool.submit(call_function, task.job.function, task.job.args)
+    if submitted is not None:
+        submitted.append(future)
+    await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    return ''
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+async def run_tasks(tasks, max_jobs=1, max_loads=None, max_memory=None, retries=0, retry_delay=1.0,
+                    timeout=None, mode='subprocess', journal=None, force=False, keep_going=True,
+                    progress=None, prefetch=0, prefetch_bytes=MAX_BYTES):
+    ''' Run tasks concurrently within resource limits
+
+    Arguments:
+        tasks        List of Tasks, in order; see job_task
+        max_jobs     Number of jobs run at once
+        max_loads    Number of jobs loading datasets into Tecplot at once
+        max_memory   Bytes of estimated field data of the running jobs
+        retries      Number of times a failed job is run again
+        retry_delay  Seconds before the first retry; doubled for each one
+        timeout      Seconds after which a job is cancelled and failed
+        mode         "subprocess" or "process" (a pool of max_jobs workers)
+        journal      batch.Journal where batch.Jobs are recorded; jobs up
+                     to date in it are skipped unless force is set
+        keep_going   Continue after a failure; otherwise cancel the others
+        progress     Show a progress line on stderr (def: if a terminal)
+        prefetch     Number of jobs, after those started, whose input files
+                     are warmed in the background (def: 0)
+        prefetch_bytes  Cap on the bytes warmed ahead
+
+    Returns:
+        batch.BatchReport with the ids of the done, skipped and failed tasks
+    '''
+    if mode not in ('subprocess', 'process'):
+        raise ValueError(f"Unknown mode '{mode}'; expected subprocess or process")
+    resources = Resources({'jobs': max_jobs, 'loads': max_loads, 'memory': max_memory})
+    status = Progress(tasks, progress)
+    report = batch.BatchReport([], [], [])
+    finished = {task.id: asyncio.Event() for task in tasks}
+    outcome = {}
+    record_lock = asyncio.Lock()
+    depends = dependencies(tasks)
+    pool = concurrent.futures.ProcessPoolExecutor(max_jobs) if mode == 'process' else None
+    submitted = [] # Futures of the pool
+    prefetcher = None
+    if prefetch > 0:
+        prefetcher = Prefetcher([batch.expand_patterns(task.inputs) for task in tasks], prefetch, prefetch_bytes)
+        prefetcher.start()
+    index = {task.id: i for i, task in enumerate(tasks)}
+    started = [False] * len(tasks)
+    next_start = 0 # Index of the first task not yet started
+
+    def reached(task):
+        # Inputs of the tasks after next_start are warmed; jobs start roughly in order
+        nonlocal next_start
+        started[index[task.id]] = True
+        while next_start < len(tasks) and started[next_start]:
+            next_start += 1
+        if prefetcher is not None:
+            prefetcher.advance(next_start - 1)
+
+    async def record(task, state, elapsed, error=None):
+        if journal is not None and task.job is not None:
+            async with record_lock:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, journal.record, task.job, state, elapsed, error,
+                )
+
+    async def run(task):
+        try:
+            for dependency in depends[task.id]:
+                await finished[dependency].wait()
+            failed = [d for d in depends[task.id] if outcome.get(d) not in ('done', 'skipped')]
+            if failed:
+                raise RuntimeError(f"inputs written by failed jobs {', '.join(failed)}")
+            loop = asyncio.get_running_loop()
+            if not force and journal is not None and task.job is not None and \
+               await loop.run_in_executor(None, journal.up_to_date, task.job):
+                LOG.info("Skip job %s; up to date", task.id)
+                status.skip(task)
+                outcome[task.id] = 'skipped'
+                report.skipped.append(task.id)
+                return
+            memory = task.memory
+            if not memory and depends[task.id]: # Inputs written by earlier tasks
+                memory = await loop.run_in_executor(None, estimate_inputs_memory, task.inputs)
+            request = {'jobs': 1, 'loads': task.loads, 'memory': memory}
+            start = time.perf_counter()
+            for attempt in range(retries + 1):
+                await resources.acquire(request)
+                reached(task)
+                status.running += 1
+                status.draw()
+                try:
+                    LOG.info("Run job %s%s", task.id, f" (attempt {attempt + 1})" if attempt else "")
+                    if pool is None:
+                        output = await run_subprocess(task, timeout)
+                    else:
+                        output = await run_worker(pool, task, timeout, submitted)
+                    break
+                except Exception as e:
+                    error = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+                    if attempt == retries:
+                        raise RuntimeError(error) from e
+                    LOG.warning("Job %s failed (%s); retrying in %.1f s", task.id, error, retry_delay * 2**attempt)
+                finally:
+                    status.running -= 1
+                    await resources.release(request)
+                await asyncio.sleep(retry_delay * 2**attempt)
+            status.clear()
+            if output:
+                sys.stdout.write(output)
+                sys.stdout.flush()
+            await record(task, 'done', time.perf_counter() - start)
+            outcome[task.id] = 'done'
+            report.done.append(task.id)
+            status.finish(task, True)
+        except Exception as e:
+            status.clear()
+            LOG.error("Job %s failed: %s", task.id, e)
+            await record(task, 'failed', 0.0, str(e))
+            outcome[task.id] = 'failed'
+            report.failed.append(task.id)
+            status.finish(task, False)
+            if not keep_going:
+                for other in running:
+                    if other is not asyncio.current_task():
+                        other.cancel()
+        finally:
+            reached(task)
+            finished[task.id].set()
+            status.draw()
+
+    async def redraw():
+        while True:
+            await asyncio.sleep(0.5)
+            status.draw()
+
+    running = [asyncio.ensure_future(run(task)) for task in tasks]
+    ticker = asyncio.ensure_future(redraw())
+    try:
+        await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        ticker.cancel()
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, ticker, return_exceptions=True)
+        if pool is not None:
+            for future in submitted:
+                future.cancel() # Pending ones only; shutdown waits for the running ones
+            pool.shutdown(wait=True)
+        if prefetcher is not None:
+            prefetcher.stop()
+        status.clear()
+    cancelled = len(tasks) - len(report.done) - len(report.skipped) - len(report.failed)
+    if cancelled:
+        LOG.warning("Cancelled %d jobs", cancelled)
+    LOG.info(
+        "Run done: %d run, %d skipped, %d failed in %.1f s (%s)",
+        len(report.done), len(report.skipped), len(report.failed),
+        time.perf_counter() - status.start, status.line(),
+    )
+    # Report tasks in their original order
+    for ids in report:
+        ids.sort(key=index.get)
+    return report
+
+def run_jobs(tasks, **kwargs):
+    ''' Run tasks with run_tasks in a new event loop; see run_tasks '''
+    return asyncio.run(run_tasks(tasks, **kwargs))
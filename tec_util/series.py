@@ -0,0 +1,324 @@
+''' Streaming statistics over a series of solution times.
+
+A series is either a list of datafiles (one solution time each) or a single
+datafile with several solution times. Timesteps are read one at a time with
+the native readers and zone data is reduced chunk by chunk, so memory use
+does not depend on the length of the series or the size of the zones.
+'''
+import collections
+import csv
+import glob
+import logging
+import numpy as np
+import os
+import re
+import tempfile
+from . import instrument
+from . import native
+from .core import NameIndex, zone_key
+from .prefetch import MAX_BYTES, Prefetcher
+
+LOG = logging.getLogger(__name__)
+
+Timestep = collections.namedtuple('Timestep', ['time', 'filename', 'zones'])
+
+
+class RunningStats:
+    ''' Streaming count/mean/variance and extrema for an array of quantities.
+
+    Each quantity (e.g. a zone-variable pair) is addressed by an index into
+    arrays of the given shape. Values are accumulated with Welford's
+    algorithm, generalized to merging whole chunks (Chan et al.), so the
+    result is numerically stable and independent of how the data is split.
+    NaN values are ignored. The time at which each extremum was first seen
+    is tracked as well.
+    '''
+    def __init__(self, shape):
+        self.count = np.zeros(shape, np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.tmin = np.full(shape, np.nan)
+        self.tmax = np.full(shape, np.nan)
+
+    def add(self, index, values, time=np.nan):
+        ''' Accumulate an array of values observed at the given time '''
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        mean = values.mean()
+        self._merge(index, values.size, mean, np.square(values - mean).sum(),
+                    values.min(), values.max(), time, time)
+
+    def merge(self, other):
+        ''' Merge all quantities of another RunningStats of the same shape '''
+        index = np.nonzero(other.count)
+        self._merge(index, other.count[index], other.mean[index], other.m2[index],
+                    other.min[index], other.max[index], other.tmin[index], other.tmax[index])
+
+    def _merge(self, index, count, mean, m2, vmin, vmax, tmin, tmax):
+        n_a = self.count[index]
+        n = n_a + count
+        delta = mean - self.mean[index]
+        self.mean[index] += delta * count / n
+        self.m2[index] += m2 + np.square(delta) * n_a * count / n
+        self.count[index] = n
+        is_min = vmin < self.min[index]
+        self.min[index] = np.where(is_min, vmin, self.min[index])
+        self.tmin[index] = np.where(is_min, tmin, self.tmin[index])
+        is_max = vmax > self.max[index]
+        self.max[index] = np.where(is_max, vmax, self.max[index])
+        self.tmax[index] = np.where(is_max, tmax, self.tmax[index])
+
+    @property
+    def variance(self):
+        ''' Population variance (NaN where nothing was accumulated) '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.m2 / self.count, np.nan)
+
+    def finalize(self):
+        ''' Replace the extrema and mean of empty quantities with NaN '''
+        empty = self.count == 0
+        for array in (self.mean, self.min, self.max):
+            array[empty] = np.nan
+
+
+#-----------------------------------------------------------------------
+# Timesteps
+#-----------------------------------------------------------------------
+def natural_key(filename):
+    ''' Sort key ordering the numbers in filenames by value (sol_2 before sol_10) '''
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', filename)]
+
+def expand_datafiles(patterns):
+    ''' Expand glob patterns into a list of files, keeping the order of patterns
+
+    The matches of each pattern are sorted naturally (see natural_key), as
+    their order is the time axis of files without solution times.
+    '''
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern), key=natural_key)
+        if not matches:
+            raise FileNotFoundError(f"No datafiles matching {pattern}")
+        files.extend(matches)
+    return files
+
+def iter_timesteps(datafiles):
+    ''' Yield Timesteps (time, filename, zone indices).
+
+    If there is a single datafile, its zones are grouped by solution time
+    and yielded in order of time. Otherwise each datafile is one timestep,
+    yielded in the order given (so the prefetcher can read ahead); its time
+    is the solution time of its first zone, or the file index if all zones
+    have time zero.
+    '''
+    if len(datafiles) == 1:
+        datafiles = list(datafiles)
+        header = native.read_header(datafiles[0])
+        times = collections.defaultdict(list)
+        for i, zone in enumerate(header.zones):
+            times[zone.solution_time].append(i)
+        for time in sorted(times):
+            yield Timestep(time, datafiles[0], times[time])
+        return
+    for i, datafile in enumerate(datafiles):
+        header = native.read_header(datafile)
+        time = header.zones[0].solution_time if header.zones else 0.0
+        if not any(z.solution_time for z in header.zones):
+            time = float(i)
+        yield Timestep(time, datafile, list(range(len(header.zones))))
+
+def select_series(reader, step, variable_patterns=None, zone_patterns=None):
+    ''' (zone keys, zone names, variable names) selected in a timestep '''
+    step_zones = [reader.zones[i] for i in step.zones]
+    selected = NameIndex(z.name for z in step_zones).select(zone_patterns)
+    keys = [zone_key(step_zones[i]) for i in selected]
+    zones = [step_zones[i].name for i in selected]
+    variables = [reader.variables[i] for i in NameIndex(reader.variables).select(variable_patterns)]
+    assert zones, f"No zones in dataset matching {' '.join(zone_patterns)}"
+    assert variables, f"No variables in dataset matching {' '.join(variable_patterns)}"
+    return keys, zones, variables
+
+def step_statistics(reader, step, keys, zones, variables):
+    ''' RunningStats of the zones (matched by key) and variables of a timestep '''
+    step_zones = [reader.zones[i] for i in step.zones]
+    zone_index = {zone_key(z): i for i, z in zip(step.zones, step_zones)}
+    var_index = {name: i for i, name in enumerate(reader.variables)}
+    stats = RunningStats((len(zones), len(variables)))
+    for iz, key in enumerate(keys):
+        if key not in zone_index:
+            LOG.warning("Zone %s missing at time %s", zones[iz], step.time)
+            continue
+        for iv, name in enumerate(variables):
+            if name not in var_index:
+                LOG.warning("Variable %s missing at time %s", name, step.time)
+                continue
+            values = native.chunked(reader.values(zone_index[key], var_index[name]))
+            for chunk in native.iter_chunks(values):
+                stats.add((iz,iv), chunk, step.time)
+    return stats
+
+
+#-----------------------------------------------------------------------
+# Output
+#-----------------------------------------------------------------------
+class CsvSeriesWriter:
+    ''' Write per-timestep statistics as rows of time,zone,variable,min,max,mean
+
+    With append, rows are added to an existing file (e.g. by tec_util.watch).
+    '''
+    def __init__(self, filename, zones, variables, append=False):
+        append = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+        self.filename = filename
+        self.start = os.path.getsize(filename) if append else None
+        self.file = open(filename, 'a' if append else 'w', newline='')
+        self.writer = csv.writer(self.file)
+        if not append:
+            self.writer.writerow(['time', 'zone', 'variable', 'min', 'max', 'mean'])
+        self.zones = zones
+        self.variables = variables
+
+    def write_step(self, time, stats):
+        for iz, zone in enumerate(self.zones):
+            for iv, var in enumerate(self.variables):
+                if stats.count[iz,iv]:
+                    self.writer.writerow([
+                        repr(float(time)), zone, var,
+                        repr(float(stats.min[iz,iv])),
+                        repr(float(stats.max[iz,iv])),
+                        repr(float(stats.mean[iz,iv])),
+                    ])
+
+    def close(self, total):
+        self.file.close()
+
+    def abort(self):
+        ''' Discard the rows written so far '''
+        self.file.close()
+        if self.start is None:
+            os.remove(self.filename)
+        else:
+            os.truncate(self.filename, self.start)
+
+class NpzSeriesWriter:
+    ''' Write per-timestep statistics as (T,Z,V) arrays in an NPZ archive.
+
+    Timesteps are buffered in a temporary file until the series ends, so
+    memory use does not grow with the length of the series.
+    '''
+    fields = ['min', 'max', 'mean']
+
+    def __init__(self, filename, zones, variables):
+        self.filename = filename
+        self.zones = zones
+        self.variables = variables
+        self.times = []
+        self.buffer = tempfile.TemporaryFile()
+
+    def write_step(self, time, stats):
+        self.times.append(time)
+        step = [np.where(stats.count > 0, getattr(stats, f), np.nan) for f in self.fields]
+        self.buffer.write(np.stack(step).astype(np.float64).tobytes())
+
+    def close(self, total):
+        self.buffer.flush()
+        shape = (len(self.times), len(self.fields), len(self.zones), len(self.variables))
+        if self.times:
+            history = np.memmap(self.buffer, np.float64, 'r', shape=shape)
+        else:
+            history = np.zeros(shape)
+        np.savez(
+            self.filename,
+            time = np.array(self.times),
+            zones = np.array(self.zones),
+            variables = np.array(self.variables),
+            **{f: history[:,i] for i, f in enumerate(self.fields)},
+            **{
+                'total_' + f: getattr(total, f)
+                for f in ['count', 'min', 'tmin', 'max', 'tmax', 'mean', 'variance']
+            },
+        )
+        del history
+        self.buffer.close()
+
+    def abort(self):
+        ''' Discard the buffered timesteps without saving '''
+        self.buffer.close()
+
+def open_series_writer(filename, zones, variables):
+    ''' CSV or NPZ series writer depending on extension '''
+    if os.path.splitext(filename)[1] == '.npz':
+        return NpzSeriesWriter(filename, zones, variables)
+    return CsvSeriesWriter(filename, zones, variables)
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+@instrument.traced
+def compute_series_statistics(datafiles, output=None, variable_patterns=None, zone_patterns=None,
+                              prefetch=0, prefetch_bytes=MAX_BYTES):
+    ''' Compute min/max/mean histories of each zone-variable over a series
+
+    Arguments:
+        datafiles          [list(str)] Datafiles (or glob patterns) with one
+                           solution time each, or a single datafile with
+                           several solution times.
+        output             [str] Optional .csv or .npz file where the
+                           statistics of every timestep are written.
+        variable_patterns  [list(str)] Names of variables to be analyzed.
+        zone_patterns      [list(str)] Names of zones to be analyzed.
+        prefetch           [int] Number of datafiles warmed in the background
+                           ahead of the one being processed (def: 0).
+        prefetch_bytes     [int] Cap on the bytes warmed ahead.
+
+    Returns:
+        (zones, variables, total) where zones is the list of zone names (of
+        the first timestep), variables the list of variable names and total
+        a RunningStats of shape (len(zones), len(variables)) over the whole
+        series, including the time of each extremum.
+
+    Zones are matched across timesteps by strand, or by name for static
+    zones. Variables are matched by name.
+    '''
+    datafiles = expand_datafiles(datafiles)
+    if prefetch and len(datafiles) > 1:
+        datafiles = Prefetcher(datafiles, prefetch, prefetch_bytes)
+    keys, zones, variables, total, writer = None, None, None, None, None
+    reader = None # Kept open over the timesteps of a datafile
+    try:
+        for step in iter_timesteps(datafiles):
+            if reader is None or reader.filename != step.filename:
+                if reader is not None:
+                    reader.close()
+                    reader = None
+                reader = native.open_dataset(step.filename)
+            with instrument.span('stream', file=step.filename, time=step.time):
+                if zones is None:
+                    # Selection is resolved against the first timestep
+                    keys, zones, variables = select_series(reader, step, variable_patterns, zone_patterns)
+                    total = RunningStats((len(zones), len(variables)))
+                    if output:
+                        writer = open_series_writer(output, zones, variables)
+                    LOG.info("Gathering statistics of %d zones, %d variables", len(zones), len(variables))
+
+                LOG.info("Process time %s from %s", step.time, step.filename)
+                stats = step_statistics(reader, step, keys, zones, variables)
+                total.merge(stats)
+                if writer:
+                    writer.write_step(step.time, stats)
+        total.finalize()
+    except BaseException:
+        # Only a complete series is saved
+        if writer:
+            writer.abort()
+        raise
+    finally:
+        if reader is not None:
+            reader.close()
+    if writer:
+        writer.close(total)
+    return zones, variables, total
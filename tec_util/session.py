@@ -0,0 +1,179 @@
+''' In-memory chaining of tec_util operations.
+
+The functions in tec_util.core are file-based: each one loads its inputs
+into a temporary frame and writes its result to a datafile. A Session
+instead owns the frames of the datasets it loads and passes Handles
+between operations, so intermediate results stay in memory:
+
+    with tec_util.Session() as session:
+        new = session.extract(session.load('new.plt'), var_patterns=['p*'])
+        old = session.load('old.plt', var_patterns=['p*'])
+        delta = session.difference(new, old)
+        stats = session.statistics(delta)
+        session.write(delta, 'diff.plt')
+
+All frames are deleted when the session is closed, which restores the
+state of the Tecplot layout as it was before the session.
+'''
+import collections
+import contextlib
+import logging
+from . import instrument
+from .core import (
+    add_differences, check_pairs, copy_zone, dataset_statistics, extract_slices, forget_name_index,
+    get_variables, get_zones, interpolate_zones, load_dataset, load_slices, revolve_zones, temp_frame,
+    write_dataset,
+)
+
+LOG = logging.getLogger(__name__)
+
+Handle = collections.namedtuple('Handle', ['dataset', 'zones', 'variables'])
+Handle.__doc__ = ''' Selection of the zones and variables of a dataset owned by a Session '''
+
+
+class Session:
+    ''' Owner of the frames holding the datasets of a chain of operations '''
+    def __init__(self):
+        self._frames = contextlib.ExitStack()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        ''' Delete all frames created by the session '''
+        self._frames.close()
+        self.closed = True
+
+    def _new_frame(self):
+        if self.closed:
+            raise RuntimeError("Session is closed")
+        return self._frames.enter_context(temp_frame())
+
+    @instrument.traced
+    def load(self, datafile, zone_patterns=None, var_patterns=None):
+        ''' Load (part of) a datafile into a new frame and return its Handle '''
+        import tecplot.constant as tpc
+        LOG.info("Load dataset %s", datafile)
+        dataset = load_dataset(
+            datafile,
+            self._new_frame(),
+            zone_patterns,
+            var_patterns,
+            initial_plot_type = tpc.PlotType.Cartesian3D,
+        )
+        return self.select(Handle(dataset, None, None), zone_patterns, var_patterns)
+
+    def select(self, handle, zone_patterns=None, var_patterns=None):
+        ''' Handle of the zones/variables of a dataset matching the given patterns
+
+        If handle already has a selection, the patterns narrow it down.
+        '''
+        zones = get_zones(handle.dataset, zone_patterns)
+        variables = get_variables(handle.dataset, var_patterns)
+        if handle.zones is not None:
+            indices = {z.index for z in handle.zones}
+            zones = [z for z in zones if z.index in indices]
+        if handle.variables is not None:
+            indices = {v.index for v in handle.variables}
+            variables = [v for v in variables if v.index in indices]
+        return Handle(handle.dataset, zones, variables)
+
+    @instrument.traced
+    def extract(self, handle, zone_patterns=None, var_patterns=None):
+        ''' Same as core.extract, without copying any data '''
+        return self.select(handle, zone_patterns, var_patterns)
+
+    @instrument.traced
+    def difference(self, new, old, nskip=3, jobs=1):
+        ''' Same as core.difference_datasets; returns a Handle of the grid and delta variables
+
+        The delta variables are added to the dataset of new, so new and old
+        must not share a dataset.
+        '''
+        if new.dataset == old.dataset:
+            LOG.error("Cannot difference two selections of the same dataset")
+            raise RuntimeError("Cannot difference two selections of the same dataset")
+        check_pairs('variable', None, [v.name for v in new.variables], [v.name for v in old.variables])
+        check_pairs('zone', None, [z.name for z in new.zones], [z.name for z in old.zones])
+        LOG.info("Compute dataset differences (new - old).")
+        deltas = add_differences(new.dataset, old.dataset, new.variables, old.variables,
+                                 new.zones, old.zones, nskip, jobs)
+        grid = [new.dataset.variable(i) for i in range(min(nskip, new.dataset.num_variables))]
+        return Handle(new.dataset, new.zones, grid + deltas)
+
+    @instrument.traced
+    def interpolate(self, source, target):
+        ''' Same as core.interpolate_dataset; returns a Handle of the interpolated zones
+
+        The zones of target are copied into the dataset of source, unless
+        they already belong to it, and its variables are interpolated onto
+        them. The variables of target must exist in source.
+        '''
+        zones = target.zones
+        if target.dataset != source.dataset:
+            zones = [copy_zone(zone, source.dataset, target.variables) for zone in target.zones]
+        interpolate_zones(source.zones, zones)
+        return Handle(source.dataset, zones, source.variables)
+
+    @instrument.traced
+    def revolve(self, handle, radial_coord=None, planes=65, angle=180.0, vector_vars=None):
+        ''' Same as core.revolve_dataset; returns a Handle of the new 3D dataset '''
+        dataset = revolve_zones(
+            handle.zones, handle.variables, self._new_frame(),
+            radial_coord, planes, angle, vector_vars,
+        )
+        return self.select(Handle(dataset, None, None))
+
+    @instrument.traced
+    def slice(self, handle, slices):
+        ''' Same as core.slice_surfaces; returns a Handle of the slice zones
+
+        slices is a slice definition file or a list of its slice tuples.
+        Slices of "all" zones cut the zones of the handle. The slice zones
+        are added to the dataset of the handle.
+        '''
+        if isinstance(slices, str):
+            slices = load_slices(slices)
+        zones = extract_slices(
+            handle.dataset.frame, handle.dataset, slices,
+            all_zones = [z.index for z in handle.zones],
+        )
+        return Handle(handle.dataset, zones, handle.variables)
+
+    @instrument.traced
+    def statistics(self, handle):
+        ''' Same as core.compute_statistics for the selection of a Handle '''
+        return dataset_statistics(handle.dataset, handle.variables, handle.zones)
+
+    @instrument.traced
+    def rename_variables(self, handle, name_map):
+        ''' Rename variables of a dataset in place; returns the Handle '''
+        for old_name, new_name in name_map.items():
+            var = handle.dataset.variable(old_name)
+            var.name = new_name
+            LOG.info("Rename %d-th variable '%s' to '%s'", var.index, old_name, new_name)
+        forget_name_index(handle.dataset, 'variables')
+        return handle
+
+    @instrument.traced
+    def rename_zones(self, handle, name_map):
+        ''' Rename zones of a dataset in place; returns the Handle '''
+        for old_name, new_name in name_map.items():
+            zone = handle.dataset.zone(old_name)
+            zone.name = new_name
+            LOG.info("Rename %d-th zone '%s' to '%s'", zone.index, old_name, new_name)
+        forget_name_index(handle.dataset, 'zones')
+        return handle
+
+    @instrument.traced
+    def write(self, handle, datafile_out, precision='auto', share=False):
+        ''' Write the selection of a Handle to a datafile; returns a WriteReport '''
+        return write_dataset(datafile_out, handle.dataset, precision,
+            share = share,
+            zones = handle.zones,
+            variables = handle.variables,
+        )
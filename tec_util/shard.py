@@ -0,0 +1,231 @@
+''' Splitting of datasets into shards and merging of shards into one dataset.
+
+split_dataset writes every zone (or group of zones) of a datafile to its
+own file. Shards are divided among worker processes, each of which opens
+the input with the native readers: PLT files are memory-mapped, so each
+zone is read from disk once however many workers there are, and no worker
+holds more than one chunk of a zone-variable in memory.
+
+merge_datafiles concatenates the zones of many datafiles into one. Only
+the headers are read up front; zones are then streamed through one file
+at a time. Variables are matched by name, so the inputs may list them in
+different orders.
+
+Both write values and connectivity identical to those of an earlier zone
+of the same output file once, shared between the zones.
+'''
+import concurrent.futures
+import logging
+import numpy as np
+import os
+import re
+from . import instrument
+from . import native
+from .core import NameIndex, WriteReport, atomic_output
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = '{index:04d}_{name}.plt'
+
+
+class Converter:
+    ''' Wrap ChunkedArrays to convert their chunks to an output precision '''
+    def __init__(self, precision='auto'):
+        if precision != 'auto' and precision not in native.PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}'; expected auto, single or double")
+        self.dtype = native.PRECISIONS.get(precision)
+        self.max_error = 0.0
+
+    def __call__(self, source):
+        if self.dtype is None:
+            return source
+        def read(start, stop):
+            chunk = source.read(start, stop)
+            result = chunk.astype(self.dtype)
+            self.max_error = max(self.max_error, native.rounding_error(chunk, result))
+            return result
+        return native.ChunkedArray(np.dtype(self.dtype), source.size, read)
+
+def shard_name(text):
+    ''' Zone name or patterns made safe for use in a filename '''
+    return re.sub(r'[^\w.+-]+', '_', text).strip('_') or 'shard'
+
+def zone_subset(zones, var_indices):
+    ''' native.Zones with the locations of the given variables only '''
+    return [
+        z._replace(locations=[z.locations[i] for i in var_indices] if z.locations else None)
+        for z in zones
+    ]
+
+def write_shards(datafile_in, shards, var_indices, precision='auto'):
+    ''' Write shards [(filename, zone indices), ...] of a datafile; returns their WriteReports '''
+    reports = []
+    with native.open_dataset(datafile_in) as reader:
+        variables = [reader.variables[i] for i in var_indices]
+        for filename, zone_indices in shards:
+            convert = Converter(precision)
+            zones = zone_subset([reader.zones[iz] for iz in zone_indices], var_indices)
+            with instrument.span('write', file=filename) as s:
+                with atomic_output(filename) as temp, native.open_writer(
+                    temp, variables, zones, reader.header.title, reader.header.aux_data, share=True,
+                ) as writer:
+                    for iz, zone in zip(zone_indices, zones):
+                        values = [convert(native.chunked(reader.values(iz, iv))) for iv in var_indices]
+                        connectivity = None if zone.zone_type == 'Ordered' else reader.connectivity(iz)
+                        writer.write_zone_chunked(values, connectivity)
+                if s:
+                    s.add(bytes=os.path.getsize(filename), points=sum(native.num_points(z) for z in zones))
+            reports.append(WriteReport(filename, os.path.getsize(filename), precision, convert.max_error))
+    return reports
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+@instrument.traced
+def split_dataset(datafile_in, output=DEFAULT_TEMPLATE, groups=None, zone_patterns=None, var_patterns=None,
+                  precision='auto', jobs=1):
+    ''' Write zones (or groups of zones) of a datafile to separate files
+
+    Arguments:
+        datafile_in     [str] Path to input Tecplot datafile (PLT or ASCII)
+        output          [str] Template of the output filenames, formatted with
+                        the shard index and name (the zone name, or the
+                        patterns of a group), e.g. "zones/{name}.plt".
+                        The extension selects PLT or ASCII output.
+        groups          [list(list(str))] Zone patterns of each shard; by
+                        default, each selected zone is a shard of its own
+        zone_patterns   [list(str)] Names of zones to be split
+        var_patterns    [list(str)] Names of variables to be written
+        precision       [str] Precision of output data: auto|single|double
+        jobs            [int] Number of worker processes
+
+    Returns:
+        List of WriteReports, one per shard
+    '''
+    Converter(precision) # Check precision before starting workers
+    with native.open_dataset(datafile_in) as reader, instrument.span('select'):
+        names = [z.name for z in reader.zones]
+        var_indices = NameIndex(reader.variables).select(var_patterns)
+        zone_indices = NameIndex(names).select(zone_patterns)
+        assert var_indices, f"No variables in dataset matching {' '.join(var_patterns)}"
+        assert zone_indices, f"No zones in dataset matching {' '.join(zone_patterns)}"
+        if groups is None:
+            shards = [(names[iz], [iz]) for iz in zone_indices]
+        else:
+            selected = set(zone_indices)
+            shards = [
+                ('_'.join(group), [iz for iz in sorted(NameIndex(names).matching(group)) if iz in selected])
+                for group in groups
+            ]
+            for name, indices in shards:
+                if not indices:
+                    LOG.warning("No zones matching group %s", name)
+            shards = [(name, indices) for name, indices in shards if indices]
+    shards = [(output.format(index=i, name=shard_name(name)), indices) for i, (name, indices) in enumerate(shards)]
+    filenames = [filename for filename, _ in shards]
+    if len(set(filenames)) != len(filenames):
+        message = f'Output template "{output}" gives the same filename to several shards; add {{index}} to it'
+        LOG.error(message)
+        raise ValueError(message)
+    for directory in {os.path.dirname(f) for f in filenames} - {''}:
+        os.makedirs(directory, exist_ok=True)
+
+    LOG.info("Split %s into %d files", datafile_in, len(shards))
+    with instrument.span('compute', jobs=jobs):
+        if jobs > 1 and len(shards) > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+                futures = [
+                    pool.submit(write_shards, datafile_in, shards[i::jobs], var_indices, precision)
+                    for i in range(jobs)
+                ]
+                partial = [future.result() for future in futures]
+            # Restore the order of shards dealt out round-robin
+            reports = [partial[i % jobs][i // jobs] for i in range(len(shards))]
+        else:
+            reports = write_shards(datafile_in, shards, var_indices, precision)
+    LOG.info(
+        "Wrote %d bytes to %d files (precision: %s, max rounding error: %.3e)",
+        sum(r.num_bytes for r in reports), len(reports), precision, max(r.max_error for r in reports),
+    )
+    return reports
+
+@instrument.traced
+def merge_datafiles(datafiles, datafile_out, zone_patterns=None, var_patterns=None, precision='auto',
+                    common=False):
+    ''' Concatenate the zones of several datafiles into one dataset
+
+    Arguments:
+        datafiles       [list(str)] Paths of the input datafiles, in order
+        datafile_out    [str] Path to Tecplot datafile to be written
+        zone_patterns   [list(str)] Names of zones to be merged
+        var_patterns    [list(str)] Names of variables to be written
+        precision       [str] Precision of output data: auto|single|double
+        common          [bool] Keep only the variables found in every file.
+                        By default, all variables are kept, in order of
+                        first appearance, and those missing in a file are
+                        passive in its zones.
+
+    Returns:
+        WriteReport of datafile_out
+
+    The title and auxiliary data of the first datafile are kept.
+    '''
+    convert = Converter(precision)
+    with instrument.span('select'):
+        headers = [native.read_header(f) for f in datafiles]
+        selected = []
+        for datafile, header in zip(datafiles, headers):
+            var_indices = NameIndex(header.variables).select(var_patterns)
+            zone_indices = NameIndex([z.name for z in header.zones]).select(zone_patterns)
+            if not zone_indices:
+                LOG.warning("No zones matching %s in %s", ' '.join(zone_patterns or []), datafile)
+            var_index = {}
+            for i in var_indices:
+                var_index.setdefault(header.variables[i], i) # First of duplicate names
+            selected.append((var_index, zone_indices))
+        variables = []
+        for var_index, _ in selected:
+            variables.extend(name for name in var_index if name not in variables)
+        if common:
+            variables = [name for name in variables if all(name in var_index for var_index, _ in selected)]
+        assert variables, "No variables to merge"
+
+        zones = []
+        for header, (var_index, zone_indices) in zip(headers, selected):
+            for iz in zone_indices:
+                zone = header.zones[iz]
+                locations = None
+                if zone.locations:
+                    locations = [zone.locations[var_index[name]] if name in var_index else 0 for name in variables]
+                zones.append(zone._replace(locations=locations if locations and any(locations) else None))
+        assert zones, "No zones to merge"
+
+    LOG.info("Merge %d zones of %d datafiles into %s", len(zones), len(datafiles), datafile_out)
+    with instrument.span('write', file=datafile_out) as s:
+        with atomic_output(datafile_out) as temp, native.open_writer(
+            temp, variables, zones, headers[0].title, headers[0].aux_data, share=True,
+        ) as writer:
+            output_zones = iter(zones)
+            for datafile, (var_index, zone_indices) in zip(datafiles, selected):
+                if not zone_indices:
+                    continue
+                with native.open_dataset(datafile) as reader:
+                    for iz in zone_indices:
+                        zone = next(output_zones)
+                        values = [
+                            convert(native.chunked(reader.values(iz, var_index[name]))) if name in var_index
+                            else native.PASSIVE
+                            for name in variables
+                        ]
+                        connectivity = None if zone.zone_type == 'Ordered' else reader.connectivity(iz)
+                        writer.write_zone_chunked(values, connectivity)
+        if s:
+            s.add(bytes=os.path.getsize(datafile_out), points=sum(native.num_points(z) for z in zones))
+
+    report = WriteReport(datafile_out, os.path.getsize(datafile_out), precision, convert.max_error)
+    LOG.info(
+        "Wrote %d bytes to %s (precision: %s, max rounding error: %.3e)",
+        report.num_bytes, datafile_out, precision, report.max_error,
+    )
+    return report
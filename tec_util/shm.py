@@ -0,0 +1,260 @@
+''' Shared-memory publication of datasets for multi-process workers.
+
+A SharedDataset is created once in the parent process, from a datafile
+read with the native readers (from_file) or by publishing the arrays of a
+loaded PyTecplot dataset one by one. The size and type of every
+zone-variable array (and FE connectivity array) is given up front, and all
+of them are laid out in a single multiprocessing.shared_memory block, so a dataset holds one file
+descriptor however many zones it has. The picklable Descriptor of the
+dataset (the block name plus the offset, dtype and shape of each array) is
+all a worker needs to attach() to it and access the arrays without copying.
+
+Only the parent process owns (and unlinks) the block. Workers attach and
+detach but never unlink, so a crashing worker cannot leak or destroy any
+data. If the parent itself dies, the multiprocessing resource tracker that
+it shares with its workers unlinks the block if it was not released.
+
+The worker functions at the end of this module take their inputs as a
+Descriptor (or the path of a datafile they read natively) and write into
+the arrays of an output Descriptor, so they can be submitted directly to a
+process pool.
+'''
+import collections
+import numpy as np
+import weakref
+from multiprocessing import shared_memory
+from . import expr
+from . import native
+
+ALIGNMENT = 64 # Bytes; arrays start on cache-line boundaries
+
+Array = collections.namedtuple('Array', ['offset', 'dtype', 'shape'])
+Descriptor = collections.namedtuple('Descriptor', [
+    'name',         # Name of the shared memory block
+    'variables',    # List of variable names
+    'zones',        # List of native.Zone
+    'values',       # Dict (izone,ivar) -> Array
+    'connectivity', # Dict izone -> Array
+])
+
+
+def _release(blocks):
+    ''' Close and unlink shared memory blocks; safe to call more than once '''
+    while blocks:
+        shm = blocks.pop()
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+def _layout(arrays, offset=0):
+    ''' {key: Array} for {key: (dtype, shape)}, packed from offset; returns (layout, end) '''
+    layout = {}
+    for key, (dtype, shape) in arrays.items():
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in np.atleast_1d(shape))
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[key] = Array(offset, dtype.str, shape)
+        offset += int(np.prod(shape)) * dtype.itemsize
+    return layout, offset
+
+def _view(buffer, array):
+    return np.ndarray(array.shape, array.dtype, buffer=buffer, offset=array.offset)
+
+class SharedDataset:
+    ''' Dataset whose arrays live in one shared memory block owned by this process.
+
+    Arguments:
+        variables     List of variable names
+        zones         List of native.Zone
+        values        {(izone, ivar): (dtype, shape)} of the arrays to share
+        connectivity  {izone: shape} of the FE connectivity arrays to share
+
+    Use as a context manager, or call close(), to release the block. Arrays
+    are uninitialized until publish()ed, or written through values(), e.g.
+    by workers for output arrays.
+    '''
+    def __init__(self, variables, zones, values, connectivity=None):
+        self.variables = list(variables)
+        self.zones = list(zones)
+        self._values, end = _layout(values)
+        self._connectivity, end = _layout(
+            {iz: (np.int32, shape) for iz, shape in (connectivity or {}).items()}, end,
+        )
+        self._blocks = []
+        self._finalizer = weakref.finalize(self, _release, self._blocks)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(end, 1))
+        self._blocks.append(self._shm)
+
+    @classmethod
+    def from_file(cls, filename, zones=None, variables=None):
+        ''' Load (a subset of) a datafile with the native readers and publish it '''
+        with native.open_dataset(filename) as reader:
+            zones = range(len(reader.zones)) if zones is None else zones
+            variables = range(len(reader.variables)) if variables is None else variables
+            shared = cls(
+                reader.variables, reader.zones,
+                {
+                    (iz, iv): (reader.dtype(iz, iv), native.value_count(reader.zones[iz], iv))
+                    for iz in zones for iv in variables
+                },
+                {
+                    iz: native.connectivity_shape(reader.zones[iz])
+                    for iz in zones if reader.zones[iz].zone_type != 'Ordered'
+                },
+            )
+            try:
+                for izone in zones:
+                    for ivar in variables:
+                        shared.publish(izone, ivar, reader.values(izone, ivar))
+                    if reader.zones[izone].zone_type != 'Ordered':
+                        shared.publish_connectivity(izone, reader.connectivity(izone))
+            except:
+                shared.close()
+                raise
+        return shared
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        ''' Release the shared memory block '''
+        self._finalizer()
+
+    def publish(self, izone, ivar, values):
+        ''' Copy a zone-variable array into shared memory '''
+        array = self.values(izone, ivar)
+        array[...] = np.asarray(values).reshape(array.shape)
+        return array
+
+    def publish_connectivity(self, izone, connectivity):
+        ''' Copy an FE zone connectivity array into shared memory '''
+        array = self.connectivity(izone)
+        array[...] = np.asarray(connectivity).reshape(array.shape)
+        return array
+
+    def values(self, izone, ivar):
+        return _view(self._shm.buf, self._values[izone, ivar])
+
+    def connectivity(self, izone):
+        return _view(self._shm.buf, self._connectivity[izone])
+
+    @property
+    def descriptor(self):
+        ''' Picklable description of the shared arrays '''
+        return Descriptor(self._shm.name, self.variables, self.zones, self._values, self._connectivity)
+
+
+class AttachedDataset:
+    ''' Worker-side, zero-copy view of a SharedDataset.
+
+    Provides the same values()/connectivity() interface as the native
+    readers. Arrays are only valid until close() is called.
+    '''
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+        self.variables = descriptor.variables
+        self.zones = descriptor.zones
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                pass # Arrays still in use; mapping is released when they are freed
+            self._shm = None
+
+    def _array(self, array):
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.descriptor.name)
+        return _view(self._shm.buf, array)
+
+    def values(self, izone, ivar):
+        return self._array(self.descriptor.values[izone, ivar])
+
+    def connectivity(self, izone):
+        return self._array(self.descriptor.connectivity[izone])
+
+def attach(descriptor):
+    ''' Attach to the arrays of a SharedDataset from a worker process '''
+    return AttachedDataset(descriptor)
+
+
+#-----------------------------------------------------------------------
+# Worker Functions
+#-----------------------------------------------------------------------
+def open_source(source):
+    ''' attach() to a Descriptor, or open a datafile with the native readers '''
+    return native.open_dataset(source) if isinstance(source, str) else attach(source)
+
+def difference_zones(source_new, source_old, descriptor_out, zone_pairs, var_pairs):
+    ''' Compute new-old for pairs of zones into preallocated output arrays.
+
+    Arguments:
+        source_new   Descriptor, or path of a datafile read natively
+        source_old   Descriptor, or path of a datafile read natively
+        zone_pairs   List of (izone_new, izone_old[, izone_out]); izone_out
+                     defaults to izone_new
+        var_pairs    List of (ivar_new, ivar_old, ivar_out)
+
+    The output array for (izone_out, ivar_out) must exist in descriptor_out.
+    Ordered cell-centered deltas are padded to the size of the output array,
+    as PyTecplot stores them. Pairs that cannot be differenced (e.g.
+    mismatched sizes) are filled with NaN and returned as a list of
+    (izone_new, izone_old, ivar_out, message).
+    '''
+    failures = []
+    with open_source(source_new) as new, open_source(source_old) as old, attach(descriptor_out) as out:
+        for znew, zold, *zout in zone_pairs:
+            zout = zout[0] if zout else znew
+            for vnew, vold, vout in var_pairs:
+                result = out.values(zout, vout)
+                try:
+                    delta = np.subtract(new.values(znew, vnew), old.values(zold, vold))
+                    zone = new.zones[znew]
+                    if delta.size < result.size and zone.zone_type == 'Ordered' and \
+                       zone.locations and zone.locations[vnew]:
+                        delta = native.pad_cell_values(zone, delta)
+                    if delta.shape != result.shape:
+                        raise ValueError(f"delta has shape {delta.shape}, expected {result.shape}")
+                    result[:] = delta
+                except Exception as e:
+                    result[:] = np.nan
+                    failures.append((znew, zold, vout, str(e)))
+    return failures
+
+def derive_zones(source_in, descriptor_out, zone_pairs, inputs, plans, coordinates=()):
+    ''' Evaluate expr.Plans over zones into preallocated output arrays.
+
+    Arguments:
+        source_in    Descriptor, or path of a datafile read natively
+        zone_pairs   List of (izone_in, izone_out)
+        inputs       Indices of the variables of source_in the plans read
+
+    The result of the k-th plan in zone izone_in is written into the array
+    for (izone_out, k) of descriptor_out, which the parent must have
+    allocated. Ordered cell-centered inputs are padded to the nodal
+    dimensions, as PyTecplot stores them.
+    '''
+    with open_source(source_in) as ds, attach(descriptor_out) as out:
+        for zin, zout in zone_pairs:
+            zone = ds.zones[zin]
+            values = {}
+            for ivar in inputs:
+                data = ds.values(zin, ivar)
+                if zone.zone_type == 'Ordered' and data.size < native.num_points(zone):
+                    data = native.pad_cell_values(zone, data)
+                values[ds.variables[ivar]] = data
+            outputs = [out.values(zout, k) for k in range(len(plans))]
+            expr.evaluate_zone(plans, zone, values, outputs, coordinates)
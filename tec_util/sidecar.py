@@ -0,0 +1,132 @@
+''' Sidecar index of per-zone, per-variable statistics.
+
+compute_statistics(..., sidecar=True) saves the statistics it computes in a
+JSON file next to the datafile (<datafile>.stats.json). Each entry holds
+the min, max, mean, standard deviation and count of the values of a
+zone-variable, plus a BLAKE2b hash of its buffer:
+
+    {"version": 1, "size": ..., "mtime_ns": ...,
+     "zones": {"0": {"name": "wing", "variables": {"p": {"min": ..., "hash": ...}}}}}
+
+If the size and modification time of the datafile match the sidecar, its
+entries are used without reading any field data. Otherwise each requested
+zone-variable is hashed and only those whose hash changed are recomputed.
+Zone-variables are read with the native readers, one chunk at a time.
+'''
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+from . import instrument
+from . import native
+from .core import NameIndex, ZoneStats, atomic_output
+from .series import RunningStats
+
+LOG = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def sidecar_path(datafile):
+    ''' Path of the sidecar of a datafile '''
+    return datafile + '.stats.json'
+
+def load_sidecar(datafile):
+    ''' Contents of the sidecar of a datafile, or None if missing or unreadable '''
+    try:
+        with open(sidecar_path(datafile)) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        LOG.warning("Ignoring unreadable sidecar %s: %s", sidecar_path(datafile), e)
+        return None
+    return index if index.get('version') == VERSION else None
+
+def save_sidecar(datafile, index):
+    with atomic_output(sidecar_path(datafile)) as temp, open(temp, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+
+def buffer_hash(values):
+    ''' BLAKE2b digest of the values of a zone-variable (incl. their data type) '''
+    digest = hashlib.blake2b(values.dtype.str.encode(), digest_size=16)
+    for chunk in native.iter_chunks(native.chunked(values)):
+        digest.update(np.ascontiguousarray(chunk).data)
+    return digest.hexdigest()
+
+def reduce_values(values):
+    ''' Sidecar entry (statistics and hash) of the values of a zone-variable '''
+    stats = RunningStats((1,))
+    digest = hashlib.blake2b(values.dtype.str.encode(), digest_size=16)
+    for chunk in native.iter_chunks(native.chunked(values)):
+        digest.update(np.ascontiguousarray(chunk).data)
+        stats.add(0, chunk)
+    stats.finalize()
+    return {
+        'min': float(stats.min[0]),
+        'max': float(stats.max[0]),
+        'mean': float(stats.mean[0]),
+        'std': float(np.sqrt(stats.variance[0])),
+        'count': int(stats.count[0]),
+        'hash': digest.hexdigest(),
+    }
+
+@instrument.traced
+def cached_statistics(datafile_in, variable_patterns=None, zone_patterns=None):
+    ''' Same as core.compute_statistics, answered from (and updating) the sidecar
+
+    Raises native.UnsupportedFormat if the datafile can't be read natively.
+    '''
+    stat = os.stat(datafile_in)
+    index = load_sidecar(datafile_in)
+    unchanged = index is not None and (index['size'], index['mtime_ns']) == (stat.st_size, stat.st_mtime_ns)
+    if index is None:
+        index = {'version': VERSION, 'zones': {}}
+    updated = not unchanged
+
+    with native.open_dataset(datafile_in) as reader:
+        variables = NameIndex(reader.variables).select(variable_patterns)
+        zones = NameIndex(z.name for z in reader.zones).select(zone_patterns)
+        assert variables, f"No variables in dataset matching {' '.join(variable_patterns)}"
+        assert zones, f"No zones in dataset matching {' '.join(zone_patterns)}"
+
+        reused, computed = 0, 0
+        with instrument.span('compute') as s:
+            for iz in zones:
+                name = reader.zones[iz].name
+                zone_index = index['zones'].get(str(iz))
+                if zone_index is None or zone_index['name'] != name:
+                    zone_index = index['zones'][str(iz)] = {'name': name, 'variables': {}}
+                for iv in variables:
+                    entry = zone_index['variables'].get(reader.variables[iv])
+                    if entry is not None and unchanged:
+                        reused += 1
+                        continue
+                    values = reader.values(iz, iv)
+                    if entry is not None and buffer_hash(values) == entry['hash']:
+                        reused += 1
+                        continue
+                    zone_index['variables'][reader.variables[iv]] = reduce_values(values)
+                    computed += 1
+                    updated = True
+                    if s:
+                        s.add(points=values.size)
+        LOG.info("Statistics of %d zone-variables from sidecar, %d computed", reused, computed)
+
+        result = {}
+        for iv in variables:
+            var = reader.variables[iv]
+            result[var] = []
+            for iz in zones:
+                entry = index['zones'][str(iz)]['variables'][var]
+                result[var].append(ZoneStats(
+                    reader.zones[iz].name, entry['max'], entry['min'], entry['mean'], entry['std'], entry['count'],
+                ))
+
+    if updated:
+        # Zones that no longer exist are dropped
+        index['zones'] = {k: v for k, v in index['zones'].items() if int(k) < len(reader.zones)}
+        index.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        save_sidecar(datafile_in, index)
+    return result
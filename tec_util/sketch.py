@@ -0,0 +1,245 @@
+''' Bounded-memory quantile and histogram sketches.
+
+QuantileSketch is a KLL-style sketch: values are kept in a hierarchy of
+compactors, where level h holds items of weight 2**h. When a level
+overflows it is sorted and every other item (starting at a random offset)
+is promoted to the next level, so memory grows only with the logarithm of
+the number of values, while the rank error stays around 1/k. Histogram
+counts values in fixed-range bins with np.bincount.
+
+Both are mergeable (merge() combines the sketches of different zones,
+files or worker processes, which can pickle them) and accept values in
+chunks, so that datasets of any size can be summarized in one pass.
+'''
+import concurrent.futures
+import logging
+import math
+import numpy as np
+from . import instrument
+from . import native
+from .core import NameIndex
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_K = 512
+
+
+class QuantileSketch:
+    ''' Streaming approximate quantiles with memory O(k log(n/k)) '''
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._rng = np.random.default_rng(seed)
+
+    def capacity(self, level):
+        ''' Number of items level may hold; lower levels hold fewer '''
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2.0/3.0) ** depth)), 2)
+
+    def add(self, values):
+        ''' Add an array of values; NaN values are ignored '''
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        ''' Add all values summarized by another sketch '''
+        if other.count == 0:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.capacity(h):
+                grown = h + 1 == len(self.levels)
+                if grown:
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                odd = len(items) % 2
+                promoted = items[self._rng.integers(2):len(items) - odd:2]
+                self.levels[h] = items[len(items) - odd:]
+                self.levels[h+1] = np.concatenate([self.levels[h+1], promoted])
+                if grown:
+                    h = 0 # A new level lowers the capacity of the levels below
+                    continue
+            h += 1
+
+    @property
+    def size(self):
+        ''' Number of items held by the sketch '''
+        return sum(len(items) for items in self.levels)
+
+    def quantiles(self, qs):
+        ''' Approximate values at the given fractions (0 to 1) of the data '''
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0**h) for h, v in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        index = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        result = items[np.minimum(index, len(items) - 1)]
+        result = np.where(qs <= 0.0, self.min, np.where(qs >= 1.0, self.max, result))
+        return np.clip(result, self.min, self.max)
+
+
+class Histogram:
+    ''' Counts of values in equal-width bins spanning [lo, hi]
+
+    Values outside the range are counted in underflow and overflow.
+    '''
+    def __init__(self, lo, hi, bins):
+        if not hi > lo:
+            lo, hi = lo - 0.5, hi + 0.5
+        self.edges = np.linspace(lo, hi, bins + 1)
+        self.counts = np.zeros(bins, np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, values):
+        ''' Add an array of values; NaN values are ignored, infinite ones are out of range '''
+        values = np.asarray(values, dtype=np.float64).ravel()
+        lo, hi, bins = self.edges[0], self.edges[-1], len(self.counts)
+        self.underflow += int(np.count_nonzero(values < lo))
+        self.overflow += int(np.count_nonzero(values > hi))
+        # Only values in range are binned, so the cast cannot overflow
+        values = values[(values >= lo) & (values <= hi)]
+        index = np.floor((values - lo) * (bins / (hi - lo))).astype(np.int64)
+        self.counts += np.bincount(np.minimum(index, bins - 1), minlength=bins)
+
+    def merge(self, other):
+        ''' Add the counts of a histogram with the same bins '''
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+
+class VariableSketch:
+    ''' Quantile sketch and (optional) histogram of the values of a variable '''
+    def __init__(self, value_range=None, bins=0, k=DEFAULT_K):
+        self.quantiles = QuantileSketch(k)
+        self.histogram = Histogram(value_range[0], value_range[1], bins) if bins else None
+
+    def add(self, values):
+        self.quantiles.add(values)
+        if self.histogram:
+            self.histogram.add(values)
+
+    def merge(self, other):
+        self.quantiles.merge(other.quantiles)
+        if self.histogram:
+            self.histogram.merge(other.histogram)
+
+    @property
+    def count(self):
+        return self.quantiles.count
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+def select(reader, variables, zone_patterns):
+    ''' (zone indices, {name: var index}) of a datafile for the given names/patterns '''
+    zones = NameIndex(z.name for z in reader.zones).select(zone_patterns)
+    indices = {name: i for i, name in reversed(list(enumerate(reader.variables)))}
+    missing = [name for name in variables if name not in indices]
+    if missing:
+        LOG.warning("Variables %s missing in %s", ' '.join(missing), reader.filename)
+    return zones, {name: indices[name] for name in variables if name in indices}
+
+def value_ranges(datafiles, variables, zone_patterns):
+    ''' {name: (min, max)} of variables over the selected zones of datafiles, from headers where possible '''
+    ranges = {name: (math.inf, -math.inf) for name in variables}
+    for datafile in datafiles:
+        with native.open_dataset(datafile) as reader:
+            zones, indices = select(reader, variables, zone_patterns)
+            for name, iv in indices.items():
+                for iz in zones:
+                    vmin, vmax = reader.value_range(iz, iv)
+                    ranges[name] = (min(ranges[name][0], vmin), max(ranges[name][1], vmax))
+    return {name: r if r[0] <= r[1] else (0.0, 1.0) for name, r in ranges.items()}
+
+def sketch_datafile(datafile, variables, zone_patterns=None, ranges=None, bins=0, k=DEFAULT_K):
+    ''' {name: VariableSketch} of variables over the selected zones of a datafile '''
+    sketches = {name: VariableSketch(ranges and ranges[name], bins, k) for name in variables}
+    with native.open_dataset(datafile) as reader, instrument.span('sketch', file=datafile) as s:
+        zones, indices = select(reader, variables, zone_patterns)
+        for name, iv in indices.items():
+            for iz in zones:
+                for chunk in native.iter_chunks(native.chunked(reader.values(iz, iv))):
+                    sketches[name].add(chunk)
+                    if s:
+                        s.add(points=chunk.size)
+    return sketches
+
+@instrument.traced
+def compute_distributions(datafiles, variable_patterns=None, zone_patterns=None, bins=0, value_range=None,
+                          jobs=1, k=DEFAULT_K):
+    ''' Sketch the distribution of each variable over zones and datafiles
+
+    Arguments:
+        datafiles          [list(str)] Datafiles to be analyzed
+        variable_patterns  [list(str)] Names of variables to be analyzed
+        zone_patterns      [list(str)] Names of zones to be analyzed
+        bins               [int] Number of histogram bins (def: 0, no histogram)
+        value_range        [(float, float)] Range of the histogram bins; by
+                           default the range of each variable, which is read
+                           from the PLT headers (or computed for ASCII files)
+        jobs               [int] Number of worker processes, each of which
+                           sketches whole datafiles
+        k                  [int] Accuracy parameter of the quantile sketches;
+                           the rank error is about 1/k
+
+    Returns:
+        {var_name: VariableSketch}, e.g.
+        result['p'].quantiles.quantiles([0.01, 0.5, 0.99])
+        result['p'].histogram.counts
+
+    Variables are selected in the first datafile and matched by name.
+    '''
+    with native.open_dataset(datafiles[0]) as reader:
+        variables = [reader.variables[i] for i in NameIndex(reader.variables).select(variable_patterns)]
+    assert variables, f"No variables in dataset matching {' '.join(variable_patterns)}"
+    ranges = None
+    if bins:
+        ranges = {name: value_range for name in variables} if value_range else \
+                 value_ranges(datafiles, variables, zone_patterns)
+
+    result = {name: VariableSketch(ranges and ranges[name], bins, k) for name in variables}
+    with instrument.span('compute', jobs=jobs):
+        if jobs > 1 and len(datafiles) > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+                futures = [
+                    pool.submit(sketch_datafile, f, variables, zone_patterns, ranges, bins, k)
+                    for f in datafiles
+                ]
+                partials = (future.result() for future in futures)
+                for sketches in partials:
+                    for name, sketch in sketches.items():
+                        result[name].merge(sketch)
+        else:
+            for datafile in datafiles:
+                for name, sketch in sketch_datafile(datafile, variables, zone_patterns, ranges, bins, k).items():
+                    result[name].merge(sketch)
+    return result
@@ -0,0 +1,413 @@
+''' Incremental post-processing of the datafiles a running solver writes.
+
+watch_directory waits for new datafiles in a directory and processes each
+one once, as soon as it is complete. A file is complete when its size and
+modification time have not changed for `settle` seconds; the directory is
+polled, or watched with inotify when the inotify_simple package is
+installed, which wakes the watcher as soon as a file is written or moved
+in rather than at the next poll.
+
+Each file is processed in this process, so Tecplot is started, and a
+layout loaded, only once for the whole run. Results are added to the
+aggregated outputs rather than regenerated from the whole directory:
+
+    stats    rows of time,zone,variable,min,max,mean appended to stats.csv
+             (the format of stats --series), streamed with the native readers
+    slice    slice zones appended to slices.dat, with the solution time of
+             their datafile and one strand per slice
+    export   the pages of a layout, with the new datafile replacing the data
+             of its frames, exported to <file>_<page>.png
+
+Processed files are recorded in watch.journal (JSON lines) in the output
+directory, with the sizes of the outputs once their results are appended, so
+a watcher that is restarted does not process them again. Outputs are
+truncated back to the sizes of the last entry on restart, and after a file
+fails, so that a file interrupted or failed part way is not appended twice;
+failed files are retried by a restarted watcher.
+'''
+import collections
+import glob
+import json
+import logging
+import os
+import stat
+import tempfile
+import time
+from . import instrument
+from . import native
+from . import series
+from .core import export_pages, load_tecplot, slice_surfaces
+from .prefetch import MAX_BYTES, Prefetcher
+
+LOG = logging.getLogger(__name__)
+
+ACTIONS = ('stats', 'slice', 'export')
+JOURNAL_FILE = 'watch.journal'
+STATS_FILE = 'stats.csv'
+SLICES_FILE = 'slices.dat'
+
+WatchReport = collections.namedtuple('WatchReport', ['processed', 'failed'])
+
+
+#-----------------------------------------------------------------------
+# Detection of complete files
+#-----------------------------------------------------------------------
+class Poller:
+    ''' Report new files matching a pattern once their size stops changing '''
+    def __init__(self, directory, pattern='*.plt', settle=2.0, exclude=()):
+        self.directory = directory
+        self.pattern = pattern
+        self.settle = settle
+        self.exclude = {os.path.abspath(f) for f in exclude}
+        self.seen = set()   # Files already reported
+        self.pending = {}   # {filename: ((size, mtime), time of the last change)}
+
+    def ignore(self, filename):
+        ''' Never report filename, e.g. because it was processed before '''
+        self.seen.add(os.path.abspath(filename))
+
+    def scan(self):
+        ''' New files unchanged for settle seconds, oldest first '''
+        now = time.monotonic()
+        complete = []
+        for filename in glob.glob(os.path.join(self.directory, self.pattern)):
+            path = os.path.abspath(filename)
+            if path in self.seen or path in self.exclude:
+                continue
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue # Removed since
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            state = (st.st_size, st.st_mtime_ns)
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != state:
+                self.pending[path] = (state, now)
+            elif st.st_size and now - previous[1] >= self.settle:
+                complete.append((st.st_mtime_ns, filename))
+        complete.sort()
+        for _, filename in complete:
+            path = os.path.abspath(filename)
+            del self.pending[path]
+            self.seen.add(path)
+        return [filename for _, filename in complete]
+
+    def next_scan(self, interval):
+        ''' Seconds until the next scan: at most interval, less if a pending file may settle '''
+        now = time.monotonic()
+        delays = [changed + self.settle - now for _, changed in self.pending.values()]
+        return max(min([interval] + delays), 0.05)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+
+    def close(self):
+        pass
+
+class InotifyPoller(Poller):
+    ''' Poller that also wakes up on inotify events (Linux, inotify_simple package) '''
+    def __init__(self, directory, *args, **kwargs):
+        from inotify_simple import INotify, flags
+        super().__init__(directory, *args, **kwargs)
+        self.inotify = INotify()
+        self.inotify.add_watch(directory, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO)
+
+    def wait(self, timeout):
+        self.inotify.read(timeout=int(timeout * 1000), read_delay=100)
+
+    def close(self):
+        self.inotify.close()
+
+def open_poller(directory, pattern='*.plt', settle=2.0, exclude=(), inotify=None):
+    ''' InotifyPoller if available (or inotify is True), else Poller '''
+    if inotify is not False:
+        try:
+            return InotifyPoller(directory, pattern, settle, exclude)
+        except (ImportError, OSError) as e:
+            if inotify:
+                raise
+            LOG.info("Polling %s every few seconds; inotify not available (%s)", directory, e)
+    return Poller(directory, pattern, settle, exclude)
+
+
+#-----------------------------------------------------------------------
+# Journal
+#-----------------------------------------------------------------------
+def read_journal(filename):
+    ''' List of the entries of a watch journal; a truncated last line is ignored '''
+    entries = []
+    if not os.path.exists(filename):
+        return entries
+    with open(filename) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                LOG.warning("Ignore truncated entry in %s", filename)
+    return entries
+
+def record(filename, entry):
+    with open(filename, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def repair_journal(filename):
+    ''' Drop a last line truncated by a crash, so that new entries start on their own line '''
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+#-----------------------------------------------------------------------
+# Actions
+#-----------------------------------------------------------------------
+def file_time(datafile, index):
+    ''' Solution time of a datafile (of its first zone), or index if all zones have time zero '''
+    header = native.read_header(datafile)
+    if any(z.solution_time for z in header.zones):
+        return header.zones[0].solution_time
+    return float(index)
+
+def append_zones(datafile_in, datafile_out, time, existing=None):
+    ''' Append the zones of datafile_in to an ASCII datafile, at solution time
+
+    The i-th zone is given strand i+1, so that zones of the same slice form a
+    strand across the files appended. The variables must be those of
+    datafile_out (existing, or read from its header if None). Returns the
+    list of variables.
+    '''
+    with native.open_dataset(datafile_in) as reader:
+        variables = reader.variables
+        if existing is None and os.path.exists(datafile_out):
+            existing = native.read_header(datafile_out).variables
+        if existing is not None:
+            if existing != variables:
+                message = f"Variables of {datafile_in} ({', '.join(variables)}) differ from those of {datafile_out}"
+                LOG.error(message)
+                raise ValueError(message)
+        zones = [z._replace(strand=i+1, solution_time=time) for i, z in enumerate(reader.zones)]
+        with native.open_writer(datafile_out, variables, zones, ascii=True, append=True) as writer:
+            for iz, zone in enumerate(zones):
+                values = [
+                    native.PASSIVE if reader.layouts[iz].passive[iv] else native.chunked(reader.values(iz, iv))
+                    for iv in range(len(variables))
+                ]
+                connectivity = None if zone.zone_type == 'Ordered' else reader.connectivity(iz)
+                writer.write_zone_chunked(values, connectivity)
+    LOG.info("Appended %d zones at time %s to %s", len(zones), time, datafile_out)
+    return variables
+
+class Processor:
+    ''' Apply the actions to each new datafile, adding to the aggregated outputs '''
+    def __init__(self, actions, output_dir, slice_file=None, layout_file=None,
+                 variable_patterns=None, zone_patterns=None):
+        self.actions = actions
+        self.output_dir = output_dir
+        self.slice_file = slice_file
+        self.layout_file = layout_file
+        self.variable_patterns = variable_patterns
+        self.zone_patterns = zone_patterns
+        self.selection = None # (keys, zones, variables) of the statistics
+        self.stats_writer = None
+        self.slice_variables = None # Variables of the slices file
+        self.layout_loaded = False
+
+    def process(self, datafile, index):
+        ''' Process a datafile, the index-th of the series '''
+        time = file_time(datafile, index)
+        if 'stats' in self.actions:
+            self.append_statistics(datafile, index)
+        if 'slice' in self.actions:
+            self.append_slices(datafile, time)
+        if 'export' in self.actions:
+            self.export(datafile)
+
+    def append_statistics(self, datafile, index):
+        steps = list(series.iter_timesteps([datafile]))
+        if len(steps) == 1 and not steps[0].time:
+            steps = [steps[0]._replace(time=float(index))]
+        with native.open_dataset(datafile) as reader:
+            for step in steps:
+                if self.selection is None:
+                    self.selection = series.select_series(reader, step, self.variable_patterns, self.zone_patterns)
+                    _, zones, variables = self.selection
+                    self.stats_writer = series.CsvSeriesWriter(
+                        os.path.join(self.output_dir, STATS_FILE), zones, variables, append=True,
+                    )
+                stats = series.step_statistics(reader, step, *self.selection)
+                self.stats_writer.write_step(step.time, stats)
+        self.stats_writer.file.flush()
+
+    def append_slices(self, datafile, time):
+        with tempfile.TemporaryDirectory(dir=self.output_dir) as temp:
+            slices = os.path.join(temp, 'slices.plt')
+            slice_surfaces(self.slice_file, datafile, slices)
+            self.slice_variables = append_zones(
+                slices, os.path.join(self.output_dir, SLICES_FILE), time, self.slice_variables,
+            )
+
+    def export(self, datafile):
+        import tecplot as tp
+        import tecplot.constant as tpc
+        if not self.layout_loaded:
+            LOG.info("Load layout %s", self.layout_file)
+            tp.load_layout(self.layout_file)
+            self.layout_loaded = True
+        for page in tp.pages():
+            for frame in page.frames():
+                if frame.has_dataset:
+                    load_tecplot(
+                        datafile,
+                        frame = frame,
+                        read_data_option = tpc.ReadDataOption.Replace,
+                        reset_style = False,
+                    )
+        prefix = os.path.splitext(os.path.basename(datafile))[0] + '_'
+        export_pages(self.output_dir, prefix)
+
+    def sizes(self):
+        ''' Sizes of the aggregated outputs, synced to disk, to record in the journal '''
+        if self.stats_writer:
+            self.stats_writer.file.flush()
+        sizes = {}
+        for name in (STATS_FILE, SLICES_FILE):
+            path = os.path.join(self.output_dir, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    os.fsync(f.fileno())
+                sizes[name] = os.path.getsize(path)
+            else:
+                sizes[name] = 0
+        return sizes
+
+    def truncate(self, sizes):
+        ''' Discard what was appended to the outputs past sizes (removed if 0) '''
+        self.close()
+        self.stats_writer = None
+        self.selection = None
+        self.slice_variables = None
+        for name in (STATS_FILE, SLICES_FILE):
+            path = os.path.join(self.output_dir, name)
+            if not os.path.exists(path):
+                continue
+            size = sizes.get(name, 0)
+            if not size:
+                os.remove(path)
+            elif os.path.getsize(path) > size:
+                LOG.info("Truncate %s to %d bytes", path, size)
+                os.truncate(path, size)
+
+    def close(self):
+        if self.stats_writer:
+            self.stats_writer.file.close()
+
+
+#-----------------------------------------------------------------------
+# API Functions
+#-----------------------------------------------------------------------
+def watch_directory(directory, actions=('stats',), output_dir=None, pattern='*.plt', slice_file=None,
+                    layout_file=None, variable_patterns=None, zone_patterns=None, settle=2.0,
+                    interval=1.0, inotify=None, idle_timeout=None, max_files=None,
+                    prefetch=0, prefetch_bytes=MAX_BYTES):
+    ''' Process each new datafile of a directory once it is complete
+
+    Arguments:
+        directory          Directory the solver writes datafiles to
+        actions            Names among ACTIONS: stats, slice and export
+        output_dir         Directory of the outputs and journal (def: directory/watch)
+        pattern            Glob pattern of the datafiles (def: *.plt)
+        slice_file         Slice definitions (see slice_surfaces), for slice
+        layout_file        Layout whose pages are exported, for export
+        variable_patterns  Variables whose statistics are computed
+        zone_patterns      Zones whose statistics are computed
+        settle             Seconds a file must stay unchanged to be complete
+        interval           Seconds between two scans of the directory
+        inotify            Use inotify (True), polling (False) or inotify if
+                           available (None)
+        idle_timeout       Stop after this many seconds without new files
+                           (def: run until interrupted)
+        max_files          Stop after processing this many files
+        prefetch           Number of complete files warmed in the background
+                           while one is processed (def: 0)
+        prefetch_bytes     Cap on the bytes warmed ahead
+
+    Returns:
+        WatchReport with the lists of the files processed and failed
+    '''
+    unknown = [action for action in actions if action not in ACTIONS]
+    if unknown:
+        message = f"Unknown actions {', '.join(unknown)}; expected {', '.join(ACTIONS)}"
+        LOG.error(message)
+        raise ValueError(message)
+    if 'slice' in actions and not slice_file:
+        message = "The slice action requires a slice definition file"
+        LOG.error(message)
+        raise ValueError(message)
+    if 'export' in actions and not layout_file:
+        message = "The export action requires a layout file"
+        LOG.error(message)
+        raise ValueError(message)
+    output_dir = output_dir or os.path.join(directory, 'watch')
+    os.makedirs(output_dir, exist_ok=True)
+    journal = os.path.join(output_dir, JOURNAL_FILE)
+    outputs = [journal, os.path.join(output_dir, STATS_FILE), os.path.join(output_dir, SLICES_FILE)]
+
+    repair_journal(journal)
+    entries = read_journal(journal)
+    done = [entry for entry in entries if entry['status'] == 'done']
+    poller = open_poller(directory, pattern, settle, exclude=outputs, inotify=inotify)
+    for entry in done:
+        poller.ignore(os.path.join(directory, entry['file']))
+    if entries:
+        LOG.info("Skip %d files processed before, according to %s", len(done), journal)
+    processor = Processor(actions, output_dir, slice_file, layout_file, variable_patterns, zone_patterns)
+    # Discard what a file interrupted before its entry was recorded appended
+    processor.truncate(entries[-1]['sizes'] if entries else {})
+    sizes = processor.sizes()
+    report = WatchReport([], [])
+    index = len(done)
+    count = 0 # Files processed by this watcher
+    last_file = time.monotonic()
+    LOG.info("Watch %s for %s (%s)", directory, pattern, ', '.join(actions))
+    try:
+        while max_files is None or count < max_files:
+            datafiles = poller.scan()
+            for datafile in Prefetcher(datafiles, prefetch, prefetch_bytes):
+                LOG.info("Process %s", datafile)
+                start = time.perf_counter()
+                entry = {'file': os.path.basename(datafile), 'status': 'done'}
+                try:
+                    with instrument.span('process', file=datafile):
+                        processor.process(datafile, index)
+                    report.processed.append(datafile)
+                    index += 1
+                except Exception as e:
+                    LOG.error("Failed to process %s: %s", datafile, e)
+                    entry.update(status='failed', error=str(e))
+                    report.failed.append(datafile)
+                    processor.truncate(sizes)
+                sizes = processor.sizes()
+                entry.update(elapsed=round(time.perf_counter() - start, 3), sizes=sizes)
+                record(journal, entry)
+                count += 1
+                last_file = time.monotonic()
+                if max_files is not None and count >= max_files:
+                    break
+            if datafiles:
+                continue
+            if idle_timeout is not None and not poller.pending and time.monotonic() - last_file >= idle_timeout:
+                LOG.info("No new files for %.1f s; stop watching", idle_timeout)
+                break
+            poller.wait(poller.next_scan(interval))
+    except KeyboardInterrupt:
+        LOG.info("Interrupted; stop watching")
+    finally:
+        processor.close()
+        poller.close()
+    LOG.info("Processed %d files, %d failed", len(report.processed), len(report.failed))
+    return report
@@ -0,0 +1,73 @@
+import json
+import os
+import test
+import unittest
+from tec_util import batch
+from tec_util import core
+
+def write_manifest(filename, jobs):
+    with open(filename, 'w') as f:
+        json.dump({'defaults': {'nskip': 3, 'output': None}, 'jobs': jobs}, f)
+
+class TestBatch(unittest.TestCase):
+    ''' Unit tests for resumable batch processing '''
+
+    def test_resume(self):
+        with test.temp_workspace():
+            test.write_synthetic_dataset('a.plt', num_zones=1, shape=(4,4,2))
+            test.write_synthetic_dataset('b.plt', num_zones=1, shape=(4,4,2))
+            write_manifest('jobs.json', [
+                {'id': 'diff', 'function': 'difference_datafiles',
+                 'args': {'datafile_new': 'a.plt', 'datafile_old': 'b.plt', 'datafile_out': 'diff.plt'}},
+                {'id': 'stats', 'function': 'compute_series_statistics',
+                 'args': {'datafiles': ['[ab].plt'], 'output': 'stats.csv'}},
+            ])
+            jobs = batch.load_manifest('jobs.json')
+            self.assertEqual(jobs[0].inputs, ['a.plt', 'b.plt'])
+            self.assertEqual(jobs[0].outputs, ['diff.plt'])
+            self.assertEqual(jobs[1].inputs, ['[ab].plt'])
+            self.assertNotIn('nskip', jobs[1].args)
+            self.assertEqual(jobs[1].args['output'], 'stats.csv')
+
+            report = batch.run_manifest('jobs.json', prefetch=1)
+            self.assertEqual(report.done, ['diff', 'stats'])
+            report = batch.run_manifest('jobs.json')
+            self.assertEqual(report.skipped, ['diff', 'stats'])
+
+            # Jobs are rerun if an output is missing or an input changed
+            os.remove('diff.plt')
+            self.assertEqual(batch.run_manifest('jobs.json').done, ['diff'])
+            os.utime('a.plt', ns=(0, 0)) # Same contents
+            self.assertEqual(batch.run_manifest('jobs.json').done, [])
+            test.write_synthetic_dataset('b.plt', num_zones=1, shape=(4,4,3))
+            self.assertEqual(batch.run_manifest('jobs.json').done, ['diff', 'stats'])
+
+    def test_failure(self):
+        with test.temp_workspace():
+            write_manifest('jobs.json', [
+                {'id': 'missing', 'function': 'extract',
+                 'args': {'datafile_in': 'missing.plt', 'datafile_out': 'out.plt'}},
+            ])
+            with open('jobs.json.journal', 'w') as f:
+                f.write('{"id": "trunc')  # Killed while writing
+            report = batch.run_manifest('jobs.json')
+            self.assertEqual(report.failed, ['missing'])
+            journal = batch.Journal('jobs.json.journal')
+            self.assertEqual(journal.entries['missing']['status'], 'failed')
+
+    def test_atomic_output(self):
+        with test.temp_workspace():
+            with open('out.plt', 'w') as f:
+                f.write('complete')
+            with self.assertRaises(RuntimeError):
+                with core.atomic_output('out.plt') as temp:
+                    self.assertTrue(temp.endswith('.plt'))
+                    with open(temp, 'w') as f:
+                        f.write('trunc')
+                    raise RuntimeError('killed')
+            self.assertEqual(os.listdir('.'), ['out.plt'])
+            with open('out.plt') as f:
+                self.assertEqual(f.read(), 'complete')
+
+if __name__ == '__main__':
+    unittest.main()
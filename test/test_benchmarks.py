@@ -0,0 +1,64 @@
+import json
+import numpy as np
+import test
+import unittest
+from benchmarks import compare
+from benchmarks import run
+from benchmarks.__main__ import main
+from benchmarks.generate import generate_dataset
+from tec_util import native
+
+class TestGenerate(unittest.TestCase):
+    ''' Unit tests for the synthetic dataset generator '''
+
+    def test_ordered(self):
+        with test.temp_workspace():
+            zones = generate_dataset('data.plt', num_zones=3, num_points=1000, num_vars=2, num_times=2)
+            header = native.read_header('data.plt')
+        self.assertEqual(header.variables, ['x', 'y', 'z', 'q1', 'q2'])
+        self.assertEqual(header.zones, zones)
+        self.assertEqual(zones[0].shape, (10,10,10))
+        self.assertEqual([(z.strand, z.solution_time) for z in zones[2:4]], [(3, 0.0), (1, 1.0)])
+
+    def test_fe(self):
+        with test.temp_workspace():
+            generate_dataset('data.dat', num_zones=1, num_points=16, num_vars=1, fe=True, rank=2)
+            with native.open_dataset('data.dat') as reader:
+                self.assertEqual(reader.zones[0].zone_type, 'FEQuad')
+                self.assertEqual(reader.connectivity(0).shape, (9, 4))
+                np.testing.assert_allclose(reader.values(0, 0).max(), 1.0)
+
+class TestCompare(unittest.TestCase):
+    ''' Unit tests for regression detection '''
+
+    def test_regressions(self):
+        baseline = {'results': {
+            'a': {'wall': 1.0, 'throughput': 100.0, 'peak_rss': 100},
+            'b': {'wall': 1.0, 'throughput': 100.0, 'peak_rss': 100},
+            'c': {'wall': 1.0, 'throughput': 100.0, 'peak_rss': 100},
+        }}
+        current = {'results': {
+            'a': {'wall': 1.05, 'throughput': 95.0, 'peak_rss': 100},
+            'b': {'wall': 1.0, 'throughput': 100.0, 'peak_rss': 150},
+            'c': {'error': 'failed'},
+            'd': {'wall': 9.0, 'throughput': 1.0, 'peak_rss': 100},
+        }}
+        regressions = compare.compare_runs(baseline, current, threshold=0.1)
+        self.assertEqual([r[:2] for r in regressions], [('b', 'peak_rss'), ('c', 'error')])
+
+class TestRun(unittest.TestCase):
+    ''' End to end run of the default benchmark suite '''
+
+    def test_default_suite(self):
+        with test.temp_workspace():
+            main(['run', '--history', 'history.json'])
+            main(['run', 'diff_out_of_core', '--history', 'history.json'])
+            with open('history.json') as f:
+                history = json.load(f)
+            self.assertEqual(len(history), 2)
+            results = history[0]['results']
+            self.assertEqual(list(results), list(run.BENCHMARKS))
+            for name, result in results.items():
+                # Benchmarks may fail without Tecplot, but never on their command line
+                self.assertNotIn('exit status', result.get('error', ''), name)
+            self.assertEqual(list(history[1]['results']), ['diff_out_of_core'])
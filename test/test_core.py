@@ -1,14 +1,41 @@
 import math
+import numpy as np
+import os
 import tecplot as tp
 import tecplot.constant as tpc
 import tec_util
 import tempfile
 import test
+import time
 import unittest
+from tec_util import native
 
 def load_and_replace(dataset_name):
     return tp.data.load_tecplot(dataset_name, read_data_option=tpc.ReadDataOption.Replace)
 
+class TestNameIndex(unittest.TestCase):
+    ''' Unit tests for the NameIndex used by get_zones/get_variables '''
+
+    def test_select(self):
+        ''' Ordering and de-duplication match the pattern-by-pattern scan '''
+        index = tec_util.NameIndex(['wing:1', 'fuse:1', 'wing:2', 'tail', 'wing:1'])
+        self.assertEqual(index.select(None), [0, 1, 2, 3, 4])
+        self.assertEqual(index.select('wing:1'), [0, 4])
+        self.assertEqual(index.select('wing*'), [0, 2, 4])
+        self.assertEqual(index.select(['tail', 'wing*', '*:1']), [3, 4, 2, 1])
+        self.assertEqual(index.select(['nothing*']), [])
+        self.assertEqual(index.matching(['tail', '*:2']), [2, 3])
+
+    def test_cache(self):
+        ''' Name indexes are reused within an API call '''
+        with test.temp_workspace():
+            with tec_util.temp_frame() as frame:
+                ds = tp.data.load_tecplot(test.data_item_path("cube.dat"), frame=frame)
+                index = tec_util.name_index(ds, 'zones')
+                self.assertIs(tec_util.name_index(ds, 'zones'), index)
+                zones = tec_util.get_zones(ds, ['*:[246]', '*:1'])
+                self.assertEqual([z.index for z in zones], [1, 3, 5, 0])
+
 class TestDifferenceDatasets(unittest.TestCase):
     ''' Unit tests for the difference_datasets function '''
 
@@ -81,6 +108,110 @@ class TestDifferenceDatasets(unittest.TestCase):
             self.assertTrue(ds.zone(1).name.endswith(":4"))
             self.assertTrue(ds.zone(2).name.endswith(":6"))
 
+    def test_jobs(self):
+        ''' Parallel deltas should be identical to the serial ones '''
+        with test.temp_workspace():
+            for jobs in [1, 3]:
+                tec_util.difference_datasets(
+                    test.data_item_path("cube.dat"),
+                    test.data_item_path("cube.dat"),
+                    "diff%d.plt" % jobs,
+                    nskip=1,
+                    jobs=jobs,
+                )
+            serial = load_and_replace("diff1.plt")
+            serial = {
+                (z.name, v.name): v.values(z.index).as_numpy_array()
+                for z in serial.zones() for v in serial.variables()
+            }
+            parallel = load_and_replace("diff3.plt")
+            for z in parallel.zones():
+                for v in parallel.variables():
+                    np.testing.assert_array_equal(
+                        v.values(z.index).as_numpy_array(),
+                        serial[z.name, v.name],
+                    )
+
+    def test_out_of_core(self):
+        ''' Streamed deltas should match the in-core ones '''
+        with test.temp_workspace():
+            for out_of_core in [False, True]:
+                tec_util.difference_datasets(
+                    test.data_item_path("sphere.dat"),
+                    test.data_item_path("sphere.dat"),
+                    "diff%d.plt" % out_of_core,
+                    nskip=1,
+                    out_of_core=out_of_core,
+                )
+            expected = load_and_replace("diff0.plt")
+            expected = {
+                (z.name, v.name): v.values(z.index).as_numpy_array()
+                for z in expected.zones() for v in expected.variables()
+            }
+            ds = load_and_replace("diff1.plt")
+            self.assertEqual(len(expected), ds.num_zones * ds.num_variables)
+            for z in ds.zones():
+                for v in ds.variables():
+                    np.testing.assert_array_equal(
+                        v.values(z.index).as_numpy_array(),
+                        expected[z.name, v.name],
+                    )
+
+    def test_transient(self):
+        ''' Zones are paired by strand and solution time, interpolating in time '''
+        def write(filename, times, scale):
+            zones = [
+                native.Zone(name, 'Ordered', (3,1,1), strand, t)
+                for t in times for strand, name in [(1, 'a'), (2, 'b')]
+            ]
+            with native.open_writer(filename, ['x', 'q'], zones) as writer:
+                for zone in zones:
+                    writer.write_zone([np.arange(3.0), np.full(3, scale * zone.strand * zone.solution_time)])
+
+        with test.temp_workspace():
+            write('new.plt', [1.0, 2.0], scale=1.0)
+            write('old.plt', [2.0, 0.0, 4.0], scale=0.5)
+            tec_util.difference_datasets(
+                'new.plt', 'old.plt', 'diff.plt', nskip=1, transient=True, norms_out='norms.csv',
+            )
+            with native.open_dataset('diff.plt') as reader:
+                self.assertEqual([(z.strand, z.solution_time) for z in reader.zones], [(1, 2.0), (2, 2.0)])
+                np.testing.assert_array_equal(reader.values(1, 1), [2.0, 2.0, 2.0])
+            tec_util.difference_datasets(
+                'new.plt', 'old.plt', 'diff.plt', nskip=1, transient=True, interpolate_time=True,
+            )
+            with native.open_dataset('diff.plt') as reader:
+                self.assertEqual(len(reader.zones), 4)
+                np.testing.assert_allclose(reader.values(1, 1), [1.0, 1.0, 1.0])
+            with open('norms.csv') as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0], 'time,zone,variable,l2,linf')
+            self.assertEqual(len(lines), 3)
+
+class TestLoadDataset(unittest.TestCase):
+    ''' Unit tests for the load_dataset function '''
+
+    def test_subset(self):
+        ''' Loading only the requested zones/variables saves memory and time '''
+        def load(**kwargs):
+            with tec_util.temp_frame() as frame:
+                start = time.perf_counter()
+                ds = tec_util.load_dataset("many.plt", frame, **kwargs)
+                nbytes = sum(
+                    tec_util.field_array(z, v).nbytes
+                    for z in ds.zones() for v in ds.variables()
+                )
+                return ds.num_zones, ds.num_variables, nbytes, time.perf_counter() - start
+
+        with test.temp_workspace():
+            test.write_synthetic_dataset("many.plt", num_zones=4, num_vars=120)
+            full = load()
+            part = load(zone_patterns=["block:2"], var_patterns=["q1?"], extra_variables=range(3))
+            self.assertEqual(full[:2], (4, 120))
+            self.assertEqual(part[:2], (1, 13))
+            self.assertLess(part[2], full[2]/30)
+            self.assertLess(part[3], full[3])
+
 class TestExtract(unittest.TestCase):
     ''' Unit tests for extract function '''
 
@@ -99,6 +230,108 @@ class TestExtract(unittest.TestCase):
             self.assertEqual(ds.num_variables,2)
             self.assertEqual(ds.num_zones,3)
 
+    def test_prune(self):
+        ''' Zones are pruned by the variable ranges in their headers '''
+        sphere = test.data_item_path("sphere.dat")
+        self.assertEqual(tec_util.prune_zones(sphere, None, [(0.8,2.0)]), [5])
+        self.assertEqual(tec_util.prune_zones(sphere, ['*:[1-4]'], [(0.8,2.0)]), [])
+        condition = tec_util.parse_condition('z < -0.9')
+        self.assertEqual(condition, ('z', '<', -0.9))
+        self.assertEqual(tec_util.prune_zones(sphere, None, conditions=[condition]), [4])
+        with self.assertRaises(ValueError):
+            tec_util.parse_condition('z=>1')
+
+    def test_clip(self):
+        with test.temp_workspace():
+            tec_util.extract(
+                test.data_item_path("sphere.dat"),
+                "box.plt",
+                box=[0.8, 2.0, -2.0, 2.0, -2.0, 2.0],
+            )
+            ds = load_and_replace("box.plt")
+            self.assertEqual(ds.num_zones, 1)
+            self.assertEqual(ds.zone(0).name, "sphere.x:6")
+            self.assertLess(ds.zone(0).num_points, 121)
+            self.assertGreaterEqual(ds.variable('x').values(0).max(), 0.8)
+
+            tec_util.extract(test.data_item_path("sphere.dat"), "where.plt", where=['z<-0.9', 'x>=0'])
+            ds = load_and_replace("where.plt")
+            self.assertEqual(ds.num_zones, 1)
+            self.assertLess(ds.zone(0).num_points, 121)
+            tec_util.extract(test.data_item_path("sphere.dat"), "where_x.plt", var_patterns='x', where=['z<-0.9'])
+            ds = load_and_replace("where_x.plt")
+            self.assertEqual([v.name for v in ds.variables()], ['x'])
+            with self.assertRaises(RuntimeError):
+                tec_util.extract(test.data_item_path("sphere.dat"), "none.plt", box=[2.0, 3.0])
+
+class TestDecimate(unittest.TestCase):
+    ''' Unit tests for decimate function '''
+
+    def test_strides(self):
+        with test.temp_workspace():
+            report = tec_util.decimate(
+                test.data_item_path("sphere.dat"),
+                "preview.plt",
+                strides=(5,5,1),
+                zone_patterns=['*:1'],
+            )
+            ds = load_and_replace("preview.plt")
+            self.assertEqual(ds.num_zones, 1)
+            self.assertEqual(tuple(ds.zone(0).dimensions), (3,3,1))
+            self.assertLess(report.num_bytes, os.path.getsize(test.data_item_path("sphere.dat")))
+
+class TestDerive(unittest.TestCase):
+    ''' Unit tests for derive_variables function '''
+
+    def test_derive(self):
+        with test.temp_workspace():
+            expressions = ["r = sqrt(x**2 + y**2 + z**2)", "{dr dx} = ddx(r)"]
+            tec_util.derive_variables(test.data_item_path("sphere.dat"), "serial.plt", expressions)
+            tec_util.derive_variables(test.data_item_path("sphere.dat"), "parallel.plt", expressions, jobs=2)
+            ds = load_and_replace("parallel.plt")
+            self.assertEqual([v.name for v in ds.variables()], ['x', 'y', 'z', 'r', 'dr dx'])
+            r = ds.variable('r').values(0).as_numpy_array()
+            self.assertAlmostEqual(r.max(), 1.0, delta=1e-5) # Unit sphere
+            serial = load_and_replace("serial.plt")
+            np.testing.assert_array_equal(
+                serial.variable('dr dx').values(5).as_numpy_array(),
+                ds.variable('dr dx').values(5).as_numpy_array(),
+            )
+            with self.assertRaises(ValueError):
+                tec_util.derive_variables(test.data_item_path("sphere.dat"), "bad.plt", ["r = x + pressure"])
+
+class TestWriteDataset(unittest.TestCase):
+    ''' Unit tests for the write_dataset function '''
+
+    def test_precision(self):
+        ''' Check that output precision can be forced to single/double '''
+        with test.temp_workspace():
+            ds = load_and_replace(test.data_item_path("cube.dat"))
+            double = tec_util.write_dataset("double.plt", ds, precision="double")
+            single = tec_util.write_dataset("single.plt", ds, precision="single")
+            self.assertLess(single.num_bytes, double.num_bytes)
+            self.assertEqual(single.max_error, 0.0) # cube.dat is single precision
+            ds = load_and_replace("double.plt")
+            self.assertEqual(ds.num_zones, 6)
+            self.assertEqual(ds.variable(0).values(0).data_type, tpc.FieldDataType.Double)
+            ds = load_and_replace("single.plt")
+            self.assertEqual(ds.variable(0).values(0).data_type, tpc.FieldDataType.Float)
+
+    def test_share(self):
+        ''' Tecplot loads shared output of the native writers with the same values '''
+        with test.temp_workspace():
+            ds = load_and_replace(test.data_item_path("sphere.dat"))
+            plain = tec_util.write_dataset("plain.plt", ds)
+            shared = tec_util.write_dataset("shared.plt", ds, share=True)
+            self.assertLessEqual(shared.num_bytes, plain.num_bytes)
+            ds = load_and_replace("plain.plt")
+            expected = [[z.values(v.index).as_numpy_array() for v in ds.variables()] for z in ds.zones()]
+            ds = load_and_replace("shared.plt")
+            self.assertEqual(ds.num_zones, len(expected))
+            for zone, arrays in zip(ds.zones(), expected):
+                for var, values in zip(ds.variables(), arrays):
+                    np.testing.assert_array_equal(zone.values(var.index).as_numpy_array(), values)
+
 class TestRenameVariables(unittest.TestCase):
     ''' Unit test for the rename_variables function '''
 
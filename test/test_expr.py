@@ -0,0 +1,127 @@
+import concurrent.futures
+import numpy as np
+import resource
+import test
+import unittest
+from tec_util import expr
+from tec_util import native
+from tec_util import shm
+
+def skewed_block(shape=(5,4,3)):
+    ''' Coordinates of a sheared IJK block '''
+    I, J, K = shape
+    k, j, i = np.meshgrid(np.arange(K), np.arange(J), np.arange(I), indexing='ij')
+    x, y, z = 0.5 * i + 0.2 * j, 0.3 * j, 0.25 * k + 0.1 * i
+    return x.ravel(), y.ravel(), z.ravel()
+
+class TestCompile(unittest.TestCase):
+    ''' Unit tests for compiling and evaluating expressions '''
+
+    def test_evaluate(self):
+        plan = expr.compile_expression("M = sqrt(u**2 + {v vel}**2) / c * (2 * pi / pi)")
+        self.assertEqual(plan.name, 'M')
+        self.assertEqual(plan.inputs, ['u', 'v vel', 'c'])
+        self.assertEqual(plan.num_registers, 2) # Constants folded, registers reused
+        values = {'u': np.arange(10.0), 'v vel': np.ones(10, np.float32), 'c': np.full(10, 4.0)}
+        expected = np.sqrt(values['u']**2 + 1) / 2
+        np.testing.assert_allclose(plan.evaluate(values, 10, chunk_size=3), expected)
+        out = np.empty(10)
+        self.assertIs(plan.evaluate(values, 10, out), out)
+        np.testing.assert_allclose(out, expected)
+
+    def test_trivial(self):
+        ''' Plans without any step copy a variable or fill in a constant '''
+        values = {'p': np.arange(4.0)}
+        np.testing.assert_array_equal(expr.compile_expression("{q 2} = p").evaluate(values, 4), values['p'])
+        np.testing.assert_array_equal(expr.compile_expression("one = 3 - 2").evaluate(values, 4), np.ones(4))
+        self.assertEqual(expr.compile_expression("{q 2} = p").name, 'q 2')
+
+    def test_errors(self):
+        for text in ["p", "a = b < c", "a = foo(b)", "a = max(b)", "a = ddx(b, c)", "a, b = c", "a = b +"]:
+            with self.assertRaises(ValueError, msg=text):
+                expr.compile_expression(text)
+        plans = [expr.compile_expression("a = p + 1"), expr.compile_expression("b = a * q")]
+        expr.check_names(plans, ['p', 'q'])
+        with self.assertRaises(ValueError):
+            expr.check_names(plans[::-1], ['p', 'q'])
+
+class TestGradient(unittest.TestCase):
+    ''' Unit tests for expressions with finite-difference gradients '''
+
+    def test_ordered(self):
+        ''' Gradients of a linear field are exact, even on a skewed grid '''
+        x, y, z = skewed_block()
+        zone = native.Zone('block', 'Ordered', (5,4,3))
+        plans = [
+            expr.compile_expression("f = 2*x - y + 3*z"),
+            expr.compile_expression("g = ddx(f) + 10*ddy(f) + 100*ddz(f)"),
+        ]
+        outputs = [np.empty(60), np.empty(60)]
+        expr.evaluate_zone(plans, zone, {'x': x, 'y': y, 'z': z}, outputs, ('x','y','z'), chunk_size=7)
+        self.assertEqual(len(plans[1].gradients), 1) # One gradient of f for all three components
+        np.testing.assert_allclose(outputs[1], 2 - 10 + 300)
+
+    def test_locations(self):
+        zone = native.Zone('block', 'Ordered', (5,4,3), locations=[0,0,0,1,1])
+        variables = ['x','y','z','p','q']
+        plans = [expr.compile_expression("a = p * q"), expr.compile_expression("b = a + 1")]
+        self.assertEqual(expr.result_locations(plans, zone, variables, ('x','y','z')), [1, 1])
+        for text in ["a = p + x", "a = ddx(p)", "a = ddz(x)"]:
+            with self.assertRaises(ValueError, msg=text):
+                expr.result_locations([expr.compile_expression(text)], zone, variables, ('x','y'))
+        fe = native.Zone('tets', 'FETetra', (4,1))
+        with self.assertRaises(ValueError):
+            expr.result_locations([expr.compile_expression("a = ddx(x)")], fe, variables[:3], ('x','y','z'))
+
+    def test_workers(self):
+        x, y, z = skewed_block()
+        zones = [native.Zone(name, 'Ordered', (5,4,3)) for name in ('a', 'b')]
+        plans = [expr.compile_expression("vx = ddx(x*y)")]
+        inputs = {(iz, ivar): (np.float64, 60) for iz in range(2) for ivar in range(3)}
+        outputs = {(iz, 0): (np.float64, 60) for iz in range(2)}
+        with shm.SharedDataset(['x','y','z'], zones, inputs) as shared_in, \
+             shm.SharedDataset(['vx'], zones, outputs) as shared_out, \
+             concurrent.futures.ProcessPoolExecutor(2) as pool:
+            for iz in range(2):
+                for ivar, values in enumerate([x, y, z]):
+                    shared_in.publish(iz, ivar, values)
+            futures = [
+                pool.submit(shm.derive_zones, shared_in.descriptor, shared_out.descriptor, [(iz, iz)], [0,1,2],
+                            plans, ('x','y','z'))
+                for iz in range(2)
+            ]
+            for future in futures:
+                future.result()
+            for iz in range(2):
+                np.testing.assert_allclose(shared_out.values(iz, 0), y, atol=1e-12)
+
+    def test_workers_many_zones(self):
+        ''' Workers read thousands of zones from a datafile into one output block '''
+        num_zones = 2000
+        zones = [native.Zone(f'z{i}', 'Ordered', (3,2,1), locations=[0,1]) for i in range(num_zones)]
+        plans = [expr.compile_expression("a = c * 2"), expr.compile_expression("b = a + 1")]
+        with test.temp_workspace():
+            with native.open_writer('many.plt', ['x','c'], zones) as writer:
+                for iz in range(num_zones):
+                    writer.write_zone([np.arange(6.0), np.array([iz, -iz], np.float32)])
+            outputs = {(iz, k): (np.float64, 6) for iz in range(num_zones) for k in range(2)}
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(256, hard), hard))
+            try:
+                with shm.SharedDataset(['a','b'], zones, outputs) as shared_out, \
+                     concurrent.futures.ProcessPoolExecutor(2) as pool:
+                    pairs = [(iz, iz) for iz in range(num_zones)]
+                    futures = [
+                        pool.submit(shm.derive_zones, 'many.plt', shared_out.descriptor, pairs[i::2], [1], plans)
+                        for i in range(2)
+                    ]
+                    for future in futures:
+                        future.result()
+                    # Cell-centered results are padded to the nodal dimensions
+                    np.testing.assert_array_equal(shared_out.values(1999, 0), [3998, -3998, 0, 0, 0, 0])
+                    np.testing.assert_array_equal(shared_out.values(7, 1), [15, -13, 1, 1, 1, 1])
+            finally:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+if __name__ == '__main__':
+    unittest.main()
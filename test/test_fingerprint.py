@@ -0,0 +1,73 @@
+import contextlib
+import io
+import numpy as np
+import test
+import unittest
+from tec_util import core
+from tec_util import fingerprint
+from tec_util import native
+from tec_util import sidecar
+from tec_util.__main__ import main
+
+def write_dataset(filename, p, names=('wing', 'tail')):
+    zones = [native.Zone(name, 'Ordered', (3,1,1)) for name in names]
+    with native.open_writer(filename, ['x','p'], zones) as writer:
+        for iz in range(len(zones)):
+            writer.write_zone([np.arange(3.0), np.asarray(p[iz], np.float64)])
+
+class TestFingerprint(unittest.TestCase):
+    ''' Unit tests for zone fingerprints '''
+
+    def test_formats(self):
+        ''' Fingerprints depend on the data, not on the file format '''
+        with test.temp_workspace():
+            write_dataset('a.plt', [[1,2,3], [4,5,6]])
+            write_dataset('a.dat', [[1,2,3], [4,5,6]])
+            self.assertEqual(fingerprint.datafile_fingerprints('a.plt'), fingerprint.datafile_fingerprints('a.dat'))
+
+    def test_compare(self):
+        with test.temp_workspace():
+            write_dataset('a.plt', [[1,2,3], [4,5,6]])
+            write_dataset('b.plt', [[1,2,3], [4,5,7], [0,0,0]], names=['wing', 'tail', 'flap'])
+            result = fingerprint.compare_datafiles('a.plt', 'b.plt')
+            self.assertEqual(result.identical, ['wing'])
+            self.assertEqual(result.changed, [('tail', ['p'])])
+            self.assertEqual((result.missing, result.added), ([], ['flap']))
+
+    def test_sidecar(self):
+        ''' Hashes of an up-to-date sidecar are used without reading the data '''
+        with test.temp_workspace():
+            write_dataset('a.plt', [[1,2,3], [4,5,6]])
+            sidecar.cached_statistics('a.plt')
+            index = sidecar.load_sidecar('a.plt')
+            index['zones']['0']['variables']['p']['hash'] = 'cached'
+            sidecar.save_sidecar('a.plt', index)
+            self.assertEqual(fingerprint.datafile_fingerprints('a.plt')[0].variables['p'], 'cached')
+
+class TestSkipIdentical(unittest.TestCase):
+    ''' Unit tests for difference_datafiles(skip_identical=True) '''
+
+    def test_skip(self):
+        with test.temp_workspace():
+            write_dataset('new.plt', [[1,2,3], [4,5,6]])
+            write_dataset('old.plt', [[1,2,3], [4,5,4]])
+            core.difference_datafiles('new.plt', 'old.plt', 'diff.plt', nskip=1, skip_identical=True)
+            with native.open_dataset('diff.plt') as reader:
+                np.testing.assert_array_equal(reader.values(0, 1), [0,0,0])
+                np.testing.assert_array_equal(reader.values(1, 1), [0,0,2])
+                self.assertEqual(reader.layouts[1].shared[0], 0) # Grid stored once
+
+    def test_main(self):
+        with test.temp_workspace():
+            write_dataset('a.plt', [[1,2,3], [4,5,6]])
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(['hash', 'a.plt', '-v', 'p'])
+                main(['compare', 'a.plt', 'a.plt'])
+            lines = out.getvalue().splitlines()
+            self.assertEqual(len(lines), 4 + 3)
+            self.assertTrue(lines[1].endswith('  wing/p'))
+            self.assertEqual(lines[-1], '2 identical, 0 changed, 0 missing, 0 added')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import test
+import time
+import unittest
+from tec_util import instrument
+
+class TestSpans(unittest.TestCase):
+    ''' Unit tests for timing spans '''
+
+    def test_disabled(self):
+        ''' Spans are no-ops unless recording '''
+        with instrument.span('load') as s:
+            s.add(bytes=10)
+        self.assertFalse(s)
+        self.assertFalse(instrument.enabled())
+
+    def test_recording(self):
+        @instrument.traced
+        def work():
+            with instrument.span('compute') as s:
+                s.add(points=100)
+                s.add(points=50)
+                time.sleep(0.01)
+
+        with instrument.recording() as recorder:
+            work()
+            work()
+        self.assertFalse(instrument.enabled())
+        summary = recorder.summary()
+        self.assertEqual(summary['work']['count'], 2)
+        self.assertEqual(summary['compute']['points'], 300)
+        self.assertGreaterEqual(summary['work']['total'], summary['compute']['total'])
+        self.assertIn('compute', recorder.format_summary())
+
+    def test_chrome_trace(self):
+        with instrument.recording() as recorder:
+            with self.assertRaises(ValueError):
+                with instrument.span('write', file='out.plt'):
+                    raise ValueError
+        with test.temp_workspace():
+            recorder.write_chrome_trace('trace.json')
+            with open('trace.json') as f:
+                trace = json.load(f)
+        event, = trace['traceEvents']
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(event['args'], {'file': 'out.plt', 'error': 'ValueError'})
+
+class TestMemory(unittest.TestCase):
+    ''' Unit tests for memory reporting '''
+
+    def test_peaks(self):
+        ''' Python peaks include short-lived arrays of nested spans '''
+        with instrument.recording(memory=True) as recorder:
+            with instrument.span('outer'):
+                with instrument.span('inner'):
+                    data = bytearray(20 * 2**20)
+                    del data
+        summary = recorder.summary()
+        self.assertGreaterEqual(summary['inner']['py_peak'], 20 * 2**20)
+        self.assertGreaterEqual(summary['outer']['py_peak'], summary['inner']['py_peak'])
+        self.assertGreater(summary['outer']['rss_peak'], 0)
+        self.assertIn('RSS pk MB', recorder.format_summary())
@@ -0,0 +1,112 @@
+import numpy as np
+import os
+import test
+import unittest
+from tec_util import integrate
+from tec_util import native
+from tec_util.__main__ import main
+
+def write_surfaces(filename, pressure=1.0):
+    ''' Write a unit plate (ordered), a unit square contour (FE lines) and a volume zone '''
+    i, j = np.meshgrid(np.linspace(0, 1, 3), np.linspace(0, 1, 3))
+    x, y = i.ravel(), j.ravel()
+    sx, sy = np.array([0,1,1,0.]), np.array([0,0,1,1.])
+    zones = [
+        native.Zone('plate', 'Ordered', (3,3,1)),
+        native.Zone('square', 'FELineSeg', (4,4)),
+        native.Zone('block', 'Ordered', (2,2,2)),
+    ]
+    with native.open_writer(filename, ['x','y','z','p','u','v','w'], zones) as writer:
+        writer.write_zone([x, y, np.zeros(9), np.full(9, pressure), np.zeros(9), np.zeros(9), np.full(9, 2.0)])
+        writer.write_zone([sx, sy, np.zeros(4), np.full(4, pressure), sx, sy, np.zeros(4)],
+                          np.array([[0,1], [1,2], [2,3], [3,0]]))
+        writer.write_zone([np.arange(8.0)] * 7)
+
+class TestIntegrate(unittest.TestCase):
+    ''' Unit tests for integrate_surfaces '''
+
+    def test_integrals(self):
+        with test.temp_workspace():
+            write_surfaces('t0.plt')
+            rows = integrate.integrate_surfaces(
+                ['t0.plt'], scalars=['p'], forces=['p'], fluxes=[['u','v','w']], center=(0.5, 0.5),
+            )
+            self.assertEqual([r.zone for r in rows], ['plate', 'square']) # Volume zone skipped
+            plate, square = rows[0].values, rows[1].values
+            self.assertAlmostEqual(plate['area'], 1.0)
+            self.assertEqual([plate[f'p_{c}'] for c in integrate.FORCE_COMPONENTS], [0, 0, 1, 0, 0, 0])
+            self.assertAlmostEqual(plate['flux(u,v,w)'], 2.0)
+            self.assertAlmostEqual(square['area'], 4.0) # Perimeter
+            self.assertAlmostEqual(square['flux(u,v,w)'], 2.0) # Twice the enclosed area
+            total, = integrate.total_integrals(rows)
+            self.assertAlmostEqual(total.values['p'], 5.0)
+
+    def test_cache(self):
+        ''' Timesteps on the same mesh reuse the geometry, also across runs '''
+        with test.temp_workspace():
+            write_surfaces('t0.plt')
+            write_surfaces('t1.plt', pressure=2.0)
+            integrate._geometry_cache.clear()
+            with self.assertLogs('tec_util.integrate', 'INFO') as logs:
+                rows = integrate.integrate_surfaces(['t*.plt'], forces=['p'], cache_dir='geometry')
+            self.assertIn('reused the geometry of 2', logs.output[-1])
+            self.assertEqual(len(os.listdir('geometry')), 2)
+            self.assertAlmostEqual(rows[2].values['p_Fz'], 2.0)
+
+            integrate._geometry_cache.clear()
+            main(['integrate', 't1.plt', '-f', 'p', '-z', 'plate', '--geometry-cache', 'geometry', '-o', 'forces.csv', '-j', '2'])
+            with open('forces.csv') as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0], 'datafile,zone,time,area,p_Fx,p_Fy,p_Fz,p_Mx,p_My,p_Mz')
+            self.assertEqual(lines[1].split(',')[:2], ['t1.plt', 'plate'])
+            self.assertEqual(lines[2].split(',')[1], '<total>')
+            with self.assertRaises(ValueError):
+                integrate.integrate_surfaces(['t1.plt'], scalars=['q'])
+
+    def test_workers(self):
+        ''' Each worker integrates the same zones of every timestep, so it reuses their geometry '''
+        with test.temp_workspace():
+            for i in range(3):
+                write_surfaces('t%d.plt' % i, pressure=float(i))
+            integrate._geometry_cache.clear()
+            with self.assertLogs('tec_util.integrate', 'INFO') as logs:
+                rows = integrate.integrate_surfaces(['t*.plt'], forces=['p'], jobs=2)
+            self.assertIn('Integrated 6 zones; reused the geometry of 4', logs.output[-1])
+            self.assertEqual([(r.datafile, r.zone) for r in rows[:3]], [('t0.plt', 'plate'), ('t0.plt', 'square'), ('t1.plt', 'plate')])
+
+    def test_geometry_key(self):
+        with test.temp_workspace():
+            write_surfaces('a.plt', pressure=1.0)
+            write_surfaces('b.plt', pressure=2.0)
+            zone = native.Zone('plate', 'Ordered', (3,3,1))
+            with native.open_writer('moved.plt', ['x','y','z'], [zone]) as writer:
+                x = np.tile(np.linspace(0, 1, 3), 3)
+                y = np.repeat(np.linspace(0, 1, 3), 3)
+                y[4] = 0.6 # Inside the range
+                writer.write_zone([x, y, np.zeros(9)])
+            keys = []
+            for filename in ['a.plt', 'b.plt', 'moved.plt']:
+                with native.open_dataset(filename) as reader:
+                    keys.append(integrate.geometry_key(reader, {}, 0, [0,1,2]))
+            self.assertEqual(keys[0], keys[1])
+            self.assertNotEqual(keys[0], keys[2])
+
+            # An interior node moving between the sampled values is only seen by the full key
+            zone = native.Zone('flap', 'Ordered', (50,50,1))
+            x = np.tile(np.linspace(0, 1, 50), 50)
+            y = np.repeat(np.linspace(0, 1, 50), 50)
+            for filename, dy in [('flap_0.plt', 0.0), ('flap_1.plt', 0.001)]:
+                with native.open_writer(filename, ['x','y','z'], [zone]) as writer:
+                    writer.write_zone([x, y + np.where(np.arange(2500) == 1201, dy, 0.0), np.zeros(2500)])
+            keys = {}
+            for sampled in (False, True):
+                for filename in ['flap_0.plt', 'flap_1.plt']:
+                    with native.open_dataset(filename) as reader:
+                        keys[filename, sampled] = integrate.geometry_key(reader, {}, 0, [0,1,2], sampled)
+            self.assertNotEqual(keys['flap_0.plt', False], keys['flap_1.plt', False])
+            self.assertEqual(keys['flap_0.plt', True], keys['flap_1.plt', True])
+            values = np.arange(10000)
+            self.assertEqual(integrate.sample(values, 1000)[[0,1,-1]].tolist(), [0, 10, 9999])
+
+if __name__ == '__main__':
+    unittest.main()
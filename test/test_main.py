@@ -1,3 +1,5 @@
+import json
+import os
 import tecplot as tp
 import tecplot.constant as tpc
 import test
@@ -23,6 +25,52 @@ class TestMain(unittest.TestCase):
             self.assertEqual(ds.num_variables,2)
             self.assertEqual(ds.num_zones,4)
 
+    def test_extract_precision(self):
+        ''' Make sure --precision controls the output data type '''
+        with test.temp_workspace():
+            main([
+                'extract',
+                '--variables=x,y',
+                '--precision=double',
+                test.data_item_path('sphere.dat')
+            ])
+            ds = load_and_replace("extract.plt")
+            self.assertEqual(ds.num_variables,2)
+            self.assertEqual(ds.variable(0).values(0).data_type, tpc.FieldDataType.Double)
+
+    def test_profile(self):
+        ''' Make sure --profile writes a trace of the load/write phases '''
+        with test.temp_workspace():
+            main([
+                '--profile=profile.json',
+                'extract',
+                '--variables=x,y',
+                test.data_item_path('sphere.dat')
+            ])
+            with open('profile.json') as f:
+                trace = json.load(f)
+            names = [e['name'] for e in trace['traceEvents']]
+            for name in ['extract', 'load', 'write']:
+                self.assertIn(name, names)
+            self.assertGreater(trace['otherData']['summary']['write']['bytes'], 0)
+
+    def test_mem_budget(self):
+        ''' Make sure --mem-budget fails fast or switches diff to streaming '''
+        with test.temp_workspace():
+            with self.assertRaises(RuntimeError):
+                main(['--mem-budget=1K', 'extract', test.data_item_path('sphere.dat')])
+            self.assertFalse(os.path.exists('extract.plt'))
+            main([
+                '--mem-budget=4K',
+                'diff',
+                '--nskip=1',
+                '-o', 'diff.plt',
+                test.data_item_path('axi_sphere.plt'),
+                test.data_item_path('axi_sphere.plt'),
+            ])
+            ds = load_and_replace("diff.plt")
+            self.assertEqual(ds.variable(1).name, "delta_y")
+
     def test_interp(self):
         ''' Make sure interp command works '''
         with test.temp_workspace():
@@ -0,0 +1,88 @@
+import numpy as np
+import unittest
+from tec_util import mesh
+
+class TestDecimate(unittest.TestCase):
+    ''' Unit tests for decimation kernels '''
+
+    def test_ordered(self):
+        ''' Strides keep the last node along each axis '''
+        node_index, cell_index, shape = mesh.decimate_ordered((5,4,1), (2,2,2))
+        self.assertEqual(shape, (3,3,1))
+        np.testing.assert_array_equal(node_index, [0,2,4, 10,12,14, 15,17,19])
+        np.testing.assert_array_equal(cell_index, [0,2, 8,10])
+
+    def test_clustering(self):
+        x, y = np.meshgrid(np.linspace(0.0, 1.0, 41), np.linspace(0.0, 1.0, 41))
+        nodes = np.arange(41*41).reshape(41,41)
+        quads = np.stack([nodes[:-1,:-1], nodes[:-1,1:], nodes[1:,1:], nodes[1:,:-1]], axis=-1).reshape(-1,4)
+        cluster, count = mesh.cluster_vertices([x.ravel(), y.ravel(), np.zeros(x.size)], 200)
+        self.assertLess(abs(count - 200), 20)
+        conn, element_index = mesh.cluster_elements('FEQuad', quads, cluster)
+        self.assertTrue(0 < len(conn) < count)
+        self.assertTrue(np.all(conn < count))
+        self.assertEqual(len(element_index), len(conn))
+        mean_x = mesh.cluster_mean(x.ravel(), cluster, count)
+        self.assertEqual(mean_x.shape, (count,))
+        self.assertAlmostEqual(mean_x.min(), 0.0, delta=0.1)
+
+class TestClip(unittest.TestCase):
+    ''' Unit tests for clipping kernels '''
+
+    def test_ordered(self):
+        ''' Cells touching a selected node are kept, reduced to an IJK block '''
+        x = np.tile(np.arange(5.0), 4)
+        y = np.repeat(np.arange(4.0), 5)
+        node_mask = mesh.box_mask([x, y], [(1.5, 2.5), (0.5, 1.5)])
+        self.assertEqual(np.flatnonzero(node_mask).tolist(), [7])
+        cell_mask = mesh.ordered_cell_mask((5,4,1), node_mask)
+        self.assertEqual(np.flatnonzero(cell_mask).tolist(), [1, 2, 5, 6])
+        node_index, cell_index, shape = mesh.ordered_subblock((5,4,1), cell_mask)
+        self.assertEqual(shape, (3,3,1))
+        self.assertEqual(node_index.tolist(), [1,2,3, 6,7,8, 11,12,13])
+        self.assertEqual(cell_index.tolist(), [1,2, 5,6])
+        self.assertIsNone(mesh.ordered_subblock((5,4,1), np.zeros(12, bool)))
+
+    def test_fe(self):
+        conn = np.array([[0,1,2],[1,3,2],[3,4,2]])
+        conn_out, node_index, element_index = mesh.fe_subset(conn, np.array([False, True, True]))
+        self.assertEqual(node_index.tolist(), [1,2,3,4])
+        self.assertEqual(element_index.tolist(), [1,2])
+        np.testing.assert_array_equal(node_index[conn_out], conn[1:])
+
+    def test_bounds(self):
+        self.assertTrue(mesh.box_intersects([(0,1),(0,1)], [(0.5,2),(-1,0)]))
+        self.assertFalse(mesh.box_intersects([(0,1),(0,1)], [(0.5,2),(1.5,2)]))
+
+class TestGradient(unittest.TestCase):
+    ''' Unit tests for finite-difference gradients of ordered zones '''
+
+    def test_surface(self):
+        ''' On a surface, the gradient is projected on its tangent plane '''
+        i, j = np.meshgrid(np.arange(4.0), np.arange(3.0))
+        x, y, z = i.ravel(), j.ravel(), i.ravel() # Plane z = x
+        grad = mesh.ordered_gradient(3 * x + 2 * y, (4,3,1), [x, y, z])
+        self.assertEqual(grad.shape, (3, 12))
+        np.testing.assert_allclose(grad, [[1.5]*12, [2.0]*12, [1.5]*12])
+        np.testing.assert_array_equal(mesh.ordered_gradient(np.ones(1), (1,1,1), [x[:1]]), [[0.0]])
+
+class TestSurfaceGeometry(unittest.TestCase):
+    ''' Unit tests for surface element geometry '''
+
+    def test_ordered(self):
+        self.assertEqual(mesh.ordered_elements((3,2,1)).tolist(), [[0,1,4,3], [1,2,5,4]])
+        self.assertEqual(mesh.ordered_elements((3,1,1)).tolist(), [[0,1], [1,2]])
+        with self.assertRaises(ValueError):
+            mesh.ordered_elements((2,2,2))
+
+    def test_geometry(self):
+        ''' Area vectors of triangles and quads; in-plane normals of segments '''
+        x, y, z = np.array([0,1,1,0.]), np.array([0,0,1,1.]), np.array([0,0,0,2.])
+        vectors, measure, centroid = mesh.element_geometry(np.array([[0,1,2,3]]), [x, y, z])
+        np.testing.assert_allclose(vectors, [[1,-1,1]])
+        vectors, measure, centroid = mesh.element_geometry(np.array([[0,1,2]]), [x, y, z])
+        np.testing.assert_allclose(vectors, [[0,0,0.5]])
+        np.testing.assert_allclose(centroid, [[2/3, 1/3, 0]])
+        vectors, measure, centroid = mesh.element_geometry(np.array([[0,1], [1,2]]), [x[:3], y[:3]])
+        np.testing.assert_allclose(vectors, [[0,-1,0], [1,0,0]])
+        np.testing.assert_allclose(measure, [1, 1])
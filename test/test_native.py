@@ -0,0 +1,216 @@
+import numpy as np
+import os
+import test
+import unittest
+import unittest.mock
+from tec_util import native
+
+def ordered_zone(name='zone', shape=(4,3,2), **kwargs):
+    return native.Zone(name, 'Ordered', shape, **kwargs)
+
+def write_cube(filename, dtype, num_vars=3, shape=(4,3,2)):
+    zone = ordered_zone(shape=shape)
+    npts = native.num_points(zone)
+    variables = ['v%d' % i for i in range(num_vars)]
+    with native.open_writer(filename, variables, [zone]) as writer:
+        writer.write_zone([np.linspace(0, i+1, npts).astype(dtype) for i in range(num_vars)])
+    return npts
+
+class TestWriters(unittest.TestCase):
+    ''' Unit tests for the native PLT/ASCII writers '''
+
+    def test_plt_precision(self):
+        ''' Single precision output should save 4 bytes per value '''
+        with test.temp_workspace():
+            npts = write_cube('single.plt', np.float32)
+            write_cube('double.plt', np.float64)
+            size_single = os.path.getsize('single.plt')
+            size_double = os.path.getsize('double.plt')
+            self.assertEqual(size_double - size_single, 3*npts*4)
+            with open('single.plt', 'rb') as f:
+                self.assertEqual(f.read(8), b'#!TDV112')
+
+    def test_ascii_types(self):
+        ''' ASCII output should declare the type of each variable '''
+        with test.temp_workspace():
+            write_cube('single.dat', np.float32)
+            with open('single.dat') as f:
+                text = f.read()
+            self.assertIn('DT=(SINGLE SINGLE SINGLE )', text)
+            self.assertIn('I=4, J=3, K=2', text)
+
+    def test_fe_connectivity(self):
+        ''' FE zones require connectivity of the right shape '''
+        zone = native.Zone('tri', 'FETriangle', (4,2))
+        xyz = [np.zeros(4), np.ones(4)]
+        with test.temp_workspace():
+            with native.open_writer('tri.plt', ['x','y'], [zone]) as writer:
+                with self.assertRaises(ValueError):
+                    writer.write_zone(xyz)
+                writer.write_zone(xyz, [[0,1,2],[1,2,3]])
+
+    def test_value_count(self):
+        ''' Arrays that do not match the zone shape are rejected '''
+        zone = ordered_zone(shape=(3,3,1), locations=[0,1])
+        self.assertEqual(native.value_count(zone, 0), 9)
+        self.assertEqual(native.value_count(zone, 1), 4)
+        with test.temp_workspace():
+            writer = native.open_writer('bad.plt', ['x','q'], [zone])
+            with self.assertRaises(ValueError):
+                writer.write_zone([np.zeros(9), np.zeros(9)])
+            with self.assertRaises(RuntimeError):
+                writer.close()
+
+    def test_chunked(self):
+        ''' Output does not depend on the chunk size used to stream it '''
+        zones = [
+            native.Zone('block', 'Ordered', (4,3,3), locations=[0,1]),
+            native.Zone('tris', 'FETriangle', (4,2)),
+        ]
+        values = [
+            [np.arange(36.0), np.arange(12.0)],
+            [np.arange(4.0), np.arange(4.0)],
+        ]
+        for filename in ['chunks.plt', 'chunks.dat']:
+            contents = []
+            with test.temp_workspace():
+                for chunk_size in [native.CHUNK_SIZE, 3]:
+                    with native.open_writer(filename, ['x','p'], zones) as writer:
+                        writer.chunk_size = chunk_size
+                        writer.write_zone(values[0])
+                        writer.write_zone_chunked([native.chunked(v) for v in values[1]], [[0,1,2],[1,2,3]])
+                    with open(filename, 'rb') as f:
+                        contents.append(f.read())
+                with native.open_dataset(filename) as reader:
+                    np.testing.assert_array_equal(reader.values(0, 1), values[0][1])
+            self.assertEqual(contents[0], contents[1])
+
+    def test_sharing(self):
+        ''' Shared and passive data are stored once and read back transparently '''
+        zones = [native.Zone('t%d' % i, 'FETriangle', (4,2), 1, float(i)) for i in range(3)]
+        conn = np.array([[0,1,2],[1,2,3]])
+        x = np.arange(4.0)
+        for filename in ['shared.plt', 'shared.dat']:
+            with test.temp_workspace():
+                with native.open_writer(filename, ['x','p'], zones) as writer:
+                    writer.write_zone([x, x + 1], conn)
+                    writer.write_zone([native.Shared(0), native.PASSIVE], native.Shared(0))
+                    with self.assertRaises(ValueError):
+                        writer.write_zone([native.Shared(2), x], conn) # Not written yet
+                    writer.write_zone([x, x + 2], conn)
+                with native.open_writer('copy' + filename[-4:], ['x','p'], zones, share=True) as writer:
+                    for p in [x + 1, x + 1, x + 2]:
+                        writer.write_zone([x, p], conn)
+                with native.open_writer('full' + filename[-4:], ['x','p'], zones) as writer:
+                    for p in [x + 1, x + 1, x + 2]:
+                        writer.write_zone([x, p], conn)
+                self.assertLess(os.path.getsize('copy' + filename[-4:]), os.path.getsize('full' + filename[-4:]))
+                for name in [filename, 'copy' + filename[-4:]]:
+                    with native.open_dataset(name) as reader:
+                        np.testing.assert_array_equal(reader.values(1, 0), x)
+                        np.testing.assert_array_equal(reader.values(2, 0), x)
+                        np.testing.assert_array_equal(reader.connectivity(2), conn)
+                        np.testing.assert_array_equal(reader.values(2, 1), x + 2)
+                        self.assertEqual(reader.value_range(2, 1), (2.0, 5.0))
+                with native.open_dataset(filename) as reader:
+                    np.testing.assert_array_equal(reader.values(1, 1), np.zeros(4))
+
+    def test_share_index(self):
+        ''' Only zones of the same structure share data, and only those are hashed '''
+        zones = [
+            native.Zone('a', 'Ordered', (4,3,1)),
+            native.Zone('b', 'Ordered', (3,4,1)), # Same number of values, other shape
+            native.Zone('c', 'Ordered', (4,3,1)),
+        ]
+        index = native.ShareIndex(zones, 1)
+        values = native.chunked(np.arange(12.0))
+        with unittest.mock.patch.object(native, 'chunked_hash', wraps=native.chunked_hash) as hashed:
+            self.assertIs(index.share_values(0, zones[0], 0, values), values)
+            self.assertIs(index.share_values(1, zones[1], 0, values), values)
+            self.assertEqual(index.share_values(2, zones[2], 0, values), native.Shared(0))
+        self.assertEqual(hashed.call_count, 2)
+        with test.temp_workspace():
+            with native.open_writer('shape.plt', ['p'], zones) as writer:
+                writer.write_zone([np.arange(12.0)])
+                with self.assertRaises(ValueError):
+                    writer.write_zone([native.Shared(0)])
+                writer.write_zone([np.arange(12.0)])
+                writer.write_zone([native.Shared(0)])
+
+    def test_rounding_error(self):
+        ''' Rounding error measures the loss from downcasting '''
+        data = np.array([1.0, 1.0 + 1e-12, np.nan])
+        self.assertEqual(native.rounding_error(data, data.copy()), 0.0)
+        self.assertAlmostEqual(native.rounding_error(data, data.astype(np.float32)), 1e-12)
+
+class TestReadHeader(unittest.TestCase):
+    ''' Unit tests for reading datafile headers '''
+
+    def test_ascii(self):
+        header = native.read_header(test.data_item_path('cube.dat'))
+        self.assertEqual(header.title, 'Plot3D DataSet')
+        self.assertEqual(header.variables, ['x', 'y', 'z'])
+        self.assertEqual([z.name for z in header.zones], ['cube.x:%d' % i for i in range(1,7)])
+        self.assertEqual(header.zones[0].shape, (11,11,1))
+        self.assertEqual(header.aux_data['Common.SpeedOfSound'], '1.0')
+
+    def test_plt(self):
+        header = native.read_header(test.data_item_path('axi_sphere.plt'))
+        self.assertEqual(header.variables, ['x', 'y', 'q1', 'q2', 'v1', 'v2'])
+        self.assertEqual(len(header.zones), 1)
+        self.assertEqual(header.zones[0].zone_type, 'Ordered')
+        self.assertEqual(header.zones[0].shape, (11,9,1))
+
+    def test_roundtrip(self):
+        ''' Headers written by the native writers can be read back '''
+        zones = [
+            native.Zone('block', 'Ordered', (3,2,1), strand=2, solution_time=1.5, locations=[0,1]),
+            native.Zone('tris', 'FETriangle', (4,2), aux_data={'Common.Note': 'x'}),
+        ]
+        for filename in ['rt.plt', 'rt.dat']:
+            with test.temp_workspace():
+                with native.open_writer(filename, ['x','p'], zones, title='T') as writer:
+                    writer.write_zone([np.arange(6.0), np.arange(2.0)])
+                    writer.write_zone([np.arange(4.0), np.arange(4.0)], [[0,1,2],[1,2,3]])
+                header = native.read_header(filename)
+            self.assertEqual(header.title, 'T')
+            self.assertEqual(header.variables, ['x','p'])
+            self.assertEqual(header.zones[0], zones[0])
+            self.assertEqual(header.zones[1].shape, (4,2))
+            self.assertEqual(header.zones[1].aux_data, {'Common.Note': 'x'})
+
+    def test_unsupported(self):
+        with test.temp_workspace():
+            with open('data.szplt', 'wb') as f:
+                f.write(b'#!SZPLT ' + bytes(64))
+            with self.assertRaises(native.UnsupportedFormat):
+                native.read_header('data.szplt')
+
+class TestReaders(unittest.TestCase):
+    ''' Unit tests for the native PLT/ASCII readers '''
+
+    def test_roundtrip(self):
+        zones = [
+            native.Zone('block', 'Ordered', (3,2,1), locations=[0,1]),
+            native.Zone('tris', 'FETriangle', (4,2)),
+        ]
+        conn = np.array([[0,1,2],[1,2,3]])
+        for filename in ['rt.plt', 'rt.dat']:
+            with test.temp_workspace():
+                with native.open_writer(filename, ['x','p'], zones) as writer:
+                    writer.write_zone([np.arange(6.0), np.arange(2.0)])
+                    writer.write_zone([np.arange(4.0), -np.arange(4.0)], conn)
+                with native.open_dataset(filename) as reader:
+                    self.assertEqual(reader.variable_index('p'), 1)
+                    np.testing.assert_array_equal(reader.values(0, 0), np.arange(6.0))
+                    np.testing.assert_array_equal(reader.values(0, 1), np.arange(2.0))
+                    np.testing.assert_array_equal(reader.values(1, 1), -np.arange(4.0))
+                    np.testing.assert_array_equal(reader.connectivity(1), conn)
+                    self.assertEqual(reader.value_range(1, 1), (-3.0, 0.0))
+
+    def test_plt(self):
+        ''' Values read from a PyTecplot file should match its header ranges '''
+        with native.open_dataset(test.data_item_path('axi_sphere.plt')) as reader:
+            x = reader.values(0, 0)
+            self.assertEqual(x.shape, (99,))
+            self.assertTrue(np.all(np.isfinite(x)))
@@ -0,0 +1,61 @@
+import os
+import test
+import time
+import unittest
+from tec_util import instrument
+from tec_util import prefetch
+
+class TestPrefetcher(unittest.TestCase):
+    ''' Unit tests for background prefetching '''
+
+    def test_order(self):
+        with test.temp_workspace():
+            filenames = ['file%d.bin' % i for i in range(5)]
+            for filename in filenames:
+                with open(filename, 'wb') as f:
+                    f.write(os.urandom(1000))
+            with instrument.recording() as recorder:
+                prefetcher = prefetch.Prefetcher(filenames, depth=2)
+                seen = []
+                for filename in prefetcher:
+                    time.sleep(0.01) # Give the thread time to warm the next file
+                    seen.append(filename)
+            self.assertEqual(seen, filenames)
+            self.assertEqual(prefetcher.bytes, 4000) # The first file is read by the consumer
+            self.assertEqual(recorder.summary()['prefetch']['bytes'], 4000)
+            self.assertGreaterEqual(prefetcher.hidden_time, 0.0)
+
+    def test_max_bytes(self):
+        with test.temp_workspace():
+            with open('big.bin', 'wb') as f:
+                f.write(os.urandom(3000))
+            self.assertEqual(prefetch.warm_file('big.bin', max_bytes=1000, block_size=256), 1000)
+            filenames = ['big.bin'] * 4
+            prefetcher = prefetch.Prefetcher(filenames, depth=3, max_bytes=2000)
+            self.assertEqual(list(prefetcher), filenames)
+            self.assertLessEqual(prefetcher.bytes, 3 * 2000)
+
+    def test_groups(self):
+        with test.temp_workspace():
+            for filename, size in [('a.bin', 100), ('b.bin', 200), ('c.bin', 300)]:
+                with open(filename, 'wb') as f:
+                    f.write(os.urandom(size))
+            # Items are started out of order by the consumer, as by runner.run_tasks
+            prefetcher = prefetch.Prefetcher([['a.bin'], ['b.bin', 'c.bin', 'missing.bin'], ['a.bin']], depth=1)
+            prefetcher.start()
+            deadline = time.monotonic() + 10
+            while prefetcher.bytes < 500 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(prefetcher.bytes, 500)
+            prefetcher.advance(1)
+            while prefetcher.bytes < 600 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            prefetcher.advance(0) # Never moves back
+            prefetcher.stop()
+            self.assertEqual(prefetcher.bytes, 600)
+
+    def test_disabled(self):
+        self.assertEqual(list(prefetch.Prefetcher(['a', 'b'], depth=0)), ['a', 'b'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import io
+import json
+import os
+import test
+import unittest
+from tec_util import batch
+from tec_util import native
+from tec_util import runner
+from tec_util.__main__ import main
+
+def task(id, inputs=(), outputs=(), memory=0, loads=0):
+    return runner.Task(id, None, ['info', 'missing.plt'], list(inputs), list(outputs), memory, loads)
+
+class TestScheduling(unittest.TestCase):
+    ''' Unit tests for resource limits and dependencies '''
+
+    def test_resources(self):
+        async def check():
+            resources = runner.Resources({'jobs': 2, 'memory': 100, 'loads': None})
+            self.assertNotIn('loads', resources.limits)
+            await resources.acquire({'jobs': 1, 'memory': 60, 'loads': 1})
+            self.assertTrue(resources.fits({'jobs': 1, 'memory': 40}))
+            self.assertFalse(resources.fits({'jobs': 1, 'memory': 50}))
+            await resources.release({'jobs': 1, 'memory': 60, 'loads': 1})
+            self.assertTrue(resources.fits({'jobs': 1, 'memory': 500})) # Runs alone
+        asyncio.run(check())
+
+    def test_dependencies(self):
+        tasks = [
+            task('a', ['in.plt'], ['a.plt']),
+            task('b', ['in.plt'], ['b_*.plt']),
+            task('c', ['a.plt', 'b_1.plt'], ['c.plt']),
+            task('d', ['*.plt']),
+        ]
+        self.assertEqual(runner.dependencies(tasks), {
+            'a': [], 'b': [], 'c': ['a', 'b'], 'd': ['a', 'b', 'c'],
+        })
+
+    def test_progress(self):
+        tasks = [task('a'), task('b')]
+        progress = runner.Progress(tasks, enabled=True, stream=io.StringIO())
+        self.assertTrue(progress.line().startswith('[0/2] 0 running, 0 failed'))
+        self.assertTrue(progress.line().endswith('ETA ?'))
+        progress.finish(tasks[0], True)
+        progress.draw()
+        self.assertIn('[1/2]', progress.stream.getvalue())
+        self.assertNotIn('?', progress.line())
+
+class TestRunner(unittest.TestCase):
+    ''' Unit tests for concurrent batches and command lines '''
+
+    def test_manifest(self):
+        with test.temp_workspace():
+            test.write_synthetic_dataset('a.plt', num_zones=1, shape=(4,4,2))
+            test.write_synthetic_dataset('b.plt', num_zones=1, shape=(4,4,2))
+            with open('jobs.json', 'w') as f:
+                json.dump({'jobs': [
+                    {'id': 'merge', 'function': 'merge_datafiles',
+                     'args': {'datafiles': ['a.plt', 'b.plt'], 'datafile_out': 'ab.plt'}},
+                    {'id': 'diff', 'function': 'difference_datafiles',
+                     'args': {'datafile_new': 'a.plt', 'datafile_old': 'b.plt', 'datafile_out': 'diff.plt'}},
+                    {'id': 'stats', 'function': 'compute_series_statistics',
+                     'args': {'datafiles': ['ab.plt'], 'output': 'stats.csv'}},
+                    {'id': 'missing', 'function': 'merge_datafiles',
+                     'args': {'datafiles': ['missing.plt'], 'datafile_out': 'm.plt'}},
+                ]}, f)
+            report = batch.run_manifest('jobs.json', jobs=2, max_memory=1, retries=1, retry_delay=0.01, prefetch=2)
+            self.assertEqual(report.done, ['merge', 'diff', 'stats'])
+            self.assertEqual(report.failed, ['missing'])
+            self.assertTrue(os.path.exists('stats.csv'))
+            with native.open_dataset('ab.plt') as reader:
+                self.assertEqual(len(reader.zones), 2)
+            report = batch.run_manifest('jobs.json', jobs=2, mode='process')
+            self.assertEqual(report.skipped, ['merge', 'diff', 'stats'])
+            self.assertEqual(report.failed, ['missing'])
+
+    def test_failed_dependency(self):
+        with test.temp_workspace():
+            tasks = [
+                task('a', [], ['a.plt']),
+                task('b', ['a.plt'], ['b.plt']),
+            ]
+            report = runner.run_jobs(tasks, max_jobs=2)
+            self.assertEqual(report.failed, ['a', 'b'])
+
+    def test_commands(self):
+        with test.temp_workspace():
+            test.write_synthetic_dataset('a.plt', num_zones=2, shape=(4,4,2))
+            with open('commands.txt', 'w') as f:
+                f.write("# Split, then merge the zones back\n")
+                f.write("split a.plt -o 'out/{name}.plt'\n")
+            main(['run', '-f', 'commands.txt', 'hash a.plt', '-j', '2', '--no-progress', '--prefetch', '1'])
+            self.assertEqual(len(os.listdir('out')), 2)
+            with self.assertRaises(ValueError):
+                main(['run', 'unknown a.plt'])
+            with self.assertRaises(RuntimeError):
+                main(['run', 'hash missing.plt', '--retries', '1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import numpy as np
+import os
+import test
+import unittest
+import unittest.mock
+from tec_util import native
+from tec_util import series
+from tec_util.__main__ import main
+
+def write_step(filename, values, time=0.0, strand=0):
+    zone = native.Zone('line', 'Ordered', (len(values),1,1), strand, time)
+    x = np.linspace(0.0, 1.0, len(values))
+    with native.open_writer(filename, ['x','q'], [zone]) as writer:
+        writer.write_zone([x, np.asarray(values, np.float64)])
+
+class TestRunningStats(unittest.TestCase):
+    ''' Unit tests for streaming mean/variance/extrema '''
+
+    def test_chunks(self):
+        values = np.random.default_rng(0).normal(5.0, 2.0, 1000)
+        values[10] = np.nan
+        stats = series.RunningStats((2,))
+        for chunk in np.split(values, [1, 300, 301, 777]):
+            stats.add(1, chunk, time=len(chunk))
+        finite = values[~np.isnan(values)]
+        self.assertEqual(stats.count[1], finite.size)
+        self.assertAlmostEqual(stats.mean[1], finite.mean())
+        self.assertAlmostEqual(stats.variance[1], finite.var())
+        self.assertEqual(stats.min[1], finite.min())
+        self.assertEqual(stats.count[0], 0)
+        self.assertTrue(np.isnan(stats.variance[0]))
+
+    def test_merge(self):
+        a, b = series.RunningStats((1,)), series.RunningStats((1,))
+        a.add(0, [1.0, 2.0], time=0.0)
+        b.add(0, [3.0, -1.0], time=1.0)
+        a.merge(b)
+        self.assertEqual(a.mean[0], 1.25)
+        self.assertEqual((a.min[0], a.tmin[0], a.max[0], a.tmax[0]), (-1.0, 1.0, 3.0, 1.0))
+
+class TestSeries(unittest.TestCase):
+    ''' Unit tests for time-series statistics '''
+
+    def test_files(self):
+        with test.temp_workspace():
+            for i in range(3):
+                write_step('step_%d.plt' % i, [i, 2*i, 3*i], time=0.5*i, strand=1)
+            zones, variables, total = series.compute_series_statistics(
+                ['step_*.plt'], output='series.csv', variable_patterns=['q'], prefetch=2,
+            )
+            with open('series.csv') as f:
+                lines = f.read().splitlines()
+        self.assertEqual((zones, variables), (['line'], ['q']))
+        self.assertEqual(total.count[0,0], 9)
+        self.assertEqual(total.mean[0,0], 2.0)
+        self.assertEqual((total.max[0,0], total.tmax[0,0]), (6.0, 1.0))
+        self.assertEqual(lines[0], 'time,zone,variable,min,max,mean')
+        self.assertEqual(lines[3], '1.0,line,q,2.0,6.0,4.0')
+
+    def test_solution_times(self):
+        zones = [native.Zone('line', 'Ordered', (2,1,1), 1, t) for t in (2.0, 1.0)]
+        with test.temp_workspace():
+            with native.open_writer('series.dat', ['x','q'], zones) as writer:
+                writer.write_zone([np.zeros(2), np.array([1.0, 9.0])])
+                writer.write_zone([np.zeros(2), np.array([-1.0, 0.0])])
+            with unittest.mock.patch.object(native, 'open_dataset', wraps=native.open_dataset) as opened:
+                series.compute_series_statistics(['series.dat'], output='series.npz')
+            self.assertEqual(opened.call_count, 1) # Opened once for all its timesteps
+            with np.load('series.npz') as npz:
+                np.testing.assert_array_equal(npz['time'], [1.0, 2.0])
+                np.testing.assert_array_equal(npz['max'][:,0,1], [0.0, 9.0])
+                self.assertEqual(npz['total_tmin'][0,1], 1.0)
+
+    def test_natural_order(self):
+        ''' Files without solution times are timesteps in natural order '''
+        with test.temp_workspace():
+            for i in (1, 2, 10):
+                write_step('sol_%d.plt' % i, [float(i)])
+            self.assertEqual(series.expand_datafiles(['sol_*.plt']), ['sol_1.plt', 'sol_2.plt', 'sol_10.plt'])
+            _, _, total = series.compute_series_statistics(['sol_*.plt'], variable_patterns=['q'])
+            self.assertEqual((total.max[0,0], total.tmax[0,0]), (10.0, 2.0))
+
+    def test_failure(self):
+        with test.temp_workspace():
+            write_step('step_0.plt', [1.0, 2.0], time=0.0, strand=1)
+            with open('step_1.plt', 'wb') as f:
+                f.write(b'#!TDV112 truncated')
+            for output in ['series.csv', 'series.npz']:
+                with self.assertRaises(Exception):
+                    series.compute_series_statistics(['step_*.plt'], output=output)
+                self.assertFalse(os.path.exists(output))
+
+            # Rows appended to an existing file are rolled back
+            with open('stats.csv', 'w') as f:
+                f.write('time,zone,variable,min,max,mean\n')
+            writer = series.CsvSeriesWriter('stats.csv', ['line'], ['q'], append=True)
+            stats = series.RunningStats((1,1))
+            stats.add((0,0), [1.0])
+            writer.write_step(0.0, stats)
+            writer.abort()
+            with open('stats.csv') as f:
+                self.assertEqual(f.read(), 'time,zone,variable,min,max,mean\n')
+
+    def test_main(self):
+        with test.temp_workspace():
+            write_step('a.plt', [1.0, 2.0])
+            write_step('b.plt', [3.0, 4.0])
+            main(['stats', '--series', '-o', 'series.csv', 'a.plt', 'b.plt'])
+            with open('series.csv') as f:
+                self.assertEqual(len(f.read().splitlines()), 5)
+            with self.assertRaises(RuntimeError):
+                main(['stats', 'a.plt', 'b.plt'])
+
+if __name__ == '__main__':
+    unittest.main()
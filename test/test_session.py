@@ -0,0 +1,87 @@
+import os
+import tecplot as tp
+import tecplot.constant as tpc
+import tec_util
+import test
+import unittest
+
+def load_and_replace(dataset_name):
+    return tp.data.load_tecplot(dataset_name, read_data_option=tpc.ReadDataOption.Replace)
+
+class TestSession(unittest.TestCase):
+    ''' Unit tests for in-memory chaining of operations '''
+
+    def test_chain(self):
+        ''' extract -> diff -> stats without intermediate files '''
+        num_frames = len(list(tp.active_page().frames()))
+        with test.temp_workspace():
+            with tec_util.Session() as session:
+                new = session.load(test.data_item_path("sphere.dat"))
+                new = session.extract(new, zone_patterns=["*:[1-4]"])
+                old = session.load(test.data_item_path("sphere.dat"), zone_patterns=["*:[1-4]"])
+                delta = session.difference(new, old, nskip=1)
+                self.assertEqual([v.name for v in delta.variables], ["x", "delta_y", "delta_z"])
+                self.assertEqual(len(delta.zones), 4)
+                stats = session.statistics(delta)
+                self.assertEqual(stats["delta_y"][0].max, 0.0)
+                self.assertEqual(os.listdir('.'), [])
+                session.write(delta, "diff.plt")
+            self.assertEqual(len(list(tp.active_page().frames())), num_frames)
+            ds = load_and_replace("diff.plt")
+            self.assertEqual(ds.num_zones, 4)
+            self.assertEqual(ds.num_variables, 3)
+
+    def test_interpolate(self):
+        with test.temp_workspace():
+            with tec_util.Session() as session:
+                source = session.load(test.data_item_path("interp_src.dat"))
+                target = session.load(test.data_item_path("interp_tgt.dat"))
+                result = session.interpolate(source, target)
+                self.assertEqual(len(result.zones), 1)
+                self.assertEqual(result.zones[0].dimensions, (9, 5, 1))
+                vrange = result.zones[0].values("r").minmax()
+                self.assertAlmostEqual(max(vrange), 6.39408e-01, delta=1e-6)
+                self.assertAlmostEqual(min(vrange), 5.10930e-01, delta=1e-6)
+                self.assertEqual(os.listdir('.'), [])
+
+    def test_revolve(self):
+        num_frames = len(list(tp.active_page().frames()))
+        with tec_util.Session() as session:
+            surf = session.load(test.data_item_path("axi_sphere_surf.plt"))
+            sphere = session.revolve(surf, planes=13, angle=90.0)
+            self.assertEqual([v.name for v in sphere.variables], ['x','y','z','q1','q2','v1','v2'])
+            self.assertEqual(sphere.zones[0].dimensions, (11,13,1))
+            stats = session.statistics(session.select(sphere, var_patterns=['y', 'z']))
+            self.assertEqual(stats['y'][0].max, stats['z'][0].max)
+        self.assertEqual(len(list(tp.active_page().frames())), num_frames)
+
+    def test_slice(self):
+        with test.temp_workspace():
+            with tec_util.Session() as session:
+                sphere = session.load(test.data_item_path("sphere.dat"))
+                cut = session.slice(sphere, [('x0', (0,0,0), (1,0,0), 'all')])
+                self.assertEqual([z.name for z in cut.zones], ['x0'])
+                self.assertAlmostEqual(max(map(abs, cut.zones[0].values('x').minmax())), 0.0, delta=1e-6)
+                session.write(cut, "slice.plt")
+            ds = load_and_replace("slice.plt")
+            self.assertEqual(ds.num_zones, 1)
+
+    def test_rename(self):
+        ''' Selections after a rename use the new names '''
+        with tec_util.Session() as session:
+            handle = session.load(test.data_item_path("sphere.dat"))
+            session.select(handle, var_patterns=['x'])
+            session.rename_variables(handle, {'x': 'X'})
+            session.rename_zones(handle, {'sphere.x:1': 'cap'})
+            selected = session.select(handle, zone_patterns=['cap'], var_patterns=['X'])
+            self.assertEqual([v.name for v in selected.variables], ['X'])
+            self.assertEqual([z.name for z in selected.zones], ['cap'])
+
+    def test_closed(self):
+        session = tec_util.Session()
+        session.close()
+        with self.assertRaises(RuntimeError):
+            session.load(test.data_item_path("sphere.dat"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import numpy as np
+import os
+import test
+import unittest
+from tec_util import native
+from tec_util import shard
+from tec_util.__main__ import main
+
+def write_zones(filename, variables, names):
+    ''' Write ordered zones whose values of the i-th variable are i + zone index '''
+    zones = [native.Zone(name, 'Ordered', (3,2,1)) for name in names]
+    with native.open_writer(filename, variables, zones) as writer:
+        for iz in range(len(zones)):
+            writer.write_zone([np.full(6, i + iz, np.float64) for i in range(len(variables))])
+
+class TestSplit(unittest.TestCase):
+    ''' Unit tests for split_dataset '''
+
+    def test_zones(self):
+        with test.temp_workspace():
+            write_zones('in.plt', ['x','p'], ['wing', 'flap', 'tail'])
+            reports = shard.split_dataset('in.plt', 'out/{name}.dat', var_patterns=['p'], jobs=2)
+            self.assertEqual([r.filename for r in reports], ['out/wing.dat', 'out/flap.dat', 'out/tail.dat'])
+            with native.open_dataset('out/tail.dat') as reader:
+                self.assertEqual(reader.variables, ['p'])
+                self.assertEqual([z.name for z in reader.zones], ['tail'])
+                np.testing.assert_array_equal(reader.values(0, 0), np.full(6, 3.0))
+
+    def test_groups(self):
+        with test.temp_workspace():
+            write_zones('in.plt', ['x','p'], ['wing', 'flap', 'tail'])
+            main(['split', 'in.plt', '-g', 'wing,flap', '-g', 'tail', '--precision', 'single'])
+            self.assertEqual(sorted(os.listdir()), ['0000_wing_flap.plt', '0001_tail.plt', 'in.plt'])
+            with native.open_dataset('0000_wing_flap.plt') as reader:
+                self.assertEqual([z.name for z in reader.zones], ['wing', 'flap'])
+                self.assertEqual(reader.dtype(1, 1), np.float32)
+            with self.assertRaises(ValueError):
+                shard.split_dataset('in.plt', 'same.plt')
+
+class TestMerge(unittest.TestCase):
+    ''' Unit tests for merge_datafiles '''
+
+    def test_variables(self):
+        ''' Variables are matched by name; missing ones are passive '''
+        with test.temp_workspace():
+            write_zones('a.plt', ['x','p','q'], ['a1', 'a2'])
+            write_zones('b.dat', ['x','q'], ['b1'])
+            report = shard.merge_datafiles(['a.plt', 'b.dat'], 'merged.plt')
+            self.assertGreater(report.num_bytes, 0)
+            with native.open_dataset('merged.plt') as reader:
+                self.assertEqual(reader.variables, ['x','p','q'])
+                self.assertEqual([z.name for z in reader.zones], ['a1', 'a2', 'b1'])
+                np.testing.assert_array_equal(reader.values(2, 2), np.full(6, 1.0))
+                self.assertTrue(reader.layouts[2].passive[1])
+                self.assertEqual(reader.layouts[2].shared[0], 0) # Same x as a1
+            main(['merge', 'a.plt', 'b.dat', '--common', '-z', '*1', '-o', 'common.dat'])
+            with native.open_dataset('common.dat') as reader:
+                self.assertEqual(reader.variables, ['x','q'])
+                self.assertEqual([z.name for z in reader.zones], ['a1', 'b1'])
+
+if __name__ == '__main__':
+    unittest.main()
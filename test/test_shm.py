@@ -0,0 +1,107 @@
+import concurrent.futures
+import numpy as np
+import os
+import resource
+import test
+import unittest
+from multiprocessing import shared_memory
+from tec_util import native
+from tec_util import shm
+
+def crash(descriptor):
+    with shm.attach(descriptor) as ds:
+        ds.values(0, 0)
+        os._exit(1)
+
+def write_line(filename, offset=0.0):
+    zone = native.Zone('line', 'Ordered', (11,1,1))
+    x = np.linspace(0.0, 1.0, 11)
+    with native.open_writer(filename, ['x','y','z','q'], [zone]) as writer:
+        writer.write_zone([x, np.zeros(11), np.zeros(11), x**2 + offset])
+
+class TestSharedDataset(unittest.TestCase):
+    ''' Unit tests for the shared-memory dataset broker '''
+
+    def test_workers(self):
+        with test.temp_workspace():
+            write_line('new.plt', offset=0.5)
+            write_line('old.plt')
+            with shm.SharedDataset.from_file('new.plt') as new, \
+                 shm.SharedDataset.from_file('old.plt') as old, \
+                 shm.SharedDataset(new.variables, new.zones, {(0, 3): (np.float64, 11)}) as out, \
+                 concurrent.futures.ProcessPoolExecutor(2) as pool:
+                failures = pool.submit(shm.difference_zones, new.descriptor, old.descriptor, out.descriptor,
+                                       [(0,0)], [(3,3,3)]).result()
+                self.assertEqual(failures, [])
+                np.testing.assert_array_equal(out.values(0, 3), np.full(11, 0.5))
+
+    def test_cleanup(self):
+        ''' Blocks survive a crashing worker and are unlinked on close '''
+        dataset = shm.SharedDataset(['x'], [native.Zone('line', 'Ordered', (4,1,1))], {(0, 0): (np.float64, 4)})
+        dataset.publish(0, 0, np.arange(4.0))
+        name = dataset.descriptor.name
+        with concurrent.futures.ProcessPoolExecutor(1) as pool:
+            with self.assertRaises(concurrent.futures.process.BrokenProcessPool):
+                pool.submit(crash, dataset.descriptor).result()
+        np.testing.assert_array_equal(dataset.values(0, 0), np.arange(4.0))
+        dataset.close()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_difference_zones(self):
+        ''' Mismatched zone pairs are filled with NaN and reported '''
+        zones = [native.Zone('a', 'Ordered', (4,1,1)), native.Zone('b', 'Ordered', (3,1,1))]
+        layout = {(0, 0): (np.float64, 4), (1, 0): (np.float64, 3)}
+        with shm.SharedDataset(['q'], zones, layout) as data, shm.SharedDataset(['q'], zones, layout) as out:
+            data.publish(0, 0, np.arange(4.0))
+            data.publish(1, 0, np.arange(3.0))
+            failures = shm.difference_zones(
+                data.descriptor, data.descriptor, out.descriptor,
+                [(0,0), (1,0)], [(0,0,0)],
+            )
+            np.testing.assert_array_equal(out.values(0, 0), np.zeros(4))
+            self.assertTrue(np.all(np.isnan(out.values(1, 0))))
+            self.assertEqual([f[:3] for f in failures], [(1,0,0)])
+
+    def test_many_zones(self):
+        ''' Thousands of zones share one block, and one file descriptor '''
+        zones = [native.Zone(f'z{i}', 'Ordered', (3,1,1)) for i in range(3000)]
+        layout = {(iz, ivar): (np.float32 if ivar else np.float64, 3) for iz in range(3000) for ivar in range(2)}
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(256, hard), hard))
+        try:
+            with shm.SharedDataset(['x','q'], zones, layout) as data:
+                for iz in range(3000):
+                    data.publish(iz, 0, np.full(3, iz))
+                    data.publish(iz, 1, np.full(3, -iz))
+                offsets = [a.offset for a in data.descriptor.values.values()]
+                self.assertTrue(all(offset % shm.ALIGNMENT == 0 for offset in offsets))
+                with shm.attach(data.descriptor) as ds:
+                    np.testing.assert_array_equal(ds.values(2999, 0), np.full(3, 2999.0))
+                    self.assertEqual(ds.values(1234, 1).dtype, np.float32)
+                    np.testing.assert_array_equal(ds.values(1234, 1), np.full(3, -1234.0))
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def test_from_file(self):
+        with test.temp_workspace():
+            zone = native.Zone('tri', 'FETriangle', (3,1), locations=[0,1])
+            with native.open_writer('tri.plt', ['x','c'], [zone]) as writer:
+                writer.write_zone([np.arange(3.0), np.array([7.0])], connectivity=[[0,1,2]])
+            with shm.SharedDataset.from_file('tri.plt') as data, shm.attach(data.descriptor) as ds:
+                np.testing.assert_array_equal(ds.values(0, 1), [7.0])
+                np.testing.assert_array_equal(ds.connectivity(0), [[0,1,2]])
+
+    def test_difference_files(self):
+        ''' Workers read the inputs natively and pad ordered cell-centered deltas '''
+        with test.temp_workspace():
+            zone = native.Zone('box', 'Ordered', (3,2,1), locations=[0,1])
+            for filename, offset in [('new.plt', 2.0), ('old.plt', 0.5)]:
+                with native.open_writer(filename, ['x','c'], [zone]) as writer:
+                    writer.write_zone([np.arange(6.0) + offset, np.full(2, offset)])
+            layout = {(5, 0): (np.float64, 6), (5, 1): (np.float64, 6)}
+            with shm.SharedDataset(['x','c'], [], layout) as out:
+                failures = shm.difference_zones('new.plt', 'old.plt', out.descriptor, [(0,0,5)], [(0,0,0), (1,1,1)])
+                self.assertEqual(failures, [])
+                np.testing.assert_array_equal(out.values(5, 0), np.full(6, 1.5))
+                np.testing.assert_array_equal(out.values(5, 1), [1.5, 1.5, 0, 0, 0, 0])
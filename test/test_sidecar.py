@@ -0,0 +1,48 @@
+import json
+import numpy as np
+import os
+import test
+import unittest
+from tec_util import native
+from tec_util import sidecar
+from tec_util.core import compute_statistics
+
+def write(filename, offset=0.0):
+    zones = [native.Zone('a', 'Ordered', (5,1,1)), native.Zone('b', 'Ordered', (3,1,1))]
+    with native.open_writer(filename, ['x', 'q'], zones) as writer:
+        writer.write_zone([np.arange(5.0), np.arange(5.0) + offset])
+        writer.write_zone([np.arange(3.0), np.array([1.0, 2.0, 6.0])])
+
+class TestSidecar(unittest.TestCase):
+    ''' Unit tests for the statistics sidecar index '''
+
+    def test_cache(self):
+        with test.temp_workspace():
+            write('data.plt')
+            stats = compute_statistics('data.plt', ['q'], sidecar=True)
+            self.assertEqual(stats['q'][1].name, 'b')
+            self.assertEqual((stats['q'][1].min, stats['q'][1].max, stats['q'][1].mean), (1.0, 6.0, 3.0))
+            self.assertAlmostEqual(stats['q'][0].std, np.std(np.arange(5.0)))
+            self.assertEqual(stats['q'][0].count, 5)
+            self.assertTrue(os.path.exists('data.plt.stats.json'))
+
+            # Unchanged file: answered from the sidecar
+            with open('data.plt.stats.json') as f:
+                index = json.load(f)
+            index['zones']['1']['variables']['q']['max'] = 99.0
+            with open('data.plt.stats.json', 'w') as f:
+                json.dump(index, f)
+            os.utime('data.plt.stats.json')
+            self.assertEqual(compute_statistics('data.plt', ['q'], sidecar=True)['q'][1].max, 99.0)
+
+            # Changed file: only zones whose hash changed are recomputed
+            write('data.plt', offset=1.0)
+            os.utime('data.plt', ns=(0, 0))
+            stats = compute_statistics('data.plt', sidecar=True)
+            self.assertEqual(stats['q'][0].max, 5.0)
+            self.assertEqual(stats['q'][1].max, 99.0)
+            self.assertEqual(stats['x'][0].max, 4.0)
+            self.assertEqual(len(sidecar.load_sidecar('data.plt')['zones']['0']['variables']), 2)
+
+if __name__ == '__main__':
+    unittest.main()
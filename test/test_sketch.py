@@ -0,0 +1,71 @@
+import numpy as np
+import pickle
+import test
+import unittest
+from tec_util import sketch
+from tec_util.__main__ import main
+
+class TestQuantileSketch(unittest.TestCase):
+    ''' Unit tests for the streaming quantile sketch '''
+
+    def test_accuracy(self):
+        values = np.random.default_rng(0).normal(size=1000000)
+        qs = [0.01, 0.5, 0.99]
+        a, b = sketch.QuantileSketch(seed=1), sketch.QuantileSketch(seed=2)
+        for chunk in np.array_split(values[:400000], 7):
+            a.add(chunk)
+        for chunk in np.array_split(values[400000:], 5):
+            b.add(chunk)
+        a.merge(pickle.loads(pickle.dumps(b)))
+        self.assertEqual(a.count, values.size)
+        self.assertLess(a.size, 3 * sketch.DEFAULT_K)
+        ranks = np.searchsorted(np.sort(values), a.quantiles(qs)) / values.size
+        np.testing.assert_allclose(ranks, qs, atol=0.01)
+        self.assertEqual(a.quantiles([0.0, 1.0]).tolist(), [values.min(), values.max()])
+
+    def test_small(self):
+        s = sketch.QuantileSketch()
+        s.add([3.0, np.nan, 1.0, 2.0])
+        self.assertEqual(s.quantiles([0.5]).tolist(), [2.0])
+        self.assertTrue(np.isnan(sketch.QuantileSketch().quantiles([0.5])[0]))
+
+class TestHistogram(unittest.TestCase):
+    ''' Unit tests for fixed-range histograms '''
+
+    def test_counts(self):
+        h = sketch.Histogram(0.0, 4.0, 4)
+        h.add([0.0, 0.5, 1.0, 3.9, 4.0, -1.0, 5.0, np.nan])
+        other = sketch.Histogram(0.0, 4.0, 4)
+        other.add([2.5])
+        h.merge(other)
+        self.assertEqual(h.counts.tolist(), [2, 1, 1, 2])
+        self.assertEqual((h.underflow, h.overflow), (1, 1))
+        with self.assertRaises(ValueError):
+            h.merge(sketch.Histogram(0.0, 1.0, 4))
+
+    def test_non_finite(self):
+        h = sketch.Histogram(0.0, 4.0, 4)
+        with np.errstate(all='raise'):
+            h.add([np.inf, -np.inf, np.nan, 1e300, -1e300, 2.0])
+        self.assertEqual(h.counts.tolist(), [0, 0, 1, 0])
+        self.assertEqual((h.underflow, h.overflow), (2, 2))
+
+class TestDistributions(unittest.TestCase):
+    ''' Unit tests for per-variable distributions over datafiles '''
+
+    def test_datafiles(self):
+        with test.temp_workspace():
+            for i in range(2):
+                test.write_synthetic_dataset('data%d.plt' % i, shape=(10,10,5), num_vars=4)
+            test.write_synthetic_dataset('data2.dat', shape=(10,10,5), num_vars=4)
+            datafiles = ['data0.plt', 'data1.plt', 'data2.dat']
+            result = sketch.compute_distributions(datafiles, ['x', 'q1'], bins=10, jobs=2)
+            self.assertEqual(list(result), ['x', 'q1'])
+            self.assertEqual(result['x'].count, 3 * 2 * 500)
+            self.assertEqual(result['x'].histogram.counts.sum(), 3000)
+            self.assertEqual(result['x'].histogram.edges[[0,-1]].tolist(), [0.0, 19.0])
+            self.assertIn(result['x'].quantiles.quantiles([0.5])[0], [9.0, 10.0])
+            main(['stats', '--percentiles', '1,50,99', '--histogram', '4'] + datafiles)
+
+if __name__ == '__main__':
+    unittest.main()
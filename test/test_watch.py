@@ -0,0 +1,109 @@
+import csv
+import numpy as np
+import os
+import test
+import unittest
+from tec_util import native
+from tec_util import watch
+from tec_util.__main__ import main
+
+def read_rows(filename):
+    with open(filename, newline='') as f:
+        return list(csv.reader(f))
+
+class TestPoller(unittest.TestCase):
+    ''' Unit tests for the detection of complete files '''
+
+    def test_settle(self):
+        with test.temp_workspace():
+            poller = watch.Poller('.', '*.plt', settle=0.0, exclude=['out.plt'])
+            with open('a.plt', 'w') as f:
+                f.write('part')
+            open('out.plt', 'w').close()
+            self.assertEqual(poller.scan(), []) # First seen
+            with open('a.plt', 'a') as f:
+                f.write('ial')
+            self.assertEqual(poller.scan(), []) # Still growing
+            self.assertEqual(poller.scan(), ['./a.plt'])
+            self.assertEqual(poller.scan(), []) # Reported once
+            self.assertEqual(poller.pending, {})
+
+class TestWatch(unittest.TestCase):
+    ''' Unit tests for incremental post-processing '''
+
+    def test_stats(self):
+        with test.temp_workspace():
+            os.mkdir('run')
+            test.write_synthetic_dataset('run/flow_1.plt', num_zones=2, shape=(4,4,2), num_vars=5)
+            test.write_synthetic_dataset('run/flow_2.plt', num_zones=2, shape=(4,4,2), num_vars=5)
+            kwargs = dict(settle=0.0, interval=0.01, inotify=False, idle_timeout=0.1)
+            report = watch.watch_directory('run', ['stats'], variable_patterns=['q*'], **kwargs)
+            self.assertEqual(len(report.processed), 2)
+            rows = read_rows('run/watch/stats.csv')
+            self.assertEqual(rows[0], ['time', 'zone', 'variable', 'min', 'max', 'mean'])
+            self.assertEqual(len(rows), 1 + 2*2*2)
+            self.assertEqual({r[0] for r in rows[1:]}, {'0.0', '1.0'})
+
+            # A restarted watcher only processes new files, and appends to the outputs
+            test.write_synthetic_dataset('run/flow_3.plt', num_zones=2, shape=(4,4,2), num_vars=5)
+            main(['watch', 'run', '-v', 'q*', '--poll', '--settle', '0', '--max-files', '1', '--prefetch', '1'])
+            rows = read_rows('run/watch/stats.csv')
+            self.assertEqual(len(rows), 1 + 3*2*2)
+            self.assertEqual(rows[-1][:3], ['2.0', 'block:2', 'q2'])
+            self.assertEqual(len(watch.read_journal('run/watch/watch.journal')), 3)
+
+    def test_restart(self):
+        with test.temp_workspace():
+            os.mkdir('run')
+            test.write_synthetic_dataset('run/flow_1.plt', num_zones=2, shape=(4,4,2), num_vars=5)
+            with open('run/flow_2.plt', 'w') as f:
+                f.write('not a datafile')
+            kwargs = dict(settle=0.0, interval=0.01, inotify=False, idle_timeout=0.1)
+            report = watch.watch_directory('run', ['stats'], variable_patterns=['q*'], **kwargs)
+            self.assertEqual(len(report.processed), 1)
+            self.assertEqual(len(report.failed), 1)
+            entries = watch.read_journal('run/watch/watch.journal')
+            self.assertEqual([e['status'] for e in entries], ['done', 'failed'])
+            self.assertEqual(entries[-1]['sizes']['stats.csv'], os.path.getsize('run/watch/stats.csv'))
+
+            # Rows appended after the last entry (an interrupted file) are discarded,
+            # and the failed file is retried
+            with open('run/watch/stats.csv', 'a') as f:
+                f.write('0.5,block:1,q1,0.0')
+            with open('run/watch/watch.journal', 'a') as f:
+                f.write('{"file": "flow')
+            test.write_synthetic_dataset('run/flow_2.plt', num_zones=2, shape=(4,4,2), num_vars=5)
+            report = watch.watch_directory('run', ['stats'], variable_patterns=['q*'], **kwargs)
+            self.assertEqual(report.processed, ['run/flow_2.plt'])
+            rows = read_rows('run/watch/stats.csv')
+            self.assertEqual(len(rows), 1 + 2*2*2)
+            self.assertEqual({r[0] for r in rows[1:]}, {'0.0', '1.0'})
+            entries = watch.read_journal('run/watch/watch.journal')
+            self.assertEqual([e['status'] for e in entries], ['done', 'failed', 'done'])
+
+    def test_append_zones(self):
+        with test.temp_workspace():
+            zones = [native.Zone('cut', 'FETriangle', (3,1))]
+            with native.open_writer('cut.plt', ['x','p'], zones) as writer:
+                writer.write_zone([np.arange(3.0), np.ones(3)], connectivity=[[0,1,2]])
+            self.assertEqual(watch.append_zones('cut.plt', 'slices.dat', 1.5), ['x','p'])
+            watch.append_zones('cut.plt', 'slices.dat', 2.5, existing=['x','p'])
+            with native.open_dataset('slices.dat') as reader:
+                self.assertEqual(len(reader.zones), 2)
+                self.assertEqual([z.solution_time for z in reader.zones], [1.5, 2.5])
+                self.assertEqual([z.strand for z in reader.zones], [1, 1])
+                np.testing.assert_array_equal(reader.connectivity(1), [[0,1,2]])
+            with self.assertRaises(ValueError):
+                watch.append_zones('cut.plt', 'slices.dat', 3.5, existing=['x','y'])
+            with self.assertRaises(ValueError):
+                native.open_writer('slices.plt', ['x','p'], zones, append=True)
+
+    def test_options(self):
+        with test.temp_workspace():
+            with self.assertRaises(ValueError):
+                watch.watch_directory('.', ['slice'])
+            with self.assertRaises(ValueError):
+                watch.watch_directory('.', ['plot'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import contextlib
+import numpy as np
 import os
 import sys
 import tempfile
+from tec_util import native
 
 test_root = os.path.dirname(os.path.abspath(__file__))
 
@@ -24,3 +26,14 @@ def temp_workspace():
         finally:
             os.chdir(home)
 
+
+def write_synthetic_dataset(filename, num_zones=2, shape=(20,20,10), num_vars=10):
+    ''' Write an ordered dataset with x,y,z plus num_vars-3 field variables '''
+    zones = [native.Zone('block:%d' % (i+1), 'Ordered', shape) for i in range(num_zones)]
+    variables = ['x', 'y', 'z'] + ['q%d' % i for i in range(1, num_vars-2)]
+    with native.open_writer(filename, variables, zones) as writer:
+        for i, zone in enumerate(zones):
+            k, j, ii = np.meshgrid(*[np.arange(n, dtype=np.float32) for n in shape[::-1]], indexing='ij')
+            xyz = [ii + i*shape[0], j, k]
+            fields = [np.sin(xyz[0]*n) + xyz[1] for n in range(1, num_vars-2)]
+            writer.write_zone(xyz + fields)